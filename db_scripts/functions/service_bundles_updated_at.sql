@@ -0,0 +1,21 @@
+-- Keep service_bundles.updated_at current on every update
+-- The bundle catalog in long-running services compares the bundles' updated_at values
+-- to decide whether it has to reload, so an update that leaves updated_at untouched
+-- (e.g. the upsert in scripts/populate_service_bundles.py) would go unnoticed.
+
+CREATE OR REPLACE FUNCTION set_service_bundles_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS service_bundles_set_updated_at ON service_bundles;
+
+CREATE TRIGGER service_bundles_set_updated_at
+    BEFORE UPDATE ON service_bundles
+    FOR EACH ROW
+    EXECUTE FUNCTION set_service_bundles_updated_at();
+
+COMMENT ON FUNCTION set_service_bundles_updated_at() IS 'Sets service_bundles.updated_at on every update so the bundle catalog can detect changes';
@@ -0,0 +1,39 @@
+-- Function to record an inbound message in a single round trip
+-- This function creates the user if they don't exist yet (or updates last_active_at
+-- if they do), logs the inbound message and returns the user row
+
+CREATE OR REPLACE FUNCTION touch_user_and_log_inbound(
+    p_whatsapp_id TEXT,
+    p_message_content TEXT,
+    p_data_size_kb FLOAT DEFAULT 0.1,
+    p_preferred_language TEXT DEFAULT 'en'
+)
+RETURNS JSONB AS $$
+DECLARE
+    user_row users%ROWTYPE;
+    is_new_user BOOLEAN;
+BEGIN
+    -- Create the user, or touch last_active_at for an existing user
+    -- xmax is 0 only for rows inserted by this statement
+    INSERT INTO users (whatsapp_id, preferred_language, popia_consent_given, created_at, last_active_at)
+    VALUES (p_whatsapp_id, p_preferred_language, FALSE, NOW(), NOW())
+    ON CONFLICT (whatsapp_id) DO UPDATE SET last_active_at = NOW()
+    RETURNING (xmax = 0) INTO is_new_user;
+    
+    SELECT * INTO user_row FROM users WHERE whatsapp_id = p_whatsapp_id;
+    
+    -- Log the inbound message
+    INSERT INTO message_logs (user_whatsapp_id, direction, message_content, timestamp, data_size_kb)
+    VALUES (p_whatsapp_id, 'inbound', p_message_content, NOW(), p_data_size_kb);
+    
+    -- Return the user row with a flag telling the caller whether it was just created,
+    -- leaving out the encrypted Baileys credentials, which message handling never reads
+    RETURN (to_jsonb(user_row) - 'baileys_creds_encrypted') || jsonb_build_object('is_new_user', is_new_user);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Grant execute permission to authenticated users
+GRANT EXECUTE ON FUNCTION touch_user_and_log_inbound(TEXT, TEXT, FLOAT, TEXT) TO authenticated;
+
+-- Comment on function
+COMMENT ON FUNCTION touch_user_and_log_inbound(TEXT, TEXT, FLOAT, TEXT) IS 'Creates or touches a user, logs their inbound message and returns the user row in one call';
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark script to measure command dispatch cost for Township Connect.
+
+This script registers a growing number of commands (the real ones plus synthetic
+slash commands such as /sale, /expense and /pay) and measures how long it takes to
+parse a message, both with the table-driven CommandRegistry and with an if-chain that
+checks every command in turn, as parse_message used to.
+
+Usage:
+    python scripts/benchmark_command_dispatch.py [--commands N [N ...]] [--iterations N]
+
+Options:
+    --commands N     Numbers of registered commands to measure (default: 10 50 200)
+    --iterations N   Number of parses per measurement (default: 100000)
+"""
+
+import argparse
+import logging
+import os
+import sys
+import timeit
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import core_handler
+from src.commands import CommandRegistry
+
+# Feature areas the synthetic commands are named after
+FEATURE_WORDS = ['sale', 'expense', 'pay', 'stock', 'invoice', 'customer', 'report', 'price', 'order', 'refund']
+
+# Messages measured: the default (echo) path, an exact command and the last slash command
+SAMPLE_MESSAGES = {
+    'echo': "How much is a loaf of bread today?",
+    'exact': "/bundle",
+}
+
+def setup_argparse() -> argparse.Namespace:
+    """Set up command line argument parsing."""
+    parser = argparse.ArgumentParser(description='Measure command dispatch cost')
+    parser.add_argument('--commands', type=int, nargs='+', default=[10, 50, 200], help='Numbers of registered commands to measure (default: 10 50 200)')
+    parser.add_argument('--iterations', type=int, default=100000, help='Number of parses per measurement (default: 100000)')
+    return parser.parse_args()
+
+def synthetic_names(count: int) -> List[str]:
+    """
+    Generate slash command names like /sale, /expense2 and /pay3.
+
+    Args:
+        count: Number of names to generate
+
+    Returns:
+        The command names
+    """
+    names = []
+    for i in range(count):
+        word = FEATURE_WORDS[i % len(FEATURE_WORDS)]
+        suffix = i // len(FEATURE_WORDS)
+        names.append(f"/{word}{suffix if suffix else ''}")
+    return names
+
+def parse_amount_arguments(command_type: str) -> Callable[[str, str], Optional[Tuple[str, Dict[str, Any]]]]:
+    """Build an argument parser for a synthetic '/<command> <amount>' command."""
+    def parse(arguments: str, message_text: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        if arguments.replace('.', '', 1).isdigit():
+            return command_type, {"amount": float(arguments)}
+        return None
+    return parse
+
+def build_registry(names: List[str]) -> CommandRegistry:
+    """
+    Build the production registry plus the synthetic commands.
+
+    Args:
+        names: Synthetic command names
+
+    Returns:
+        The registry
+    """
+    registry = core_handler.build_command_registry()
+    for name in names:
+        command_type = name.lstrip('/')
+        registry.add_command(command_type, lambda params, sender_id, language: "ok")
+        registry.add_prefix(name, parse_amount_arguments(command_type))
+    return registry
+
+def build_if_chain(names: List[str]) -> Callable[[str], Tuple[str, Dict[str, Any]]]:
+    """
+    Build a parser that checks every command in turn, like the old parse_message.
+
+    Args:
+        names: Synthetic command names, checked after the production commands
+
+    Returns:
+        The parser
+    """
+    checks = []
+    for name in names:
+        prefix = name + ' '
+        parse = parse_amount_arguments(name.lstrip('/'))
+        checks.append((prefix, parse))
+
+    def parse_message(message_text: str) -> Tuple[str, Dict[str, Any]]:
+        message_text = message_text.strip()
+        if message_text.lower().startswith('/lang '):
+            parts = message_text.split(' ', 1)
+            if len(parts) == 2 and parts[1].lower() in ['en', 'xh', 'af']:
+                return "language", {"language": parts[1].lower()}
+        if message_text == '/delete':
+            return "delete", {}
+        if message_text == '/delete confirm':
+            return "delete_confirm", {}
+        if message_text.lower().startswith('/simulate_qr_user '):
+            return core_handler.parse_simulate_qr_user_arguments(message_text.split(' ', 1)[1], message_text)
+        for prefix, parse in checks:
+            if message_text.lower().startswith(prefix):
+                parsed = parse(message_text[len(prefix):], message_text)
+                if parsed:
+                    return parsed
+        if message_text == '/bundle':
+            return "bundle_list", {}
+        if message_text.isdigit() and len(message_text) == 1 and 1 <= int(message_text) <= 9:
+            return "bundle_select", {"bundle_number": int(message_text)}
+        return "echo", {"text": message_text}
+
+    return parse_message
+
+def measure(parse: Callable[[str], Any], message: str, iterations: int) -> float:
+    """
+    Measure the average parse time.
+
+    Args:
+        parse: The parser to measure
+        message: The message to parse
+        iterations: Number of parses
+
+    Returns:
+        Nanoseconds per parse
+    """
+    return timeit.timeit(lambda: parse(message), number=iterations) / iterations * 1e9
+
+def main():
+    """Main function."""
+    args = setup_argparse()
+    logging.disable(logging.CRITICAL)
+
+    print(f"Parse cost in ns per message ({args.iterations} parses per measurement)\n")
+    print(f"{'commands':>8} {'message':<8} {'if-chain':>10} {'registry':>10}")
+    for count in args.commands:
+        names = synthetic_names(count)
+        registry = build_registry(names)
+        if_chain = build_if_chain(names)
+        total = len(registry.commands())
+
+        messages = dict(SAMPLE_MESSAGES)
+        messages['last'] = f"{names[-1]} 25.50"
+        for label, message in messages.items():
+            # Both parsers must agree before their speed is compared
+            assert registry.parse(message) == if_chain(message), message
+            chain_ns = measure(if_chain, message, args.iterations)
+            registry_ns = measure(registry.parse, message, args.iterations)
+            print(f"{total:>8} {label:<8} {chain_ns:>10.0f} {registry_ns:>10.0f}")
+
+if __name__ == "__main__":
+    main()
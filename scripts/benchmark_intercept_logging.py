@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for the logging path of the Township Connect Python Core API.
+
+This script logs access-log style lines through the standard library into loguru, the
+way uvicorn and the message core log in the API (see township_connect_py_core/log.py),
+and prints the log calls per second and the slowest call for each caller resolution
+mode (walking the frames or reading the record) and sink (writing to the stream in
+the logging call or queueing for the background writer). --write-delay-ms makes the
+stream slow, e.g. a stdout pipe the log collector is not draining; the slowest call
+is then how long the event loop would stall.
+
+Requires the Python Core API's dependencies (loguru, pydantic-settings).
+
+Usage:
+    python scripts/benchmark_intercept_logging.py [--calls N] [--write-delay-ms MS]
+
+Options:
+    --calls N            Log calls timed per configuration (default: 50000)
+    --write-delay-ms MS  Time each write to the stream takes (default: 0)
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import Tuple
+
+# Add the Python Core API to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'python_core_api')))
+
+from loguru import logger
+
+from township_connect_py_core.log import LOG_FORMAT, NO_CONTEXT, InterceptHandler, QueueSink
+from township_connect_py_core.settings import LogCaller
+
+class NullStream:
+    """A stream that discards what is written, optionally taking a while per write."""
+
+    def __init__(self, write_delay: float = 0.0):
+        self.write_delay = write_delay
+
+    def write(self, message: str) -> None:
+        if self.write_delay:
+            time.sleep(self.write_delay)
+
+    def flush(self) -> None:
+        pass
+
+def setup_argparse() -> argparse.Namespace:
+    """Set up command line argument parsing."""
+    parser = argparse.ArgumentParser(description='Benchmark the logging path of the Python Core API')
+    parser.add_argument('--calls', type=int, default=50000, help='Log calls timed per configuration (default: 50000)')
+    parser.add_argument('--write-delay-ms', type=float, default=0.0, help='Time each write to the stream takes (default: 0)')
+    return parser.parse_args()
+
+def run(caller: LogCaller, queued: bool, serialize: bool, calls: int, write_delay: float) -> Tuple[float, float]:
+    """
+    Time log calls through one configuration.
+
+    Args:
+        caller: How the InterceptHandler finds the caller
+        queued: Whether messages go through a QueueSink
+        serialize: Whether messages are written as JSON
+        calls: Number of log calls to time
+        write_delay: Seconds each write to the stream takes
+
+    Returns:
+        A tuple of (calls per second, slowest call in milliseconds)
+    """
+    stream = NullStream(write_delay)
+    sink = QueueSink(stream, max_size=10000) if queued else stream
+    logger.remove()
+    logger.configure(extra={"trace_id": NO_CONTEXT, "sender_hash": NO_CONTEXT})
+    logger.add(sink, format=LOG_FORMAT, serialize=serialize, colorize=False)
+
+    access_logger = logging.getLogger("uvicorn.access")
+    access_logger.handlers = [InterceptHandler(caller)]
+    access_logger.propagate = False
+    access_logger.setLevel(logging.INFO)
+
+    slowest = 0.0
+    started = time.perf_counter()
+    for _ in range(calls):
+        call_started = time.perf_counter()
+        access_logger.info('%s - "%s %s HTTP/%s" %d', "127.0.0.1:53211", "POST", "/api/whatsapp/inbound", "1.1", 200)
+        slowest = max(slowest, time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    # Drains the queue, so the next configuration starts idle
+    logger.remove()
+    return calls / elapsed, slowest * 1000
+
+def main():
+    """Main function."""
+    args = setup_argparse()
+    calls = args.calls if not args.write_delay_ms else min(args.calls, 2000)
+    print(f"{calls} log calls per configuration, {args.write_delay_ms} ms per stream write\n")
+    print(f"{'caller':<8} {'sink':<8} {'format':<6} {'calls/s':>10} {'slowest ms':>11}")
+
+    for caller, queued, serialize in [
+        (LogCaller.FRAMES, False, False),
+        (LogCaller.RECORD, False, False),
+        (LogCaller.FRAMES, True, False),
+        (LogCaller.RECORD, True, False),
+        (LogCaller.RECORD, True, True),
+    ]:
+        rate, slowest = run(caller, queued, serialize, calls, args.write_delay_ms / 1000)
+        print(
+            f"{caller.value.lower():<8} {'queue' if queued else 'stream':<8} "
+            f"{'json' if serialize else 'text':<6} {rate:>10.0f} {slowest:>11.2f}"
+        )
+
+if __name__ == "__main__":
+    main()
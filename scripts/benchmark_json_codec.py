@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark script to compare the JSON codecs of Township Connect.
+
+This script decodes Twilio WhatsApp webhook payloads and encodes replies with every
+codec installed (see src/json_codec.py), the way the message pipeline does for each
+message: the webhook body is decoded from bytes and the reply is encoded once. It
+prints the time per operation and the speedup over the standard library.
+
+Usage:
+    python scripts/benchmark_json_codec.py [--iterations N]
+
+Options:
+    --iterations N   Operations timed per payload and codec (default: 20000)
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from typing import Any, Dict, List, Tuple
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.json_codec import available_codecs
+
+def setup_argparse() -> argparse.Namespace:
+    """Set up command line argument parsing."""
+    parser = argparse.ArgumentParser(description='Compare the JSON codecs')
+    parser.add_argument('--iterations', type=int, default=20000, help='Operations timed per payload and codec (default: 20000)')
+    return parser.parse_args()
+
+def twilio_payload(body: str, **fields: str) -> Dict[str, str]:
+    """
+    Build an inbound WhatsApp message with the fields Twilio posts to a webhook.
+
+    Args:
+        body: The message text
+        **fields: Extra or overridden fields
+
+    Returns:
+        The payload as sent to /api/whatsapp/inbound
+    """
+    payload = {
+        'SmsMessageSid': 'SM3b1c4e0f7d9a2b6c8e1f0a3d5b7c9e2f',
+        'NumMedia': '0',
+        'ProfileName': 'Thandi',
+        'MessageType': 'text',
+        'SmsSid': 'SM3b1c4e0f7d9a2b6c8e1f0a3d5b7c9e2f',
+        'WaId': '27821234567',
+        'SmsStatus': 'received',
+        'Body': body,
+        'To': 'whatsapp:+14155238886',
+        'NumSegments': '1',
+        'ReferralNumMedia': '0',
+        'MessageSid': 'SM3b1c4e0f7d9a2b6c8e1f0a3d5b7c9e2f',
+        'AccountSid': 'AC9f8e7d6c5b4a39281706f5e4d3c2b1a0',
+        'From': 'whatsapp:+27821234567',
+        'ApiVersion': '2010-04-01',
+    }
+    payload.update(fields)
+    return payload
+
+def sample_messages() -> List[Tuple[str, bytes, Dict[str, Any]]]:
+    """
+    Build the benchmark messages: webhook bodies and the replies they get.
+
+    Returns:
+        A list of (name, webhook body bytes, reply) tuples
+    """
+    popia_notice = open(os.path.join(os.path.dirname(__file__), '..', 'content', 'popia_notice_xh.txt'), encoding='utf-8').read()
+    messages = [
+        ('greeting', twilio_payload('Molo'), 'Echo: Molo'),
+        ('command', twilio_payload('/lang af'), 'Taal verander na Afrikaans.'),
+        ('popia notice', twilio_payload('Hello'), popia_notice),
+        ('media', twilio_payload(
+            '', NumMedia='1', MessageType='image', MediaContentType0='image/jpeg',
+            MediaUrl0='https://api.twilio.com/2010-04-01/Accounts/AC9f8e7d6c5b4a39281706f5e4d3c2b1a0/Messages/MM1/Media/ME1'
+        ), ''),
+    ]
+    return [
+        (name, json.dumps(payload).encode('utf-8'), {'reply_to': payload['From'], 'reply_text': reply_text})
+        for name, payload, reply_text in messages
+    ]
+
+def main():
+    """Main function."""
+    args = setup_argparse()
+    codecs = available_codecs()
+    print(f"Codecs installed: {', '.join(codec.name for codec in codecs)}\n")
+    print(f"{'payload':<14} {'bytes':>6} {'codec':<8} {'decode us':>10} {'encode us':>10} {'speedup':>8}")
+
+    for name, body, reply in sample_messages():
+        baseline = None
+        for codec in reversed(codecs):
+            decode = timeit.timeit(lambda: codec.loads(body), number=args.iterations) / args.iterations * 1e6
+            encode = timeit.timeit(lambda: codec.dumps(reply), number=args.iterations) / args.iterations * 1e6
+            baseline = baseline or decode + encode
+            speedup = baseline / (decode + encode)
+            print(f"{name:<14} {len(body):>6} {codec.name:<8} {decode:>10.2f} {encode:>10.2f} {speedup:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
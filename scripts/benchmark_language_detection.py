@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for the language detector of Township Connect.
+
+This script times src.language_utils.guess_language on greetings (answered by the
+combined greeting pattern) and on other messages (scored with character n-grams), and
+detect_languages on a backfill-sized batch, printing the time per message.
+
+Usage:
+    python scripts/benchmark_language_detection.py [--iterations N]
+
+Options:
+    --iterations N   Detections timed per message (default: 100000)
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.language_utils import detect_languages, guess_language
+
+MESSAGES = [
+    ('greeting', 'Molo'),
+    ('greeting', 'Goeie môre, hoe gaan dit?'),
+    ('scored', 'Ndifuna ukujonga imali yam'),
+    ('scored', 'Ek wil graag my besigheid registreer'),
+    ('scored', 'Can you help me register my business'),
+]
+
+def setup_argparse() -> argparse.Namespace:
+    """Set up command line argument parsing."""
+    parser = argparse.ArgumentParser(description='Benchmark the language detector')
+    parser.add_argument('--iterations', type=int, default=100000, help='Detections timed per message (default: 100000)')
+    return parser.parse_args()
+
+def main():
+    """Main function."""
+    args = setup_argparse()
+    # Trains the scorer outside the timings
+    guess_language('warm up')
+
+    print(f"{'path':<9} {'us':>6} {'language':>8} {'confidence':>10}  message")
+    for path, text in MESSAGES:
+        elapsed = timeit.timeit(lambda: guess_language(text), number=args.iterations)
+        language, confidence = guess_language(text)
+        print(f"{path:<9} {elapsed / args.iterations * 1e6:>6.2f} {language:>8} {confidence:>10.4f}  {text}")
+
+    # Distinct texts, so every one is scored, but made of words the scorer has seen
+    batch = [f"{text} {i}" for i in range(args.iterations // len(MESSAGES)) for _, text in MESSAGES]
+    elapsed = timeit.timeit(lambda: detect_languages(batch), number=1)
+    print(f"\ndetect_languages: {len(batch)} messages in {elapsed * 1000:.1f} ms "
+          f"({elapsed / len(batch) * 1e6:.2f} us per message)")
+
+if __name__ == "__main__":
+    main()
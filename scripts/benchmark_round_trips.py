@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark script to count Supabase round trips per message for Township Connect.
+
+This script runs messages through the separate get_user, last_active_at update and
+inbound log requests (what the handlers fall back to when the database function is
+not deployed) and through one touch_user_and_log_inbound call against the mock
+Supabase client, and prints the number of requests each one makes.
+
+Usage:
+    python scripts/benchmark_round_trips.py [--messages N]
+
+Options:
+    --messages N    Number of messages to send per scenario (default: 100)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Callable, Dict
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import async_handler, core_handler
+from src.db.supabase_client import MockSupabaseClient
+
+EXISTING_USER_ID = 'whatsapp:+27820000000'
+
+def setup_argparse() -> argparse.Namespace:
+    """Set up command line argument parsing."""
+    parser = argparse.ArgumentParser(description='Count Supabase round trips per message')
+    parser.add_argument('--messages', type=int, default=100, help='Number of messages to send per scenario (default: 100)')
+    return parser.parse_args()
+
+def make_client() -> MockSupabaseClient:
+    """
+    Create a mock client with one existing user who has consented and picked a bundle.
+
+    Returns:
+        A MockSupabaseClient instance
+    """
+    client = MockSupabaseClient()
+    client.users[EXISTING_USER_ID] = {
+        'whatsapp_id': EXISTING_USER_ID,
+        'preferred_language': 'en',
+        'popia_consent_given': True,
+        'current_bundle': 'street_vendor_crm'
+    }
+    return client
+
+def inbound_stage_before(client: MockSupabaseClient, sender_id: str, text: str) -> None:
+    """Run the inbound stage with separate requests: one request per step."""
+    user, is_new_user, _ = core_handler.get_or_register_user(sender_id, text)
+    if not is_new_user:
+        core_handler.touch_user_activity(sender_id)
+    core_handler.log_message(client, sender_id, 'inbound', text, len(text.encode('utf-8')) / 1024.0)
+
+def inbound_stage_after(client: MockSupabaseClient, sender_id: str, text: str) -> None:
+    """Run the inbound stage as both pipelines do: one database function call."""
+    ctx = core_handler.build_message_context({'From': sender_id, 'Body': text})
+    core_handler.record_inbound_message(ctx)
+
+def full_message_before(client: MockSupabaseClient, sender_id: str, text: str) -> None:
+    """Run a whole message through the synchronous handler with separate requests."""
+    core_handler._touch_rpc_available = False
+    try:
+        core_handler.handle_incoming_message(json.dumps({'From': sender_id, 'Body': text}))
+    finally:
+        core_handler._touch_rpc_available = True
+
+def full_message_after(client: MockSupabaseClient, sender_id: str, text: str) -> None:
+    """Run a whole message through the async pipeline, including its background writes."""
+    async def run():
+        await async_handler.handle_incoming_message_async(json.dumps({'From': sender_id, 'Body': text}))
+        await async_handler.drain_background_tasks()
+    asyncio.run(run())
+
+def count_requests(step: Callable[[MockSupabaseClient, str, str], None], messages: int, new_users: bool) -> float:
+    """
+    Count the average number of Supabase requests per message for a pipeline step.
+
+    Args:
+        step: The step to run for each message
+        messages: Number of messages to send
+        new_users: Whether every message comes from a first-time sender
+
+    Returns:
+        The average number of requests per message
+    """
+    client = make_client()
+    core_handler.supabase_client = client
+
+    for i in range(messages):
+        sender_id = f'whatsapp:+2783{i:07d}' if new_users else EXISTING_USER_ID
+        step(client, sender_id, 'Hello')
+
+    return client.request_count / messages
+
+def main():
+    """Main function."""
+    args = setup_argparse()
+    logging.disable(logging.CRITICAL)
+
+    # Keep the benchmark off any real Redis instance
+    core_handler.redis_client = None
+
+    scenarios: Dict[str, Dict[str, Callable]] = {
+        'inbound stage': {'before': inbound_stage_before, 'after': inbound_stage_after},
+        'whole message': {'before': full_message_before, 'after': full_message_after},
+    }
+
+    print(f"Supabase requests per message (mock client, {args.messages} messages per scenario)\n")
+    print(f"{'scenario':<16} {'user':<10} {'before':>8} {'after':>8}")
+    for name, steps in scenarios.items():
+        for new_users in (False, True):
+            before = count_requests(steps['before'], args.messages, new_users)
+            after = count_requests(steps['after'], args.messages, new_users)
+            user_kind = 'new' if new_users else 'existing'
+            print(f"{name:<16} {user_kind:<10} {before:>8.1f} {after:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark script to measure sender scheduler throughput for Township Connect.
+
+This script sends a synthetic multi-user load through the SenderScheduler with a
+growing concurrency cap (0 for no cap). Each message is handled by a stand-in
+coroutine that waits for a fixed time, like the Supabase and Redis round trips of a
+real message; the first user's messages are slower, like a user stuck on a slow
+request. It prints, per cap, the throughput of the other users' messages (the slow
+user's messages are serialized, so counting them would only measure the slow user),
+how long the other users took to be answered (which must not depend on the slow
+user), how long the slow user's messages took, and the number of messages that ran
+out of order for their sender (which must be 0).
+
+Usage:
+    python scripts/benchmark_sender_scheduler.py [--users N] [--messages N] [--latency-ms MS] [--slow-latency-ms MS] [--max-concurrent N [N ...]]
+
+Options:
+    --users N             Number of simulated users (default: 200)
+    --messages N          Messages per user (default: 5)
+    --latency-ms MS       Time each message takes to handle (default: 20)
+    --slow-latency-ms MS  Time each message of the first user takes (default: 500)
+    --max-concurrent N    Concurrency caps to measure, 0 for none (default: 1 4 16 64 0)
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.sender_scheduler import SenderScheduler
+
+def setup_argparse() -> argparse.Namespace:
+    """Set up command line argument parsing."""
+    parser = argparse.ArgumentParser(description='Measure sender scheduler throughput')
+    parser.add_argument('--users', type=int, default=200, help='Number of simulated users (default: 200)')
+    parser.add_argument('--messages', type=int, default=5, help='Messages per user (default: 5)')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Time each message takes to handle (default: 20)')
+    parser.add_argument('--slow-latency-ms', type=float, default=500, help='Time each message of the first user takes (default: 500)')
+    parser.add_argument('--max-concurrent', type=int, nargs='+', default=[1, 4, 16, 64, 0], help='Concurrency caps to measure, 0 for none (default: 1 4 16 64 0)')
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error('--users must be at least 2 (one slow user and the others)')
+    return args
+
+def synthetic_load(users: int, messages: int) -> List[Tuple[str, int]]:
+    """
+    Build the messages in arrival order: each user's n-th message, then the (n+1)-th.
+
+    Args:
+        users: Number of users
+        messages: Messages per user
+
+    Returns:
+        (sender_id, sequence number) pairs
+    """
+    senders = [f"whatsapp:+2782{i:07d}" for i in range(users)]
+    return [(sender_id, n) for n in range(messages) for sender_id in senders]
+
+async def run_load(max_concurrent: int, load: List[Tuple[str, int]], latency: float, slow_latency: float) -> Tuple[float, float, int]:
+    """
+    Send the load through a scheduler.
+
+    Args:
+        max_concurrent: Scheduler concurrency cap, 0 for none
+        load: (sender_id, sequence number) pairs in arrival order
+        latency: Seconds each message takes to handle
+        slow_latency: Seconds each message of the first sender takes to handle
+
+    Returns:
+        A tuple containing (seconds taken, seconds until the other senders were answered,
+        messages handled out of order)
+    """
+    scheduler = SenderScheduler(max_concurrent)
+    slow_sender = load[0][0]
+    last_handled: Dict[str, int] = {}
+    out_of_order = 0
+    others_done = 0.0
+
+    async def handle(sender_id: str, sequence: int) -> None:
+        nonlocal out_of_order, others_done
+        await asyncio.sleep(slow_latency if sender_id == slow_sender else latency)
+        if last_handled.get(sender_id, -1) != sequence - 1:
+            out_of_order += 1
+        last_handled[sender_id] = sequence
+        if sender_id != slow_sender:
+            others_done = time.perf_counter()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(scheduler.submit(sender_id, handle, sender_id, n) for sender_id, n in load))
+    elapsed = time.perf_counter() - started
+    await scheduler.stop()
+    return elapsed, others_done - started, out_of_order
+
+def main():
+    """Main function."""
+    args = setup_argparse()
+    logging.disable(logging.CRITICAL)
+
+    load = synthetic_load(args.users, args.messages)
+    latency = args.latency_ms / 1000.0
+    slow_latency = args.slow_latency_ms / 1000.0
+    print(f"{len(load)} messages from {args.users} users, {args.latency_ms:g}ms per message "
+          f"({args.slow_latency_ms:g}ms for one slow user)\n")
+    print(f"{'max concurrent':>14} {'msg/s':>10} {'others done':>12} {'all done':>10} {'out of order':>12}")
+
+    other_messages = len(load) - args.messages
+    for max_concurrent in args.max_concurrent:
+        elapsed, others_done, out_of_order = asyncio.run(run_load(max_concurrent, load, latency, slow_latency))
+        label = max_concurrent or 'none'
+        print(f"{label:>14} {other_messages / others_done:>10.0f} {others_done * 1000:>10.0f}ms "
+              f"{elapsed * 1000:>8.0f}ms {out_of_order:>12}")
+
+if __name__ == "__main__":
+    main()
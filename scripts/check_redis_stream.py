@@ -4,15 +4,19 @@ Utility script to check Redis Stream for Township Connect.
 
 This script connects to the Redis instance and reads messages from the
 'incoming_whatsapp_messages' stream. It can be used to verify that messages
-are being published to the stream correctly.
+are being published to the stream correctly. With --archive it reads the
+messages that the stream archiver moved to local files instead.
 
 Usage:
     python check_redis_stream.py [--count N] [--block MS] [--clear]
+    python check_redis_stream.py --archive [YYYY-MM-DD] [--archive-dir DIR] [--count N]
 
 Options:
-    --count N    Number of messages to read (default: 10)
-    --block MS   Block for MS milliseconds if no messages (default: 1000)
-    --clear      Clear the stream after reading (default: False)
+    --count N          Number of messages to read (default: 10)
+    --block MS         Block for MS milliseconds if no messages (default: 1000)
+    --clear            Clear the stream after reading (default: False)
+    --archive [DATE]   Read archived messages for DATE, or list the archived dates
+    --archive-dir DIR  Archive directory (default: STREAM_ARCHIVE_DIR)
 """
 
 import os
@@ -23,12 +27,19 @@ import redis
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple
 
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.stream_archive import archive_dates, read_archive
+
 def setup_argparse() -> argparse.Namespace:
     """Set up command line argument parsing."""
     parser = argparse.ArgumentParser(description='Check Redis Stream for Township Connect')
     parser.add_argument('--count', type=int, default=10, help='Number of messages to read (default: 10)')
     parser.add_argument('--block', type=int, default=1000, help='Block for MS milliseconds if no messages (default: 1000)')
     parser.add_argument('--clear', action='store_true', help='Clear the stream after reading')
+    parser.add_argument('--archive', nargs='?', const='', default=None, metavar='DATE', help='Read archived messages for DATE (YYYY-MM-DD), or list the archived dates')
+    parser.add_argument('--archive-dir', default=os.getenv('STREAM_ARCHIVE_DIR'), help='Archive directory (default: STREAM_ARCHIVE_DIR)')
     return parser.parse_args()
 
 def get_redis_client() -> Optional[redis.Redis]:
@@ -187,10 +198,44 @@ def format_message(message_id: bytes, message_data: Dict[bytes, bytes]) -> str:
     
     return f"Message ID: {id_str}\nTimestamp: {timestamp}\nData:\n{formatted_data}\n"
 
+def read_archived_messages(archive_dir: str, stream_name: str, date: str, count: int) -> List[Tuple[bytes, Dict[bytes, bytes]]]:
+    """
+    Read the last messages archived for a date.
+    
+    Args:
+        archive_dir: Directory the stream archiver writes to
+        stream_name: Name of the archived stream
+        date: The date as YYYY-MM-DD
+        count: Maximum number of messages to read
+        
+    Returns:
+        List of (message_id, message_data) tuples, most recent first
+    """
+    entries = list(read_archive(archive_dir, stream_name, date))
+    print(f"Archive for {date} has {len(entries)} messages.")
+    return [
+        (entry_id.encode('utf-8'), {k.encode('utf-8'): v.encode('utf-8') for k, v in fields.items()})
+        for entry_id, fields in reversed(entries[-count:])
+    ]
+
 def main():
     """Main function."""
     args = setup_argparse()
     
+    if args.archive is not None:
+        if not args.archive_dir:
+            print("Error: Set --archive-dir or STREAM_ARCHIVE_DIR.")
+            sys.exit(1)
+        if not args.archive:
+            dates = archive_dates(args.archive_dir, 'incoming_whatsapp_messages')
+            print("Archived dates: " + (", ".join(dates) if dates else "none"))
+            return
+        messages = read_archived_messages(args.archive_dir, 'incoming_whatsapp_messages', args.archive, args.count)
+        for i, (message_id, message_data) in enumerate(messages, 1):
+            print(f"\n[{i}/{len(messages)}]")
+            print(format_message(message_id, message_data))
+        return
+    
     # Get Redis client
     client = get_redis_client()
     if not client:
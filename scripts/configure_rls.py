@@ -15,7 +15,8 @@ from pathlib import Path
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.db.supabase_client import get_client, execute_sql
+from src.db.client_registry import get_client_registry
+from src.db.supabase_client import execute_sql
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -184,6 +185,9 @@ def main():
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         return 1
+    finally:
+        # Every execute_sql call above reused the same clients; close their connections
+        get_client_registry().reset()
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Run the outbound reply sender for Township Connect.
+
+This script reads the replies the stream workers write to 'outgoing_whatsapp_replies'
+through the 'reply-senders' consumer group and sends them with the Twilio Messages
+API, at most OUTBOUND_RATE_PER_SECOND messages per second per sending number.
+Replies Twilio keeps refusing are copied to 'outgoing_whatsapp_replies:failed'.
+
+Set TWILIO_API_BASE_URL to a local stub (python -m tests.twilio_stub) to load test
+without sending real messages.
+
+Usage:
+    python scripts/run_reply_sender.py
+"""
+
+import logging
+import os
+import signal
+import sys
+import threading
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import core_handler
+from src.logging_utils import configure_logging
+from src.outbound_sender import OutboundSender, ReplyStreamSender
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sender statistics log lines
+STATS_INTERVAL_SECONDS = 60
+
+def main():
+    """Main function."""
+    configure_logging()
+
+    if core_handler.redis_client is None:
+        print("Error: Redis is not configured. Set UPSTASH_REDIS_* or REDIS_URL.")
+        sys.exit(1)
+
+    sender = OutboundSender.from_env()
+    if sender is None:
+        print("Error: Twilio is not configured. Set TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN and TWILIO_WHATSAPP_FROM.")
+        sys.exit(1)
+
+    stream_sender = ReplyStreamSender(core_handler.redis_client, sender)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    sender.start()
+    reader = threading.Thread(target=stream_sender.run, args=(stop,), name="reply-stream-reader", daemon=True)
+    reader.start()
+    while not stop.wait(STATS_INTERVAL_SECONDS):
+        logger.info(f"Reply sender stats: {sender.stats}, queued: {sender.queue_size()}")
+
+    logger.info("Stopping reply sender")
+    reader.join(10)
+    sender.stop()
+    sender.client.close()
+    logger.info(f"Reply sender stats: {sender.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Run message stream workers for Township Connect.
+
+This script starts a pool of workers that consume the 'incoming_whatsapp_messages'
+stream through the 'message-workers' consumer group, answer the messages enqueued by
+the /api/whatsapp/enqueue webhook and write the replies to 'outgoing_whatsapp_replies'.
+Run it on as many machines as needed; every process joins the same consumer group.
+
+Usage:
+    python scripts/run_stream_workers.py [--workers N]
+
+Options:
+    --workers N   Number of worker threads (default: STREAM_WORKER_COUNT or 4)
+"""
+
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import core_handler
+from src.bundle_catalog import BundleCatalog
+from src.db import log_writer, user_cache
+from src.logging_utils import configure_logging
+from src.message_dedup import MessageDedup
+from src.stream_worker import StreamWorkerPool
+from src.template_store import TemplateStore
+
+logger = logging.getLogger(__name__)
+
+# Seconds between worker statistics log lines
+STATS_INTERVAL_SECONDS = 60
+
+def setup_argparse() -> argparse.Namespace:
+    """Set up command line argument parsing."""
+    parser = argparse.ArgumentParser(description='Run message stream workers for Township Connect')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker threads (default: STREAM_WORKER_COUNT or 4)')
+    return parser.parse_args()
+
+def handle_queued_message(message_data_json_string: str) -> str:
+    """
+    Handle a message read from the stream, without publishing it again.
+
+    Failures are raised rather than answered with the generic error reply, so the
+    worker leaves the entry pending to be retried and, eventually, dead-lettered.
+    """
+    return core_handler.process_incoming_message(message_data_json_string, publish=False)
+
+def setup_message_core() -> None:
+    """Load the same caches and writers as the web service does on startup."""
+    status = core_handler.warm_up_clients()
+    logger.info(f"Message core clients warmed up: {status}")
+
+    store = TemplateStore.from_env(core_handler.TEMPLATE_DIR, core_handler.CONTENT_DIR)
+    store.load()
+    core_handler.template_store = store
+
+    core_handler.message_dedup = MessageDedup.from_env(core_handler.redis_client)
+
+    if core_handler.supabase_client is not None:
+        user_cache.install_user_cache(core_handler.redis_client)
+        catalog = BundleCatalog.from_env(core_handler.supabase_client, core_handler.generate_bundle_selection_prompt)
+        catalog.load()
+        core_handler.bundle_catalog = catalog
+        log_writer.install_log_writer(core_handler.supabase_client)
+
+def main():
+    """Main function."""
+    args = setup_argparse()
+    configure_logging()
+
+    if core_handler.redis_client is None:
+        print("Error: Redis is not configured. Set UPSTASH_REDIS_* or REDIS_URL.")
+        sys.exit(1)
+
+    setup_message_core()
+
+    pool = StreamWorkerPool.from_env(
+        core_handler.redis_client, handle_queued_message,
+        workers=args.workers, release=core_handler.release_queued_message
+    )
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    pool.start()
+    while not stop.wait(STATS_INTERVAL_SECONDS):
+        logger.info(f"Stream worker stats: {pool.stats()}")
+
+    logger.info("Stopping stream workers")
+    pool.stop()
+    log_writer.uninstall_log_writer()
+    user_cache.uninstall_user_cache()
+    logger.info(f"Stream worker stats: {pool.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Admission Control Module for Township Connect WhatsApp Assistant.
+
+This module tells the webhook when the service is falling behind. AdmissionController
+tracks how many messages this process is handling and, in a background thread, how
+many queued messages the live stream workers have not answered yet. Above either
+threshold a message is shed: it is queued for the stream workers, which answer it (and
+write its logs, activity timestamp and stream copy) once they get to it, and the sender
+gets a short localized "busy, we'll reply shortly" reply straight away instead of a
+timeout.
+"""
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from src.stream_worker import CONSUMER_GROUP, QUEUED_COUNT_KEY, STREAM_NAME
+
+logger = logging.getLogger(__name__)
+
+class AdmissionController:
+    """
+    Decides whether a message is handled now or queued for the stream workers.
+
+    The in-flight count covers every message between track() and its reply, including
+    messages waiting for their sender. The lag is the number of queued messages the
+    workers have not answered yet: the counter kept by enqueue_message and the workers,
+    capped by the unread and pending entries of the consumer group, so the inline
+    webhook's stream copies (which the workers skip) are not counted. It is refreshed
+    every check_interval_seconds, so a check costs no Redis command.
+
+    Nothing is shed unless a consumer of the group is live (has been active within
+    consumer_idle_ms), since no worker would answer a shed message; entries nobody is
+    reading are logged instead.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        max_in_flight: int = 200,
+        max_lag: int = 1000,
+        check_interval_seconds: float = 1.0,
+        consumer_idle_ms: int = 30000,
+        stream: str = STREAM_NAME,
+        group: str = CONSUMER_GROUP
+    ):
+        """
+        Initialize the controller. The lag is not read until start() or refresh_lag().
+
+        Args:
+            redis_client: A Redis client, or None to never shed
+            max_in_flight: Messages in progress above which new ones are shed, 0 for no limit (default: 200)
+            max_lag: Unanswered queued messages above which new ones are shed, 0 for no limit (default: 1000)
+            check_interval_seconds: Time between lag reads (default: 1)
+            consumer_idle_ms: Idle time after which a consumer no longer counts as live (default: 30000)
+            stream: The stream the workers consume (default: 'incoming_whatsapp_messages')
+            group: The workers' consumer group (default: 'message-workers')
+        """
+        self.redis_client = redis_client
+        self.max_in_flight = max_in_flight
+        self.max_lag = max_lag
+        self.check_interval = check_interval_seconds
+        self.consumer_idle_ms = consumer_idle_ms
+        self.stream = stream
+        self.group = group
+
+        self.in_flight = 0
+        self.lag: Optional[int] = None
+        self.live_consumers = 0
+
+        self._reported_no_consumers = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {"admitted": 0, "shed": 0, "lag_errors": 0}
+
+    @classmethod
+    def from_env(cls, redis_client) -> Optional["AdmissionController"]:
+        """
+        Create a controller configured from environment variables.
+
+        Reads ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_LAG, ADMISSION_CHECK_INTERVAL_SECONDS
+        and ADMISSION_CONSUMER_IDLE_MS, falling back to the defaults.
+
+        Args:
+            redis_client: A Redis client, or None when Redis is not configured
+
+        Returns:
+            An AdmissionController instance (not started), or None if both limits are 0
+        """
+        max_in_flight = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "200"))
+        max_lag = int(os.getenv("ADMISSION_MAX_LAG", "1000"))
+        if max_in_flight <= 0 and max_lag <= 0:
+            return None
+        return cls(
+            redis_client,
+            max_in_flight=max_in_flight,
+            max_lag=max_lag,
+            check_interval_seconds=float(os.getenv("ADMISSION_CHECK_INTERVAL_SECONDS", "1")),
+            consumer_idle_ms=int(os.getenv("ADMISSION_CONSUMER_IDLE_MS", "30000"))
+        )
+
+    def start(self) -> None:
+        """Read the lag once, then start the background thread that keeps it current."""
+        if self._thread and self._thread.is_alive():
+            return
+        self.refresh_lag()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="admission-lag", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """
+        Stop the background thread.
+
+        Args:
+            timeout: Maximum number of seconds to wait for the thread (default: 5)
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def refresh_lag(self) -> Optional[int]:
+        """
+        Read how many queued messages the live workers have not answered yet.
+
+        Returns:
+            The lag, or None if no consumer of the group is live or it could not be read
+        """
+        if self.redis_client is None:
+            return None
+        try:
+            group = next(
+                (group for group in self.redis_client.xinfo_groups(self.stream) if _to_str(group.get("name")) == self.group),
+                None
+            )
+            consumers = self.redis_client.xinfo_consumers(self.stream, self.group) if group else []
+            queued = int(self.redis_client.get(QUEUED_COUNT_KEY) or 0)
+        except Exception as e:
+            # The stream does not exist yet, or Redis is unavailable
+            self.stats["lag_errors"] += 1
+            logger.debug("Could not read consumer lag of '%s': %s", self.stream, e)
+            self.lag, self.live_consumers = None, 0
+            return None
+
+        if group is not None and group.get("lag") is not None:
+            # Queued entries are either unread or pending; a counter that drifted up
+            # (e.g. entries trimmed before a worker read them) is capped by both
+            queued = min(queued, int(group["lag"]) + int(group.get("pending", 0)))
+        queued = max(queued, 0)
+
+        live_consumers = sum(1 for consumer in consumers if int(consumer.get("idle", 0)) < self.consumer_idle_ms)
+        if queued and not live_consumers:
+            # Logged once per outage rather than every interval
+            if not self._reported_no_consumers:
+                logger.warning("%s queued messages on '%s' but no live consumer in group '%s'", queued, self.stream, self.group)
+            self._reported_no_consumers = True
+        else:
+            self._reported_no_consumers = False
+
+        self.live_consumers = live_consumers
+        self.lag = queued if live_consumers else None
+        return self.lag
+
+    def overload_reason(self) -> Optional[str]:
+        """
+        Check whether a new message should be shed.
+
+        Returns:
+            Why the service is overloaded, or None if the message should be handled now
+        """
+        if not self.live_consumers:
+            return None
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return f"{self.in_flight} messages in flight"
+        lag = self.lag
+        if self.max_lag and lag is not None and lag >= self.max_lag:
+            return f"{lag} queued messages for {self.live_consumers} live workers"
+        return None
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """Count the message handled inside the block as in flight."""
+        with self._lock:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _run(self) -> None:
+        """Background loop: read the lag every interval."""
+        while not self._stop.wait(self.check_interval):
+            self.refresh_lag()
+
+def _to_str(value: Any) -> Any:
+    """Decode a Redis reply value."""
+    return value.decode("utf-8") if isinstance(value, bytes) else value
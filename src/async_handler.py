@@ -0,0 +1,211 @@
+"""
+Async Message Pipeline Module for Township Connect WhatsApp Assistant.
+
+This module provides an asyncio variant of core_handler.handle_incoming_message for
+long-running services. Only the user lookup stays on the critical path: the Redis
+commands are sent in one pipeline with the reply (see src.redis_batch), and the
+remaining writes either share the user lookup's request or run in the background
+while (or after) the reply is produced.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from src import core_handler, json_codec
+from src.json_codec import JsonText
+from src.logging_utils import HOT_PATH, message_logging, payload
+from src.message_context import MessageContext
+from src.redis_batch import RedisBatch
+
+logger = logging.getLogger(__name__)
+
+# Installed by long-running services so that each sender's messages are processed in
+# order (see src.sender_scheduler); None processes every message straight away
+sender_scheduler = None
+
+# Installed by long-running services to shed messages to the stream workers when the
+# service falls behind (see src.admission_control); None handles every message here
+admission_controller = None
+
+# Strong references to in-flight background writes so they are not garbage collected
+_background_tasks: Set[asyncio.Task] = set()
+
+def run_in_background(func: Callable[..., Any], *args: Any) -> asyncio.Task:
+    """
+    Run a blocking call in a worker thread without waiting for it.
+
+    Args:
+        func: The blocking function to run
+        *args: Positional arguments for the function
+
+    Returns:
+        The task running the call
+    """
+    task = asyncio.get_running_loop().create_task(asyncio.to_thread(func, *args))
+    _background_tasks.add(task)
+    task.add_done_callback(_finish_background_task)
+    return task
+
+def _finish_background_task(task: asyncio.Task) -> None:
+    """
+    Forget a finished background task and report its failure, if any.
+
+    Args:
+        task: The finished task
+    """
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background write failed: {str(task.exception())}")
+
+async def drain_background_tasks(timeout: Optional[float] = None) -> None:
+    """
+    Wait for pending background writes, e.g. before shutting down.
+
+    Args:
+        timeout: Maximum number of seconds to wait (default: wait for all of them)
+    """
+    if _background_tasks:
+        await asyncio.wait(set(_background_tasks), timeout=timeout)
+
+async def handle_incoming_message_async(message_data_json_string: JsonText) -> str:
+    """
+    Process an incoming WhatsApp message, in order with the sender's earlier messages.
+
+    If an admission controller is installed and the service is overloaded, the message
+    is queued for the stream workers and a busy reply is returned at once (see
+    core_handler.shed_message). Otherwise,
+    if a sender scheduler is installed, the message waits for the sender's earlier
+    messages to finish; without one it is processed straight away.
+
+    Args:
+        message_data_json_string: A JSON string (or its UTF-8 bytes, e.g. a webhook body)
+                                  containing the incoming message data, in direct
+                                  (Twilio webhook) or n8n format
+
+    Returns:
+        A JSON string containing the response data
+    """
+    controller = admission_controller
+    if controller is None:
+        return await schedule_message_async(message_data_json_string)
+
+    reason = controller.overload_reason()
+    if reason is not None:
+        # The busy reply's language may come from the Redis tier of the user cache
+        busy_reply = await asyncio.to_thread(core_handler.shed_message, message_data_json_string, reason)
+        if busy_reply is not None:
+            controller.stats["shed"] += 1
+            return busy_reply
+
+    with controller.track():
+        return await schedule_message_async(message_data_json_string)
+
+async def schedule_message_async(message_data_json_string: JsonText) -> str:
+    """
+    Process a message through the sender scheduler, if one is installed.
+
+    Args:
+        message_data_json_string: A JSON string (or its UTF-8 bytes) containing the incoming message data
+
+    Returns:
+        A JSON string containing the response data
+    """
+    scheduler = sender_scheduler
+    if scheduler is None:
+        return await process_message_async(message_data_json_string)
+    return await scheduler.submit(
+        sender_key(message_data_json_string), process_message_async, message_data_json_string
+    )
+
+def sender_key(message_data_json_string: JsonText) -> str:
+    """
+    Get the sender ID a message is scheduled by.
+
+    Args:
+        message_data_json_string: A JSON string (or its UTF-8 bytes) containing the incoming message data
+
+    Returns:
+        The sender ID, or '' for payloads without one (e.g. invalid JSON)
+    """
+    try:
+        message_data = json_codec.loads(message_data_json_string)
+        if core_handler.is_n8n_format_message(message_data):
+            return str(message_data['message'].get('from', ''))
+        return str(message_data.get('From', ''))
+    except (ValueError, AttributeError):
+        return ''
+
+async def process_message_async(message_data_json_string: JsonText) -> str:
+    """
+    Process an incoming WhatsApp message with concurrent I/O stages.
+
+    Produces the same reply as core_handler.handle_incoming_message. The differences
+    are in scheduling: the Redis commands, stream publish included, share one pipeline; the
+    user lookup, activity update and inbound log share one request (see
+    core_handler.record_inbound_message); and outbound logs are written after the reply has been built.
+
+    Args:
+        message_data_json_string: A JSON string (or its UTF-8 bytes, e.g. a webhook body)
+                                  containing the incoming message data, in direct
+                                  (Twilio webhook) or n8n format
+
+    Returns:
+        A JSON string containing the response data
+    """
+    try:
+        message_data = json_codec.loads(message_data_json_string)
+        ctx = core_handler.build_message_context(message_data)
+
+        # Log lines carry a hash of the sender and the MessageSid rather than the phone number
+        with message_logging(ctx.sender_id, ctx.message_sid):
+            logger.info("Received message: %s", payload(ctx.text), extra=HOT_PATH)
+
+            # Redis commands of this message (including the stream publish) are sent in one
+            # pipeline once the reply is ready
+            redis_client = core_handler.redis_client
+            batch = RedisBatch(redis_client) if redis_client else None
+            token = batch.activate() if batch else None
+            try:
+                # Twilio retries slow webhooks; repeated deliveries are marked as duplicates
+                # (claiming may wait for the first delivery, so it runs in a thread)
+                duplicate_reply = None
+                if core_handler.message_dedup is not None and ctx.message_sid:
+                    duplicate_reply = await asyncio.to_thread(core_handler.claim_message, ctx)
+                if duplicate_reply is not None:
+                    return duplicate_reply
+
+                try:
+                    # Only queues the XADD in the batch, so it does not need a thread
+                    core_handler.publish_to_redis_stream(message_data_json_string)
+
+                    # The inbound writes finish before routing, so a /delete confirm never
+                    # races with them
+                    if core_handler.supabase_client:
+                        await asyncio.to_thread(core_handler.record_inbound_message, ctx)
+
+                    # Outbound logs are collected while routing and written once the reply is ready
+                    deferred_logs: List[Tuple[Any, ...]] = []
+                    reply = await asyncio.to_thread(
+                        core_handler.route_message,
+                        ctx,
+                        lambda *args: deferred_logs.append(args)
+                    )
+
+                    for log_args in deferred_logs:
+                        run_in_background(core_handler.log_message, *log_args)
+                except Exception:
+                    core_handler.release_message(ctx)
+                    raise
+                core_handler.complete_message(ctx)
+                return reply
+            finally:
+                if batch:
+                    batch.deactivate(token)
+                    await asyncio.to_thread(batch.close)
+    except Exception as e:
+        logger.error(f"Error processing message: {str(e)}")
+        return json_codec.dumps_str({
+            'reply_to': 'unknown',
+            'reply_text': core_handler.ERROR_REPLY_TEXT
+        })
@@ -0,0 +1,217 @@
+"""
+Bundle Catalog Module for Township Connect WhatsApp Assistant.
+
+This module provides an in-memory catalog of the active service bundles for
+long-running services. Bundles are kept in a stable order, so a bundle number always
+maps to the same bundle, and the bundle selection prompt is rendered once per
+language when the catalog is loaded instead of on every message.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.db.user_record import BUNDLE_COLUMNS, BUNDLE_ORDER, select_list
+
+logger = logging.getLogger(__name__)
+
+# Languages the bundle selection prompt is pre-rendered for
+PROMPT_LANGUAGES = ("en", "xh", "af")
+
+class _Snapshot:
+    """An immutable view of the catalog, swapped in whole on every reload."""
+
+    __slots__ = ("bundles", "by_id", "prompts", "version", "checked_at")
+
+    def __init__(
+        self,
+        bundles: Tuple[Dict[str, Any], ...],
+        prompts: Dict[str, str],
+        version: Tuple[Tuple[Any, Any], ...]
+    ):
+        self.bundles = bundles
+        self.by_id = {bundle.get("bundle_id"): bundle for bundle in bundles}
+        self.prompts = prompts
+        self.version = version
+        self.checked_at = time.monotonic()
+
+class BundleCatalog:
+    """
+    In-memory catalog of active service bundles with pre-rendered selection prompts.
+
+    Reads never wait for the database once the catalog has been loaded. When the
+    catalog is older than refresh_interval_seconds, the next read still returns it
+    but starts a background check of the bundles' updated_at values (stale-while-
+    revalidate). The full table is only read again, and the prompts only re-rendered,
+    when that check shows that a bundle was added, changed, deactivated or removed.
+    """
+
+    def __init__(
+        self,
+        client,
+        render_prompt: Callable[[List[Dict[str, Any]], str], str],
+        refresh_interval_seconds: float = 60
+    ):
+        """
+        Initialize the catalog. Nothing is loaded until load() or the first read.
+
+        Args:
+            client: A Supabase client instance
+            render_prompt: Function that renders the selection prompt for a list of
+                           bundles and a language (core_handler.generate_bundle_selection_prompt)
+            refresh_interval_seconds: How old the catalog may get before it is revalidated (default: 60)
+        """
+        self.client = client
+        self.render_prompt = render_prompt
+        self.refresh_interval = refresh_interval_seconds
+
+        self._snapshot: Optional[_Snapshot] = None
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+
+        self.stats = {"loads": 0, "revalidations": 0, "load_errors": 0}
+
+    @classmethod
+    def from_env(cls, client, render_prompt: Callable[[List[Dict[str, Any]], str], str]) -> "BundleCatalog":
+        """
+        Create a catalog configured from the BUNDLE_CATALOG_REFRESH_SECONDS environment variable.
+
+        Args:
+            client: A Supabase client instance
+            render_prompt: Function that renders the selection prompt for a list of bundles and a language
+
+        Returns:
+            A BundleCatalog instance (not loaded)
+        """
+        return cls(
+            client,
+            render_prompt,
+            refresh_interval_seconds=float(os.getenv("BUNDLE_CATALOG_REFRESH_SECONDS", "60"))
+        )
+
+    def load(self) -> bool:
+        """
+        Read the active bundles and render their prompts.
+
+        Returns:
+            True if the catalog was loaded, False if the query failed (the previous
+            catalog, if any, stays in use)
+        """
+        with self._load_lock:
+            try:
+                query = self.client.table("service_bundles").select(select_list(BUNDLE_COLUMNS)).eq("active", True)
+                for column in BUNDLE_ORDER:
+                    query = query.order(column)
+                result = query.execute()
+                bundles = tuple(_response_data(result))
+            except Exception as e:
+                self.stats["load_errors"] += 1
+                logger.error(f"Error loading bundle catalog: {str(e)}")
+                if self._snapshot is None:
+                    self._snapshot = _Snapshot((), {}, ())
+                return False
+
+            prompts = {}
+            if bundles:
+                for language in PROMPT_LANGUAGES:
+                    prompts[language] = self.render_prompt(list(bundles), language)
+
+            self._snapshot = _Snapshot(bundles, prompts, _version_of(bundles))
+            self.stats["loads"] += 1
+            logger.info(f"Loaded bundle catalog with {len(bundles)} active bundles")
+            return True
+
+    def bundles(self) -> List[Dict[str, Any]]:
+        """
+        Get the active bundles in display order.
+
+        Returns:
+            The active bundles; position i holds bundle number i + 1
+        """
+        return list(self._current().bundles)
+
+    def bundle_by_number(self, bundle_number: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a bundle by the number shown in the selection prompt.
+
+        Args:
+            bundle_number: The 1-based bundle number
+
+        Returns:
+            The bundle data, or None if the number is out of range
+        """
+        bundles = self._current().bundles
+        if 1 <= bundle_number <= len(bundles):
+            return bundles[bundle_number - 1]
+        return None
+
+    def bundle_by_id(self, bundle_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get an active bundle by its ID.
+
+        Args:
+            bundle_id: The ID of the bundle
+
+        Returns:
+            The bundle data, or None if there is no active bundle with that ID
+        """
+        return self._current().by_id.get(bundle_id)
+
+    def prompt(self, language: str = 'en') -> str:
+        """
+        Get the bundle selection prompt.
+
+        Args:
+            language: The user's preferred language
+
+        Returns:
+            The rendered prompt (rendered on demand for languages that are not pre-rendered)
+        """
+        snapshot = self._current()
+        if language in snapshot.prompts:
+            return snapshot.prompts[language]
+        return self.render_prompt(list(snapshot.bundles), language)
+
+    def _current(self) -> _Snapshot:
+        """Get the current snapshot, loading it on first use and revalidating it when stale."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.load()
+            return self._snapshot
+
+        if time.monotonic() - snapshot.checked_at >= self.refresh_interval and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._revalidate, name="bundle-catalog-refresh", daemon=True).start()
+        return snapshot
+
+    def _revalidate(self) -> None:
+        """Reload the catalog if the bundles' updated_at values changed since the last load."""
+        try:
+            self.stats["revalidations"] += 1
+            result = self.client.table("service_bundles").select("bundle_id,updated_at") \
+                .eq("active", True).execute()
+            version = _version_of(_response_data(result))
+            snapshot = self._snapshot
+            if snapshot is not None and version == snapshot.version:
+                snapshot.checked_at = time.monotonic()
+            else:
+                self.load()
+        except Exception as e:
+            self.stats["load_errors"] += 1
+            logger.error(f"Error revalidating bundle catalog: {str(e)}")
+            # Try again after another interval rather than on every read
+            if self._snapshot is not None:
+                self._snapshot.checked_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+def _response_data(result: Any) -> List[Dict[str, Any]]:
+    """Get the rows from a Supabase response or a mock dict response."""
+    data = result.get("data") if isinstance(result, dict) else getattr(result, "data", None)
+    return data or []
+
+def _version_of(bundles) -> Tuple[Tuple[Any, Any], ...]:
+    """Identify a set of bundles by their IDs and updated_at values."""
+    return tuple(sorted((str(b.get("bundle_id")), str(b.get("updated_at"))) for b in bundles))
@@ -0,0 +1,195 @@
+"""
+Command Registry Module for Township Connect WhatsApp Assistant.
+
+This module provides a table-driven command router. Messages are matched to commands
+with dictionary lookups (on the whole message, then on its first word) instead of a
+chain of checks, so the cost of parsing a message does not grow with the number of
+registered commands.
+"""
+
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Parsed command: (command_type, parameters)
+ParsedCommand = Tuple[str, Dict[str, Any]]
+
+# Handler signature: (parameters, sender_id, language) -> reply text
+CommandHandler = Callable[[Dict[str, Any], str, str], str]
+
+# Argument parser signature: (arguments, message_text) -> parsed command, or None if the
+# arguments do not match and the message should be treated as if no command matched
+ArgumentParser = Callable[[str, str], Optional[ParsedCommand]]
+
+class Command:
+    """A command type and the handler that builds its reply."""
+
+    __slots__ = ("name", "handler", "description")
+
+    def __init__(self, name: str, handler: CommandHandler, description: str = ""):
+        """
+        Initialize the command.
+
+        Args:
+            name: The command type, e.g. 'bundle_list'
+            handler: Function that builds the reply for the command
+            description: Short description for help texts and logs
+        """
+        self.name = name
+        self.handler = handler
+        self.description = description
+
+    def handle(self, params: Dict[str, Any], sender_id: str, language: str) -> str:
+        """
+        Build the reply for the command.
+
+        Args:
+            params: The parsed command parameters
+            sender_id: The WhatsApp ID of the sender
+            language: The sender's preferred language
+
+        Returns:
+            The reply text
+        """
+        return self.handler(params, sender_id, language)
+
+class CommandRegistry:
+    """
+    Maps message texts to command types and command types to handlers.
+
+    Parsing tries, in order:
+        1. an exact match on the stripped message ('/delete', '1')
+        2. an exact match on the lowercased message, for case-insensitive keywords
+        3. for messages starting with '/', the lowercased first word ('/lang xh'),
+           whose argument parser may decline the arguments
+    and otherwise returns the default command. Each step is one dictionary lookup.
+    """
+
+    def __init__(self, default_command: str, default_param: str = "text"):
+        """
+        Initialize an empty registry.
+
+        Args:
+            default_command: Command type for messages that match no command (e.g. 'echo')
+            default_param: Parameter name the message text is passed in for the default command
+        """
+        self.default_command = default_command
+        self.default_param = default_param
+
+        self._exact: Dict[str, ParsedCommand] = {}
+        self._keywords: Dict[str, ParsedCommand] = {}
+        self._prefixes: Dict[str, ArgumentParser] = {}
+        self._commands: Dict[str, Command] = {}
+
+    def add_command(self, name: str, handler: CommandHandler, description: str = "") -> Command:
+        """
+        Register the handler for a command type.
+
+        Args:
+            name: The command type
+            handler: Function that builds the reply for the command
+            description: Short description of the command
+
+        Returns:
+            The registered Command
+        """
+        if name in self._commands:
+            raise ValueError(f"Command already registered: {name}")
+        command = Command(name, handler, description)
+        self._commands[name] = command
+        return command
+
+    def add_exact(self, text: str, command_type: str, params: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Route a message that is exactly the given text (case-sensitive).
+
+        Args:
+            text: The message text
+            command_type: The command type to route it to
+            params: The parameters to pass to the command
+        """
+        self._add_unique(self._exact, text, (command_type, params or {}))
+
+    def add_keyword(self, keyword: str, command_type: str, params: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Route a message that is the given keyword in any letter case.
+
+        Args:
+            keyword: The keyword
+            command_type: The command type to route it to
+            params: The parameters to pass to the command
+        """
+        self._add_unique(self._keywords, keyword.lower(), (command_type, params or {}))
+
+    def add_prefix(self, prefix: str, parser: ArgumentParser) -> None:
+        """
+        Route messages whose first word is the given slash command (case-insensitive).
+
+        Args:
+            prefix: The slash command, e.g. '/lang'
+            parser: Function that parses the rest of the message into a command
+        """
+        if not prefix.startswith('/') or ' ' in prefix:
+            raise ValueError(f"Prefix commands must be a single word starting with '/': {prefix}")
+        self._add_unique(self._prefixes, prefix.lower(), parser)
+
+    def parse(self, message_text: str) -> ParsedCommand:
+        """
+        Parse a message into a command type and its parameters.
+
+        Args:
+            message_text: The text message to parse
+
+        Returns:
+            A tuple containing (command_type, parameters). Parameter dicts are fresh
+            copies, so callers may modify them.
+        """
+        message_text = message_text.strip()
+
+        parsed = self._exact.get(message_text) or self._keywords.get(message_text.lower())
+        if parsed:
+            return parsed[0], dict(parsed[1])
+
+        if message_text.startswith('/'):
+            parts = message_text.split(' ', 1)
+            parser = self._prefixes.get(parts[0].lower())
+            if parser and len(parts) == 2:
+                parsed = parser(parts[1], message_text)
+                if parsed:
+                    return parsed
+
+        return self.default_command, {self.default_param: message_text}
+
+    def dispatch(self, command_type: str, params: Dict[str, Any], sender_id: str, language: str = 'en') -> str:
+        """
+        Build the reply for a parsed command.
+
+        Args:
+            command_type: The type of command
+            params: The parameters for the command
+            sender_id: The ID of the sender
+            language: The user's preferred language
+
+        Returns:
+            The reply text
+        """
+        command = self._commands.get(command_type)
+        if command is None:
+            return f"Unknown command: {command_type}"
+        return command.handle(params, sender_id, language)
+
+    def commands(self) -> Dict[str, Command]:
+        """
+        Get the registered commands.
+
+        Returns:
+            A dict of command type to Command
+        """
+        return dict(self._commands)
+
+    def _add_unique(self, table: Dict[str, Any], key: str, value: Any) -> None:
+        """Add a routing entry, refusing to silently replace an existing one."""
+        if key in table:
+            raise ValueError(f"Message text already routed: {key}")
+        table[key] = value
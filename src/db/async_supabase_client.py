@@ -0,0 +1,750 @@
+"""
+Async Supabase Client Module for Township Connect WhatsApp Assistant.
+
+This module provides async equivalents of the data access functions in
+src/db/supabase_client.py, so an async server can await them instead of running the
+synchronous functions on threads. They talk to Supabase's PostgREST API through one
+httpx.AsyncClient per process (and event loop), which keeps connections alive between
+requests, uses HTTP/2 when the h2 package is installed, and has explicit pool limits
+and timeouts (SUPABASE_HTTP_* variables). Each function takes the same arguments, with
+an AsyncSupabaseClient in place of the Supabase client, and returns the same shape as
+its synchronous counterpart; they share the user cache and the buffered log writer.
+An AsyncPostgresClient (src/db/asyncpg_client.py) can be passed instead to query
+Postgres directly.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import httpx
+from postgrest import APIResponse
+
+from src import json_codec
+from src.db import supabase_client
+from src.db.asyncpg_client import AsyncPostgresClient
+from src.db.client_registry import get_client_registry
+from src.db.user_record import BUNDLE_COLUMNS, BUNDLE_ORDER, MESSAGE_USER_COLUMNS, UserRecord, project, select_list
+from src.logging_utils import HOT_PATH
+
+logger = logging.getLogger(__name__)
+
+# Whether httpx can speak HTTP/2 (it needs the optional h2 package)
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+class AsyncSupabaseClient:
+    """
+    Minimal async client for Supabase's PostgREST API.
+
+    Requests share one connection pool. Every method returns a tuple of (data, error)
+    where error is the PostgREST error message, or None on success; network errors
+    and timeouts are raised as httpx exceptions.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry_seconds: float = 30.0,
+        timeout_seconds: float = 5.0,
+        http2: Optional[bool] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Initialize the client. Connections are opened on first use.
+
+        Args:
+            url: The Supabase project URL
+            key: The API key (anon or service key)
+            max_connections: Maximum open connections (default: 100)
+            max_keepalive_connections: Idle connections kept open (default: 20)
+            keepalive_expiry_seconds: Time an idle connection is kept open (default: 30)
+            timeout_seconds: Default timeout of a request (default: 5)
+            http2: Whether to use HTTP/2 (default: when the h2 package is installed)
+            transport: Transport to send requests with, e.g. httpx.MockTransport in tests
+        """
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry_seconds
+        )
+        self._http = httpx.AsyncClient(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            headers={
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json",
+            },
+            http2=self.http2,
+            limits=self.limits,
+            timeout=httpx.Timeout(timeout_seconds),
+            transport=transport
+        )
+
+        self.stats = {"requests": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls, service: bool = False) -> Optional["AsyncSupabaseClient"]:
+        """
+        Create a client configured from environment variables.
+
+        Reads SUPABASE_URL, SUPABASE_ANON_KEY (or SUPABASE_SERVICE_KEY),
+        SUPABASE_HTTP_MAX_CONNECTIONS, SUPABASE_HTTP_MAX_KEEPALIVE,
+        SUPABASE_HTTP_KEEPALIVE_EXPIRY_SECONDS, SUPABASE_HTTP_TIMEOUT_SECONDS and
+        SUPABASE_HTTP2 (HTTP/2 is only used when h2 is installed), falling back to the defaults.
+
+        Args:
+            service: Whether to use the service key, which bypasses RLS (default: False)
+
+        Returns:
+            An AsyncSupabaseClient instance, or None if Supabase is not configured
+        """
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_SERVICE_KEY" if service else "SUPABASE_ANON_KEY")
+        if not url or not key:
+            return None
+        return cls(
+            url,
+            key,
+            max_connections=int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry_seconds=float(os.getenv("SUPABASE_HTTP_KEEPALIVE_EXPIRY_SECONDS", "30")),
+            timeout_seconds=float(os.getenv("SUPABASE_HTTP_TIMEOUT_SECONDS", "5")),
+            http2=HTTP2_AVAILABLE and os.getenv("SUPABASE_HTTP2", "true").lower() in ("1", "true", "yes")
+        )
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        body: Any = None,
+        prefer: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Tuple[Any, Optional[str]]:
+        """
+        Send a request to PostgREST.
+
+        Args:
+            method: The HTTP method
+            path: The path below /rest/v1, e.g. '/users'
+            params: Query parameters (filters, select)
+            body: The JSON body, if any
+            prefer: The Prefer header, e.g. 'return=representation'
+            timeout: Timeout of this request in seconds (default: the client's timeout)
+
+        Returns:
+            A tuple of (decoded response body or None, error message or None)
+        """
+        headers = {"Prefer": prefer} if prefer else None
+        content = json_codec.dumps(body) if body is not None else None
+        request_timeout = httpx.Timeout(timeout) if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        self.stats["requests"] += 1
+        response = await self._http.request(
+            method, path, params=params, content=content, headers=headers, timeout=request_timeout
+        )
+        data = json_codec.loads(response.content) if response.content else None
+        if response.is_error:
+            self.stats["errors"] += 1
+            message = data.get("message") if isinstance(data, dict) else None
+            return None, message or f"HTTP {response.status_code}"
+        return data, None
+
+    async def select(
+        self,
+        table: str,
+        filters: Dict[str, str],
+        columns: str = "*",
+        timeout: Optional[float] = None,
+        order: Tuple[str, ...] = ()
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Select rows matching equality filters.
+
+        Args:
+            table: The table name
+            filters: Column values the rows must equal
+            columns: The columns to return (default: all)
+            timeout: Timeout of this request in seconds
+            order: Columns to sort the rows by, ascending (default: unordered)
+
+        Returns:
+            A tuple of (rows, error message or None)
+        """
+        params = {"select": columns, **_eq_filters(filters)}
+        if order:
+            params["order"] = ",".join(order)
+        rows, error = await self.request("GET", f"/{table}", params=params, timeout=timeout)
+        return rows or [], error
+
+    async def insert(
+        self,
+        table: str,
+        rows: Any,
+        returning: bool = True,
+        timeout: Optional[float] = None,
+        ignore_conflicts_on: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Insert one row (a dict) or several (a list of dicts).
+
+        Args:
+            table: The table name
+            rows: The row or rows to insert
+            returning: Whether to return the inserted rows (default: True)
+            timeout: Timeout of this request in seconds
+            ignore_conflicts_on: A unique column; rows conflicting on it are skipped
+                (ON CONFLICT DO NOTHING) and not returned
+
+        Returns:
+            A tuple of (inserted rows, or [] if not returning; error message or None)
+        """
+        prefer = "return=representation" if returning else "return=minimal"
+        params = None
+        if ignore_conflicts_on:
+            prefer += ",resolution=ignore-duplicates"
+            params = {"on_conflict": ignore_conflicts_on}
+        inserted, error = await self.request(
+            "POST", f"/{table}", params=params, body=rows, prefer=prefer, timeout=timeout
+        )
+        return inserted or [], error
+
+    async def update(
+        self,
+        table: str,
+        fields: Dict[str, Any],
+        filters: Dict[str, str],
+        timeout: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Update the rows matching equality filters.
+
+        Args:
+            table: The table name
+            fields: The columns to set
+            filters: Column values the rows must equal
+            timeout: Timeout of this request in seconds
+
+        Returns:
+            A tuple of (updated rows, error message or None)
+        """
+        updated, error = await self.request(
+            "PATCH", f"/{table}", params=_eq_filters(filters), body=fields,
+            prefer="return=representation", timeout=timeout
+        )
+        return updated or [], error
+
+    async def delete(
+        self,
+        table: str,
+        filters: Dict[str, str],
+        timeout: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Delete the rows matching equality filters.
+
+        Args:
+            table: The table name
+            filters: Column values the rows must equal
+            timeout: Timeout of this request in seconds
+
+        Returns:
+            A tuple of (deleted rows, error message or None)
+        """
+        deleted, error = await self.request(
+            "DELETE", f"/{table}", params=_eq_filters(filters),
+            prefer="return=representation", timeout=timeout
+        )
+        return deleted or [], error
+
+    async def rpc(
+        self,
+        function: str,
+        args: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Tuple[Any, Optional[str]]:
+        """
+        Call a database function.
+
+        Args:
+            function: The function name
+            args: The function's named arguments
+            timeout: Timeout of this request in seconds
+
+        Returns:
+            A tuple of (the function's result, error message or None)
+        """
+        return await self.request("POST", f"/rpc/{function}", body=args, timeout=timeout)
+
+    async def aclose(self) -> None:
+        """Close the pooled connections."""
+        await self._http.aclose()
+
+def _eq_filters(filters: Dict[str, str]) -> Dict[str, str]:
+    """Turn column values into PostgREST equality filters."""
+    return {column: f"eq.{value}" for column, value in filters.items()}
+
+# Client shared by the async functions, and the event loop it belongs to (httpx
+# connections cannot be used from another loop)
+_shared_client: Optional[Union[AsyncSupabaseClient, AsyncPostgresClient]] = None
+_shared_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_async_client() -> Optional[Union[AsyncSupabaseClient, AsyncPostgresClient]]:
+    """
+    Get the client shared by this process's running event loop, creating it if needed.
+
+    DATABASE_BACKEND selects the client: 'postgrest' (the default) for an
+    AsyncSupabaseClient, or 'asyncpg' for an AsyncPostgresClient connecting to
+    DATABASE_URL directly (see src/db/asyncpg_client.py).
+
+    Returns:
+        The shared client, or None if the selected backend is not configured
+    """
+    global _shared_client, _shared_loop
+    loop = asyncio.get_running_loop()
+    if _shared_client is None or _shared_loop is not loop:
+        if os.getenv("DATABASE_BACKEND", "postgrest").lower() == "asyncpg":
+            _shared_client = AsyncPostgresClient.from_env()
+        else:
+            _shared_client = AsyncSupabaseClient.from_env()
+        _shared_loop = loop
+    return _shared_client
+
+def _forget_shared_client() -> None:
+    """Drop the shared client without closing it (its connections may belong to another loop or process)."""
+    global _shared_client, _shared_loop
+    _shared_client = _shared_loop = None
+
+# A reset of the client registry, or a fork, also drops the shared async client
+get_client_registry().add_reset_hook(_forget_shared_client)
+
+async def close_async_client() -> None:
+    """Close the shared client, if this loop has one."""
+    global _shared_client, _shared_loop
+    client, loop = _shared_client, _shared_loop
+    _shared_client = _shared_loop = None
+    if client is not None and loop is asyncio.get_running_loop():
+        await client.aclose()
+
+async def _cache_call(method, *args):
+    """Call a user cache method, on a thread when the cache may talk to Redis."""
+    if getattr(method.__self__, "redis_client", None) is None:
+        return method(*args)
+    return await asyncio.to_thread(method, *args)
+
+async def _write_through_user(whatsapp_id: str, fields: Dict[str, Any], error: Optional[str]) -> None:
+    """Apply a successful user update to the user cache, or drop the user if it failed."""
+    user_cache = supabase_client.get_user_cache()
+    if not user_cache:
+        return
+    if error:
+        await _cache_call(user_cache.invalidate, whatsapp_id)
+    else:
+        await _cache_call(user_cache.update, whatsapp_id, fields)
+
+async def _invalidate_cached_user(whatsapp_id: str) -> None:
+    """Drop a user from the user cache, if one is installed."""
+    user_cache = supabase_client.get_user_cache()
+    if user_cache:
+        await _cache_call(user_cache.invalidate, whatsapp_id)
+
+async def log_message(
+    client: AsyncSupabaseClient,
+    user_whatsapp_id: str,
+    direction: str,
+    message_content: str,
+    data_size_kb: float = 0.1
+) -> Dict[str, Any]:
+    """
+    Log a message in the database.
+
+    Args:
+        client: An AsyncSupabaseClient instance
+        user_whatsapp_id: The WhatsApp ID of the user
+        direction: The direction of the message ('inbound' or 'outbound')
+        message_content: The content of the message
+        data_size_kb: The size of the message in KB (default: 0.1)
+
+    Returns:
+        The result of the database operation
+    """
+    logger.info("Logging %s message", direction, extra=HOT_PATH)
+
+    message_data = {
+        "user_whatsapp_id": user_whatsapp_id,
+        "direction": direction,
+        "message_content": message_content,
+        "timestamp": datetime.now().isoformat(),
+        "data_size_kb": data_size_kb
+    }
+
+    # Hand the row to the buffered writer when one is installed (enqueueing never blocks)
+    log_writer = supabase_client.get_log_writer()
+    if log_writer and log_writer.enqueue("message_logs", message_data):
+        return {"data": [message_data], "error": None}
+
+    try:
+        rows, error = await client.insert("message_logs", message_data)
+        return {"data": rows, "error": error}
+    except Exception as e:
+        logger.error(f"Exception during log_message: {str(e)}")
+        return {"data": [message_data], "error": str(e)}
+
+async def log_security_event(
+    client: AsyncSupabaseClient,
+    whatsapp_id: str,
+    event_type: str,
+    details: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    Log a security audit event.
+
+    Args:
+        client: An AsyncSupabaseClient instance
+        whatsapp_id: The WhatsApp ID of the user the event concerns
+        event_type: The type of event (e.g. 'DATA_DELETE_REQUESTED')
+        details: Additional event details (default: the current timestamp)
+
+    Raises:
+        Exception: If the row is inserted directly and the insert fails
+    """
+    security_log = {
+        "user_whatsapp_id": whatsapp_id,
+        "event_type": event_type,
+        "details": details or {"timestamp": datetime.now().isoformat()},
+        "timestamp": datetime.now().isoformat()
+    }
+
+    log_writer = supabase_client.get_log_writer()
+    if log_writer and log_writer.enqueue("security_logs", security_log):
+        return
+
+    _, error = await client.insert("security_logs", security_log, returning=False)
+    if error:
+        raise RuntimeError(f"Could not log security event: {error}")
+
+async def get_user(
+    client: AsyncSupabaseClient,
+    whatsapp_id: str,
+    columns: Tuple[str, ...] = MESSAGE_USER_COLUMNS
+) -> Optional[UserRecord]:
+    """
+    Get a user from the database.
+
+    Args:
+        client: An AsyncSupabaseClient instance
+        whatsapp_id: The WhatsApp ID of the user to get
+        columns: The users columns to read (default: MESSAGE_USER_COLUMNS, the only
+            projection answered from the user cache)
+
+    Returns:
+        The user record, or None if the user doesn't exist
+    """
+    user_cache = supabase_client.get_user_cache() if columns == MESSAGE_USER_COLUMNS else None
+    if user_cache:
+        cached_user = await _cache_call(user_cache.get, whatsapp_id)
+        if cached_user is not None:
+            logger.debug("Getting user from cache", extra=HOT_PATH)
+            return UserRecord.from_row(cached_user)
+
+    logger.info("Getting user", extra=HOT_PATH)
+
+    try:
+        rows, error = await client.select("users", {"whatsapp_id": whatsapp_id}, columns=select_list(columns))
+        if error:
+            logger.error(f"Error getting user: {error}")
+            return None
+        if rows:
+            row = project(rows[0], columns)
+            if user_cache:
+                await _cache_call(user_cache.set, whatsapp_id, row)
+            return UserRecord.from_row(row)
+        return None
+    except Exception as e:
+        logger.error(f"Error getting user: {str(e)}")
+        return None
+
+async def touch_user_and_log_inbound(
+    client: AsyncSupabaseClient,
+    whatsapp_id: str,
+    message_content: str,
+    data_size_kb: float = 0.1,
+    preferred_language: str = 'en'
+) -> Tuple[Optional[UserRecord], bool, Optional[str]]:
+    """
+    Create or touch a user and log their inbound message in a single request.
+
+    Args:
+        client: An AsyncSupabaseClient instance
+        whatsapp_id: The WhatsApp ID of the sender
+        message_content: The content of the inbound message
+        data_size_kb: The size of the message in KB (default: 0.1)
+        preferred_language: The language to store if the user is created (default: 'en')
+
+    Returns:
+        A tuple of (user, is_new_user, error) where user is the user record (None on error),
+        is_new_user tells whether the user was created by this call, and error is the
+        error message or None
+    """
+    logger.info("Touching user and logging inbound message", extra=HOT_PATH)
+
+    try:
+        data, error = await client.rpc("touch_user_and_log_inbound", {
+            "p_whatsapp_id": whatsapp_id,
+            "p_message_content": message_content,
+            "p_data_size_kb": data_size_kb,
+            "p_preferred_language": preferred_language
+        })
+        if error:
+            return None, False, error
+        if not isinstance(data, dict):
+            return None, False, f"Unexpected response from touch_user_and_log_inbound: {data!r}"
+
+        is_new_user = bool(data.get("is_new_user", False))
+        user = project(data, MESSAGE_USER_COLUMNS)
+        user_cache = supabase_client.get_user_cache()
+        if user_cache:
+            await _cache_call(user_cache.set, whatsapp_id, user)
+        return UserRecord.from_row(user), is_new_user, None
+    except Exception as e:
+        logger.error(f"Exception during touch_user_and_log_inbound: {str(e)}")
+        return None, False, str(e)
+
+async def create_user(
+    client: AsyncSupabaseClient,
+    whatsapp_id: str,
+    preferred_language: str = 'en',
+    popia_consent: bool = False
+) -> Dict[str, Any]:
+    """
+    Create a new user in the database.
+
+    Args:
+        client: An AsyncSupabaseClient instance
+        whatsapp_id: The WhatsApp ID of the user
+        preferred_language: The user's preferred language (default: 'en')
+        popia_consent: Whether the user has given POPIA consent (default: False)
+
+    Returns:
+        The result of the database operation
+    """
+    logger.info("Creating user with language %s", preferred_language)
+
+    user_data = {
+        "whatsapp_id": whatsapp_id,
+        "preferred_language": preferred_language,
+        "popia_consent_given": popia_consent,
+        "created_at": datetime.now().isoformat(),
+        "last_active_at": datetime.now().isoformat()
+    }
+
+    try:
+        rows, error = await client.insert("users", user_data)
+        user_cache = supabase_client.get_user_cache()
+        if user_cache and not error:
+            await _cache_call(user_cache.set, whatsapp_id, project(rows[0] if rows else user_data, MESSAGE_USER_COLUMNS))
+        return {"data": rows, "error": error}
+    except Exception as e:
+        logger.error(f"Exception during create_user: {str(e)}")
+        return {"data": [user_data], "error": str(e)}
+
+async def get_or_create_user(
+    client: AsyncSupabaseClient,
+    whatsapp_id: str,
+    preferred_language: str = 'en',
+    popia_consent: bool = False
+) -> Tuple[Optional[UserRecord], bool, Optional[str]]:
+    """
+    Create a user unless they exist, in a single atomic request.
+
+    Args:
+        client: An AsyncSupabaseClient instance
+        whatsapp_id: The WhatsApp ID of the user
+        preferred_language: The language to store if the user is created (default: 'en')
+        popia_consent: The POPIA consent to store if the user is created (default: False)
+
+    Returns:
+        A tuple of (user, is_new_user, error) where user is the user record (None on error),
+        is_new_user tells whether the user was created by this call, and error is the
+        error message or None
+    """
+    logger.info("Getting or creating user with language %s", preferred_language, extra=HOT_PATH)
+
+    now = datetime.now().isoformat()
+    user_data = {
+        "whatsapp_id": whatsapp_id,
+        "preferred_language": preferred_language,
+        "popia_consent_given": popia_consent,
+        "created_at": now,
+        "last_active_at": now
+    }
+
+    try:
+        rows, error = await client.insert("users", user_data, ignore_conflicts_on="whatsapp_id")
+        if error:
+            return None, False, error
+        if rows:
+            created = project(rows[0], MESSAGE_USER_COLUMNS)
+            user_cache = supabase_client.get_user_cache()
+            if user_cache:
+                await _cache_call(user_cache.set, whatsapp_id, created)
+            return UserRecord.from_row(created), True, None
+
+        # Nothing was inserted: the user already exists (e.g. created by a concurrent message)
+        existing = await get_user(client, whatsapp_id)
+        if existing is None:
+            return None, False, "User was neither created nor found"
+        return existing, False, None
+    except Exception as e:
+        logger.error(f"Exception during get_or_create_user: {str(e)}")
+        return None, False, str(e)
+
+async def _update_user(client: AsyncSupabaseClient, whatsapp_id: str, fields: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Update a user's fields and write them through to the user cache."""
+    try:
+        rows, error = await client.update("users", fields, {"whatsapp_id": whatsapp_id})
+    except Exception:
+        await _invalidate_cached_user(whatsapp_id)
+        raise
+    await _write_through_user(whatsapp_id, fields, error)
+    return rows, error
+
+async def update_user_language(client: AsyncSupabaseClient, whatsapp_id: str, language: str) -> Any:
+    """
+    Update a user's preferred language.
+
+    Args:
+        client: An AsyncSupabaseClient instance
+        whatsapp_id: The WhatsApp ID of the user to update
+        language: The new preferred language
+
+    Returns:
+        The result of the database operation
+    """
+    logger.info("Updating user language to %s", language)
+
+    if language not in ['en', 'xh', 'af']:
+        logger.error(f"Invalid language code: {language}")
+        return {"data": [], "error": f"Invalid language code: {language}"}
+
+    try:
+        rows, error = await _update_user(client, whatsapp_id, {
+            "preferred_language": language,
+            "last_active_at": datetime.now().isoformat()
+        })
+        if error:
+            return {"data": [], "error": error}
+        return APIResponse(data=rows, count=None)
+    except Exception as e:
+        logger.error(f"Error updating user language: {str(e)}")
+        return {"data": [], "error": str(e)}
+
+async def update_user_bundle(client: AsyncSupabaseClient, whatsapp_id: str, bundle_id: str) -> Any:
+    """
+    Update a user's selected service bundle.
+
+    Args:
+        client: An AsyncSupabaseClient instance
+        whatsapp_id: The WhatsApp ID of the user to update
+        bundle_id: The ID of the selected bundle
+
+    Returns:
+        The result of the database operation
+    """
+    logger.info("Updating user bundle to %s", bundle_id)
+
+    try:
+        rows, error = await _update_user(client, whatsapp_id, {
+            "current_bundle": bundle_id,
+            "last_active_at": datetime.now().isoformat()
+        })
+        if error:
+            return {"data": [], "error": error}
+        return APIResponse(data=rows, count=None)
+    except Exception as e:
+        logger.error(f"Error updating user bundle: {str(e)}")
+        return {"data": [], "error": str(e)}
+
+async def update_user_popia_consent(client: AsyncSupabaseClient, whatsapp_id: str, consent_given: bool) -> Dict[str, Any]:
+    """
+    Update a user's POPIA consent status.
+
+    Args:
+        client: An AsyncSupabaseClient instance
+        whatsapp_id: The WhatsApp ID of the user to update
+        consent_given: Whether the user has given POPIA consent
+
+    Returns:
+        The result of the database operation
+    """
+    logger.info("Updating POPIA consent to %s", consent_given)
+
+    try:
+        rows, error = await _update_user(client, whatsapp_id, {
+            "popia_consent_given": consent_given,
+            "last_active_at": datetime.now().isoformat()
+        })
+        return {"data": rows, "error": error}
+    except Exception as e:
+        logger.error(f"Exception during update_user_popia_consent: {str(e)}")
+        return {"data": [], "error": str(e)}
+
+async def delete_user_data(client: AsyncSupabaseClient, whatsapp_id: str) -> Any:
+    """
+    Delete all data for a user (POPIA compliance).
+
+    Args:
+        client: An AsyncSupabaseClient instance
+        whatsapp_id: The WhatsApp ID of the user whose data should be deleted
+
+    Returns:
+        The result of the database operation
+    """
+    logger.info("Deleting user data")
+
+    try:
+        supabase_client.discard_pending_logs(whatsapp_id)
+        await log_security_event(client, whatsapp_id, "DATA_DELETE_CONFIRMED")
+        _, error = await client.delete("message_logs", {"user_whatsapp_id": whatsapp_id})
+        if not error:
+            rows, error = await client.delete("users", {"whatsapp_id": whatsapp_id})
+        if error:
+            logger.error(f"Error deleting user data: {error}")
+            return {"data": [], "error": error}
+        return APIResponse(data=rows, count=None)
+    except Exception as e:
+        logger.error(f"Error deleting user data: {str(e)}")
+        return {"data": [], "error": str(e)}
+    finally:
+        # Dropped after the delete so a concurrent get_user cannot cache the row again
+        await _invalidate_cached_user(whatsapp_id)
+
+async def get_service_bundles(client: AsyncSupabaseClient) -> List[Dict[str, Any]]:
+    """
+    Get the active service bundles from the database, in the bundle catalog's order.
+
+    Args:
+        client: An AsyncSupabaseClient instance
+
+    Returns:
+        A list of service bundle data
+    """
+    logger.info("Getting service bundles")
+
+    try:
+        rows, error = await client.select(
+            "service_bundles", {"active": "true"}, columns=select_list(BUNDLE_COLUMNS), order=BUNDLE_ORDER
+        )
+        if error:
+            logger.error(f"Error getting service bundles: {error}")
+            return []
+        return rows
+    except Exception as e:
+        logger.error(f"Error getting service bundles: {str(e)}")
+        return []
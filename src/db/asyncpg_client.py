@@ -0,0 +1,371 @@
+"""
+Asyncpg Client Module for Township Connect WhatsApp Assistant.
+
+This module provides AsyncPostgresClient, a drop-in replacement for the
+AsyncSupabaseClient of src/db/async_supabase_client.py that talks to Postgres
+directly with asyncpg instead of going through PostgREST over HTTP. Statements are
+prepared once per pooled connection and reused, and rows come back in Postgres'
+binary format, so there is no HTTP framing or JSON encoding per query.
+
+Set DATABASE_BACKEND=asyncpg and DATABASE_URL to use it; the async data access
+functions then run against it unchanged. Only the tables of
+db_scripts/supabase_schema.sql and the functions below can be queried. Connections
+log in as the DATABASE_URL role, so row-level security applies as it would to that
+role, not as it does to the anon key. asyncpg is an optional dependency.
+"""
+
+import asyncio
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from src import json_codec
+
+try:
+    import asyncpg
+except ImportError:  # pragma: no cover - optional dependency
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+# Columns of the tables in db_scripts/supabase_schema.sql
+TABLES = {
+    "users": (
+        "whatsapp_id", "preferred_language", "current_bundle", "popia_consent_given",
+        "created_at", "last_active_at", "baileys_creds_encrypted",
+    ),
+    "service_bundles": (
+        "bundle_id", "bundle_name_en", "bundle_name_xh", "bundle_name_af", "description_en",
+        "description_xh", "description_af", "price_tier", "active", "created_at", "updated_at",
+    ),
+    "message_logs": (
+        "log_id", "user_whatsapp_id", "direction", "message_content", "timestamp", "data_size_kb",
+    ),
+    "security_logs": (
+        "event_id", "user_whatsapp_id", "event_type", "details", "timestamp",
+    ),
+}
+
+# TIMESTAMPTZ columns; the data access functions pass them as ISO 8601 strings
+TIMESTAMP_COLUMNS = frozenset({"created_at", "last_active_at", "updated_at", "timestamp"})
+
+# Database functions that can be called with rpc (see db_scripts/functions)
+FUNCTIONS = frozenset({"touch_user_and_log_inbound", "hard_delete_user_data", "get_user_count"})
+
+# Names allowed for function arguments, which are written into the statement
+ARGUMENT_NAME = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+# Errors reported by Postgres itself; the PostgREST client returns these as error
+# messages too, while connection errors and timeouts are raised
+POSTGRES_ERRORS = (asyncpg.PostgresError,) if asyncpg else ()
+
+class AsyncPostgresClient:
+    """
+    Async client for the Township Connect tables over a pool of asyncpg connections.
+
+    It has the same methods as AsyncSupabaseClient, each returning a tuple of
+    (data, error) where error is the Postgres error message, or None on success.
+    The pool is created on first use, in the event loop it is used from.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 2,
+        max_size: int = 20,
+        command_timeout_seconds: float = 5.0,
+        statement_cache_size: int = 100,
+        pool: Any = None
+    ):
+        """
+        Initialize the client. Connections are opened on first use.
+
+        Args:
+            dsn: The Postgres connection URL
+            min_size: Connections the pool keeps open (default: 2)
+            max_size: Maximum open connections (default: 20)
+            command_timeout_seconds: Default timeout of a query (default: 5)
+            statement_cache_size: Prepared statements kept per connection; 0 when
+                connecting through a transaction-mode pooler such as PgBouncer (default: 100)
+            pool: An already created pool to use instead, e.g. a fake one in tests
+        """
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.command_timeout = command_timeout_seconds
+        self.statement_cache_size = statement_cache_size
+        self._pool = pool
+        self._pool_lock = asyncio.Lock()
+
+        self.stats = {"requests": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["AsyncPostgresClient"]:
+        """
+        Create a client configured from environment variables.
+
+        Reads DATABASE_URL, POSTGRES_POOL_MIN_SIZE, POSTGRES_POOL_MAX_SIZE,
+        POSTGRES_COMMAND_TIMEOUT_SECONDS and POSTGRES_STATEMENT_CACHE_SIZE, falling
+        back to the defaults.
+
+        Returns:
+            An AsyncPostgresClient instance, or None if DATABASE_URL is not set or asyncpg is not installed
+        """
+        dsn = os.getenv("DATABASE_URL")
+        if not dsn:
+            return None
+        if asyncpg is None:
+            logger.error("DATABASE_BACKEND is asyncpg but asyncpg is not installed")
+            return None
+        return cls(
+            dsn,
+            min_size=int(os.getenv("POSTGRES_POOL_MIN_SIZE", "2")),
+            max_size=int(os.getenv("POSTGRES_POOL_MAX_SIZE", "20")),
+            command_timeout_seconds=float(os.getenv("POSTGRES_COMMAND_TIMEOUT_SECONDS", "5")),
+            statement_cache_size=int(os.getenv("POSTGRES_STATEMENT_CACHE_SIZE", "100"))
+        )
+
+    async def _get_pool(self) -> Any:
+        """Get the connection pool, creating it on first use."""
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await asyncpg.create_pool(
+                        self.dsn,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        command_timeout=self.command_timeout,
+                        statement_cache_size=self.statement_cache_size,
+                        init=_init_connection
+                    )
+        return self._pool
+
+    async def query(
+        self,
+        sql: str,
+        args: List[Any],
+        timeout: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Run a statement on a pooled connection, which prepares it once and reuses it.
+
+        Args:
+            sql: The statement, with $1, $2, ... placeholders
+            args: The placeholder values
+            timeout: Timeout of this query in seconds (default: the client's timeout)
+
+        Returns:
+            A tuple of (rows as dicts, error message or None)
+        """
+        pool = await self._get_pool()
+        self.stats["requests"] += 1
+        try:
+            records = await pool.fetch(sql, *args, timeout=timeout)
+        except POSTGRES_ERRORS as e:
+            self.stats["errors"] += 1
+            return [], str(e)
+        return [_row(record) for record in records], None
+
+    async def select(
+        self,
+        table: str,
+        filters: Dict[str, str],
+        columns: str = "*",
+        timeout: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Select rows matching equality filters.
+
+        Args:
+            table: The table name
+            filters: Column values the rows must equal
+            columns: The columns to return, comma-separated (default: all)
+            timeout: Timeout of this query in seconds
+
+        Returns:
+            A tuple of (rows, error message or None)
+        """
+        selected = "*" if columns == "*" else ", ".join(map(_quote, _columns(table, columns.split(","))))
+        where, args = _where(table, filters)
+        return await self.query(f"SELECT {selected} FROM {_table(table)}{where}", args, timeout)
+
+    async def insert(
+        self,
+        table: str,
+        rows: Any,
+        returning: bool = True,
+        timeout: Optional[float] = None,
+        ignore_conflicts_on: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Insert one row (a dict) or several (a list of dicts with the same columns).
+
+        Args:
+            table: The table name
+            rows: The row or rows to insert
+            returning: Whether to return the inserted rows (default: True)
+            timeout: Timeout of this query in seconds
+            ignore_conflicts_on: A unique column; rows conflicting on it are skipped
+                (ON CONFLICT DO NOTHING) and not returned
+
+        Returns:
+            A tuple of (inserted rows, or [] if not returning; error message or None)
+        """
+        rows = [rows] if isinstance(rows, dict) else list(rows)
+        if not rows:
+            return [], None
+        columns = _columns(table, rows[0])
+        placeholders = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+        sql = f"INSERT INTO {_table(table)} ({', '.join(map(_quote, columns))}) VALUES ({placeholders})"
+        if ignore_conflicts_on:
+            sql += f" ON CONFLICT ({_quote(_columns(table, [ignore_conflicts_on])[0])}) DO NOTHING"
+        values = [[_value(column, row.get(column)) for column in columns] for row in rows]
+
+        if returning:
+            inserted = []
+            for args in values:
+                added, error = await self.query(sql + " RETURNING *", args, timeout)
+                if error:
+                    return inserted, error
+                inserted.extend(added)
+            return inserted, None
+
+        pool = await self._get_pool()
+        self.stats["requests"] += 1
+        try:
+            await pool.executemany(sql, values, timeout=timeout)
+        except POSTGRES_ERRORS as e:
+            self.stats["errors"] += 1
+            return [], str(e)
+        return [], None
+
+    async def update(
+        self,
+        table: str,
+        fields: Dict[str, Any],
+        filters: Dict[str, str],
+        timeout: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Update the rows matching equality filters.
+
+        Args:
+            table: The table name
+            fields: The columns to set
+            filters: Column values the rows must equal
+            timeout: Timeout of this query in seconds
+
+        Returns:
+            A tuple of (updated rows, error message or None)
+        """
+        columns = _columns(table, fields)
+        assignments = ", ".join(f"{_quote(column)} = ${i}" for i, column in enumerate(columns, 1))
+        where, args = _where(table, filters, start=len(columns) + 1)
+        values = [_value(column, fields[column]) for column in columns]
+        return await self.query(
+            f"UPDATE {_table(table)} SET {assignments}{where} RETURNING *", values + args, timeout
+        )
+
+    async def delete(
+        self,
+        table: str,
+        filters: Dict[str, str],
+        timeout: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Delete the rows matching equality filters.
+
+        Args:
+            table: The table name
+            filters: Column values the rows must equal
+            timeout: Timeout of this query in seconds
+
+        Returns:
+            A tuple of (deleted rows, error message or None)
+        """
+        where, args = _where(table, filters)
+        return await self.query(f"DELETE FROM {_table(table)}{where} RETURNING *", args, timeout)
+
+    async def rpc(
+        self,
+        function: str,
+        args: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Tuple[Any, Optional[str]]:
+        """
+        Call a database function.
+
+        Args:
+            function: The function name
+            args: The function's named arguments
+            timeout: Timeout of this query in seconds
+
+        Returns:
+            A tuple of (the function's result, error message or None)
+        """
+        if function not in FUNCTIONS:
+            raise ValueError(f"Unknown database function: {function}")
+        names = list(args)
+        for name in names:
+            if not ARGUMENT_NAME.match(name):
+                raise ValueError(f"Invalid argument name for {function}: {name}")
+        arguments = ", ".join(f"{name} => ${i}" for i, name in enumerate(names, 1))
+        rows, error = await self.query(
+            f"SELECT {function}({arguments}) AS result", [args[name] for name in names], timeout
+        )
+        return (rows[0]["result"] if rows else None), error
+
+    async def aclose(self) -> None:
+        """Close the pooled connections."""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+async def _init_connection(connection: Any) -> None:
+    """Decode and encode json and jsonb values with the pipeline's JSON codec."""
+    for type_name in ("json", "jsonb"):
+        await connection.set_type_codec(
+            type_name, schema="pg_catalog", encoder=json_codec.dumps_str, decoder=json_codec.loads
+        )
+
+def _table(table: str) -> str:
+    """Check that a table can be queried and return its name."""
+    if table not in TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    return table
+
+def _columns(table: str, columns: Any) -> List[str]:
+    """Check that columns belong to a table and return their names."""
+    known = TABLES[_table(table)]
+    names = [column.strip() for column in columns]
+    for name in names:
+        if name not in known:
+            raise ValueError(f"Unknown column of {table}: {name}")
+    return names
+
+def _quote(column: str) -> str:
+    """Quote a column name ("timestamp" is also a type name)."""
+    return f'"{column}"'
+
+def _where(table: str, filters: Dict[str, str], start: int = 1) -> Tuple[str, List[Any]]:
+    """Build a WHERE clause of equality filters, numbering placeholders from start."""
+    columns = _columns(table, filters)
+    if not columns:
+        return "", []
+    conditions = " AND ".join(f"{_quote(column)} = ${i}" for i, column in enumerate(columns, start))
+    return f" WHERE {conditions}", [_value(column, filters[column]) for column in columns]
+
+def _value(column: str, value: Any) -> Any:
+    """Convert a value to what asyncpg expects for its column."""
+    if column in TIMESTAMP_COLUMNS and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+def _row(record: Any) -> Dict[str, Any]:
+    """Convert a record to a dict shaped like a PostgREST row (timestamps as ISO 8601 strings)."""
+    return {
+        key: value.isoformat() if isinstance(value, (datetime, date)) else value
+        for key, value in record.items()
+    }
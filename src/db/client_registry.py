@@ -0,0 +1,194 @@
+"""
+Client Registry Module for Township Connect WhatsApp Assistant.
+
+This module keeps one Supabase client per kind (the anon client and the service client)
+for the whole process. Clients are created on first use and then reused, so requests
+go over warm keep-alive connections instead of each new client opening its own
+connection pool and TLS session.
+
+The registry is fork-safe: a forked child (e.g. a pre-forking server worker) drops the
+clients inherited from its parent without closing their connections, which the parent
+is still using, and creates its own on first use.
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from supabase import create_client
+
+logger = logging.getLogger(__name__)
+
+# Table read by check_health; it is small and readable with either key
+HEALTH_CHECK_TABLE = "service_bundles"
+
+class ClientRegistry:
+    """
+    Lazily created, process-wide Supabase clients keyed by kind.
+
+    A client is rebuilt when the URL or key it was created with changes, when its
+    connection pool has been closed, when a health check fails or after reset().
+    Reset hooks registered with add_reset_hook run on every reset and in a forked
+    child, so other process-wide clients (e.g. the async Supabase client) are reset
+    along with these.
+    """
+
+    def __init__(self, factory: Callable[[str, str], Any] = create_client):
+        """
+        Initialize the registry.
+
+        Args:
+            factory: Function creating a client from a URL and key (default: supabase.create_client)
+        """
+        self.factory = factory
+        self._clients: Dict[str, Tuple[Tuple[str, str], Any]] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._reset_hooks: List[Callable[[], None]] = []
+
+        self.stats = {
+            "created": 0,
+            "reused": 0,
+            "resets": 0,
+            "health_checks_failed": 0
+        }
+
+    def get(self, kind: str, url: str, key: str) -> Any:
+        """
+        Get the client of a kind, creating it if needed.
+
+        Args:
+            kind: Name of the client, e.g. "anon" or "service"
+            url: The Supabase URL
+            key: The Supabase key the client authenticates with
+
+        Returns:
+            The client of that kind for this process
+
+        Raises:
+            Exception: Whatever the factory raises when the client cannot be created
+        """
+        if self._pid != os.getpid():
+            self._after_fork()
+
+        entry = self._clients.get(kind)
+        if entry and entry[0] == (url, key) and not _is_closed(entry[1]):
+            self.stats["reused"] += 1
+            return entry[1]
+
+        with self._lock:
+            entry = self._clients.get(kind)
+            if entry and entry[0] == (url, key) and not _is_closed(entry[1]):
+                self.stats["reused"] += 1
+                return entry[1]
+            if entry:
+                _close(entry[1])
+            client = self.factory(url, key)
+            self._clients[kind] = ((url, key), client)
+            self.stats["created"] += 1
+            logger.info("Created Supabase %s client", kind)
+            return client
+
+    def has(self, kind: str) -> bool:
+        """
+        Check whether the registry holds a client of a kind.
+
+        Args:
+            kind: Name of the client, e.g. "anon" or "service"
+
+        Returns:
+            True if a client of that kind has been created and not reset since
+        """
+        return kind in self._clients
+
+    def check_health(self, kind: str) -> bool:
+        """
+        Check that the client of a kind can reach Supabase, dropping it if it cannot.
+
+        Args:
+            kind: Name of the client, e.g. "anon" or "service"
+
+        Returns:
+            True if the client answered a one-row read, False if it failed or does not exist yet
+        """
+        entry = self._clients.get(kind)
+        if not entry:
+            return False
+        try:
+            entry[1].table(HEALTH_CHECK_TABLE).select("bundle_id").limit(1).execute()
+            return True
+        except Exception as e:
+            self.stats["health_checks_failed"] += 1
+            logger.warning("Supabase %s client failed its health check, it will be recreated: %s", kind, e)
+            self.reset(kind)
+            return False
+
+    def reset(self, kind: Optional[str] = None) -> None:
+        """
+        Close and drop clients, so the next get creates new ones.
+
+        Args:
+            kind: Name of the client to reset, or None to reset all clients and run the reset hooks
+        """
+        with self._lock:
+            kinds = [kind] if kind else list(self._clients)
+            for name in kinds:
+                entry = self._clients.pop(name, None)
+                if entry:
+                    _close(entry[1])
+            self.stats["resets"] += 1
+        if kind is None:
+            self._run_reset_hooks()
+
+    def add_reset_hook(self, hook: Callable[[], None]) -> None:
+        """
+        Run a function whenever all clients are reset, including in a forked child.
+
+        Args:
+            hook: Function taking no arguments; it must not touch connections in a forked child
+        """
+        self._reset_hooks.append(hook)
+
+    def _after_fork(self) -> None:
+        """Forget the parent's clients, leaving their connections to the parent."""
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._pid = os.getpid()
+        self._run_reset_hooks()
+
+    def _run_reset_hooks(self) -> None:
+        """Run the reset hooks, logging instead of raising their errors."""
+        for hook in self._reset_hooks:
+            try:
+                hook()
+            except Exception as e:
+                logger.error("Error in Supabase client reset hook: %s", e)
+
+def _is_closed(client: Any) -> bool:
+    """Check whether a client's PostgREST connection pool has been closed."""
+    session = getattr(getattr(client, "postgrest", None), "session", None)
+    return bool(getattr(session, "is_closed", False))
+
+def _close(client: Any) -> None:
+    """Close a client's PostgREST connection pool, ignoring errors."""
+    session = getattr(getattr(client, "postgrest", None), "session", None)
+    try:
+        if session is not None:
+            session.close()
+    except Exception as e:
+        logger.debug("Error closing Supabase client: %s", e)
+
+_registry = ClientRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: _registry._after_fork())
+
+def get_client_registry() -> ClientRegistry:
+    """
+    Get the process-wide client registry.
+
+    Returns:
+        The ClientRegistry shared by this process
+    """
+    return _registry
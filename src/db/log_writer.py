@@ -0,0 +1,281 @@
+"""
+Buffered Log Writer Module for Township Connect WhatsApp Assistant.
+
+This module provides a write-behind writer for the message_logs and security_logs
+tables. Rows are collected in memory and written as bulk inserts from a background
+thread, so log writes no longer sit in the reply path of long-running services.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src.logging_utils import sender_hash
+
+logger = logging.getLogger(__name__)
+
+# Tables the writer accepts rows for
+BUFFERED_TABLES = ("message_logs", "security_logs")
+
+class BufferedLogWriter:
+    """
+    Collects log rows in memory and flushes them to Supabase as bulk inserts.
+
+    A flush happens when max_batch_size rows are buffered or when the oldest buffered
+    row is flush_interval_ms old, whichever comes first. At most max_buffer_size rows
+    are held in memory: when the buffer is full, enqueue returns False and the caller
+    is expected to write the row directly, so a slow Supabase slows logging down
+    instead of growing memory or losing rows.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_batch_size: int = 50,
+        flush_interval_ms: int = 500,
+        max_buffer_size: int = 5000
+    ):
+        """
+        Initialize the writer.
+
+        Args:
+            client: A Supabase client instance used for the bulk inserts
+            max_batch_size: Number of buffered rows that triggers a flush (default: 50)
+            flush_interval_ms: Maximum time a row waits in the buffer (default: 500)
+            max_buffer_size: Maximum number of rows held in memory (default: 5000)
+        """
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_buffer_size = max_buffer_size
+
+        self._buffer: Deque[Tuple[str, Dict[str, Any]]] = deque()
+        self._oldest_enqueued_at: Optional[float] = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {"enqueued": 0, "rejected": 0, "written": 0, "dropped": 0, "discarded": 0, "batches": 0}
+
+    @classmethod
+    def from_env(cls, client) -> "BufferedLogWriter":
+        """
+        Create a writer configured from environment variables.
+
+        Reads LOG_WRITER_BATCH_SIZE, LOG_WRITER_FLUSH_INTERVAL_MS and
+        LOG_WRITER_MAX_BUFFER_SIZE, falling back to the defaults.
+
+        Args:
+            client: A Supabase client instance used for the bulk inserts
+
+        Returns:
+            A BufferedLogWriter instance (not started)
+        """
+        return cls(
+            client,
+            max_batch_size=int(os.getenv("LOG_WRITER_BATCH_SIZE", "50")),
+            flush_interval_ms=int(os.getenv("LOG_WRITER_FLUSH_INTERVAL_MS", "500")),
+            max_buffer_size=int(os.getenv("LOG_WRITER_MAX_BUFFER_SIZE", "5000"))
+        )
+
+    def start(self) -> None:
+        """Start the background flush thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """
+        Stop the background thread and flush every buffered row.
+
+        Args:
+            timeout: Maximum number of seconds to wait for the thread (default: 10)
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        # Anything enqueued while the thread was exiting
+        self.flush()
+
+    def enqueue(self, table: str, row: Dict[str, Any]) -> bool:
+        """
+        Add a row to the buffer.
+
+        Args:
+            table: The table the row belongs to ('message_logs' or 'security_logs')
+            row: The row to insert
+
+        Returns:
+            True if the row was buffered, False if the buffer is full or the writer
+            is stopping and the caller should write the row itself
+        """
+        if table not in BUFFERED_TABLES:
+            raise ValueError(f"Unsupported table for buffered writes: {table}")
+
+        with self._condition:
+            if self._stopping or len(self._buffer) >= self.max_buffer_size:
+                self.stats["rejected"] += 1
+                return False
+            if not self._buffer:
+                self._oldest_enqueued_at = time.monotonic()
+            self._buffer.append((table, row))
+            self.stats["enqueued"] += 1
+            # Wake the flush thread to start the interval timer, or to flush a full batch
+            if len(self._buffer) == 1 or len(self._buffer) >= self.max_batch_size:
+                self._condition.notify()
+        return True
+
+    def discard(self, whatsapp_id: str) -> int:
+        """
+        Drop the buffered rows of a user, e.g. before their data is erased.
+
+        Waits for a flush in progress, so once this returns no row of the user is
+        buffered or being written; rows enqueued afterwards are kept.
+
+        Args:
+            whatsapp_id: The WhatsApp ID of the user
+
+        Returns:
+            The number of rows dropped
+        """
+        with self._flush_lock:
+            with self._condition:
+                kept = deque(item for item in self._buffer if item[1].get("user_whatsapp_id") != whatsapp_id)
+                discarded = len(self._buffer) - len(kept)
+                self._buffer = kept
+                if not kept:
+                    self._oldest_enqueued_at = None
+                self.stats["discarded"] += discarded
+        return discarded
+
+    def pending(self) -> int:
+        """
+        Get the number of buffered rows.
+
+        Returns:
+            The number of rows waiting to be written
+        """
+        with self._condition:
+            return len(self._buffer)
+
+    def flush(self) -> int:
+        """
+        Write every buffered row now.
+
+        Returns:
+            The number of rows written
+        """
+        with self._flush_lock:
+            with self._condition:
+                rows = list(self._buffer)
+                self._buffer.clear()
+                self._oldest_enqueued_at = None
+
+            written = 0
+            for start in range(0, len(rows), self.max_batch_size):
+                written += self._write_batch(rows[start:start + self.max_batch_size])
+            return written
+
+    def _run(self) -> None:
+        """Background loop: wait for a full batch or the flush interval, then flush."""
+        while True:
+            with self._condition:
+                while not self._stopping and not self._flush_due():
+                    self._condition.wait(self._time_until_due())
+                if self._stopping:
+                    break
+            self.flush()
+        self.flush()
+
+    def _flush_due(self) -> bool:
+        """Check whether the buffer is big or old enough to flush. Caller holds the condition."""
+        if not self._buffer:
+            return False
+        if len(self._buffer) >= self.max_batch_size:
+            return True
+        return time.monotonic() - self._oldest_enqueued_at >= self.flush_interval
+
+    def _time_until_due(self) -> Optional[float]:
+        """Get how long the oldest row can still wait, or None when the buffer is empty."""
+        if not self._buffer:
+            return None
+        return max(0.0, self.flush_interval - (time.monotonic() - self._oldest_enqueued_at))
+
+    def _write_batch(self, rows: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        Bulk insert a batch, one request per table.
+
+        If a bulk insert fails, its rows are retried one at a time so that a single bad
+        row (e.g. a log for a user whose data was just erased) does not take the rest of
+        the batch down with it. Rows that still fail are dropped and counted.
+
+        Args:
+            rows: (table, row) pairs to write
+
+        Returns:
+            The number of rows written
+        """
+        by_table: Dict[str, List[Dict[str, Any]]] = {}
+        for table, row in rows:
+            by_table.setdefault(table, []).append(row)
+
+        written = 0
+        for table, table_rows in by_table.items():
+            self.stats["batches"] += 1
+            try:
+                self.client.table(table).insert(table_rows).execute()
+                written += len(table_rows)
+                continue
+            except Exception as e:
+                logger.error("Bulk insert of %d rows into %s failed: %s", len(table_rows), table, e)
+
+            for row in table_rows:
+                try:
+                    self.client.table(table).insert(row).execute()
+                    written += 1
+                except Exception as e:
+                    self.stats["dropped"] += 1
+                    logger.error("Dropping %s row for user %s: %s", table, sender_hash(row.get("user_whatsapp_id", "")), e)
+
+        self.stats["written"] += written
+        return written
+
+def install_log_writer(client) -> BufferedLogWriter:
+    """
+    Start a writer configured from the environment and route log writes through it.
+
+    Args:
+        client: A Supabase client instance used for the bulk inserts
+
+    Returns:
+        The started BufferedLogWriter
+    """
+    from src.db import supabase_client
+
+    writer = BufferedLogWriter.from_env(client)
+    writer.start()
+    supabase_client.set_log_writer(writer)
+    return writer
+
+def uninstall_log_writer(timeout: Optional[float] = 10.0) -> None:
+    """
+    Stop routing log writes through the installed writer and flush it.
+
+    Args:
+        timeout: Maximum number of seconds to wait for the flush thread (default: 10)
+    """
+    from src.db import supabase_client
+
+    writer = supabase_client.get_log_writer()
+    supabase_client.set_log_writer(None)
+    if writer:
+        writer.stop(timeout)
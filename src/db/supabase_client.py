@@ -10,17 +10,112 @@ import logging
 from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 
-from supabase import create_client, Client
+from supabase import Client
 from dotenv import load_dotenv
 
+from src.db.client_registry import get_client_registry
+from src.db.user_record import BUNDLE_COLUMNS, BUNDLE_ORDER, MESSAGE_USER_COLUMNS, UserRecord, project, select_list
+from src.logging_utils import HOT_PATH, sender_hash
+
 logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file if it exists
 load_dotenv()
 
+# Write-behind writer for message_logs and security_logs rows (see src/db/log_writer.py).
+# None means every log row is inserted directly.
+_log_writer = None
+
+def set_log_writer(writer) -> None:
+    """
+    Route log writes through a buffered writer, or back to direct inserts.
+
+    Args:
+        writer: A started BufferedLogWriter, or None to insert rows directly
+    """
+    global _log_writer
+    _log_writer = writer
+
+def get_log_writer():
+    """
+    Get the installed buffered log writer.
+
+    Returns:
+        The BufferedLogWriter in use, or None if log rows are inserted directly
+    """
+    return _log_writer
+
+def discard_pending_logs(whatsapp_id: str) -> int:
+    """
+    Drop a user's log rows still waiting in the buffered writer, before their data is erased.
+
+    Otherwise they would be written after the erasure: message_logs rows then fail the
+    foreign key to users, and security_logs rows bring the user's data back.
+
+    Args:
+        whatsapp_id: The WhatsApp ID of the user
+
+    Returns:
+        The number of rows dropped (0 if no buffered writer is installed)
+    """
+    return _log_writer.discard(whatsapp_id) if _log_writer else 0
+
+# Two-tier cache for user rows (see src/db/user_cache.py). None means every get_user
+# call goes to Supabase.
+_user_cache = None
+
+def set_user_cache(cache) -> None:
+    """
+    Put a user cache in front of get_user, or remove it.
+
+    Args:
+        cache: A UserCache, or None to read users from Supabase every time
+    """
+    global _user_cache
+    _user_cache = cache
+
+def get_user_cache():
+    """
+    Get the installed user cache.
+
+    Returns:
+        The UserCache in use, or None if users are always read from Supabase
+    """
+    return _user_cache
+
+def invalidate_cached_user(whatsapp_id: str) -> None:
+    """
+    Drop a user from the user cache, if one is installed.
+
+    Args:
+        whatsapp_id: The WhatsApp ID of the user
+    """
+    if _user_cache:
+        _user_cache.invalidate(whatsapp_id)
+
+def _write_through_user(whatsapp_id: str, fields: Dict[str, Any], response: Any) -> None:
+    """
+    Apply a successful user update to the user cache, or drop the user if it failed.
+
+    Args:
+        whatsapp_id: The WhatsApp ID of the updated user
+        fields: The fields that were written
+        response: The response of the update request
+    """
+    if not _user_cache:
+        return
+    if isinstance(response, dict):
+        err_val = response.get("error")
+    else:
+        err_val = getattr(response, 'error', None)
+    if err_val:
+        _user_cache.invalidate(whatsapp_id)
+    else:
+        _user_cache.update(whatsapp_id, fields)
+
 def get_client():
     """
-    Get a Supabase client instance.
+    Get the process-wide Supabase client instance, creating it on first use.
     
     Returns:
         A Supabase client instance
@@ -37,14 +132,15 @@ def get_client():
         return MockSupabaseClient()
     
     try:
-        return create_client(supabase_url, supabase_key)
+        return get_client_registry().get("anon", supabase_url, supabase_key)
     except Exception as e:
         logger.error(f"Error creating Supabase client: {str(e)}")
         return MockSupabaseClient()
 
 def get_service_client():
     """
-    Get a Supabase client instance using the SERVICE KEY (bypasses RLS).
+    Get the process-wide Supabase client instance using the SERVICE KEY (bypasses RLS),
+    creating it on first use.
     
     Returns:
         A Supabase client instance
@@ -61,7 +157,7 @@ def get_service_client():
         raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set for the service client.")
         
     try:
-        return create_client(supabase_url, supabase_key)
+        return get_client_registry().get("service", supabase_url, supabase_key)
     except Exception as e:
         logger.error(f"Error creating Supabase service client: {str(e)}")
         raise ValueError(f"Could not create Supabase service client: {str(e)}")
@@ -126,6 +222,19 @@ def execute_sql(sql, params=None) -> Tuple[bool, Any]:
         logger.error(f"Error executing SQL: {str(e)}")
         return False, str(e)
 
+class MockResponse(dict):
+    """
+    A mock query response that supports both the dict access used by older code
+    (response["data"]) and the attribute access of real Supabase responses (response.data).
+    """
+    @property
+    def data(self):
+        return self.get("data")
+    
+    @property
+    def error(self):
+        return self.get("error")
+
 class MockSupabaseClient:
     """
     A mock Supabase client for testing and development.
@@ -133,8 +242,11 @@ class MockSupabaseClient:
     def __init__(self):
         self.users = {}
         self.messages = []
+        self.bundles = []
         self.current_table = None
         self.current_query = {}
+        # Number of requests that would have been sent to Supabase (one per execute call)
+        self.request_count = 0
         
     def table(self, table_name):
         self.current_table = table_name
@@ -151,7 +263,22 @@ class MockSupabaseClient:
             if user_id:
                 self.users[user_id] = data
         elif self.current_table == "message_logs":
-            self.messages.append(data)
+            if isinstance(data, list):
+                self.messages.extend(data)
+            else:
+                self.messages.append(data)
+        elif self.current_table == "service_bundles":
+            self.bundles.extend(data if isinstance(data, list) else [data])
+        return self
+        
+    def upsert(self, data, ignore_duplicates=False, on_conflict="", returning="representation"):
+        if self.current_table == "users":
+            user_id = data.get("whatsapp_id")
+            if user_id in self.users and ignore_duplicates:
+                self.current_query["upsert"] = []
+            else:
+                self.users[user_id] = dict(self.users.get(user_id, {}), **data)
+                self.current_query["upsert"] = [self.users[user_id]]
         return self
         
     def update(self, data):
@@ -162,6 +289,10 @@ class MockSupabaseClient:
         self.current_query["eq"] = (column, value)
         return self
     
+    def order(self, column, desc=False):
+        self.current_query.setdefault("order", []).append(column)
+        return self
+    
     def rpc(self, function_name, params=None):
         """
         Mock implementation of the rpc method.
@@ -173,10 +304,15 @@ class MockSupabaseClient:
         Returns:
             self for method chaining
         """
-        self.current_query["rpc"] = (function_name, params or {})
+        self.current_table = None
+        self.current_query = {"rpc": (function_name, params or {})}
         return self
         
     def execute(self):
+        self.request_count += 1
+        return MockResponse(self._execute())
+        
+    def _execute(self):
         if self.current_table == "users":
             if "eq" in self.current_query:
                 column, value = self.current_query["eq"]
@@ -199,10 +335,21 @@ class MockSupabaseClient:
                         # If it's not a dictionary, log a warning
                         logger.warning(f"Expected dictionary for update_data, got {type(update_data)}")
                     return {"data": [self.users[value]], "error": None}
+            elif "upsert" in self.current_query:
+                return {"data": self.current_query["upsert"], "error": None}
             elif "insert" in self.current_query:
                 return {"data": [self.current_query["insert"]], "error": None}
         elif self.current_table == "message_logs":
             return {"data": self.messages[-1:] if self.messages else [], "error": None}
+        elif self.current_table == "service_bundles":
+            bundles = self.bundles
+            if "eq" in self.current_query:
+                column, value = self.current_query["eq"]
+                bundles = [b for b in bundles if b.get(column, True) == value]
+            # Apply the order columns from the last one to the first (stable sort)
+            for column in reversed(self.current_query.get("order", [])):
+                bundles = sorted(bundles, key=lambda b: str(b.get(column) or ""))
+            return {"data": [dict(b) for b in bundles], "error": None}
         elif "rpc" in self.current_query:
             function_name, params = self.current_query["rpc"]
             # Mock responses for specific RPC functions
@@ -215,6 +362,26 @@ class MockSupabaseClient:
                 if user_id in self.users:
                     del self.users[user_id]
                 return {"data": {"success": True}, "error": None}
+            elif function_name == 'touch_user_and_log_inbound':
+                user_id = params.get('p_whatsapp_id')
+                now = datetime.now().isoformat()
+                is_new_user = user_id not in self.users
+                if is_new_user:
+                    self.users[user_id] = {
+                        "whatsapp_id": user_id,
+                        "preferred_language": params.get('p_preferred_language', 'en'),
+                        "popia_consent_given": False,
+                        "created_at": now
+                    }
+                self.users[user_id]["last_active_at"] = now
+                self.messages.append({
+                    "user_whatsapp_id": user_id,
+                    "direction": "inbound",
+                    "message_content": params.get('p_message_content'),
+                    "timestamp": now,
+                    "data_size_kb": params.get('p_data_size_kb')
+                })
+                return {"data": dict(self.users[user_id], is_new_user=is_new_user), "error": None}
             else:
                 return {"data": [], "error": None}
         
@@ -234,10 +401,9 @@ def log_message(client, user_whatsapp_id: str, direction: str, message_content:
     Returns:
         The result of the database operation
     """
-    logger.info(f"Logging {direction} message for user {user_whatsapp_id}")
+    logger.info("Logging %s message", direction, extra=HOT_PATH)
     
     # Prepare message data
-    from datetime import datetime
     message_data = {
         "user_whatsapp_id": user_whatsapp_id,
         "direction": direction,
@@ -246,6 +412,11 @@ def log_message(client, user_whatsapp_id: str, direction: str, message_content:
         "data_size_kb": data_size_kb
     }
     
+    # Hand the row to the buffered writer when one is installed; if its buffer is full,
+    # fall through to a direct insert so the row is not lost
+    if _log_writer and _log_writer.enqueue("message_logs", message_data):
+        return {"data": [message_data], "error": None}
+    
     try:
         response = client.table("message_logs").insert(message_data).execute()
         err_val = getattr(response, 'error', None)
@@ -263,28 +434,121 @@ def log_message(client, user_whatsapp_id: str, direction: str, message_content:
         logger.error(f"Exception during log_message: {str(e)}")
         return {"data": [message_data], "error": str(e)} # Keep message_data for context
 
-def get_user(client, whatsapp_id: str) -> Optional[Dict[str, Any]]:
+def log_security_event(client, whatsapp_id: str, event_type: str, details: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Log a security audit event.
+    
+    Args:
+        client: A Supabase client instance
+        whatsapp_id: The WhatsApp ID of the user the event concerns
+        event_type: The type of event (e.g. 'DATA_DELETE_REQUESTED')
+        details: Additional event details (default: the current timestamp)
+    
+    Raises:
+        Exception: If the row is inserted directly and the insert fails
+    """
+    security_log = {
+        "user_whatsapp_id": whatsapp_id,
+        "event_type": event_type,
+        "details": details or {"timestamp": datetime.now().isoformat()},
+        "timestamp": datetime.now().isoformat()
+    }
+    
+    if _log_writer and _log_writer.enqueue("security_logs", security_log):
+        return
+    
+    client.table("security_logs").insert(security_log).execute()
+
+def get_user(client, whatsapp_id: str, columns: Tuple[str, ...] = MESSAGE_USER_COLUMNS) -> Optional[UserRecord]:
     """
     Get a user from the database.
     
+    Only the given columns are read. Lookups of the message columns (the default)
+    are answered from the user cache when one is installed.
+    
     Args:
         client: A Supabase client instance
         whatsapp_id: The WhatsApp ID of the user to get
+        columns: The users columns to read (default: MESSAGE_USER_COLUMNS; ADMIN_USER_COLUMNS
+            adds the timestamps)
     
     Returns:
-        The user data, or None if the user doesn't exist
+        The user record, or None if the user doesn't exist
     """
-    logger.info(f"Getting user: {whatsapp_id}")
+    user_cache = _user_cache if columns == MESSAGE_USER_COLUMNS else None
+    if user_cache:
+        cached_user = user_cache.get(whatsapp_id)
+        if cached_user is not None:
+            logger.debug("Getting user from cache", extra=HOT_PATH)
+            return UserRecord.from_row(cached_user)
+    
+    logger.info("Getting user", extra=HOT_PATH)
     
     try:
-        result = client.table("users").select("*").eq("whatsapp_id", whatsapp_id).execute()
+        result = client.table("users").select(select_list(columns)).eq("whatsapp_id", whatsapp_id).execute()
         if result.data and len(result.data) > 0: # Changed to attribute access
-            return result.data[0] # Changed to attribute access
+            row = project(result.data[0], columns)
+            if user_cache:
+                user_cache.set(whatsapp_id, row)
+            return UserRecord.from_row(row)
         return None
     except Exception as e:
         logger.error(f"Error getting user: {str(e)}")
         return None
 
+def touch_user_and_log_inbound(
+    client,
+    whatsapp_id: str,
+    message_content: str,
+    data_size_kb: float = 0.1,
+    preferred_language: str = 'en'
+) -> Tuple[Optional[UserRecord], bool, Optional[str]]:
+    """
+    Create or touch a user and log their inbound message in a single request.
+    
+    Calls the touch_user_and_log_inbound database function, which replaces the separate
+    get_user, last_active_at update and message_logs insert requests.
+    
+    Args:
+        client: A Supabase client instance
+        whatsapp_id: The WhatsApp ID of the sender
+        message_content: The content of the inbound message
+        data_size_kb: The size of the message in KB (default: 0.1)
+        preferred_language: The language to store if the user is created (default: 'en')
+    
+    Returns:
+        A tuple of (user, is_new_user, error) where user is the user record (None on error),
+        is_new_user tells whether the user was created by this call, and error is the
+        error message or None
+    """
+    logger.info("Touching user and logging inbound message", extra=HOT_PATH)
+    
+    try:
+        response = client.rpc("touch_user_and_log_inbound", {
+            "p_whatsapp_id": whatsapp_id,
+            "p_message_content": message_content,
+            "p_data_size_kb": data_size_kb,
+            "p_preferred_language": preferred_language
+        }).execute()
+        if isinstance(response, dict):
+            err_val, dat_val = response.get("error"), response.get("data")
+        else:
+            err_val, dat_val = getattr(response, 'error', None), getattr(response, 'data', None)
+        
+        if err_val:
+            return None, False, str(getattr(err_val, 'message', err_val))
+        if not isinstance(dat_val, dict):
+            return None, False, f"Unexpected response from touch_user_and_log_inbound: {dat_val!r}"
+        
+        is_new_user = bool(dat_val.get("is_new_user", False))
+        user = project(dat_val, MESSAGE_USER_COLUMNS)
+        if _user_cache:
+            _user_cache.set(whatsapp_id, user)
+        return UserRecord.from_row(user), is_new_user, None
+    except Exception as e:
+        logger.error(f"Exception during touch_user_and_log_inbound: {str(e)}")
+        return None, False, str(e)
+
 def create_user(client, whatsapp_id: str, preferred_language: str = 'en', popia_consent: bool = False) -> Dict[str, Any]:
     """
     Create a new user in the database.
@@ -298,7 +562,7 @@ def create_user(client, whatsapp_id: str, preferred_language: str = 'en', popia_
     Returns:
         The result of the database operation
     """
-    logger.info(f"Creating user: {whatsapp_id} with language {preferred_language}")
+    logger.info("Creating user %s with language %s", sender_hash(whatsapp_id), preferred_language)
     
     # Prepare user data
     from datetime import datetime
@@ -321,12 +585,75 @@ def create_user(client, whatsapp_id: str, preferred_language: str = 'en', popia_
                 error_message = err_val.message
             else:
                 error_message = str(err_val)
+        
+        if _user_cache and not error_message:
+            _user_cache.set(whatsapp_id, project(dat_val[0] if dat_val else user_data, MESSAGE_USER_COLUMNS))
                 
         return {"data": dat_val, "error": error_message}
     except Exception as e: # This catches broader issues like network errors before a response is formed
         logger.error(f"Exception during create_user: {str(e)}")
         return {"data": [user_data], "error": str(e)} # Keep user_data for context on exception
 
+def get_or_create_user(
+    client,
+    whatsapp_id: str,
+    preferred_language: str = 'en',
+    popia_consent: bool = False
+) -> Tuple[Optional[UserRecord], bool, Optional[str]]:
+    """
+    Create a user unless they exist, in a single atomic request.
+    
+    The insert is sent as an upsert that ignores duplicates (INSERT ... ON CONFLICT
+    DO NOTHING RETURNING), so concurrent first messages from the same sender cannot
+    both create the user or fail on the primary key. Only when the user already
+    existed is a second request made, to read their row.
+    
+    Args:
+        client: A Supabase client instance
+        whatsapp_id: The WhatsApp ID of the user
+        preferred_language: The language to store if the user is created (default: 'en')
+        popia_consent: The POPIA consent to store if the user is created (default: False)
+    
+    Returns:
+        A tuple of (user, is_new_user, error) where user is the user record (None on error),
+        is_new_user tells whether the user was created by this call, and error is the
+        error message or None
+    """
+    logger.info("Getting or creating user with language %s", preferred_language, extra=HOT_PATH)
+    
+    now = datetime.now().isoformat()
+    user_data = {
+        "whatsapp_id": whatsapp_id,
+        "preferred_language": preferred_language,
+        "popia_consent_given": popia_consent,
+        "created_at": now,
+        "last_active_at": now
+    }
+    
+    try:
+        response = client.table("users").upsert(user_data, ignore_duplicates=True, on_conflict="whatsapp_id").execute()
+        if isinstance(response, dict):
+            err_val, dat_val = response.get("error"), response.get("data")
+        else:
+            err_val, dat_val = getattr(response, 'error', None), getattr(response, 'data', None)
+        if err_val:
+            return None, False, str(getattr(err_val, 'message', err_val))
+        
+        if dat_val:
+            created = project(dat_val[0], MESSAGE_USER_COLUMNS)
+            if _user_cache:
+                _user_cache.set(whatsapp_id, created)
+            return UserRecord.from_row(created), True, None
+        
+        # Nothing was inserted: the user already exists (e.g. created by a concurrent message)
+        existing = get_user(client, whatsapp_id)
+        if existing is None:
+            return None, False, "User was neither created nor found"
+        return existing, False, None
+    except Exception as e:
+        logger.error(f"Exception during get_or_create_user: {str(e)}")
+        return None, False, str(e)
+
 def update_user_language(client, whatsapp_id: str, language: str) -> Dict[str, Any]:
     """
     Update a user's preferred language.
@@ -339,7 +666,7 @@ def update_user_language(client, whatsapp_id: str, language: str) -> Dict[str, A
     Returns:
         The result of the database operation
     """
-    logger.info(f"Updating user language: {whatsapp_id} -> {language}")
+    logger.info("Updating user language: %s -> %s", sender_hash(whatsapp_id), language)
     
     # Validate the language code
     if language not in ['en', 'xh', 'af']:
@@ -349,11 +676,15 @@ def update_user_language(client, whatsapp_id: str, language: str) -> Dict[str, A
     try:
         # Update the user's last active timestamp as well
         from datetime import datetime
-        return client.table("users").update({
+        fields = {
             "preferred_language": language,
             "last_active_at": datetime.now().isoformat()
-        }).eq("whatsapp_id", whatsapp_id).execute()
+        }
+        response = client.table("users").update(fields).eq("whatsapp_id", whatsapp_id).execute()
+        _write_through_user(whatsapp_id, fields, response)
+        return response
     except Exception as e:
+        invalidate_cached_user(whatsapp_id)
         logger.error(f"Error updating user language: {str(e)}")
         return {"data": [], "error": str(e)}
 
@@ -368,18 +699,13 @@ def delete_user_data(client, whatsapp_id: str) -> Dict[str, Any]:
     Returns:
         The result of the database operation
     """
-    logger.info(f"Deleting user data: {whatsapp_id}")
+    logger.info("Deleting user data: %s", sender_hash(whatsapp_id))
     
     try:
+        discard_pending_logs(whatsapp_id)
+        
         # Log the deletion for security audit
-        from datetime import datetime
-        security_log = {
-            "user_whatsapp_id": whatsapp_id,
-            "event_type": "DATA_DELETE_CONFIRMED",
-            "details": {"timestamp": datetime.now().isoformat()},
-            "timestamp": datetime.now().isoformat()
-        }
-        client.table("security_logs").insert(security_log).execute()
+        log_security_event(client, whatsapp_id, "DATA_DELETE_CONFIRMED")
         
         # Delete messages
         client.table("message_logs").delete().eq("user_whatsapp_id", whatsapp_id).execute()
@@ -390,10 +716,13 @@ def delete_user_data(client, whatsapp_id: str) -> Dict[str, Any]:
     except Exception as e:
         logger.error(f"Error deleting user data: {str(e)}")
         return {"data": [], "error": str(e)}
+    finally:
+        # Dropped after the delete so a concurrent get_user cannot cache the row again
+        invalidate_cached_user(whatsapp_id)
 
 def get_service_bundles(client) -> List[Dict[str, Any]]:
     """
-    Get all available service bundles from the database.
+    Get the active service bundles from the database, in the bundle catalog's order.
     
     Args:
         client: A Supabase client instance
@@ -404,8 +733,11 @@ def get_service_bundles(client) -> List[Dict[str, Any]]:
     logger.info("Getting service bundles")
     
     try:
-        result = client.table("service_bundles").select("*").execute()
-        return result["data"] if result["data"] else []
+        query = client.table("service_bundles").select(select_list(BUNDLE_COLUMNS)).eq("active", True)
+        for column in BUNDLE_ORDER:
+            query = query.order(column)
+        result = query.execute()
+        return result.data if result.data else []
     except Exception as e:
         logger.error(f"Error getting service bundles: {str(e)}")
         return []
@@ -422,16 +754,20 @@ def update_user_bundle(client, whatsapp_id: str, bundle_id: str) -> Dict[str, An
     Returns:
         The result of the database operation
     """
-    logger.info(f"Updating user bundle: {whatsapp_id} -> {bundle_id}")
+    logger.info("Updating user bundle: %s -> %s", sender_hash(whatsapp_id), bundle_id)
     
     try:
         # Update the user's bundle and last active timestamp
         from datetime import datetime
-        return client.table("users").update({
+        fields = {
             "current_bundle": bundle_id,
             "last_active_at": datetime.now().isoformat()
-        }).eq("whatsapp_id", whatsapp_id).execute()
+        }
+        response = client.table("users").update(fields).eq("whatsapp_id", whatsapp_id).execute()
+        _write_through_user(whatsapp_id, fields, response)
+        return response
     except Exception as e:
+        invalidate_cached_user(whatsapp_id)
         logger.error(f"Error updating user bundle: {str(e)}")
         return {"data": [], "error": str(e)}
 
@@ -447,15 +783,17 @@ def update_user_popia_consent(client, whatsapp_id: str, consent_given: bool) ->
     Returns:
         The result of the database operation
     """
-    logger.info(f"Updating POPIA consent for user {whatsapp_id} to {consent_given}")
+    logger.info("Updating POPIA consent for user %s to %s", sender_hash(whatsapp_id), consent_given)
     
     try:
         # Update the user's POPIA consent and last active timestamp
         from datetime import datetime
-        response = client.table("users").update({
+        fields = {
             "popia_consent_given": consent_given,
             "last_active_at": datetime.now().isoformat()
-        }).eq("whatsapp_id", whatsapp_id).execute()
+        }
+        response = client.table("users").update(fields).eq("whatsapp_id", whatsapp_id).execute()
+        _write_through_user(whatsapp_id, fields, response)
         err_val = getattr(response, 'error', None)
         dat_val = getattr(response, 'data', [])
         
@@ -468,5 +806,6 @@ def update_user_popia_consent(client, whatsapp_id: str, consent_given: bool) ->
                 
         return {"data": dat_val, "error": error_message}
     except Exception as e:
+        invalidate_cached_user(whatsapp_id)
         logger.error(f"Exception during update_user_popia_consent: {str(e)}")
         return {"data": [], "error": str(e)}
\ No newline at end of file
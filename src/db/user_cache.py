@@ -0,0 +1,348 @@
+"""
+User Cache Module for Township Connect WhatsApp Assistant.
+
+This module provides a two-tier cache for user rows: an in-process LRU with a short
+TTL in front of a Redis hash per user that is shared by every worker. Most messages
+come from a small set of active users, so most get_user calls are answered without
+a Supabase request. Every write is published on a Redis channel, so other processes
+drop their local copy of the user instead of answering from it until it expires.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from src.redis_batch import count_commands, execute_command
+
+logger = logging.getLogger(__name__)
+
+# Prefix for the per-user Redis hashes
+REDIS_KEY_PREFIX = "township-connect:user:"
+
+# Channel a user's WhatsApp ID is published on whenever their cached row changes
+INVALIDATION_CHANNEL = "township-connect:user-invalidations"
+
+class UserCache:
+    """
+    Two-tier cache for user rows keyed by WhatsApp ID.
+
+    Reads check the local LRU first, then the user's Redis hash, and are counted as
+    local hits, Redis hits or misses. Writes go to both tiers and are published on
+    INVALIDATION_CHANNEL. Once start() is called, a listener thread drops the local
+    entries that other processes have changed; while it is not subscribed (e.g. Redis
+    is restarting) the local tier is skipped, and it is emptied on every subscribe, so
+    a language or consent change is never answered from a stale local entry. The
+    Redis TTL only bounds how long inactive users stay in Redis.
+
+    Absent users are never cached, so a user created by another worker is seen on
+    their next message.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        max_size: int = 10000,
+        local_ttl_seconds: float = 30,
+        redis_ttl_seconds: int = 3600
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            redis_client: A Redis client for the shared tier, or None for a local-only cache
+            max_size: Maximum number of users held in the local LRU (default: 10000)
+            local_ttl_seconds: How long a user stays in the local LRU (default: 30)
+            redis_ttl_seconds: How long a user's Redis hash lives after its last write (default: 3600)
+        """
+        self.redis_client = redis_client
+        self.max_size = max_size
+        self.local_ttl = local_ttl_seconds
+        self.redis_ttl = redis_ttl_seconds
+
+        self._local: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Identifies this cache's own invalidations, which the listener skips
+        self._origin = uuid.uuid4().hex
+        self._listener: Optional[threading.Thread] = None
+        self._subscribed = threading.Event()
+        self._stopping = threading.Event()
+
+        self.stats = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "remote_invalidations": 0,
+            "redis_errors": 0
+        }
+
+    @classmethod
+    def from_env(cls, redis_client=None) -> "UserCache":
+        """
+        Create a cache configured from environment variables.
+
+        Reads USER_CACHE_MAX_SIZE, USER_CACHE_LOCAL_TTL_SECONDS and
+        USER_CACHE_REDIS_TTL_SECONDS, falling back to the defaults.
+
+        Args:
+            redis_client: A Redis client for the shared tier, or None for a local-only cache
+
+        Returns:
+            A UserCache instance
+        """
+        return cls(
+            redis_client,
+            max_size=int(os.getenv("USER_CACHE_MAX_SIZE", "10000")),
+            local_ttl_seconds=float(os.getenv("USER_CACHE_LOCAL_TTL_SECONDS", "30")),
+            redis_ttl_seconds=int(os.getenv("USER_CACHE_REDIS_TTL_SECONDS", "3600"))
+        )
+
+    def get(self, whatsapp_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a cached user.
+
+        Args:
+            whatsapp_id: The WhatsApp ID of the user
+
+        Returns:
+            A copy of the cached user data, or None on a miss
+        """
+        with self._lock:
+            entry = self._local.get(whatsapp_id) if self._local_is_current() else None
+            if entry and entry[0] > time.monotonic():
+                self._local.move_to_end(whatsapp_id)
+                self.stats["local_hits"] += 1
+                return dict(entry[1])
+            if entry:
+                del self._local[whatsapp_id]
+
+        user = self._redis_get(whatsapp_id)
+        if user is not None:
+            self._local_set(whatsapp_id, user)
+            with self._lock:
+                self.stats["redis_hits"] += 1
+            return dict(user)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, whatsapp_id: str, user: Dict[str, Any]) -> None:
+        """
+        Cache a complete user row in both tiers.
+
+        Args:
+            whatsapp_id: The WhatsApp ID of the user
+            user: The user data
+        """
+        user = dict(user)
+        self._local_set(whatsapp_id, user)
+        self._redis_write(whatsapp_id, user, replace=True)
+
+    def update(self, whatsapp_id: str, fields: Dict[str, Any]) -> None:
+        """
+        Write changed fields through to a cached user.
+
+        Users that are not cached in Redis are not added there, so a partial row is
+        never cached; other processes are told to drop their local copy either way.
+
+        Args:
+            whatsapp_id: The WhatsApp ID of the user
+            fields: The changed fields and their new values
+        """
+        with self._lock:
+            entry = self._local.get(whatsapp_id)
+            if entry:
+                entry[1].update(fields)
+        self._redis_write(whatsapp_id, fields, replace=False)
+
+    def invalidate(self, whatsapp_id: str) -> None:
+        """
+        Remove a user from both tiers.
+
+        Args:
+            whatsapp_id: The WhatsApp ID of the user
+        """
+        with self._lock:
+            self._local.pop(whatsapp_id, None)
+            self.stats["invalidations"] += 1
+        if self.redis_client:
+            try:
+                execute_command(self.redis_client, "delete", REDIS_KEY_PREFIX + whatsapp_id)
+                execute_command(self.redis_client, "publish", INVALIDATION_CHANNEL, self._invalidation(whatsapp_id))
+            except Exception as e:
+                self._redis_failed("delete", e)
+
+    def clear_local(self) -> None:
+        """Empty the local LRU, leaving the shared Redis tier as it is."""
+        with self._lock:
+            self._local.clear()
+
+    def start(self) -> None:
+        """Start the thread that drops local entries changed by other processes."""
+        if not self.redis_client or (self._listener and self._listener.is_alive()):
+            return
+        self._stopping.clear()
+        self._listener = threading.Thread(target=self._listen, name="user-cache-invalidations", daemon=True)
+        self._listener.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """
+        Stop the invalidation listener.
+
+        Args:
+            timeout: Maximum number of seconds to wait for the thread (default: 5)
+        """
+        self._stopping.set()
+        if self._listener:
+            self._listener.join(timeout)
+            self._listener = None
+
+    def hit_rate(self) -> float:
+        """
+        Get the share of reads answered by either tier.
+
+        Returns:
+            The hit rate between 0 and 1 (0 when nothing has been read yet)
+        """
+        with self._lock:
+            hits = self.stats["local_hits"] + self.stats["redis_hits"]
+            total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def _local_is_current(self) -> bool:
+        """Check whether local entries can be trusted: no listener was started, or it is subscribed."""
+        return self._listener is None or self._subscribed.is_set()
+
+    def _invalidation(self, whatsapp_id: str) -> str:
+        """Build the message published on INVALIDATION_CHANNEL for a changed user."""
+        return f"{self._origin} {whatsapp_id}"
+
+    def _listen(self) -> None:
+        """Drop the local entries of users changed by other processes until stopped."""
+        backoff = 0.0
+        while not self._stopping.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Changes published while this process was not subscribed were missed
+                self.clear_local()
+                self._subscribed.set()
+                backoff = 0.0
+                while not self._stopping.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self._drop_changed(_to_str(message["data"]))
+            except Exception as e:
+                self._subscribed.clear()
+                self._redis_failed("subscribe", e)
+                backoff = min(backoff * 2 or 0.5, 30.0)
+                self._stopping.wait(backoff)
+            finally:
+                self._subscribed.clear()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _drop_changed(self, message: str) -> None:
+        """Remove the user named in an invalidation message published by another process."""
+        origin, _, whatsapp_id = message.partition(" ")
+        if origin == self._origin:
+            return
+        with self._lock:
+            self._local.pop(whatsapp_id, None)
+            self.stats["remote_invalidations"] += 1
+
+    def _local_set(self, whatsapp_id: str, user: Dict[str, Any]) -> None:
+        """Put a user in the local LRU, evicting the least recently used users if full."""
+        with self._lock:
+            self._local[whatsapp_id] = (time.monotonic() + self.local_ttl, user)
+            self._local.move_to_end(whatsapp_id)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def _redis_get(self, whatsapp_id: str) -> Optional[Dict[str, Any]]:
+        """Read a user's Redis hash. Field values are stored JSON-encoded to keep their types."""
+        if not self.redis_client:
+            return None
+        try:
+            fields = execute_command(self.redis_client, "hgetall", REDIS_KEY_PREFIX + whatsapp_id)
+        except Exception as e:
+            self._redis_failed("read", e)
+            return None
+        if not fields:
+            return None
+        return {_to_str(key): json.loads(value) for key, value in fields.items()}
+
+    def _redis_write(self, whatsapp_id: str, fields: Dict[str, Any], replace: bool) -> None:
+        """Write fields to a user's Redis hash, refresh its TTL and publish the change."""
+        if not self.redis_client or not fields:
+            return
+        key = REDIS_KEY_PREFIX + whatsapp_id
+        mapping = {field: json.dumps(value, default=str) for field, value in fields.items()}
+        try:
+            cached = replace or execute_command(self.redis_client, "exists", key)
+            pipe = self.redis_client.pipeline()
+            if replace:
+                pipe.delete(key)
+            if cached:
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, self.redis_ttl)
+            pipe.publish(INVALIDATION_CHANNEL, self._invalidation(whatsapp_id))
+            pipe.execute()
+            count_commands(self.redis_client, 1 + (2 if cached else 0) + (1 if replace else 0))
+        except Exception as e:
+            self._redis_failed("write", e)
+            # A failed partial write could leave a stale hash behind
+            if not replace:
+                try:
+                    self.redis_client.delete(key)
+                except Exception:
+                    pass
+
+    def _redis_failed(self, operation: str, error: Exception) -> None:
+        """Count and log a Redis failure. The cache keeps working from the local tier."""
+        with self._lock:
+            self.stats["redis_errors"] += 1
+        logger.warning("User cache Redis %s failed: %s", operation, error)
+
+def _to_str(value: Any) -> str:
+    """Decode a Redis key that may come back as bytes."""
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+def install_user_cache(redis_client=None) -> UserCache:
+    """
+    Create a cache configured from the environment, start its invalidation listener
+    and put it in front of get_user.
+
+    Args:
+        redis_client: A Redis client for the shared tier, or None for a local-only cache
+
+    Returns:
+        The installed UserCache
+    """
+    from src.db import supabase_client
+
+    cache = UserCache.from_env(redis_client)
+    cache.start()
+    supabase_client.set_user_cache(cache)
+    return cache
+
+def uninstall_user_cache() -> None:
+    """Stop caching user rows and log the cache statistics."""
+    from src.db import supabase_client
+
+    cache = supabase_client.get_user_cache()
+    supabase_client.set_user_cache(None)
+    if cache:
+        cache.stop()
+        logger.info("User cache stats: %s (hit rate %.1f%%)", cache.stats, cache.hit_rate() * 100)
@@ -0,0 +1,166 @@
+"""
+User Record Module for Township Connect WhatsApp Assistant.
+
+This module defines the column projections the data access functions read for each
+use case, and UserRecord, the compact read-only user returned by get_user. Reading
+only the needed columns keeps large columns such as baileys_creds_encrypted out of
+every lookup, the user cache and the Redis hashes behind it.
+"""
+
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple
+
+# Users columns read while handling a message
+MESSAGE_USER_COLUMNS = ("whatsapp_id", "preferred_language", "current_bundle", "popia_consent_given")
+
+# Users columns read by admin commands
+ADMIN_USER_COLUMNS = MESSAGE_USER_COLUMNS + ("created_at", "last_active_at")
+
+# Service bundle columns read to list bundles and render the selection prompt
+BUNDLE_COLUMNS = (
+    "bundle_id", "bundle_name_en", "bundle_name_xh", "bundle_name_af",
+    "description_en", "description_xh", "description_af", "price_tier", "updated_at",
+)
+
+# Columns active service bundles are listed by, so a bundle number always maps to the same bundle
+BUNDLE_ORDER = ("created_at", "bundle_id")
+
+def select_list(columns: Tuple[str, ...]) -> str:
+    """
+    Format columns for a PostgREST select.
+
+    Args:
+        columns: The column names
+
+    Returns:
+        The comma-separated column list
+    """
+    return ",".join(columns)
+
+def project(row: Mapping[str, Any], columns: Tuple[str, ...]) -> Dict[str, Any]:
+    """
+    Keep only some columns of a row.
+
+    Args:
+        row: The row, e.g. as returned by a database function
+        columns: The columns to keep
+
+    Returns:
+        A dict of the row's values for those columns it has
+    """
+    return {column: row[column] for column in columns if column in row}
+
+class UserRecord:
+    """
+    A read-only user as read for one use case.
+
+    Columns are attributes. For code written against user dicts, get() and item
+    access work as on a dict; get() also returns the default for columns that were
+    not read or are NULL.
+    """
+
+    __slots__ = ADMIN_USER_COLUMNS
+
+    whatsapp_id: str
+    preferred_language: Optional[str]
+    current_bundle: Optional[str]
+    popia_consent_given: Optional[bool]
+    created_at: Optional[str]
+    last_active_at: Optional[str]
+
+    def __init__(
+        self,
+        whatsapp_id: str,
+        preferred_language: Optional[str] = None,
+        current_bundle: Optional[str] = None,
+        popia_consent_given: Optional[bool] = None,
+        created_at: Optional[str] = None,
+        last_active_at: Optional[str] = None
+    ):
+        """
+        Initialize the record.
+
+        Args:
+            whatsapp_id: The WhatsApp ID of the user
+            preferred_language: The user's preferred language
+            current_bundle: The ID of the user's selected bundle
+            popia_consent_given: Whether the user has given POPIA consent
+            created_at: When the user was created (ISO 8601)
+            last_active_at: When the user was last active (ISO 8601)
+        """
+        set_column = object.__setattr__
+        set_column(self, "whatsapp_id", whatsapp_id)
+        set_column(self, "preferred_language", preferred_language)
+        set_column(self, "current_bundle", current_bundle)
+        set_column(self, "popia_consent_given", popia_consent_given)
+        set_column(self, "created_at", created_at)
+        set_column(self, "last_active_at", last_active_at)
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> "UserRecord":
+        """
+        Create a record from a users row, ignoring columns it has no attribute for.
+
+        Args:
+            row: The row as returned by PostgREST or the user cache
+
+        Returns:
+            A UserRecord instance
+        """
+        return cls(**{column: row[column] for column in cls.__slots__ if column in row})
+
+    def get(self, column: str, default: Any = None) -> Any:
+        """
+        Get a column's value like dict.get.
+
+        Args:
+            column: The column name
+            default: Returned if the column was not read or is NULL (default: None)
+
+        Returns:
+            The column's value, or the default
+        """
+        value = getattr(self, column, None) if column in self.__slots__ else None
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the columns that have a value.
+
+        Returns:
+            A dict of column names to values
+        """
+        return {column: getattr(self, column) for column in self.__slots__ if getattr(self, column) is not None}
+
+    def keys(self):
+        """Get the names of the columns that have a value, so dict(record) works."""
+        return self.to_dict().keys()
+
+    def __getitem__(self, column: str) -> Any:
+        if column not in self.__slots__:
+            raise KeyError(column)
+        return getattr(self, column)
+
+    def __contains__(self, column: object) -> bool:
+        return isinstance(column, str) and column in self.__slots__ and getattr(self, column) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.to_dict())
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("UserRecord is read-only")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("UserRecord is read-only")
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, UserRecord):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(tuple(getattr(self, column) for column in self.__slots__))
+
+    def __repr__(self) -> str:
+        return f"UserRecord(whatsapp_id={self.whatsapp_id!r}, preferred_language={self.preferred_language!r})"
@@ -0,0 +1,190 @@
+"""
+JSON Codec Module for Township Connect WhatsApp Assistant.
+
+This module is the single place the message pipeline encodes and decodes JSON. It
+uses orjson or msgspec when one of them is installed and the standard library json
+module otherwise; set JSON_CODEC to 'orjson', 'msgspec' or 'stdlib' to pin one.
+Every codec decodes str or bytes and encodes to UTF-8 bytes, so a webhook body can
+be handed over as received instead of being decoded to a str first.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# JSON text as received or produced by a codec
+JsonText = Union[str, bytes]
+
+# Codecs in order of preference
+PREFERRED_CODECS = ("orjson", "msgspec", "stdlib")
+
+class JsonCodec:
+    """A pair of JSON decode and encode functions from one library."""
+
+    __slots__ = ("name", "_loads", "_dumps")
+
+    def __init__(self, name: str, loads: Callable[[JsonText], Any], dumps: Callable[[Any], bytes]):
+        """
+        Initialize the codec.
+
+        Args:
+            name: Name of the library, e.g. 'orjson'
+            loads: Function decoding JSON text (str or bytes)
+            dumps: Function encoding an object to UTF-8 JSON bytes
+        """
+        self.name = name
+        self._loads = loads
+        self._dumps = dumps
+
+    def loads(self, data: JsonText) -> Any:
+        """
+        Decode JSON text.
+
+        Args:
+            data: The JSON text, as str or UTF-8 bytes
+
+        Returns:
+            The decoded object
+
+        Raises:
+            ValueError: If the text is not valid JSON
+        """
+        return self._loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        """
+        Encode an object as compact JSON.
+
+        Non-ASCII text is written as UTF-8 rather than escaped.
+
+        Args:
+            obj: The object to encode
+
+        Returns:
+            The JSON text as UTF-8 bytes
+        """
+        return self._dumps(obj)
+
+    def dumps_str(self, obj: Any) -> str:
+        """
+        Encode an object as compact JSON text.
+
+        Args:
+            obj: The object to encode
+
+        Returns:
+            The JSON text
+        """
+        return self._dumps(obj).decode("utf-8")
+
+    def __repr__(self) -> str:
+        return f"JsonCodec({self.name!r})"
+
+def _stdlib_codec() -> JsonCodec:
+    """Build the codec backed by the json module."""
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    return JsonCodec("stdlib", json.loads, lambda obj: encoder.encode(obj).encode("utf-8"))
+
+def _orjson_codec() -> Optional[JsonCodec]:
+    """Build the orjson codec, if orjson is installed."""
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return JsonCodec("orjson", orjson.loads, orjson.dumps)
+
+def _msgspec_codec() -> Optional[JsonCodec]:
+    """Build the msgspec codec, if msgspec is installed."""
+    try:
+        import msgspec
+    except ImportError:
+        return None
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder()
+
+    def loads(data: JsonText) -> Any:
+        # msgspec raises its own DecodeError; callers expect ValueError like json and orjson
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+    return JsonCodec("msgspec", loads, encoder.encode)
+
+_FACTORIES: Dict[str, Callable[[], Optional[JsonCodec]]] = {
+    "orjson": _orjson_codec,
+    "msgspec": _msgspec_codec,
+    "stdlib": _stdlib_codec,
+}
+
+def available_codecs() -> List[JsonCodec]:
+    """
+    Get every codec whose library is installed.
+
+    Returns:
+        The codecs in order of preference; the stdlib codec is always last
+    """
+    return [codec for codec in (_FACTORIES[name]() for name in PREFERRED_CODECS) if codec is not None]
+
+def get_codec(name: Optional[str] = None) -> JsonCodec:
+    """
+    Get a codec by name, or the fastest installed one.
+
+    Args:
+        name: 'orjson', 'msgspec' or 'stdlib'; None or '' for the fastest installed
+
+    Returns:
+        The codec (the stdlib codec if the named library is not installed)
+    """
+    if name:
+        factory = _FACTORIES.get(name.lower())
+        codec = factory() if factory else None
+        if codec is not None:
+            return codec
+        logger.warning(f"JSON codec '{name}' is not available, using the fastest installed codec")
+    return available_codecs()[0]
+
+# Codec used by the message pipeline
+codec = get_codec(os.getenv("JSON_CODEC"))
+
+def loads(data: JsonText) -> Any:
+    """
+    Decode JSON text with the pipeline's codec.
+
+    Args:
+        data: The JSON text, as str or UTF-8 bytes
+
+    Returns:
+        The decoded object
+
+    Raises:
+        ValueError: If the text is not valid JSON
+    """
+    return codec.loads(data)
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode an object as compact UTF-8 JSON bytes with the pipeline's codec.
+
+    Args:
+        obj: The object to encode
+
+    Returns:
+        The JSON text as UTF-8 bytes
+    """
+    return codec.dumps(obj)
+
+def dumps_str(obj: Any) -> str:
+    """
+    Encode an object as compact JSON text with the pipeline's codec.
+
+    Args:
+        obj: The object to encode
+
+    Returns:
+        The JSON text
+    """
+    return codec.dumps_str(obj)
@@ -6,29 +6,141 @@ including detecting the language from user messages and storing user language pr
 """
 
 import logging
+import math
+import os
 import re
-from typing import Dict, Any, Optional
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional, Tuple
+
+from src.logging_utils import HOT_PATH, payload, sender_hash
 
 logger = logging.getLogger(__name__)
 
-# Define language detection patterns
-LANGUAGE_PATTERNS = {
-    'en': [
-        r'\b(?:hello|hi|hey|good morning|good day|good evening)\b',
-    ],
-    'xh': [
-        r'\b(?:molo|molweni|mholweni)\b',
-    ],
-    'af': [
-        r'\b(?:hallo|goeie dag|goeie môre|goeie more)\b',
-    ]
-}
+# Languages the assistant speaks, in the order of their scores
+LANGUAGES = ('en', 'xh', 'af')
 
-# Compile the patterns for efficiency
-COMPILED_PATTERNS = {
-    lang: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
-    for lang, patterns in LANGUAGE_PATTERNS.items()
+# Greetings that decide the language of a message on their own
+GREETINGS = {
+    'en': ['hello', 'hi', 'hey', 'good morning', 'good day', 'good evening'],
+    'xh': ['molo', 'molweni', 'mholweni'],
+    'af': ['hallo', 'goeie dag', 'goeie môre', 'goeie more'],
 }
+
+# All greetings in one pattern, matched against lowercased text; the named group of a
+# match is its language. The lookahead skips most positions without trying every
+# greeting, and IGNORECASE would make the search several times slower.
+GREETING_PATTERN = re.compile(
+    r"\b(?=[%s])(?:%s)\b" % (
+        ''.join(sorted({greeting[0] for greetings in GREETINGS.values() for greeting in greetings})),
+        '|'.join(f"(?P<{lang}>{'|'.join(map(re.escape, greetings))})" for lang, greetings in GREETINGS.items())
+    )
+)
+
+# Texts the n-gram scorer is trained on: files named <name>_<language>.txt
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TRAINING_DIRS = (
+    PROJECT_ROOT / "content",
+    PROJECT_ROOT / "data" / "message_templates",
+    PROJECT_ROOT / "data" / "language_samples",
+)
+
+# Characters per n-gram; words are padded with a space on each side
+NGRAM_SIZE = 3
+
+# Confidence below which detect_language returns the default language
+MIN_CONFIDENCE = float(os.getenv("LANGUAGE_MIN_CONFIDENCE", "0.95"))
+
+# Words of lowercased text: English, isiXhosa and Afrikaans are written in Latin letters
+WORD_PATTERN = re.compile(r"[a-zà-öø-ÿ]+")
+# Template markup that is not text in the template's language
+TRAINING_NOISE_PATTERN = re.compile(r"\[Placeholder:[^-]*-|/lang \w\w \([^)]*\)")
+
+class LanguageGuess(NamedTuple):
+    """A detected language and how sure the detector is of it."""
+
+    language: Optional[str]
+    confidence: float
+
+# Returned for text without any letters
+NO_GUESS = LanguageGuess(None, 0.0)
+
+def _word_ngrams(word: str) -> List[str]:
+    """Split a lowercase word into padded character n-grams."""
+    padded = f" {word} "
+    return [padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)]
+
+@lru_cache(maxsize=1)
+def _ngram_model() -> Tuple[Dict[str, Tuple[float, ...]], Tuple[float, ...]]:
+    """
+    Train the n-gram scorer on the message templates and language samples.
+
+    Returns:
+        A tuple of (log-probabilities of each n-gram per language, log-probabilities
+        of an unseen n-gram per language), both in LANGUAGES order
+    """
+    counts = {lang: Counter() for lang in LANGUAGES}
+    for directory in TRAINING_DIRS:
+        for path in sorted(directory.glob("*_*.txt")):
+            lang = path.stem.rsplit("_", 1)[1]
+            if lang not in counts:
+                continue
+            text = TRAINING_NOISE_PATTERN.sub(" ", path.read_text(encoding="utf-8").lower())
+            for word in WORD_PATTERN.findall(text):
+                counts[lang].update(_word_ngrams(word))
+
+    # Add-one smoothing over the n-grams seen in any language
+    vocabulary = set().union(*counts.values())
+    totals = [sum(counts[lang].values()) + len(vocabulary) + 1 for lang in LANGUAGES]
+    table = {
+        ngram: tuple(math.log((counts[lang][ngram] + 1) / total) for lang, total in zip(LANGUAGES, totals))
+        for ngram in vocabulary
+    }
+    logger.debug(f"Trained the language scorer on {len(vocabulary)} n-grams")
+    return table, tuple(math.log(1 / total) for total in totals)
+
+@lru_cache(maxsize=65536)
+def _word_scores(word: str) -> Tuple[float, ...]:
+    """Sum the n-gram log-probabilities of a lowercase word per language (cached, chat vocabulary repeats)."""
+    table, unseen = _ngram_model()
+    scores = [0.0] * len(LANGUAGES)
+    for ngram in _word_ngrams(word):
+        for i, log_probability in enumerate(table.get(ngram, unseen)):
+            scores[i] += log_probability
+    return tuple(scores)
+
+def guess_language(text: Optional[str]) -> LanguageGuess:
+    """
+    Detect the language of a text message and how sure the detection is.
+
+    A greeting (see GREETINGS) decides the language with confidence 1. Other
+    text is scored with character n-grams; the confidence is the probability of the
+    best language against the other two.
+
+    Args:
+        text: The text message to analyze
+
+    Returns:
+        The language code and confidence, or NO_GUESS for text without letters
+    """
+    if not text:
+        return NO_GUESS
+    text = str(text).lower()
+
+    greeting = GREETING_PATTERN.search(text)
+    if greeting:
+        return LanguageGuess(greeting.lastgroup, 1.0)
+
+    words = WORD_PATTERN.findall(text)
+    if not words:
+        return NO_GUESS
+    scores = list(map(sum, zip(*map(_word_scores, words))))
+
+    best = max(scores)
+    weights = [math.exp(score - best) for score in scores]
+    return LanguageGuess(LANGUAGES[scores.index(best)], 1 / sum(weights))
+
 def detect_initial_language(message_text: str, default_language: str = 'en') -> str:
     """
     Detect the initial language from a user's first message, focusing on common greetings.
@@ -43,42 +155,60 @@ def detect_initial_language(message_text: str, default_language: str = 'en') ->
     Returns:
         The detected language code ('en', 'xh', or 'af')
     """
-    logger.info(f"Detecting initial language from greeting: {message_text}")
+    logger.info("Detecting initial language from greeting: %s", payload(message_text), extra=HOT_PATH)
     
     # Use the existing language detection logic
     return detect_language(message_text, default_language)
 
-def detect_language(text: str, default_language: str = 'en') -> str:
+def detect_language(text: str, default_language: str = 'en', min_confidence: Optional[float] = None) -> str:
     """
     Detect the language of a text message.
     
     Args:
         text: The text message to analyze
-        default_language: The default language to return if no match is found
+        default_language: The language to return if the detection is not confident enough
+        min_confidence: Confidence required to return the detected language (default: MIN_CONFIDENCE)
     
     Returns:
         The detected language code ('en', 'xh', or 'af')
     """
-    logger.info(f"Detecting language for: {text}")
+    logger.info("Detecting language for: %s", payload(text), extra=HOT_PATH)
     
-    if not text:
+    language, confidence = guess_language(text)
+    if language is None or confidence < (MIN_CONFIDENCE if min_confidence is None else min_confidence):
         return default_language
+    return language
+
+def detect_languages(
+    texts: Iterable[Optional[str]],
+    default_language: str = 'en',
+    min_confidence: Optional[float] = None
+) -> List[LanguageGuess]:
+    """
+    Detect the languages of many text messages, e.g. to backfill users' languages.
     
-    # Convert to string in case None is passed
-    if text is None:
-        return default_language
-        
-    text = str(text).lower()
+    Repeated texts are scored once and the word scores are shared across the batch.
     
-    # Check each language's patterns
-    for lang, patterns in COMPILED_PATTERNS.items():
-        for pattern in patterns:
-            if pattern.search(text):
-                return lang
+    Args:
+        texts: The text messages to analyze
+        default_language: The language given to texts the detection is not confident about
+        min_confidence: Confidence required to keep a detected language (default: MIN_CONFIDENCE)
     
-    # If no match is found, return the default language
-    return default_language
-    return default_language
+    Returns:
+        The language and detection confidence of each text, in order
+    """
+    threshold = MIN_CONFIDENCE if min_confidence is None else min_confidence
+    guesses: Dict[Optional[str], LanguageGuess] = {}
+    results = []
+    for text in texts:
+        guess = guesses.get(text)
+        if guess is None:
+            language, confidence = guess_language(text)
+            if language is None or confidence < threshold:
+                language = default_language
+            guess = guesses[text] = LanguageGuess(language, confidence)
+        results.append(guess)
+    return results
 
 def get_user_language(user_id: str, default_language: str = 'en') -> str:
     """
@@ -92,7 +222,7 @@ def get_user_language(user_id: str, default_language: str = 'en') -> str:
         The user's preferred language code ('en', 'xh', or 'af')
     """
     # TODO: Implement user language retrieval
-    logger.info(f"Getting language preference for user: {user_id}")
+    logger.info("Getting language preference for user %s", sender_hash(user_id))
     
     # When implemented, this should work:
     # from src.db.supabase_client import get_client, get_user
@@ -120,7 +250,7 @@ def set_user_language(user_id: str, language: str) -> bool:
         True if successful, False otherwise
     """
     # TODO: Implement user language setting
-    logger.info(f"Setting language preference for user {user_id} to {language}")
+    logger.info("Setting language preference for user %s to %s", sender_hash(user_id), language)
     
     # Validate the language code
     if language not in ['en', 'xh', 'af']:
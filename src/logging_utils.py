@@ -0,0 +1,220 @@
+"""
+Logging Utilities Module for Township Connect WhatsApp Assistant.
+
+This module keeps the per-message log lines cheap and free of personal data:
+
+- message_logging sets a per-message context (a salted hash of the sender and a
+  trace ID) that ContextFilter adds to every record, so log lines do not need to
+  carry the sender's phone number.
+- payload wraps message text so it is redacted or truncated (LOG_PAYLOAD_MODE), and
+  only when the line is actually written; pass it as a %-style argument.
+- Lines logged with extra=HOT_PATH are sampled per message (LOG_SAMPLE_RATE): for an
+  unsampled message they are dropped below WARNING, and a sampled message keeps all
+  of them so its trace stays complete.
+- configure_logging sets up a handler with the filter and a text or JSON formatter
+  (LOG_FORMAT).
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+
+from src import json_codec
+
+# Pass as extra= to mark a per-message INFO/DEBUG line that may be sampled out
+HOT_PATH = {"hot_path": True}
+
+# Text format used by configure_logging
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(trace_id)s %(sender_hash)s]: %(message)s"
+
+# Shown for the context fields outside a message
+NO_CONTEXT = "-"
+
+# How message text is logged: 'redact' (length only), 'truncate' or 'full'
+PAYLOAD_MODE = os.getenv("LOG_PAYLOAD_MODE", "redact").lower()
+
+# Characters kept when PAYLOAD_MODE is 'truncate'
+PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "32"))
+
+# Share of messages whose HOT_PATH lines are written
+SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+# Salt for sender hashes, so they cannot be reversed by hashing every phone number
+_SENDER_HASH_SALT = os.getenv("LOG_SENDER_HASH_SALT", "").encode("utf-8")
+
+class MessageLogContext(NamedTuple):
+    """The log context of the message being handled."""
+
+    sender_hash: str
+    trace_id: str
+    sampled: bool
+
+# Context of the message being handled; copied into threads started with asyncio.to_thread
+_current_context: ContextVar[Optional[MessageLogContext]] = ContextVar("message_log_context", default=None)
+
+@lru_cache(maxsize=4096)
+def sender_hash(sender_id: str) -> str:
+    """
+    Get a short, stable pseudonym for a sender.
+
+    Args:
+        sender_id: The WhatsApp ID of the sender
+
+    Returns:
+        The first 12 hex digits of the salted SHA-256 HMAC of the sender ID
+    """
+    if not sender_id:
+        return NO_CONTEXT
+    return hmac.new(_SENDER_HASH_SALT, sender_id.encode("utf-8"), hashlib.sha256).hexdigest()[:12]
+
+@contextmanager
+def message_logging(sender_id: str, trace_id: Optional[str] = None) -> Iterator[MessageLogContext]:
+    """
+    Set the log context for the message handled inside the block.
+
+    If a context is already set (e.g. the async pipeline calling shared code), the
+    block keeps it.
+
+    Args:
+        sender_id: The WhatsApp ID of the sender
+        trace_id: ID linking the message's log lines, e.g. the MessageSid (default: random)
+
+    Yields:
+        The message's log context
+    """
+    current = _current_context.get()
+    if current is not None:
+        yield current
+        return
+
+    context = MessageLogContext(
+        sender_hash(sender_id),
+        trace_id or uuid.uuid4().hex[:16],
+        SAMPLE_RATE >= 1 or random.random() < SAMPLE_RATE
+    )
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+def current_log_context() -> Optional[MessageLogContext]:
+    """
+    Get the log context of the message being handled.
+
+    Returns:
+        The context, or None outside a message
+    """
+    return _current_context.get()
+
+class Payload:
+    """Message text that is redacted or truncated when, and only if, it is formatted."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: Any):
+        self.text = text
+
+    def __str__(self) -> str:
+        text = self.text if isinstance(self.text, str) else str(self.text)
+        if PAYLOAD_MODE == "full":
+            return text
+        if PAYLOAD_MODE == "truncate":
+            if len(text) <= PAYLOAD_MAX_CHARS:
+                return repr(text)
+            return f"{text[:PAYLOAD_MAX_CHARS]!r}... ({len(text)} chars)"
+        return f"<{len(text)} chars>"
+
+    __repr__ = __str__
+
+def payload(text: Any) -> Payload:
+    """
+    Wrap message text for logging as a %-style argument.
+
+    Args:
+        text: The message text (or any value whose str() is personal content)
+
+    Returns:
+        A wrapper formatted according to LOG_PAYLOAD_MODE
+    """
+    return Payload(text)
+
+class ContextFilter(logging.Filter):
+    """
+    Adds the message context to records and samples HOT_PATH lines.
+
+    Attach it to handlers (not loggers), so it also sees records propagated from
+    child loggers.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _current_context.get()
+        if context is None:
+            record.sender_hash = NO_CONTEXT
+            record.trace_id = NO_CONTEXT
+            return True
+
+        record.sender_hash = context.sender_hash
+        record.trace_id = context.trace_id
+        return context.sampled or record.levelno >= logging.WARNING or not getattr(record, "hot_path", False)
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", NO_CONTEXT),
+            "sender_hash": getattr(record, "sender_hash", NO_CONTEXT),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json_codec.dumps_str(entry)
+
+def install_context_filter(logger: Optional[logging.Logger] = None) -> ContextFilter:
+    """
+    Add a ContextFilter to every handler of a logger that does not have one yet.
+
+    Args:
+        logger: The logger whose handlers get the filter (default: the root logger)
+
+    Returns:
+        The filter
+    """
+    logger = logger or logging.getLogger()
+    context_filter = ContextFilter()
+    for handler in logger.handlers:
+        if not any(isinstance(f, ContextFilter) for f in handler.filters):
+            handler.addFilter(context_filter)
+    return context_filter
+
+def configure_logging(level: Optional[str] = None, log_format: Optional[str] = None) -> None:
+    """
+    Log to stderr with the message context, replacing the root logger's handlers.
+
+    Args:
+        level: The log level (default: LOG_LEVEL, or INFO)
+        log_format: 'text' or 'json' (default: LOG_FORMAT, or text)
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    if (log_format or os.getenv("LOG_FORMAT", "text")).lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
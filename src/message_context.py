@@ -0,0 +1,159 @@
+"""
+Message Context Module for Township Connect WhatsApp Assistant.
+
+This module provides MessageContext, which holds everything the pipeline derives from
+an incoming message: the sender, the normalized text, the parsed command, the user
+record and the payload format. It is built once per message and passed to every stage,
+so nothing is parsed or computed twice. Replies are serialized by serialize_reply, and
+the replies to repeated deliveries by serialize_duplicate.
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+from src import json_codec
+from src.db.user_record import UserRecord
+from src.logging_utils import HOT_PATH
+
+logger = logging.getLogger(__name__)
+
+# Message that records POPIA consent, compared against the upper-cased text
+POPIA_AGREEMENT_TEXT = "AGREE POPIA"
+
+# Last member of the reply to a repeated delivery, which must not be sent
+DUPLICATE_MARKER = '"duplicate":true}'
+
+def text_size_kb(text: str) -> float:
+    """
+    Get the size of a message for the message logs.
+
+    Args:
+        text: The message text
+
+    Returns:
+        The UTF-8 encoded size in KB
+    """
+    return len(text.encode('utf-8')) / 1024.0
+
+class MessageContext:
+    """
+    Per-message state shared by the pipeline stages.
+
+    The message fields are set when the context is built. The user fields start with
+    the values used for unknown senders and are filled in by the user lookup stage.
+    """
+
+    __slots__ = (
+        "message_data", "is_n8n_format", "sender_id", "text", "normalized_text", "size_kb",
+        "command_type", "command_params", "is_popia_agreement",
+        "user", "is_new_user", "language", "popia_consent_given"
+    )
+
+    def __init__(
+        self,
+        message_data: Dict[str, Any],
+        is_n8n_format: bool,
+        sender_id: str,
+        text: str,
+        command_type: str,
+        command_params: Dict[str, Any]
+    ):
+        """
+        Initialize the context for a message.
+
+        Args:
+            message_data: The parsed incoming message data
+            is_n8n_format: Whether the payload is in n8n format
+            sender_id: The WhatsApp ID of the sender
+            text: The message text as received
+            command_type: The command parsed from the text
+            command_params: The parameters of the command
+        """
+        self.message_data = message_data
+        self.is_n8n_format = is_n8n_format
+        self.sender_id = sender_id
+        self.text = text
+        self.normalized_text = text.strip()
+        self.size_kb = text_size_kb(text)
+        self.command_type = command_type
+        self.command_params = command_params
+        self.is_popia_agreement = self.normalized_text.upper() == POPIA_AGREEMENT_TEXT
+
+        self.user: Optional[UserRecord] = None
+        self.is_new_user = False
+        self.language = 'en'
+        self.popia_consent_given = False
+
+    def set_user(self, user: Optional[UserRecord], is_new_user: bool, language: str) -> None:
+        """
+        Record the result of the user lookup.
+
+        Args:
+            user: The user record, or None for new users
+            is_new_user: Whether the user was created for this message
+            language: The user's preferred (or, for new users, detected) language
+        """
+        self.user = user
+        self.is_new_user = is_new_user
+        self.language = language
+        self.popia_consent_given = user.get('popia_consent_given', False) if user else False
+
+    @property
+    def message_sid(self) -> str:
+        """The Twilio MessageSid of the message, or '' if the payload has none."""
+        if self.is_n8n_format:
+            message = self.message_data.get('message') or {}
+            return message.get('sid') or message.get('MessageSid') or ''
+        return self.message_data.get('MessageSid') or ''
+
+    def __repr__(self) -> str:
+        return (
+            f"MessageContext(sender_id={self.sender_id!r}, command_type={self.command_type!r}, "
+            f"language={self.language!r}, is_new_user={self.is_new_user})"
+        )
+
+def serialize_reply(ctx: MessageContext, reply_text: str, kind: str = "response") -> str:
+    """
+    Serialize the reply to a message.
+
+    n8n and direct (Twilio webhook) payloads get the same reply shape; the format is
+    only logged.
+
+    Args:
+        ctx: The context of the message being answered
+        reply_text: The reply text
+        kind: What the reply is, for the log line (e.g. 'POPIA notice')
+
+    Returns:
+        A JSON string containing the response data
+    """
+    logger.info("Sending %s format %s", 'n8n' if ctx.is_n8n_format else 'direct', kind, extra=HOT_PATH)
+    return json_codec.dumps_str({'reply_to': ctx.sender_id, 'reply_text': reply_text})
+
+def serialize_duplicate(ctx: MessageContext) -> str:
+    """
+    Serialize the reply to a repeated delivery of a message that is (being) answered.
+
+    The reply text is empty and the reply is marked as a duplicate, so callers send
+    nothing; the marker is the last member so that is_duplicate_reply needs no parsing.
+
+    Args:
+        ctx: The context of the repeated delivery
+
+    Returns:
+        A JSON string containing the duplicate marker
+    """
+    logger.info("Marking repeated delivery as a duplicate", extra=HOT_PATH)
+    return json_codec.dumps_str({'reply_to': ctx.sender_id, 'reply_text': '', 'duplicate': True})
+
+def is_duplicate_reply(reply: str) -> bool:
+    """
+    Check whether a reply JSON answers a repeated delivery and must not be sent.
+
+    Args:
+        reply: A reply JSON string
+
+    Returns:
+        True if the reply was built by serialize_duplicate
+    """
+    return reply.endswith(DUPLICATE_MARKER)
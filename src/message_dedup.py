@@ -0,0 +1,158 @@
+"""
+Message Deduplication Module for Township Connect WhatsApp Assistant.
+
+Twilio retries a webhook when the reply is slow, so the same message (same MessageSid)
+can arrive several times. This module provides MessageDedup, which lets only the first
+delivery of a MessageSid through the pipeline. The first delivery claims the SID in
+Redis with SET NX on a short lease and, once answered, marks it done for the full TTL;
+later deliveries are reported as duplicates without logging, publishing or answering
+the message again. Only the marker is stored, never the reply, which holds the user's
+own content. If the process handling the first delivery dies, the
+lease runs out and a retry is handled normally.
+"""
+
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from src.redis_batch import defer_command, execute_command
+
+logger = logging.getLogger(__name__)
+
+# Prefix for the per-message Redis keys
+REDIS_KEY_PREFIX = "township-connect:message-sid:"
+
+# Value of a claimed key until the message is answered
+PENDING = "__pending__"
+
+# Value of the key of an answered message
+DONE = "__done__"
+
+class MessageDedup:
+    """
+    Claims MessageSids and remembers which were answered in Redis.
+
+    A claim is a PENDING value that expires after lease_seconds; complete() replaces it
+    with DONE, remembered for ttl_seconds. A duplicate that arrives while the first
+    delivery is still being handled waits up to wait_seconds for it to finish, and gets
+    PENDING if it still has not. If handling fails, the claim is released so
+    that Twilio's next retry (or a waiting duplicate) is handled normally; if the process
+    dies, the lease expires instead. Keep the lease above the time a message takes to
+    handle, or a slow first delivery and a retry are both handled.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        ttl_seconds: int = 86400,
+        lease_seconds: int = 30,
+        wait_seconds: float = 2.0,
+        poll_interval_seconds: float = 0.1
+    ):
+        """
+        Initialize the deduplicator.
+
+        Args:
+            redis_client: A Redis client
+            ttl_seconds: How long an answered MessageSid is remembered (default: 86400)
+            lease_seconds: How long a claim lasts without being completed (default: 30)
+            wait_seconds: How long a duplicate waits for the first delivery to finish (default: 2)
+            poll_interval_seconds: How often a waiting duplicate checks the claim again (default: 0.1)
+        """
+        self.redis_client = redis_client
+        self.ttl = ttl_seconds
+        self.lease = lease_seconds
+        self.wait = wait_seconds
+        self.poll_interval = poll_interval_seconds
+
+        self.stats = {"claimed": 0, "duplicates": 0, "in_progress": 0, "released": 0}
+
+    @classmethod
+    def from_env(cls, redis_client) -> "MessageDedup":
+        """
+        Create a deduplicator configured from environment variables.
+
+        Reads MESSAGE_DEDUP_TTL_SECONDS, MESSAGE_DEDUP_LEASE_SECONDS and
+        MESSAGE_DEDUP_WAIT_SECONDS, falling back to the defaults.
+
+        Args:
+            redis_client: A Redis client
+
+        Returns:
+            A MessageDedup instance
+        """
+        return cls(
+            redis_client,
+            ttl_seconds=int(os.getenv("MESSAGE_DEDUP_TTL_SECONDS", "86400")),
+            lease_seconds=int(os.getenv("MESSAGE_DEDUP_LEASE_SECONDS", "30")),
+            wait_seconds=float(os.getenv("MESSAGE_DEDUP_WAIT_SECONDS", "2"))
+        )
+
+    def claim(self, message_sid: str) -> Optional[str]:
+        """
+        Claim a MessageSid for handling.
+
+        Args:
+            message_sid: The Twilio MessageSid
+
+        Returns:
+            None if this delivery should be handled; otherwise DONE if the first
+            delivery was answered, or PENDING if it is still being handled
+        """
+        key = REDIS_KEY_PREFIX + message_sid
+        deadline = time.monotonic() + self.wait
+        try:
+            while True:
+                if execute_command(self.redis_client, "set", key, PENDING, nx=True, ex=self.lease):
+                    self.stats["claimed"] += 1
+                    return None
+                status = _to_str(execute_command(self.redis_client, "get", key))
+                if status == DONE:
+                    break
+                if time.monotonic() >= deadline:
+                    status = PENDING
+                    break
+                # Still being handled, or released since the SET: check again shortly
+                time.sleep(self.poll_interval)
+        except Exception as e:
+            # Without Redis, handling a duplicate is better than dropping a message
+            logger.error("Error checking MessageSid %s: %s", message_sid, e)
+            return None
+
+        if status == PENDING:
+            self.stats["in_progress"] += 1
+            logger.warning("Duplicate delivery of %s while the first is still being handled", message_sid)
+        else:
+            self.stats["duplicates"] += 1
+            logger.info("Duplicate delivery of %s, which was already answered", message_sid)
+        return status
+
+    def complete(self, message_sid: str) -> None:
+        """
+        Mark a claimed MessageSid answered, remembering it for the full TTL.
+
+        Args:
+            message_sid: The Twilio MessageSid
+        """
+        try:
+            defer_command(self.redis_client, "set", REDIS_KEY_PREFIX + message_sid, DONE, ex=self.ttl)
+        except Exception as e:
+            logger.error("Error completing MessageSid %s: %s", message_sid, e)
+
+    def release(self, message_sid: str) -> None:
+        """
+        Forget a claimed MessageSid whose handling failed, so a retry is handled again.
+
+        Args:
+            message_sid: The Twilio MessageSid
+        """
+        self.stats["released"] += 1
+        try:
+            defer_command(self.redis_client, "delete", REDIS_KEY_PREFIX + message_sid)
+        except Exception as e:
+            logger.error("Error releasing MessageSid %s: %s", message_sid, e)
+
+def _to_str(value: Any) -> Optional[str]:
+    """Decode a Redis reply value."""
+    return value.decode("utf-8") if isinstance(value, bytes) else value
@@ -0,0 +1,558 @@
+"""
+Outbound Sender Module for Township Connect WhatsApp Assistant.
+
+This module sends replies through the Twilio Messages API instead of the n8n Twilio
+node. OutboundSender takes the reply_to/reply_text pair returned by
+core_handler.handle_incoming_message, queues it and sends it from worker threads that
+share one pool of keep-alive connections. A token bucket per sending number keeps
+the send rate at Twilio's per-number limit, and rate-limited (429) or failed sends
+are retried with exponential backoff, honouring Retry-After.
+
+ReplyStreamSender feeds the sender from the outgoing_whatsapp_replies stream written
+by the stream workers.
+"""
+
+import logging
+import os
+import queue
+import random
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from redis.exceptions import ResponseError
+
+from src import json_codec
+from src.logging_utils import payload, sender_hash
+from src.message_context import is_duplicate_reply
+from src.stream_archive import report_cap_trim
+from src.stream_worker import REPLY_STREAM_NAME
+
+logger = logging.getLogger(__name__)
+
+# Base URL of the Twilio REST API; point it at a stub server for load tests
+TWILIO_API_BASE_URL = "https://api.twilio.com"
+
+# Consumer group of the reply senders on the outgoing replies stream
+REPLY_SENDER_GROUP = "reply-senders"
+
+# Stream that replies which could not be sent are moved to
+FAILED_REPLY_STREAM_NAME = "outgoing_whatsapp_replies:failed"
+
+# HTTP statuses worth retrying: rate limited, or a Twilio-side failure
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Called with True once a reply is sent, or False once it is given up on
+SendCallback = Callable[[bool], None]
+
+# Queued reply: (reply_to, reply_text, from_number, callback)
+_Reply = Tuple[str, str, str, Optional[SendCallback]]
+
+class TokenBucket:
+    """
+    A thread-safe token bucket.
+
+    Tokens are added at rate per second up to burst. acquire reserves a token even when
+    the bucket is empty and sleeps until it is due, so waiting callers are served in
+    the order they arrived and the long-run rate never exceeds rate.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate: Tokens added per second
+            burst: Maximum number of tokens (default: 1)
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take a token, waiting until one is available.
+
+        Returns:
+            The number of seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def penalize(self, seconds: float) -> None:
+        """
+        Stop handing out tokens for a while, e.g. after a 429 from Twilio.
+
+        Args:
+            seconds: How long no token should be available
+        """
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+class TwilioMessageClient:
+    """
+    Minimal client for the Twilio Messages API over a pooled requests session.
+
+    The session keeps up to pool_size connections alive, so concurrent senders reuse
+    TLS connections instead of opening one per message.
+    """
+
+    def __init__(
+        self,
+        account_sid: str,
+        auth_token: str,
+        base_url: str = TWILIO_API_BASE_URL,
+        pool_size: int = 8,
+        timeout: float = 10.0
+    ):
+        """
+        Initialize the client.
+
+        Args:
+            account_sid: The Twilio account SID
+            auth_token: The Twilio auth token
+            base_url: Base URL of the Twilio API (default: https://api.twilio.com)
+            pool_size: Maximum number of kept-alive connections (default: 8)
+            timeout: Seconds to wait for Twilio to respond (default: 10)
+        """
+        self.url = f"{base_url.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.auth = (account_sid, auth_token)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def send(self, from_number: str, to: str, body: str) -> requests.Response:
+        """
+        Create a message.
+
+        Args:
+            from_number: The sending number, e.g. 'whatsapp:+14155238886'
+            to: The recipient, e.g. 'whatsapp:+27123456789'
+            body: The message text
+
+        Returns:
+            The HTTP response
+        """
+        return self.session.post(
+            self.url, data={"From": from_number, "To": to, "Body": body}, timeout=self.timeout
+        )
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self.session.close()
+
+class OutboundSender:
+    """
+    Queues replies and sends them from worker threads at a bounded rate.
+
+    Each sending number has its own token bucket, so replies from one number never
+    use another number's allowance. A 429 also pauses that number's bucket for the
+    Retry-After time, so the other threads back off with the one that was refused
+    instead of each running into the limit.
+    """
+
+    def __init__(
+        self,
+        client: TwilioMessageClient,
+        from_number: str,
+        rate_per_second: float = 20.0,
+        burst: int = 1,
+        workers: int = 4,
+        max_attempts: int = 5,
+        backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 30.0,
+        max_queue_size: int = 10000
+    ):
+        """
+        Initialize the sender. Worker threads start with start().
+
+        Args:
+            client: The Twilio client
+            from_number: Default sending number, e.g. 'whatsapp:+14155238886'
+            rate_per_second: Messages per second allowed per sending number (default: 20)
+            burst: Messages a sending number may send at once after being idle (default: 1)
+            workers: Number of sending threads (default: 4)
+            max_attempts: Attempts per reply before giving up (default: 5)
+            backoff_seconds: Delay before the first retry, doubled for each retry (default: 0.5)
+            max_backoff_seconds: Maximum delay between retries (default: 30)
+            max_queue_size: Maximum queued replies; submit blocks when full (default: 10000)
+        """
+        self.client = client
+        self.from_number = from_number
+        self.rate = rate_per_second
+        self.burst = burst
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff_seconds
+        self.max_backoff = max_backoff_seconds
+
+        self._queue: "queue.Queue[Optional[_Reply]]" = queue.Queue(max_queue_size)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "rate_limited": 0, "duplicates": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["OutboundSender"]:
+        """
+        Create a sender configured from environment variables.
+
+        Reads TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM,
+        TWILIO_API_BASE_URL, OUTBOUND_RATE_PER_SECOND, OUTBOUND_BURST,
+        OUTBOUND_WORKERS and OUTBOUND_MAX_ATTEMPTS, falling back to the defaults.
+
+        Returns:
+            An OutboundSender instance (not started), or None if the Twilio account
+            or sending number is not configured
+        """
+        account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+        auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+        from_number = os.getenv("TWILIO_WHATSAPP_FROM")
+        if not (account_sid and auth_token and from_number):
+            return None
+
+        workers = int(os.getenv("OUTBOUND_WORKERS", "4"))
+        client = TwilioMessageClient(
+            account_sid,
+            auth_token,
+            base_url=os.getenv("TWILIO_API_BASE_URL", TWILIO_API_BASE_URL),
+            pool_size=workers
+        )
+        return cls(
+            client,
+            from_number,
+            rate_per_second=float(os.getenv("OUTBOUND_RATE_PER_SECOND", "20")),
+            burst=int(os.getenv("OUTBOUND_BURST", "1")),
+            workers=workers,
+            max_attempts=int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "5"))
+        )
+
+    def start(self) -> None:
+        """Start the sending threads."""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbound-sender-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} outbound senders at {self.rate:g} messages/s per number")
+
+    def stop(self, timeout: Optional[float] = 30.0) -> None:
+        """
+        Send the queued replies, then stop the sending threads.
+
+        Args:
+            timeout: Seconds to wait for each thread (default: 30)
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(
+        self,
+        reply_to: str,
+        reply_text: str,
+        from_number: Optional[str] = None,
+        callback: Optional[SendCallback] = None
+    ) -> None:
+        """
+        Queue a reply for sending.
+
+        Args:
+            reply_to: The recipient, as returned in reply_to
+            reply_text: The message text, as returned in reply_text
+            from_number: The sending number (default: the sender's from_number)
+            callback: Called with True once the reply is sent, or False if it is given up on
+        """
+        self._queue.put((reply_to, reply_text, from_number or self.from_number, callback))
+
+    def submit_reply(self, reply_json: str, callback: Optional[SendCallback] = None) -> bool:
+        """
+        Queue a reply JSON returned by core_handler.handle_incoming_message.
+
+        Replies to a repeated delivery (marked as duplicates), empty replies and replies
+        to an unknown sender are not sent.
+
+        Args:
+            reply_json: A JSON string with reply_to and reply_text
+            callback: Called with True once the reply is sent, or False if it is given up on
+
+        Returns:
+            True if the reply was queued, False if there is nothing to send
+        """
+        if is_duplicate_reply(reply_json):
+            self._count("duplicates")
+            return False
+        try:
+            reply = json_codec.loads(reply_json)
+            reply_to, reply_text = reply.get("reply_to"), reply.get("reply_text")
+        except (ValueError, AttributeError):
+            logger.error("Not sending malformed reply: %s", payload(reply_json))
+            return False
+
+        if not reply_text or not reply_to or reply_to == "unknown":
+            return False
+        self.submit(reply_to, reply_text, callback=callback)
+        return True
+
+    def queue_size(self) -> int:
+        """
+        Get the number of replies waiting to be sent.
+
+        Returns:
+            The queue size
+        """
+        return self._queue.qsize()
+
+    def send(self, reply_to: str, reply_text: str, from_number: Optional[str] = None) -> bool:
+        """
+        Send a reply now, waiting for the rate limit and retrying failures.
+
+        Args:
+            reply_to: The recipient
+            reply_text: The message text
+            from_number: The sending number (default: the sender's from_number)
+
+        Returns:
+            True if Twilio accepted the message, False if it was given up on
+        """
+        from_number = from_number or self.from_number
+        bucket = self._bucket(from_number)
+
+        for attempt in range(1, self.max_attempts + 1):
+            bucket.acquire()
+            retry_after = None
+            try:
+                response = self.client.send(from_number, reply_to, reply_text)
+            except requests.RequestException as e:
+                error = str(e)
+            else:
+                if response.status_code < 300:
+                    self._count("sent")
+                    return True
+                error = f"HTTP {response.status_code}: {_redact_number(response.text[:200], reply_to)}"
+                if response.status_code not in RETRYABLE_STATUSES:
+                    break
+                if response.status_code == 429:
+                    self._count("rate_limited")
+                    retry_after = _retry_after(response)
+
+            if attempt == self.max_attempts:
+                break
+            self._count("retries")
+            if retry_after is not None:
+                # The next acquire waits out Retry-After, for every thread using this number
+                bucket.penalize(retry_after)
+                logger.warning("Rate limited sending to %s, retrying in %.2fs (attempt %d)", sender_hash(reply_to), retry_after, attempt)
+            else:
+                delay = self._backoff_delay(attempt)
+                logger.warning("Retrying reply to %s in %.2fs (attempt %d): %s", sender_hash(reply_to), delay, attempt, error)
+                time.sleep(delay)
+
+        self._count("failed")
+        logger.error("Giving up on reply to %s after %d attempts: %s", sender_hash(reply_to), attempt, error)
+        return False
+
+    def _count(self, name: str) -> None:
+        """Increment a counter; several sending threads update them."""
+        with self._lock:
+            self.stats[name] += 1
+
+    def _bucket(self, from_number: str) -> TokenBucket:
+        """Get the token bucket of a sending number."""
+        with self._lock:
+            bucket = self._buckets.get(from_number)
+            if bucket is None:
+                bucket = self._buckets[from_number] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for a retry."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def _run(self) -> None:
+        """Sending thread: send queued replies until stopped."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            reply_to, reply_text, from_number, callback = item
+            try:
+                sent = self.send(reply_to, reply_text, from_number)
+            except Exception as e:
+                logger.error("Error sending reply to %s: %s", sender_hash(reply_to), e)
+                sent = False
+            if callback:
+                try:
+                    callback(sent)
+                except Exception as e:
+                    logger.error("Error in reply callback for %s: %s", sender_hash(reply_to), e)
+
+class ReplyStreamSender:
+    """
+    Feeds an OutboundSender from the outgoing replies stream.
+
+    Entries are read through the reply-senders consumer group and acknowledged once
+    their reply is sent. Replies that are given up on are copied to the failed replies
+    stream before being acknowledged. Entries left pending by a crashed process are
+    reclaimed with XAUTOCLAIM once idle for claim_idle_ms; keep it well above the time
+    a reply can wait in the sender's queue, or slow replies are sent twice.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        sender: OutboundSender,
+        consumer_name: Optional[str] = None,
+        group: str = REPLY_SENDER_GROUP,
+        stream: str = REPLY_STREAM_NAME,
+        batch_size: int = 50,
+        block_ms: int = 2000,
+        claim_idle_ms: int = 300000,
+        claim_interval_seconds: float = 60
+    ):
+        """
+        Initialize the stream sender.
+
+        Args:
+            redis_client: A Redis client
+            sender: The sender replies are submitted to
+            consumer_name: Name of this consumer within the group (default: host and process ID)
+            group: The consumer group name (default: 'reply-senders')
+            stream: The stream to consume (default: 'outgoing_whatsapp_replies')
+            batch_size: Maximum number of entries read at once (default: 50)
+            block_ms: How long a read waits for new entries (default: 2000)
+            claim_idle_ms: How long an entry must be pending before it is reclaimed (default: 300000)
+            claim_interval_seconds: How often pending entries are reclaimed (default: 60)
+        """
+        self.redis_client = redis_client
+        self.sender = sender
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.group = group
+        self.stream = stream
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval_seconds
+
+        self._claim_cursor = "0-0"
+        self._next_claim = 0.0
+        self._reported_cap_trim: Optional[str] = None
+
+    def ensure_group(self) -> None:
+        """
+        Create the consumer group (and the stream) if it does not exist yet.
+
+        A new group starts at the end of the stream, so replies that are already stale
+        when the sender is first deployed are not sent.
+        """
+        try:
+            self.redis_client.xgroup_create(self.stream, self.group, id="$", mkstream=True)
+            logger.info(f"Created consumer group '{self.group}' on stream '{self.stream}'")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def run_once(self) -> int:
+        """
+        Reclaim stale entries if due, then read one batch of new entries and submit their replies.
+
+        Returns:
+            The number of entries submitted
+        """
+        entries = []
+        if time.monotonic() >= self._next_claim:
+            response = self.redis_client.xautoclaim(
+                self.stream, self.group, self.consumer_name, self.claim_idle_ms,
+                start_id=self._claim_cursor, count=self.batch_size
+            )
+            self._claim_cursor = _to_str(response[0])
+            entries.extend(response[1])
+            self._next_claim = time.monotonic() + self.claim_interval
+            # Only the emergency cap trims this stream; report replies it dropped unsent
+            self._reported_cap_trim = report_cap_trim(
+                self.redis_client, self.stream, last_reported=self._reported_cap_trim
+            )
+
+        response = self.redis_client.xreadgroup(
+            self.group, self.consumer_name, {self.stream: ">"},
+            count=self.batch_size, block=self.block_ms
+        )
+        entries.extend(entry for _, stream_entries in response or [] for entry in stream_entries)
+
+        for entry_id, fields in entries:
+            self.submit_entry(_to_str(entry_id), {_to_str(k): _to_str(v) for k, v in fields.items()})
+        return len(entries)
+
+    def submit_entry(self, entry_id: str, fields: Dict[str, str]) -> None:
+        """
+        Submit the reply of one entry, acknowledging it once it is sent or given up on.
+
+        Args:
+            entry_id: The stream entry ID
+            fields: The entry fields
+        """
+        def finish(sent: bool) -> None:
+            if not sent:
+                self.redis_client.xadd(FAILED_REPLY_STREAM_NAME, {**fields, "reply_id": entry_id})
+            self.redis_client.xack(self.stream, self.group, entry_id)
+
+        if not self.sender.submit_reply(fields.get("data", ""), callback=finish):
+            self.redis_client.xack(self.stream, self.group, entry_id)
+
+    def run(self, stop_event: threading.Event) -> None:
+        """
+        Submit replies until stop_event is set.
+
+        Redis errors are logged and retried with a growing delay.
+
+        Args:
+            stop_event: Event that stops the loop when set
+        """
+        self.ensure_group()
+        backoff = 0.0
+        while not stop_event.is_set():
+            try:
+                self.run_once()
+                backoff = 0.0
+            except Exception as e:
+                backoff = min(backoff * 2 or 0.5, 30.0)
+                logger.error(f"Reply stream sender error, retrying in {backoff}s: {str(e)}")
+                stop_event.wait(backoff)
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Get the Retry-After delay of a response in seconds, if it has one."""
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return None
+
+def _redact_number(text: str, reply_to: str) -> str:
+    """Replace the recipient's number in a Twilio error message with its sender hash."""
+    number = reply_to.split(":", 1)[-1]
+    return text.replace(number, sender_hash(reply_to)) if number else text
+
+def _to_str(value: Any) -> str:
+    """Decode a Redis reply value."""
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
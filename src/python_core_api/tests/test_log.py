@@ -0,0 +1,71 @@
+import io
+import logging
+import threading
+
+from loguru import logger
+
+from township_connect_py_core.log import LOG_FORMAT, InterceptHandler, QueueSink
+from township_connect_py_core.settings import LogCaller
+
+
+class BlockedStream(io.StringIO):
+    """Stream whose writes wait until it is released."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.released = threading.Event()
+
+    def write(self, message: str) -> int:
+        self.released.wait()
+        return super().write(message)
+
+
+def test_queue_sink_drops_instead_of_blocking() -> None:
+    """Tests that a blocked stream makes the sink drop messages, not block."""
+    stream = BlockedStream()
+    sink = QueueSink(stream, max_size=2)
+
+    for number in range(10):
+        sink.write(f"message {number}\n")
+    stream.released.set()
+    sink.stop()
+
+    output = stream.getvalue()
+    assert "message 0\n" in output
+    assert "log messages dropped" in output
+    assert output.count("message ") < 10
+
+
+def test_removing_the_handler_drains_the_queue_sink() -> None:
+    """Tests that messages queued at shutdown are written, not lost."""
+    stream = BlockedStream()
+    handler_id = logger.add(QueueSink(stream), format="{message}", colorize=False)
+
+    logger.info("Shutting down")
+    logger.info("Flushed log writer")
+    stream.released.set()
+    logger.remove(handler_id)
+
+    assert stream.getvalue() == "Shutting down\nFlushed log writer\n"
+
+
+def test_intercepted_record_keeps_caller_and_context() -> None:
+    """Tests that intercepted records keep their caller and message context."""
+    stream = io.StringIO()
+    handler_id = logger.add(stream, format=LOG_FORMAT, colorize=False)
+    stdlib_logger = logging.getLogger("src.core_handler")
+    stdlib_logger.addHandler(InterceptHandler(LogCaller.RECORD))
+    stdlib_logger.setLevel(logging.INFO)
+    try:
+        stdlib_logger.info(
+            "Received message: %s",
+            "<4 chars>",
+            extra={"trace_id": "SM0001", "sender_hash": "0a1b2c3d4e5f"},
+        )
+    finally:
+        stdlib_logger.handlers = []
+        logger.remove(handler_id)
+
+    output = stream.getvalue()
+    assert "src.core_handler:test_intercepted_record_keeps_caller_and_context" in output
+    assert "[SM0001 0a1b2c3d4e5f] - Received message: <4 chars>" in output
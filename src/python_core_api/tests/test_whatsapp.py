@@ -0,0 +1,132 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette import status
+
+from township_connect_py_core.services.message_core.dependency import (
+    get_message_enqueuer,
+    get_message_handler,
+)
+
+
+async def echo_handler(message_data_json_string: str) -> str:
+    """
+    Minimal stand-in for the message core.
+
+    :param message_data_json_string: inbound payload.
+    :return: echo reply.
+    """
+    message_data = json.loads(message_data_json_string)
+    return json.dumps(
+        {
+            "reply_to": message_data["From"],
+            "reply_text": f"Echo: {message_data['Body']}",
+        },
+    )
+
+
+@pytest.mark.anyio
+async def test_inbound_message(fastapi_app: FastAPI, client: AsyncClient) -> None:
+    """
+    Tests that inbound messages are passed to the message core.
+
+    :param fastapi_app: current application.
+    :param client: client for the app.
+    """
+    fastapi_app.dependency_overrides[get_message_handler] = lambda: echo_handler
+    url = fastapi_app.url_path_for("handle_inbound_message")
+    response = await client.post(
+        url,
+        json={"From": "whatsapp:+27123456789", "Body": "Hello"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "reply_to": "whatsapp:+27123456789",
+        "reply_text": "Echo: Hello",
+    }
+
+
+@pytest.mark.anyio
+async def test_duplicate_inbound_message(
+    fastapi_app: FastAPI,
+    client: AsyncClient,
+) -> None:
+    """
+    Tests that a repeated delivery gets no reply to send.
+
+    :param fastapi_app: current application.
+    :param client: client for the app.
+    """
+
+    async def duplicate_handler(message_data_json_string: str) -> str:
+        return '{"reply_to":"whatsapp:+27123456789","reply_text":"","duplicate":true}'
+
+    fastapi_app.dependency_overrides[get_message_handler] = lambda: duplicate_handler
+    url = fastapi_app.url_path_for("handle_inbound_message")
+    response = await client.post(
+        url,
+        json={"From": "whatsapp:+27123456789", "Body": "Hello", "MessageSid": "SM1"},
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert response.content == b""
+
+
+@pytest.mark.anyio
+async def test_enqueue_message(fastapi_app: FastAPI, client: AsyncClient) -> None:
+    """
+    Tests that enqueued messages are handed to the stream and acknowledged.
+
+    :param fastapi_app: current application.
+    :param client: client for the app.
+    """
+    enqueued = []
+
+    def enqueuer(message_data_json_string: str) -> str:
+        enqueued.append(json.loads(message_data_json_string))
+        return "1700000000000-0"
+
+    fastapi_app.dependency_overrides[get_message_enqueuer] = lambda: enqueuer
+    url = fastapi_app.url_path_for("enqueue_inbound_message")
+    payload = {"From": "whatsapp:+27123456789", "Body": "Hello"}
+    response = await client.post(url, json=payload)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json() == {"message_id": "1700000000000-0"}
+    assert enqueued == [payload]
+
+
+@pytest.mark.anyio
+async def test_enqueue_message_unavailable(
+    fastapi_app: FastAPI,
+    client: AsyncClient,
+) -> None:
+    """
+    Tests that the endpoint reports when the stream cannot be reached.
+
+    :param fastapi_app: current application.
+    :param client: client for the app.
+    """
+    fastapi_app.dependency_overrides[get_message_enqueuer] = lambda: lambda data: None
+    url = fastapi_app.url_path_for("enqueue_inbound_message")
+    response = await client.post(
+        url,
+        json={"From": "whatsapp:+27123456789", "Body": "Hello"},
+    )
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+@pytest.mark.anyio
+async def test_enqueue_empty_body(fastapi_app: FastAPI, client: AsyncClient) -> None:
+    """
+    Tests that an empty body is rejected instead of being enqueued.
+
+    :param fastapi_app: current application.
+    :param client: client for the app.
+    """
+    enqueued = []
+    fastapi_app.dependency_overrides[get_message_enqueuer] = lambda: enqueued.append
+    url = fastapi_app.url_path_for("enqueue_inbound_message")
+    response = await client.post(url, content=b"")
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert enqueued == []
@@ -1,10 +1,85 @@
+import inspect
 import logging
+import queue
 import sys
-from typing import Union
+import threading
+from typing import Any, Callable, Optional, TextIO, Union
 
 from loguru import logger
 
-from township_connect_py_core.settings import settings
+from township_connect_py_core.settings import LogCaller, settings
+
+# Default loguru format plus the message context set by the message core.
+LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
+    "<level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> | "
+    "[{extra[trace_id]} {extra[sender_hash]}] - <level>{message}</level>"
+)
+
+# Shown for the context fields outside a message.
+NO_CONTEXT = "-"
+
+
+class QueueSink:
+    """
+    Loguru sink that writes messages to a stream from a background thread.
+
+    Messages are formatted by the logging call and queued; a slow or blocked
+    stream fills the queue instead of stalling the event loop. When the queue
+    is full, messages are dropped and counted, and the count is written once
+    the stream catches up.
+
+    Loguru calls `stop` when the sink's handler is removed, which writes the
+    messages still queued.
+    """
+
+    def __init__(self, stream: TextIO, max_size: int = 10000) -> None:
+        self.stream = stream
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(max_size)
+        self._thread = threading.Thread(
+            target=self._run,
+            name="log-sink",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def write(self, message: str) -> None:
+        """
+        Queues a formatted message.
+
+        :param message: message to write.
+        """
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            # Logging threads (e.g. asyncio.to_thread workers) write concurrently
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def stop(self) -> None:
+        """Writes the queued messages and stops the thread."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        """Background loop: writes messages, flushing when the queue is empty."""
+        while True:
+            message = self._queue.get()
+            if message is None:
+                self.stream.flush()
+                return
+            if self.dropped:
+                with self._dropped_lock:
+                    dropped, self.dropped = self.dropped, 0
+                self.stream.write(f"{dropped} log messages dropped, the log sink fell behind\n")
+            self.stream.write(message)
+            if self._queue.empty():
+                self.stream.flush()
 
 
 class InterceptHandler(logging.Handler):
@@ -14,11 +89,19 @@ class InterceptHandler(logging.Handler):
     This handler intercepts all log requests and
     passes them to loguru.
 
+    With the `record` caller mode the caller is taken from the
+    standard library record, which already found it, instead of
+    walking the frames again for every record.
+
     For more info see:
     https://loguru.readthedocs.io/en/stable/overview.html#entirely-compatible-with-standard-logging
     """
 
-    def emit(self, record: logging.LogRecord) -> None:  # pragma: no cover
+    def __init__(self, caller: LogCaller = LogCaller.RECORD) -> None:
+        super().__init__()
+        self.caller = caller
+
+    def emit(self, record: logging.LogRecord) -> None:
         """
         Propagates logs to loguru.
 
@@ -29,21 +112,56 @@ class InterceptHandler(logging.Handler):
         except ValueError:
             level = record.levelno
 
-        # Find caller from where originated the logged message
-        frame, depth = logging.currentframe(), 2
-        while frame.f_code.co_filename == logging.__file__:
-            frame = frame.f_back  # type: ignore
-            depth += 1
-
-        logger.opt(depth=depth, exception=record.exc_info).log(
+        if self.caller == LogCaller.FRAMES:
+            # Find caller from where originated the logged message
+            frame, depth = inspect.currentframe(), 0
+            while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+                frame = frame.f_back
+                depth += 1
+            record_logger = logger.opt(depth=depth, exception=record.exc_info)
+        else:
+            record_logger = logger.opt(exception=record.exc_info)
+
+        record_logger.patch(_record_patcher(record, self.caller)).log(
             level,
             record.getMessage(),
         )
 
 
-def configure_logging() -> None:  # pragma: no cover
-    """Configures logging."""
-    intercept_handler = InterceptHandler()
+def _record_patcher(
+    record: logging.LogRecord,
+    caller: LogCaller,
+) -> Callable[[Any], None]:
+    """
+    Builds a loguru patcher copying a standard library record's details.
+
+    :param record: standard library record.
+    :param caller: caller resolution mode.
+    :return: patcher.
+    """
+
+    def patch(loguru_record: Any) -> None:
+        extra = loguru_record["extra"]
+        extra["trace_id"] = getattr(record, "trace_id", NO_CONTEXT)
+        extra["sender_hash"] = getattr(record, "sender_hash", NO_CONTEXT)
+        if caller == LogCaller.RECORD:
+            loguru_record["name"] = record.name
+            loguru_record["file"] = type(loguru_record["file"])(record.filename, record.pathname)
+            loguru_record["module"] = record.module
+            loguru_record["function"] = record.funcName
+            loguru_record["line"] = record.lineno
+
+    return patch
+
+
+def configure_logging() -> Optional[int]:  # pragma: no cover
+    """
+    Configures logging.
+
+    :return: loguru handler id of the queued sink, to pass to
+        `shutdown_logging`, or None if messages are written directly.
+    """
+    intercept_handler = InterceptHandler(settings.log_caller)
 
     logging.basicConfig(handlers=[intercept_handler], level=logging.NOTSET)
 
@@ -57,7 +175,39 @@ def configure_logging() -> None:  # pragma: no cover
 
     # set logs output, level and format
     logger.remove()
-    logger.add(
-        sys.stdout,
+    logger.configure(extra={"trace_id": NO_CONTEXT, "sender_hash": NO_CONTEXT})
+    if settings.log_queue_size > 0:
+        return _add_sink(QueueSink(sys.stdout, settings.log_queue_size))
+    _add_sink(sys.stdout)
+    return None
+
+
+def shutdown_logging(queue_handler_id: Optional[int]) -> None:
+    """
+    Writes the messages still queued by the log sink.
+
+    Logging switches to writing to stdout directly first, so messages
+    logged while the queue drains, or after, are not lost.
+
+    :param queue_handler_id: handler id returned by `configure_logging`.
+    """
+    if queue_handler_id is None:
+        return
+    _add_sink(sys.stdout)
+    # Removing the handler stops the QueueSink, which drains its queue
+    logger.remove(queue_handler_id)
+
+
+def _add_sink(sink: Union[TextIO, QueueSink]) -> int:
+    """
+    Adds a loguru handler with the configured level and format.
+
+    :param sink: stream or QueueSink to write to.
+    :return: handler id.
+    """
+    return logger.add(
+        sink,
         level=settings.log_level.value,
+        format=LOG_FORMAT,
+        serialize=settings.log_serialize,
     )
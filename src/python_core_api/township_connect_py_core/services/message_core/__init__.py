@@ -0,0 +1,11 @@
+"""Township Connect message core service."""
+import sys
+
+from township_connect_py_core.settings import settings
+
+
+def add_message_core_to_path() -> None:
+    """Makes the message core (the `src` package) importable."""
+    core_root = str(settings.message_core_root)
+    if core_root not in sys.path:
+        sys.path.append(core_root)
@@ -0,0 +1,36 @@
+from typing import Awaitable, Callable, Optional, Union
+
+from starlette.requests import Request
+
+
+def get_message_handler(
+    request: Request,
+) -> Callable[[Union[str, bytes]], Awaitable[str]]:  # pragma: no cover
+    """
+    Returns the message core handler loaded on startup.
+
+    The handler is a coroutine function that takes the raw inbound
+    payload as JSON (a string or the request body bytes) and returns
+    the reply as a JSON string.
+
+    :param request: current request.
+    :returns: message handler.
+    """
+    return request.app.state.message_handler
+
+
+def get_message_enqueuer(
+    request: Request,
+) -> Callable[[Union[str, bytes]], Optional[str]]:  # pragma: no cover
+    """
+    Returns the function that enqueues messages for the stream workers.
+
+    The function takes the raw inbound payload as JSON (a string or the
+    request body bytes) and returns
+    the stream entry ID, or None if the message could not be enqueued.
+    It blocks on Redis, so call it in the threadpool.
+
+    :param request: current request.
+    :returns: message enqueuer.
+    """
+    return request.app.state.message_enqueuer
@@ -0,0 +1,111 @@
+import importlib
+
+from fastapi import FastAPI
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+
+from township_connect_py_core.services.message_core import add_message_core_to_path
+
+
+async def init_message_core(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Imports the message core once and warms up its clients.
+
+    The message core builds its Supabase and Redis clients at import time,
+    so importing it here keeps them alive for the lifetime of the worker
+    instead of rebuilding them for every incoming message.
+
+    :param app: current FastAPI application.
+    """
+    add_message_core_to_path()
+
+    # Message core log lines get the message context and are sampled on their way to loguru
+    logging_utils = importlib.import_module("src.logging_utils")
+    logging_utils.install_context_filter()
+
+    core_handler = importlib.import_module("src.core_handler")
+    async_handler = importlib.import_module("src.async_handler")
+    status = await run_in_threadpool(core_handler.warm_up_clients)
+    logger.info("Message core clients warmed up: {}", status)
+
+    template_store = importlib.import_module("src.template_store")
+    store = template_store.TemplateStore.from_env(core_handler.TEMPLATE_DIR, core_handler.CONTENT_DIR)
+    await run_in_threadpool(store.load)
+    core_handler.template_store = store
+
+    if core_handler.supabase_client is not None:
+        user_cache = importlib.import_module("src.db.user_cache")
+        user_cache.install_user_cache(core_handler.redis_client)
+        app.state.message_user_cache = user_cache
+
+        bundle_catalog = importlib.import_module("src.bundle_catalog")
+        catalog = bundle_catalog.BundleCatalog.from_env(
+            core_handler.supabase_client,
+            core_handler.generate_bundle_selection_prompt,
+        )
+        await run_in_threadpool(catalog.load)
+        core_handler.bundle_catalog = catalog
+
+        log_writer = importlib.import_module("src.db.log_writer")
+        log_writer.install_log_writer(core_handler.supabase_client)
+        app.state.message_log_writer = log_writer
+
+    if core_handler.redis_client is not None:
+        message_dedup = importlib.import_module("src.message_dedup")
+        core_handler.message_dedup = message_dedup.MessageDedup.from_env(
+            core_handler.redis_client,
+        )
+
+    stream_archive = importlib.import_module("src.stream_archive")
+    app.state.message_stream_archiver = stream_archive.install_stream_archiver(
+        core_handler.redis_client,
+        core_handler.STREAM_NAME,
+    )
+
+    sender_scheduler = importlib.import_module("src.sender_scheduler")
+    async_handler.sender_scheduler = sender_scheduler.SenderScheduler.from_env()
+
+    admission_control = importlib.import_module("src.admission_control")
+    controller = admission_control.AdmissionController.from_env(core_handler.redis_client)
+    if controller is not None:
+        await run_in_threadpool(controller.start)
+    async_handler.admission_controller = controller
+
+    app.state.message_core = core_handler
+    app.state.message_async_handler = async_handler
+    app.state.message_handler = async_handler.handle_incoming_message_async
+    app.state.message_enqueuer = core_handler.enqueue_message
+
+
+async def shutdown_message_core(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Flushes background and buffered log writes and closes connections held by the message core.
+
+    :param app: current FastAPI application.
+    """
+    controller = app.state.message_async_handler.admission_controller
+    if controller is not None:
+        await run_in_threadpool(controller.stop)
+
+    scheduler = app.state.message_async_handler.sender_scheduler
+    if scheduler is not None:
+        await scheduler.stop()
+    await app.state.message_async_handler.drain_background_tasks(timeout=10)
+
+    log_writer = getattr(app.state, "message_log_writer", None)
+    if log_writer is not None:
+        await run_in_threadpool(log_writer.uninstall_log_writer, 10)
+
+    archiver = getattr(app.state, "message_stream_archiver", None)
+    if archiver is not None:
+        await run_in_threadpool(archiver.stop, 10)
+
+    user_cache = getattr(app.state, "message_user_cache", None)
+    if user_cache is not None:
+        user_cache.uninstall_user_cache()
+
+    redis_client = getattr(app.state.message_core, "redis_client", None)
+    if redis_client is not None:
+        await run_in_threadpool(redis_client.close)
+
+    await importlib.import_module("src.db.async_supabase_client").close_async_client()
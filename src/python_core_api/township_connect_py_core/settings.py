@@ -8,6 +8,8 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 from yarl import URL
 
 TEMP_DIR = Path(gettempdir())
+# Root of the Township Connect repository, which contains the `src` message core.
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
 
 
 class LogLevel(str, enum.Enum):
@@ -21,6 +23,15 @@ class LogLevel(str, enum.Enum):
     FATAL = "FATAL"
 
 
+class LogCaller(str, enum.Enum):
+    """How the caller of intercepted standard library logs is found."""
+
+    # Use the caller the standard library record already carries.
+    RECORD = "RECORD"
+    # Walk the stack frames, as in the loguru documentation.
+    FRAMES = "FRAMES"
+
+
 class Settings(BaseSettings):
     """
     Application settings.
@@ -40,6 +51,11 @@ class Settings(BaseSettings):
     environment: str = "dev"
 
     log_level: LogLevel = LogLevel.INFO
+    # Log messages queued for the background log writer (0 writes to stdout directly)
+    log_queue_size: int = 10000
+    # Write logs as JSON lines
+    log_serialize: bool = False
+    log_caller: LogCaller = LogCaller.RECORD
     users_secret: str = os.getenv("USERS_SECRET", "")
     # Variables for the database
     db_host: str = "localhost"
@@ -66,6 +82,9 @@ class Settings(BaseSettings):
     rabbit_pool_size: int = 2
     rabbit_channel_pool_size: int = 10
 
+    # Directory that makes the `src.core_handler` message core importable
+    message_core_root: Path = PROJECT_ROOT
+
     @property
     def db_url(self) -> URL:
         """
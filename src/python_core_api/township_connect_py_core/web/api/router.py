@@ -8,6 +8,7 @@ from township_connect_py_core.web.api import (
     rabbit,
     redis,
     users,
+    whatsapp,
 )
 
 api_router = APIRouter()
@@ -18,3 +19,4 @@ api_router.include_router(echo.router, prefix="/echo", tags=["echo"])
 api_router.include_router(dummy.router, prefix="/dummy", tags=["dummy"])
 api_router.include_router(redis.router, prefix="/redis", tags=["redis"])
 api_router.include_router(rabbit.router, prefix="/rabbit", tags=["rabbit"])
+api_router.include_router(whatsapp.router, prefix="/whatsapp", tags=["whatsapp"])
@@ -0,0 +1,5 @@
+"""WhatsApp message handling API."""
+
+from township_connect_py_core.web.api.whatsapp.views import router
+
+__all__ = ["router"]
@@ -0,0 +1,29 @@
+from pydantic import BaseModel, ConfigDict
+
+
+class WhatsAppInboundDTO(BaseModel):
+    """
+    Inbound message payload, used to document the request body.
+
+    The body is passed to the message core as received, so it is not
+    validated against this model; n8n payloads
+    (`{"message": {"from": ..., "body": ...}}`) are accepted as well.
+    """
+
+    model_config = ConfigDict(extra="allow")
+
+    From: str
+    Body: str
+
+
+class WhatsAppReplyDTO(BaseModel):
+    """Reply produced by the message core for an inbound message."""
+
+    reply_to: str
+    reply_text: str
+
+
+class WhatsAppQueuedDTO(BaseModel):
+    """Acknowledgement for a message enqueued for the stream workers."""
+
+    message_id: str
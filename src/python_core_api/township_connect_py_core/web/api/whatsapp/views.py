@@ -0,0 +1,107 @@
+import importlib
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.param_functions import Depends
+from starlette import status
+from starlette.concurrency import run_in_threadpool
+
+from township_connect_py_core.services.message_core import add_message_core_to_path
+from township_connect_py_core.services.message_core.dependency import (
+    get_message_enqueuer,
+    get_message_handler,
+)
+from township_connect_py_core.web.api.whatsapp.schema import (
+    WhatsAppInboundDTO,
+    WhatsAppQueuedDTO,
+    WhatsAppReplyDTO,
+)
+
+router = APIRouter()
+
+# The message core marks its reply to a repeated delivery of a message
+# (a Twilio webhook retry) by ending it with this member.
+add_message_core_to_path()
+DUPLICATE_MARKER = importlib.import_module("src.message_context").DUPLICATE_MARKER
+
+# The payload is read as raw bytes and handed to the message core as is,
+# so the request body is documented here instead of through a parameter.
+INBOUND_REQUEST_BODY: Dict[str, Any] = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": WhatsAppInboundDTO.model_json_schema()},
+        },
+    },
+}
+
+
+@router.post(
+    "/inbound",
+    response_model=WhatsAppReplyDTO,
+    openapi_extra=INBOUND_REQUEST_BODY,
+)
+async def handle_inbound_message(
+    request: Request,
+    message_handler: Callable[[Union[str, bytes]], Awaitable[str]] = Depends(
+        get_message_handler,
+    ),
+) -> Response:
+    """
+    Runs an inbound WhatsApp message through the message core.
+
+    Accepts both the Twilio webhook fields (`From`, `Body`)
+    and the n8n format (`{"message": {"from": ..., "body": ...}}`).
+    The body bytes go to the message core undecoded and its JSON reply
+    is returned as is, so the payload is parsed and the reply encoded once.
+    A repeated delivery of a message that is (being) answered gets
+    `204 No Content`: there is nothing to send.
+
+    :param request: current request.
+    :param message_handler: message core handler loaded on startup.
+    :returns: reply for the sender.
+    """
+    reply = await message_handler(await request.body())
+    if reply.endswith(DUPLICATE_MARKER):
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    return Response(content=reply, media_type="application/json")
+
+
+@router.post(
+    "/enqueue",
+    response_model=WhatsAppQueuedDTO,
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra=INBOUND_REQUEST_BODY,
+)
+async def enqueue_inbound_message(
+    request: Request,
+    message_enqueuer: Callable[[Union[str, bytes]], Optional[str]] = Depends(
+        get_message_enqueuer,
+    ),
+) -> WhatsAppQueuedDTO:
+    """
+    Enqueues an inbound WhatsApp message for the stream workers.
+
+    Accepts the same payloads as `/inbound`, and likewise enqueues the
+    body bytes without decoding them. The reply is written
+    to the `outgoing_whatsapp_replies` stream by a worker
+    (see `scripts/run_stream_workers.py`).
+
+    :param request: current request.
+    :param message_enqueuer: message core enqueuer loaded on startup.
+    :raises HTTPException: if the body is empty or the message could not be enqueued.
+    :returns: ID of the stream entry.
+    """
+    body = await request.body()
+    if not body.strip():
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Request body is empty",
+        )
+    message_id = await run_in_threadpool(message_enqueuer, body)
+    if message_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Message queue unavailable",
+        )
+    return WhatsAppQueuedDTO(message_id=message_id)
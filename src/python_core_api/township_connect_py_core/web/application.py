@@ -2,13 +2,19 @@ from importlib import metadata
 from pathlib import Path
 
 from fastapi import FastAPI
-from fastapi.responses import UJSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from township_connect_py_core.log import configure_logging
 from township_connect_py_core.web.api.router import api_router
 from township_connect_py_core.web.lifespan import lifespan_setup
 
+try:
+    # orjson encodes responses faster than ujson; it is an optional dependency
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:  # pragma: no cover
+    from fastapi.responses import UJSONResponse as DefaultResponse  # type: ignore
+
 APP_ROOT = Path(__file__).parent.parent
 
 
@@ -20,7 +26,7 @@ def get_app() -> FastAPI:
 
     :return: application.
     """
-    configure_logging()
+    log_queue_handler_id = configure_logging()
     app = FastAPI(
         title="township_connect_py_core",
         version=metadata.version("township_connect_py_core"),
@@ -28,7 +34,7 @@ def get_app() -> FastAPI:
         docs_url=None,
         redoc_url=None,
         openapi_url="/api/openapi.json",
-        default_response_class=UJSONResponse,
+        default_response_class=DefaultResponse,
     )
 
     # Main router for the API.
@@ -36,5 +42,7 @@ def get_app() -> FastAPI:
     # Adds static directory.
     # This directory is used to access swagger files.
     app.mount("/static", StaticFiles(directory=APP_ROOT / "static"), name="static")
+    # Drained by the lifespan shutdown.
+    app.state.log_queue_handler_id = log_queue_handler_id
 
     return app
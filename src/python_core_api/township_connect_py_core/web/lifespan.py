@@ -4,6 +4,11 @@ from typing import AsyncGenerator
 from fastapi import FastAPI
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
+from township_connect_py_core.log import shutdown_logging
+from township_connect_py_core.services.message_core.lifespan import (
+    init_message_core,
+    shutdown_message_core,
+)
 from township_connect_py_core.services.rabbit.lifespan import (
     init_rabbit,
     shutdown_rabbit,
@@ -49,6 +54,7 @@ async def lifespan_setup(
     _setup_db(app)
     init_redis(app)
     init_rabbit(app)
+    await init_message_core(app)
     app.middleware_stack = app.build_middleware_stack()
 
     yield
@@ -56,3 +62,6 @@ async def lifespan_setup(
 
     await shutdown_redis(app)
     await shutdown_rabbit(app)
+    await shutdown_message_core(app)
+    # Last, so the shutdown's own log lines are written too
+    shutdown_logging(getattr(app.state, "log_queue_handler_id", None))
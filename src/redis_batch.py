@@ -0,0 +1,297 @@
+"""
+Redis Batch Module for Township Connect WhatsApp Assistant.
+
+This module collects the Redis commands issued while handling one message. Commands
+whose result the handler does not need (the stream XADD, the delete request SETEX)
+are deferred and sent together in one pipeline when the message is done, and
+read-modify-write sequences run as Lua scripts, so each needs a single round trip
+and cannot interleave with another worker. Every batch reports how many commands
+and round trips its message cost.
+
+Code that issues Redis commands uses defer_command, execute_command and run_script.
+They use the batch of the message being handled if there is one (see message_batch)
+and talk to Redis directly otherwise.
+"""
+
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+from redis.exceptions import NoScriptError
+
+from src.logging_utils import HOT_PATH
+
+logger = logging.getLogger(__name__)
+
+# Batch of the message being handled; copied into threads started with asyncio.to_thread
+_current_batch: ContextVar[Optional["RedisBatch"]] = ContextVar("redis_batch", default=None)
+
+class LuaScript:
+    """A Lua script run with EVALSHA, falling back to EVAL the first time a server sees it."""
+
+    __slots__ = ("source", "sha")
+
+    def __init__(self, source: str):
+        """
+        Initialize the script.
+
+        Args:
+            source: The Lua source
+        """
+        self.source = source
+        self.sha = hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def __call__(self, redis_client, keys: Sequence[str], args: Sequence[Any] = ()) -> Any:
+        """
+        Run the script.
+
+        Args:
+            redis_client: A Redis client
+            keys: The KEYS of the script
+            args: The ARGV of the script
+
+        Returns:
+            The script result
+        """
+        try:
+            return redis_client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            return redis_client.eval(self.source, len(keys), *keys, *args)
+
+class RedisBatch:
+    """
+    The Redis commands of one message.
+
+    Deferred commands are queued until flush, which sends them in one pipeline (not a
+    MULTI transaction). Once flushed the batch is closed, and commands deferred later
+    (e.g. by a background task that outlived the message) run immediately.
+    """
+
+    def __init__(self, redis_client, label: str = "message"):
+        """
+        Initialize an empty batch.
+
+        Args:
+            redis_client: The Redis client the batched commands are sent to
+            label: What the batch is for, used in the report (default: 'message')
+        """
+        self.redis_client = redis_client
+        self.label = label
+        self.commands = 0
+        self.round_trips = 0
+
+        self._deferred: List[Tuple[str, Tuple[Any, ...], dict]] = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def defer(self, command: str, *args, **kwargs) -> None:
+        """
+        Queue a command whose result is not needed until the batch is flushed.
+
+        Args:
+            command: The redis-py method name, e.g. 'setex'
+            *args: Positional arguments of the command
+            **kwargs: Keyword arguments of the command
+        """
+        with self._lock:
+            if not self._closed:
+                self._deferred.append((command, args, kwargs))
+                return
+        self.execute(command, *args, **kwargs)
+
+    def execute(self, command: str, *args, **kwargs) -> Any:
+        """
+        Run a command now, because its result is needed.
+
+        Args:
+            command: The redis-py method name, e.g. 'hgetall'
+            *args: Positional arguments of the command
+            **kwargs: Keyword arguments of the command
+
+        Returns:
+            The command result
+        """
+        self.count(1)
+        return getattr(self.redis_client, command)(*args, **kwargs)
+
+    def run_script(self, script: LuaScript, keys: Sequence[str], args: Sequence[Any] = ()) -> Any:
+        """
+        Run a Lua script now.
+
+        Args:
+            script: The script
+            keys: The KEYS of the script
+            args: The ARGV of the script
+
+        Returns:
+            The script result
+        """
+        self.count(1)
+        return script(self.redis_client, keys, args)
+
+    def count(self, commands: int, round_trips: int = 1) -> None:
+        """
+        Record commands sent outside the batch methods, e.g. through a pipeline.
+
+        Args:
+            commands: Number of commands
+            round_trips: Number of round trips they took (default: 1)
+        """
+        with self._lock:
+            self.commands += commands
+            self.round_trips += round_trips
+
+    def flush(self) -> List[Any]:
+        """
+        Send the deferred commands in one pipeline and close the batch.
+
+        Returns:
+            The results of the deferred commands, in order
+        """
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+            self._closed = True
+        if not deferred:
+            return []
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for command, args, kwargs in deferred:
+            getattr(pipe, command)(*args, **kwargs)
+        self.count(len(deferred))
+        return pipe.execute()
+
+    def close(self) -> None:
+        """Flush the batch, logging (not raising) Redis errors, and report its cost."""
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error sending batched Redis commands for {self.label}: {str(e)}")
+        logger.info("Redis commands for %s: %d in %d round trips", self.label, self.commands, self.round_trips, extra=HOT_PATH)
+
+    def activate(self) -> Token:
+        """
+        Make this the batch of the current message (and of threads started from it).
+
+        Returns:
+            A token for deactivate
+        """
+        return _current_batch.set(self)
+
+    def deactivate(self, token: Token) -> None:
+        """
+        Restore the batch that was current before activate.
+
+        Args:
+            token: The token returned by activate
+        """
+        _current_batch.reset(token)
+
+def current_batch(redis_client=None) -> Optional[RedisBatch]:
+    """
+    Get the batch of the message being handled.
+
+    Args:
+        redis_client: If given, only return a batch that sends to this client
+
+    Returns:
+        The current batch, or None
+    """
+    batch = _current_batch.get()
+    if batch is None or (redis_client is not None and batch.redis_client is not redis_client):
+        return None
+    return batch
+
+@contextmanager
+def message_batch(redis_client, label: str = "message") -> Iterator[Optional[RedisBatch]]:
+    """
+    Batch the Redis commands issued inside the block, flushing them at the end.
+
+    If a batch is already active (e.g. a stream worker handling the message) the block
+    joins it and the outer batch is flushed by its owner.
+
+    Args:
+        redis_client: The Redis client, or None when Redis is not configured
+        label: What the batch is for, used in the report (default: 'message')
+
+    Yields:
+        The batch, or None when Redis is not configured
+    """
+    if redis_client is None or current_batch(redis_client) is not None:
+        yield current_batch(redis_client)
+        return
+
+    batch = RedisBatch(redis_client, label)
+    token = batch.activate()
+    try:
+        yield batch
+    finally:
+        batch.deactivate(token)
+        batch.close()
+
+def defer_command(redis_client, command: str, *args, **kwargs) -> None:
+    """
+    Queue a command in the current batch, or run it now if there is none.
+
+    Args:
+        redis_client: A Redis client
+        command: The redis-py method name, e.g. 'setex'
+        *args: Positional arguments of the command
+        **kwargs: Keyword arguments of the command
+    """
+    batch = current_batch(redis_client)
+    if batch is not None:
+        batch.defer(command, *args, **kwargs)
+    else:
+        getattr(redis_client, command)(*args, **kwargs)
+
+def execute_command(redis_client, command: str, *args, **kwargs) -> Any:
+    """
+    Run a command now, counting it in the current batch if there is one.
+
+    Args:
+        redis_client: A Redis client
+        command: The redis-py method name, e.g. 'hgetall'
+        *args: Positional arguments of the command
+        **kwargs: Keyword arguments of the command
+
+    Returns:
+        The command result
+    """
+    batch = current_batch(redis_client)
+    if batch is not None:
+        return batch.execute(command, *args, **kwargs)
+    return getattr(redis_client, command)(*args, **kwargs)
+
+def run_script(redis_client, script: LuaScript, keys: Sequence[str], args: Sequence[Any] = ()) -> Any:
+    """
+    Run a Lua script, counting it in the current batch if there is one.
+
+    Args:
+        redis_client: A Redis client
+        script: The script
+        keys: The KEYS of the script
+        args: The ARGV of the script
+
+    Returns:
+        The script result
+    """
+    batch = current_batch(redis_client)
+    if batch is not None:
+        return batch.run_script(script, keys, args)
+    return script(redis_client, keys, args)
+
+def count_commands(redis_client, commands: int, round_trips: int = 1) -> None:
+    """
+    Count commands sent through a pipeline in the current batch, if there is one.
+
+    Args:
+        redis_client: The Redis client the pipeline belongs to
+        commands: Number of commands
+        round_trips: Number of round trips they took (default: 1)
+    """
+    batch = current_batch(redis_client)
+    if batch is not None:
+        batch.count(commands, round_trips)
@@ -0,0 +1,148 @@
+"""
+Sender Scheduler Module for Township Connect WhatsApp Assistant.
+
+This module provides SenderScheduler, which chains the messages of each sender so
+they are handled one at a time in arrival order. Two quick messages from the same
+user (e.g. '/delete' then '/delete confirm') can never overtake each other, while
+messages from different users run in parallel and never wait for each other.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class SenderScheduler:
+    """
+    Runs coroutines in per-sender order.
+
+    Each sender with a message in progress has a chain tail: the future completed when
+    its latest job finishes. A new job waits for the tail it replaces, so a sender's
+    jobs run in submission order; the tail is dropped once the sender has no job left,
+    so memory only grows with the number of senders that have a message in progress.
+    Senders never wait for each other; max_concurrent optionally caps the number of
+    jobs running at once across all senders.
+    """
+
+    def __init__(self, max_concurrent: int = 0):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_concurrent: Maximum jobs running at once, 0 for no limit (default: 0)
+        """
+        if max_concurrent < 0:
+            raise ValueError("max_concurrent must not be negative")
+        self.max_concurrent = max_concurrent
+
+        self._tails: Dict[str, asyncio.Future] = {}
+        self._jobs: Set[asyncio.Task] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["SenderScheduler"]:
+        """
+        Create a scheduler configured from environment variables.
+
+        Reads SENDER_SCHEDULER_ENABLED (false disables the scheduler) and
+        SENDER_SCHEDULER_MAX_CONCURRENT.
+
+        Returns:
+            A SenderScheduler instance, or None if disabled
+        """
+        if os.getenv("SENDER_SCHEDULER_ENABLED", "true").lower() not in ("true", "1", "yes"):
+            return None
+        return cls(max_concurrent=int(os.getenv("SENDER_SCHEDULER_MAX_CONCURRENT", "0")))
+
+    async def submit(self, sender_id: str, func: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """
+        Run a coroutine function after every earlier job of the same sender.
+
+        The job runs to completion even if the caller is cancelled, so the sender's
+        later jobs still wait for it.
+
+        Args:
+            sender_id: The WhatsApp ID of the sender
+            func: The coroutine function to run
+            *args: Positional arguments for the function
+
+        Returns:
+            The function's result (its exception is raised here)
+        """
+        loop = asyncio.get_running_loop()
+        if self.max_concurrent and self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+
+        previous = self._tails.get(sender_id)
+        tail = loop.create_future()
+        self._tails[sender_id] = tail
+        self.stats["submitted"] += 1
+
+        job = loop.create_task(self._run(sender_id, previous, tail, func, args))
+        self._jobs.add(job)
+        job.add_done_callback(self._job_done)
+        return await asyncio.shield(job)
+
+    def active_senders(self) -> int:
+        """
+        Get the number of senders with a job queued or running.
+
+        Returns:
+            The number of chain tails held
+        """
+        return len(self._tails)
+
+    def pending(self) -> int:
+        """
+        Get the number of jobs queued or running.
+
+        Returns:
+            The number of unfinished jobs
+        """
+        return len(self._jobs)
+
+    async def stop(self) -> None:
+        """Wait for the submitted jobs to finish."""
+        if self._jobs:
+            await asyncio.gather(*self._jobs, return_exceptions=True)
+        self._slots = None
+
+    async def _run(
+        self,
+        sender_id: str,
+        previous: Optional[asyncio.Future],
+        tail: asyncio.Future,
+        func: Callable[..., Awaitable[Any]],
+        args: tuple
+    ) -> Any:
+        """Run one job after the sender's previous job, then release the sender's chain."""
+        try:
+            if previous is not None:
+                await previous
+            if self._slots is not None:
+                async with self._slots:
+                    result = await func(*args)
+            else:
+                result = await func(*args)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        else:
+            self.stats["completed"] += 1
+            return result
+        finally:
+            tail.set_result(None)
+            # Drop the chain once no later job of the sender is waiting on it
+            if self._tails.get(sender_id) is tail:
+                del self._tails[sender_id]
+
+    def _job_done(self, job: asyncio.Task) -> None:
+        """Forget a finished job; its result was delivered to the submitter, if still waiting."""
+        self._jobs.discard(job)
+        if not job.cancelled():
+            # Mark the exception retrieved when the submitter was cancelled
+            job.exception()
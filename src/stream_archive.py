@@ -0,0 +1,387 @@
+"""
+Stream Archive Module for Township Connect WhatsApp Assistant.
+
+This module bounds the memory used by the Redis message streams. StreamArchiver copies
+entries to gzipped, date-partitioned JSON Lines files before trimming them from Redis
+once they are older than the retention window and no consumer group needs them.
+STREAM_MAXLEN is only an emergency cap applied on every XADD for when that trim cannot
+keep up; report_cap_trim logs an error when the cap removed entries that were still
+needed. read_archive reads the files back.
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Emergency cap on the length of each stream, applied with MAXLEN ~ on every XADD so
+# Redis cannot run out of memory when the archiver or a consumer group stops. MAXLEN
+# ignores the archive cursor and the consumer groups, so it must stay well above the
+# entries received during the retention window; normal trimming is the archiver's
+# MINID trim. 0 disables it.
+STREAM_MAXLEN = int(os.getenv("REDIS_STREAM_MAXLEN", "1000000")) or None
+
+# Archived entry: (entry_id, fields)
+ArchivedEntry = Tuple[str, Dict[str, str]]
+
+class StreamArchiver:
+    """
+    Copies stream entries to local archive files, then trims them from Redis.
+
+    Each run appends the entries added since the last run to
+    <archive_dir>/<stream>/<YYYY-MM-DD>.jsonl.gz (by the UTC date of the entry ID) and
+    then trims, with XTRIM MINID ~, the entries that are archived, older than
+    retention_seconds and no longer needed by a consumer group (pending or not yet
+    delivered). The archive cursor lives in Redis and runs take a Redis lock, so
+    several processes may run an archiver; only one works at a time.
+
+    Entries are archived at least once: if a run stops between writing a file and
+    saving the cursor, the next run writes those entries again. read_archive skips
+    the duplicates.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        archive_dir: Path,
+        stream: str,
+        retention_seconds: int = 86400,
+        interval_seconds: float = 60,
+        batch_size: int = 1000
+    ):
+        """
+        Initialize the archiver.
+
+        Args:
+            redis_client: A Redis client
+            archive_dir: Directory the archive files are written under
+            stream: The stream to archive
+            retention_seconds: How long entries stay in Redis after being archived (default: 86400)
+            interval_seconds: Time between archive runs (default: 60)
+            batch_size: Number of entries read per XRANGE (default: 1000)
+        """
+        self.redis_client = redis_client
+        self.archive_dir = Path(archive_dir)
+        self.stream = stream
+        self.retention_ms = int(retention_seconds * 1000)
+        self.interval = interval_seconds
+        self.batch_size = batch_size
+
+        self.cursor_key = f"{stream}:archive_cursor"
+        self.lock_key = f"{stream}:archive_lock"
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reported_cap_trim: Optional[str] = None
+
+        self.stats = {"archived": 0, "trimmed": 0, "runs": 0, "errors": 0, "cap_trims": 0}
+
+    @classmethod
+    def from_env(cls, redis_client, archive_dir: Path, stream: str) -> "StreamArchiver":
+        """
+        Create an archiver configured from environment variables.
+
+        Reads STREAM_RETENTION_SECONDS and STREAM_ARCHIVE_INTERVAL_SECONDS, falling
+        back to the defaults.
+
+        Args:
+            redis_client: A Redis client
+            archive_dir: Directory the archive files are written under
+            stream: The stream to archive
+
+        Returns:
+            A StreamArchiver instance (not started)
+        """
+        return cls(
+            redis_client,
+            archive_dir,
+            stream,
+            retention_seconds=int(os.getenv("STREAM_RETENTION_SECONDS", "86400")),
+            interval_seconds=float(os.getenv("STREAM_ARCHIVE_INTERVAL_SECONDS", "60"))
+        )
+
+    def start(self) -> None:
+        """Start the background archive thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"stream-archiver-{self.stream}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """
+        Stop the background thread after its current run.
+
+        Args:
+            timeout: Maximum number of seconds to wait for the thread (default: 10)
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> int:
+        """
+        Archive new entries and trim the ones that are no longer needed in Redis.
+
+        Returns:
+            The number of entries archived, or 0 if another process holds the lock
+        """
+        token = uuid.uuid4().hex
+        lock_ms = int(max(self.interval, 30) * 2000)
+        if not self.redis_client.set(self.lock_key, token, nx=True, px=lock_ms):
+            return 0
+
+        try:
+            cursor = self.redis_client.get(self.cursor_key)
+            reported = report_cap_trim(
+                self.redis_client, self.stream, _to_str(cursor) if cursor else None, self._reported_cap_trim
+            )
+            if reported and reported != self._reported_cap_trim:
+                self.stats["cap_trims"] += 1
+            self._reported_cap_trim = reported
+            archived = self._archive_new_entries()
+            self._trim()
+            self.stats["runs"] += 1
+            return archived
+        finally:
+            if _to_str(self.redis_client.get(self.lock_key) or b"") == token:
+                self.redis_client.delete(self.lock_key)
+
+    def _archive_new_entries(self) -> int:
+        """Append the entries after the cursor to the archive files, advancing the cursor."""
+        cursor = _to_str(self.redis_client.get(self.cursor_key) or b"0-0")
+        archived = 0
+        while not self._stop.is_set():
+            entries = self.redis_client.xrange(self.stream, min=f"({cursor}", count=self.batch_size)
+            if not entries:
+                break
+            decoded = [
+                (_to_str(entry_id), {_to_str(k): _to_str(v) for k, v in fields.items()})
+                for entry_id, fields in entries
+            ]
+            self._write(decoded)
+            cursor = decoded[-1][0]
+            self.redis_client.set(self.cursor_key, cursor)
+            archived += len(decoded)
+            if len(entries) < self.batch_size:
+                break
+
+        self.stats["archived"] += archived
+        if archived:
+            logger.info(f"Archived {archived} entries from '{self.stream}' up to {cursor}")
+        return archived
+
+    def _write(self, entries: List[ArchivedEntry]) -> None:
+        """Append entries to the archive file for each of their dates."""
+        by_date: Dict[str, List[str]] = {}
+        for entry_id, fields in entries:
+            line = json.dumps({"id": entry_id, "fields": fields}, ensure_ascii=False)
+            by_date.setdefault(entry_date(entry_id), []).append(line)
+
+        directory = self.archive_dir / self.stream
+        directory.mkdir(parents=True, exist_ok=True)
+        for date, lines in by_date.items():
+            # Each append adds a gzip member; gzip readers read them as one file
+            with gzip.open(directory / f"{date}.jsonl.gz", "at", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def _trim(self) -> None:
+        """Trim entries that are archived, past retention and finished by every group."""
+        cursor = self.redis_client.get(self.cursor_key)
+        if not cursor:
+            return
+        bounds = [_next_id(_to_str(cursor)), f"{int(time.time() * 1000) - self.retention_ms}-0"]
+        oldest_needed = self._oldest_needed_by_groups()
+        if oldest_needed:
+            bounds.append(oldest_needed)
+
+        min_id = min(bounds, key=_id_key)
+        trimmed = self.redis_client.xtrim(self.stream, minid=min_id, approximate=True)
+        self.stats["trimmed"] += trimmed or 0
+
+    def _oldest_needed_by_groups(self) -> Optional[str]:
+        """Get the oldest entry that is pending or not yet delivered in any consumer group."""
+        return oldest_needed_by_groups(self.redis_client, self.stream)
+
+    def _run(self) -> None:
+        """Background loop: archive and trim every interval."""
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error archiving stream '{self.stream}': {str(e)}")
+            self._stop.wait(self.interval)
+
+def oldest_needed_by_groups(redis_client, stream: str) -> Optional[str]:
+    """
+    Get the oldest entry that is pending or not yet delivered in any consumer group.
+
+    Args:
+        redis_client: A Redis client
+        stream: The stream name
+
+    Returns:
+        The entry ID, or None if the stream has no consumer groups
+    """
+    try:
+        groups = redis_client.xinfo_groups(stream)
+    except Exception:
+        # The stream has no groups (or does not exist yet)
+        return None
+
+    needed = []
+    for group in groups:
+        needed.append(_next_id(_to_str(group["last-delivered-id"])))
+        if group["pending"]:
+            summary = redis_client.xpending(stream, group["name"])
+            needed.append(_to_str(summary["min"]))
+    return min(needed, key=_id_key) if needed else None
+
+def report_cap_trim(
+    redis_client,
+    stream: str,
+    archive_cursor: Optional[str] = None,
+    last_reported: Optional[str] = None
+) -> Optional[str]:
+    """
+    Log an error if the STREAM_MAXLEN cap trimmed entries that were still needed.
+
+    The archiver's MINID trim never deletes past the archive cursor or an entry a
+    consumer group still needs, so the stream's last deleted entry (XINFO STREAM
+    max-deleted-entry-id, Redis 7 and later) being at or past one of them means the cap
+    trimmed it: those entries were lost before being archived or handled. On older
+    Redis versions the check is skipped.
+
+    Args:
+        redis_client: A Redis client
+        stream: The stream name
+        archive_cursor: The last archived entry ID, if the stream is archived
+        last_reported: The value returned by the previous call, so a trim is logged once
+
+    Returns:
+        The last deleted entry ID if it was still needed, otherwise None
+    """
+    try:
+        info = redis_client.xinfo_stream(stream)
+    except Exception:
+        # The stream does not exist yet
+        return None
+    max_deleted = info.get("max-deleted-entry-id")
+    if not max_deleted or _to_str(max_deleted) == "0-0":
+        return None
+    max_deleted = _to_str(max_deleted)
+
+    needed = []
+    if archive_cursor:
+        needed.append(_next_id(archive_cursor))
+    oldest_needed = oldest_needed_by_groups(redis_client, stream)
+    if oldest_needed:
+        needed.append(oldest_needed)
+    if not needed or _id_key(max_deleted) < _id_key(min(needed, key=_id_key)):
+        return None
+
+    if max_deleted != last_reported:
+        logger.error(
+            "Stream '%s' was trimmed up to %s by REDIS_STREAM_MAXLEN before its entries were "
+            "archived or handled; raise REDIS_STREAM_MAXLEN or check the archiver and workers",
+            stream, max_deleted
+        )
+    return max_deleted
+
+def entry_date(entry_id: str) -> str:
+    """
+    Get the UTC date an entry was added from its ID.
+
+    Args:
+        entry_id: The stream entry ID ('<milliseconds>-<sequence>')
+
+    Returns:
+        The date as YYYY-MM-DD
+    """
+    milliseconds = int(entry_id.split("-", 1)[0])
+    return datetime.fromtimestamp(milliseconds / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+def archive_dates(archive_dir: Path, stream: str) -> List[str]:
+    """
+    List the dates that have an archive file.
+
+    Args:
+        archive_dir: Directory the archive files are written under
+        stream: The archived stream
+
+    Returns:
+        The dates as YYYY-MM-DD, oldest first
+    """
+    directory = Path(archive_dir) / stream
+    if not directory.is_dir():
+        return []
+    return sorted(path.name[:-len(".jsonl.gz")] for path in directory.glob("*.jsonl.gz"))
+
+def read_archive(archive_dir: Path, stream: str, date: str) -> Iterator[ArchivedEntry]:
+    """
+    Read the archived entries for a date, skipping entries archived twice.
+
+    Args:
+        archive_dir: Directory the archive files are written under
+        stream: The archived stream
+        date: The date as YYYY-MM-DD
+
+    Returns:
+        An iterator of (entry_id, fields) in the order they were archived
+    """
+    path = Path(archive_dir) / stream / f"{date}.jsonl.gz"
+    if not path.exists():
+        return
+    seen = set()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record["id"] in seen:
+                continue
+            seen.add(record["id"])
+            yield record["id"], record["fields"]
+
+def install_stream_archiver(redis_client, stream: str) -> Optional[StreamArchiver]:
+    """
+    Start an archiver for a stream if STREAM_ARCHIVE_DIR is set.
+
+    Args:
+        redis_client: A Redis client
+        stream: The stream to archive
+
+    Returns:
+        The started StreamArchiver, or None if archiving is not configured
+    """
+    archive_dir = os.getenv("STREAM_ARCHIVE_DIR")
+    if not archive_dir or redis_client is None:
+        return None
+    archiver = StreamArchiver.from_env(redis_client, Path(archive_dir), stream)
+    archiver.start()
+    logger.info(f"Archiving stream '{stream}' to {archive_dir}")
+    return archiver
+
+def _id_key(entry_id: str) -> Tuple[int, int]:
+    """Sort key for stream entry IDs."""
+    milliseconds, _, sequence = entry_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+def _next_id(entry_id: str) -> str:
+    """Get the smallest entry ID after the given one."""
+    milliseconds, sequence = _id_key(entry_id)
+    return f"{milliseconds}-{sequence + 1}"
+
+def _to_str(value: Any) -> str:
+    """Decode a Redis reply value."""
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
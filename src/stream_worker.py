@@ -0,0 +1,356 @@
+"""
+Stream Worker Module for Township Connect WhatsApp Assistant.
+
+This module provides workers that consume the incoming_whatsapp_messages Redis stream
+through a consumer group. The webhook only enqueues messages (see
+core_handler.enqueue_message); workers read them with XREADGROUP, run the message
+handler, write the reply to the outgoing_whatsapp_replies stream and XACK the entry.
+Entries left pending by a crashed worker are reclaimed with XAUTOCLAIM, so evening
+peaks are absorbed by adding workers instead of scaling n8n.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from redis.exceptions import ResponseError
+
+from src.stream_archive import STREAM_MAXLEN
+
+logger = logging.getLogger(__name__)
+
+# Stream the webhook enqueues incoming messages on
+STREAM_NAME = "incoming_whatsapp_messages"
+
+# Stream the workers write replies to, read by the outbound sender
+REPLY_STREAM_NAME = "outgoing_whatsapp_replies"
+
+# Stream that entries which failed max_deliveries times are moved to
+DEAD_LETTER_STREAM_NAME = "incoming_whatsapp_messages:dead"
+
+# Consumer group shared by all workers
+CONSUMER_GROUP = "message-workers"
+
+# Field set on entries that were enqueued for a worker to answer. Entries without it
+# were published by the inline webhook, which has already answered them.
+QUEUED_FIELD = "queued"
+
+# Counter of queued entries not answered yet: incremented by enqueue_message and
+# decremented when a worker acknowledges or dead-letters a queued entry
+QUEUED_COUNT_KEY = "incoming_whatsapp_messages:queued"
+
+class StreamWorker:
+    """
+    One consumer in the message worker group.
+
+    Each call to run_once reclaims entries that have been pending longer than
+    claim_idle_ms (when a reclaim is due), then reads up to batch_size new entries.
+    An entry is acknowledged only after its reply has been written, so a worker that
+    dies mid-message leaves it pending for another worker to reclaim. Entries that
+    have been delivered more than max_deliveries times are moved to the dead letter
+    stream instead of being retried forever.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        handler: Callable[[str], str],
+        consumer_name: str,
+        group: str = CONSUMER_GROUP,
+        stream: str = STREAM_NAME,
+        reply_stream: str = REPLY_STREAM_NAME,
+        batch_size: int = 10,
+        block_ms: int = 2000,
+        claim_idle_ms: int = 60000,
+        claim_interval_seconds: float = 30,
+        max_deliveries: int = 5,
+        release: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Initialize the worker.
+
+        Args:
+            redis_client: A Redis client
+            handler: Function that takes the message JSON and returns the reply JSON, raising
+                if the message could not be handled (e.g. core_handler.process_incoming_message)
+            consumer_name: Name of this consumer within the group, unique per worker
+            group: The consumer group name (default: 'message-workers')
+            stream: The stream to consume (default: 'incoming_whatsapp_messages')
+            reply_stream: The stream replies are written to (default: 'outgoing_whatsapp_replies')
+            batch_size: Maximum number of entries read or reclaimed at once (default: 10)
+            block_ms: How long a read waits for new entries (default: 2000)
+            claim_idle_ms: How long an entry must be pending before it is reclaimed (default: 60000)
+            claim_interval_seconds: How often pending entries are reclaimed (default: 30)
+            max_deliveries: Deliveries after which an entry is dead-lettered (default: 5)
+            release: Function called with the message JSON when its reply could not be
+                written, so that the retry is not taken for a duplicate delivery
+                (e.g. core_handler.release_queued_message)
+        """
+        self.redis_client = redis_client
+        self.handler = handler
+        self.release = release
+        self.consumer_name = consumer_name
+        self.group = group
+        self.stream = stream
+        self.reply_stream = reply_stream
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval_seconds
+        self.max_deliveries = max_deliveries
+
+        self._claim_cursor = "0-0"
+        self._next_claim = 0.0
+
+        self.stats = {"processed": 0, "skipped": 0, "failed": 0, "reclaimed": 0, "dead_lettered": 0}
+
+    def ensure_group(self) -> None:
+        """
+        Create the consumer group (and the stream) if it does not exist yet.
+
+        A new group starts at the end of the stream: entries published before it
+        existed were answered by the inline webhook.
+        """
+        try:
+            self.redis_client.xgroup_create(self.stream, self.group, id="$", mkstream=True)
+            logger.info("Created consumer group '%s' on stream '%s'", self.group, self.stream)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def run_once(self) -> int:
+        """
+        Reclaim stale entries if due, then read and handle one batch of new entries.
+
+        Returns:
+            The number of entries handled
+        """
+        handled = 0
+        if time.monotonic() >= self._next_claim:
+            handled += self.reclaim()
+            self._next_claim = time.monotonic() + self.claim_interval
+
+        response = self.redis_client.xreadgroup(
+            self.group, self.consumer_name, {self.stream: ">"},
+            count=self.batch_size, block=self.block_ms
+        )
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                self.handle_entry(_to_str(entry_id), fields)
+                handled += 1
+        return handled
+
+    def reclaim(self) -> int:
+        """
+        Take over entries that another consumer has left pending for too long.
+
+        Returns:
+            The number of reclaimed entries handled
+        """
+        response = self.redis_client.xautoclaim(
+            self.stream, self.group, self.consumer_name, self.claim_idle_ms,
+            start_id=self._claim_cursor, count=self.batch_size
+        )
+        self._claim_cursor = _to_str(response[0])
+        entries = response[1]
+
+        for entry_id, fields in entries:
+            entry_id = _to_str(entry_id)
+            self.stats["reclaimed"] += 1
+            logger.warning("Reclaimed stream entry %s for consumer %s", entry_id, self.consumer_name)
+            if self._delivery_count(entry_id) > self.max_deliveries:
+                self.dead_letter(entry_id, fields)
+            else:
+                self.handle_entry(entry_id, fields)
+        return len(entries)
+
+    def handle_entry(self, entry_id: str, fields: Dict[Any, Any]) -> bool:
+        """
+        Handle one stream entry and acknowledge it once its reply is written.
+
+        Args:
+            entry_id: The stream entry ID
+            fields: The entry fields
+
+        Returns:
+            True if the entry was acknowledged, False if it was left pending
+        """
+        fields = {_to_str(k): _to_str(v) for k, v in fields.items()}
+        if fields.get(QUEUED_FIELD) != "1" or "data" not in fields:
+            # Published by the inline webhook, which already replied
+            self.redis_client.xack(self.stream, self.group, entry_id)
+            self.stats["skipped"] += 1
+            return True
+
+        try:
+            reply = self.handler(fields["data"])
+            try:
+                self.redis_client.xadd(
+                    self.reply_stream, {"data": reply, "message_id": entry_id},
+                    maxlen=STREAM_MAXLEN, approximate=True
+                )
+            except Exception:
+                # The handler has marked the message answered; undo that for the retry
+                if self.release:
+                    self.release(fields["data"])
+                raise
+            self.redis_client.xack(self.stream, self.group, entry_id)
+            self.redis_client.decr(QUEUED_COUNT_KEY)
+        except Exception as e:
+            # Left pending: it is reclaimed after claim_idle_ms and retried
+            logger.error("Error handling stream entry %s: %s", entry_id, e)
+            self.stats["failed"] += 1
+            return False
+
+        self.stats["processed"] += 1
+        return True
+
+    def dead_letter(self, entry_id: str, fields: Dict[Any, Any]) -> None:
+        """
+        Move an entry that keeps failing to the dead letter stream.
+
+        Args:
+            entry_id: The stream entry ID
+            fields: The entry fields
+        """
+        fields = {_to_str(k): _to_str(v) for k, v in fields.items()}
+        fields["message_id"] = entry_id
+        self.redis_client.xadd(DEAD_LETTER_STREAM_NAME, fields, maxlen=STREAM_MAXLEN, approximate=True)
+        self.redis_client.xack(self.stream, self.group, entry_id)
+        if fields.get(QUEUED_FIELD) == "1":
+            self.redis_client.decr(QUEUED_COUNT_KEY)
+        self.stats["dead_lettered"] += 1
+        logger.error("Moved stream entry %s to '%s' after %s deliveries", entry_id, DEAD_LETTER_STREAM_NAME, self.max_deliveries)
+
+    def run(self, stop_event: threading.Event) -> None:
+        """
+        Handle entries until stop_event is set.
+
+        Redis errors are logged and retried with a growing delay, so a worker
+        survives a Redis restart.
+
+        Args:
+            stop_event: Event that stops the worker when set
+        """
+        self.ensure_group()
+        backoff = 0.0
+        while not stop_event.is_set():
+            try:
+                self.run_once()
+                backoff = 0.0
+            except Exception as e:
+                backoff = min(backoff * 2 or 0.5, 30.0)
+                logger.error("Stream worker %s error, retrying in %ss: %s", self.consumer_name, backoff, e)
+                stop_event.wait(backoff)
+
+    def _delivery_count(self, entry_id: str) -> int:
+        """Get how many times an entry has been delivered."""
+        pending = self.redis_client.xpending_range(self.stream, self.group, entry_id, entry_id, 1)
+        return pending[0]["times_delivered"] if pending else 0
+
+class StreamWorkerPool:
+    """
+    A set of StreamWorker threads sharing one Redis client.
+
+    Message handling is dominated by Supabase and Redis round trips, so threads are
+    enough to keep several messages in flight; run more processes (on one or more
+    machines) to scale further. Consumer names include the host and process ID so
+    that workers in different processes never share pending entries.
+    """
+
+    def __init__(self, redis_client, handler: Callable[[str], str], workers: int = 4, **worker_options):
+        """
+        Initialize the pool.
+
+        Args:
+            redis_client: A Redis client
+            handler: Function that takes the message JSON and returns the reply JSON
+            workers: Number of worker threads (default: 4)
+            **worker_options: Options passed to each StreamWorker, e.g. release
+        """
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self.workers = [
+            StreamWorker(redis_client, handler, f"{prefix}-{i}", **worker_options)
+            for i in range(workers)
+        ]
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @classmethod
+    def from_env(
+        cls,
+        redis_client,
+        handler: Callable[[str], str],
+        workers: Optional[int] = None,
+        release: Optional[Callable[[str], None]] = None
+    ) -> "StreamWorkerPool":
+        """
+        Create a pool configured from environment variables.
+
+        Reads STREAM_WORKER_COUNT, STREAM_WORKER_BATCH_SIZE, STREAM_WORKER_BLOCK_MS,
+        STREAM_WORKER_CLAIM_IDLE_MS and STREAM_WORKER_MAX_DELIVERIES, falling back to
+        the defaults.
+
+        Args:
+            redis_client: A Redis client
+            handler: Function that takes the message JSON and returns the reply JSON
+            workers: Number of worker threads, overriding STREAM_WORKER_COUNT
+            release: Function called with the message JSON when its reply could not be written
+
+        Returns:
+            A StreamWorkerPool instance
+        """
+        return cls(
+            redis_client,
+            handler,
+            workers=workers if workers is not None else int(os.getenv("STREAM_WORKER_COUNT", "4")),
+            batch_size=int(os.getenv("STREAM_WORKER_BATCH_SIZE", "10")),
+            block_ms=int(os.getenv("STREAM_WORKER_BLOCK_MS", "2000")),
+            claim_idle_ms=int(os.getenv("STREAM_WORKER_CLAIM_IDLE_MS", "60000")),
+            max_deliveries=int(os.getenv("STREAM_WORKER_MAX_DELIVERIES", "5")),
+            release=release
+        )
+
+    def start(self) -> None:
+        """Create the consumer group and start the worker threads."""
+        if self._threads:
+            return
+        self.workers[0].ensure_group()
+        self._stop.clear()
+        for worker in self.workers:
+            thread = threading.Thread(target=worker.run, args=(self._stop,), name=worker.consumer_name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Started %s stream workers on '%s'", len(self.workers), self.workers[0].stream)
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """
+        Stop the worker threads after their current batch.
+
+        Args:
+            timeout: Seconds to wait for each thread (default: 10)
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the combined counters of all workers.
+
+        Returns:
+            A dict of counter name to total
+        """
+        totals: Dict[str, int] = {}
+        for worker in self.workers:
+            for name, value in worker.stats.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+def _to_str(value: Any) -> str:
+    """Decode a Redis reply value."""
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
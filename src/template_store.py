@@ -0,0 +1,176 @@
+"""
+Template Store Module for Township Connect WhatsApp Assistant.
+
+This module provides an in-memory store for the message templates in
+data/message_templates and the content files in content/. Long-running services load
+every file once at startup instead of checking for and reading files on each message,
+and pick up edited, added or removed files without a restart.
+"""
+
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Extension of the files the store loads
+TEXT_FILE_SUFFIX = ".txt"
+
+class TemplateStore:
+    """
+    Holds every template and content file in memory.
+
+    Content files take precedence over templates with the same name, and empty content
+    files fall back to the template, matching core_handler's POPIA notice and language
+    confirmation lookups. That fallback is resolved once per load rather than per call.
+
+    At most once every check_interval_seconds, a lookup stats the two directories and
+    their files, and re-reads the files whose modification time changed.
+    """
+
+    def __init__(self, template_dir: Path, content_dir: Path, check_interval_seconds: float = 2):
+        """
+        Initialize the store. Nothing is loaded until load() or the first lookup.
+
+        Args:
+            template_dir: Directory holding the message templates
+            content_dir: Directory holding the content files
+            check_interval_seconds: Minimum time between checks for changed files (default: 2)
+        """
+        self.template_dir = Path(template_dir)
+        self.content_dir = Path(content_dir)
+        self.check_interval = check_interval_seconds
+
+        self._templates: Dict[str, str] = {}
+        self._contents: Dict[str, str] = {}
+        self._resolved: Dict[str, str] = {}
+        self._mtimes: Dict[Path, int] = {}
+        self._loaded = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+        self.stats = {"loads": 0, "files_read": 0}
+
+    @classmethod
+    def from_env(cls, template_dir: Path, content_dir: Path) -> "TemplateStore":
+        """
+        Create a store configured from the TEMPLATE_STORE_CHECK_SECONDS environment variable.
+
+        Args:
+            template_dir: Directory holding the message templates
+            content_dir: Directory holding the content files
+
+        Returns:
+            A TemplateStore instance (not loaded)
+        """
+        return cls(
+            template_dir,
+            content_dir,
+            check_interval_seconds=float(os.getenv("TEMPLATE_STORE_CHECK_SECONDS", "2"))
+        )
+
+    def load(self) -> None:
+        """Read every file that is new or changed since the last load and resolve the fallbacks."""
+        with self._lock:
+            self._sync(self.template_dir, self._templates)
+            self._sync(self.content_dir, self._contents)
+
+            resolved = dict(self._templates)
+            for name, text in self._contents.items():
+                if text.strip():
+                    resolved[name] = text
+            self._resolved = resolved
+
+            self._loaded = True
+            self._checked_at = time.monotonic()
+            self.stats["loads"] += 1
+
+    def serves(self, template_dir: Path, content_dir: Path) -> bool:
+        """
+        Check whether the store was built for the given directories.
+
+        Args:
+            template_dir: The template directory in use
+            content_dir: The content directory in use
+
+        Returns:
+            True if lookups for these directories can be answered by the store
+        """
+        return Path(template_dir) == self.template_dir and Path(content_dir) == self.content_dir
+
+    def template(self, name: str) -> Optional[str]:
+        """
+        Get a message template.
+
+        Args:
+            name: The file name of the template
+
+        Returns:
+            The template text, or None if there is no such template
+        """
+        self._refresh_if_due()
+        return self._templates.get(name)
+
+    def content(self, name: str) -> Optional[str]:
+        """
+        Get a content file.
+
+        Args:
+            name: The file name of the content file
+
+        Returns:
+            The file's text, or None if there is no such content file
+        """
+        self._refresh_if_due()
+        return self._contents.get(name)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """
+        Get a non-empty content file, or the template with the same name.
+
+        Args:
+            name: The file name to look up
+
+        Returns:
+            The resolved text, or None if neither exists
+        """
+        self._refresh_if_due()
+        return self._resolved.get(name)
+
+    def _refresh_if_due(self) -> None:
+        """Load on first use, and reload when the check interval has passed."""
+        if not self._loaded or time.monotonic() - self._checked_at >= self.check_interval:
+            self.load()
+
+    def _sync(self, directory: Path, files: Dict[str, str]) -> None:
+        """Bring one directory's files up to date. Caller holds the lock."""
+        seen = set()
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            logger.warning(f"Template store directory not found: {directory}")
+            entries = []
+
+        for entry in entries:
+            if not entry.name.endswith(TEXT_FILE_SUFFIX) or not entry.is_file():
+                continue
+            seen.add(entry.name)
+            path = Path(entry.path)
+            mtime = entry.stat().st_mtime_ns
+            if entry.name in files and self._mtimes.get(path) == mtime:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    files[entry.name] = f.read()
+                self._mtimes[path] = mtime
+                self.stats["files_read"] += 1
+            except Exception as e:
+                logger.error(f"Error reading {path}: {str(e)}")
+
+        for name in set(files) - seen:
+            logger.info(f"Removed from template store: {directory / name}")
+            del files[name]
+            self._mtimes.pop(directory / name, None)
@@ -0,0 +1,176 @@
+"""
+Tests for admission control in Township Connect.
+
+These tests verify that messages are queued for the stream workers with a localized busy
+reply when the service is overloaded, and are handled normally otherwise.
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+from unittest.mock import patch, AsyncMock
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import async_handler
+from src.admission_control import AdmissionController
+from src.stream_worker import CONSUMER_GROUP, QUEUED_COUNT_KEY, QUEUED_FIELD
+
+USER_ID = 'whatsapp:+27123456789'
+
+class InMemoryRedis:
+    """Minimal stand-in for the Redis commands read by admission control."""
+
+    def __init__(self, groups=None, consumers=(), queued=0):
+        self.groups = groups
+        self.consumers = list(consumers)
+        self.values = {QUEUED_COUNT_KEY: str(queued).encode()}
+        self.entries = []
+
+    def xinfo_groups(self, stream):
+        if self.groups is None:
+            raise Exception("ERR no such key")
+        return self.groups
+
+    def xinfo_consumers(self, stream, group):
+        return self.consumers
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, b'0')) + 1).encode()
+        return int(self.values[key])
+
+    def xadd(self, stream, fields, maxlen=None, approximate=True):
+        self.entries.append((stream, fields))
+        return f"{len(self.entries)}-0".encode()
+
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self)
+
+class InMemoryPipeline:
+    """Queues commands and runs them against InMemoryRedis on execute."""
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    def __getattr__(self, command):
+        return lambda *args, **kwargs: self.commands.append((command, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis_client, command)(*args, **kwargs) for command, args, kwargs in self.commands]
+
+def worker_group(lag=None, pending=0):
+    """Build an XINFO GROUPS entry for the workers' group."""
+    group = {'name': CONSUMER_GROUP.encode(), 'consumers': 2, 'pending': pending, 'last-delivered-id': b'1-0'}
+    if lag is not None:
+        group['lag'] = lag
+    return group
+
+def consumer(idle_ms):
+    """Build an XINFO CONSUMERS entry."""
+    return {'name': b'worker-1', 'pending': 0, 'idle': idle_ms}
+
+def deliver(controller, body='Hello'):
+    """Deliver a message through the async entry point with the pipeline mocked out."""
+    payload = json.dumps({'From': USER_ID, 'Body': body})
+    process = AsyncMock(return_value='handled')
+    with patch('src.async_handler.admission_controller', controller), \
+         patch('src.async_handler.sender_scheduler', None), \
+         patch('src.async_handler.process_message_async', process), \
+         patch('src.core_handler.redis_client', controller.redis_client), \
+         patch('src.core_handler.supabase_client', object()), \
+         patch('src.core_handler.get_user_cache', return_value=None):
+        reply = asyncio.run(async_handler.handle_incoming_message_async(payload))
+    return reply, process
+
+@pytest.mark.unit
+def test_lag_counts_queued_messages_for_live_workers():
+    """Test that the lag is the queued count, capped by the group's entries, while a worker is live."""
+    other_group = {'name': b'other', 'pending': 0, 'lag': 5000}
+
+    controller = AdmissionController(InMemoryRedis([other_group, worker_group(lag=40, pending=2)], [consumer(500)], queued=30))
+    assert controller.refresh_lag() == 30
+
+    # Stream copies of inline messages are unread entries too, but only queued ones count
+    controller = AdmissionController(InMemoryRedis([worker_group(lag=4000)], [consumer(500)], queued=3))
+    assert controller.refresh_lag() == 3
+
+    # A counter that drifted above the group's unread and pending entries is capped
+    controller = AdmissionController(InMemoryRedis([worker_group(lag=0, pending=1)], [consumer(500)], queued=90))
+    assert controller.refresh_lag() == 1
+
+    controller = AdmissionController(InMemoryRedis([other_group], [consumer(500)], queued=30))
+    assert controller.refresh_lag() is None
+
+@pytest.mark.unit
+def test_lag_is_ignored_without_live_workers():
+    """Test that a backlog nobody is reading does not shed traffic."""
+    controller = AdmissionController(InMemoryRedis([worker_group(lag=5000)], [consumer(600000)], queued=5000), max_lag=100)
+
+    assert controller.refresh_lag() is None
+    assert controller.overload_reason() is None
+
+@pytest.mark.unit
+def test_message_is_handled_when_not_overloaded():
+    """Test that a message is handled normally below the limits."""
+    controller = AdmissionController(InMemoryRedis([worker_group(lag=10)], [consumer(500)], queued=10), max_lag=100)
+    controller.refresh_lag()
+
+    reply, process = deliver(controller)
+
+    assert reply == 'handled'
+    process.assert_awaited_once()
+    assert controller.in_flight == 0
+    assert controller.redis_client.entries == []
+
+@pytest.mark.unit
+def test_message_is_shed_above_max_lag():
+    """Test that a message is queued for lagging workers and the sender gets a localized busy reply."""
+    controller = AdmissionController(InMemoryRedis([worker_group(lag=500)], [consumer(500)], queued=500), max_lag=100)
+    controller.refresh_lag()
+
+    reply, process = deliver(controller, body='Molo')
+
+    process.assert_not_awaited()
+    reply = json.loads(reply)
+    assert reply['reply_to'] == USER_ID
+    assert reply['reply_text'].startswith('Sifumana imiyalezo emininzi ngoku. Siwufumene owakho')
+    assert controller.stats['shed'] == 1
+
+    # The queued entry is the only write: a worker answers it and writes its logs
+    [(_, fields)] = controller.redis_client.entries
+    assert json.loads(fields['data'])['Body'] == 'Molo'
+    assert fields[QUEUED_FIELD] == '1'
+    assert controller.redis_client.values[QUEUED_COUNT_KEY] == b'501'
+
+@pytest.mark.unit
+def test_message_is_shed_above_max_in_flight():
+    """Test that too many messages in progress sheds new ones to the live workers."""
+    controller = AdmissionController(InMemoryRedis([worker_group(lag=0)], [consumer(500)]), max_in_flight=1)
+    controller.refresh_lag()
+
+    with controller.track():
+        reply, process = deliver(controller)
+
+    process.assert_not_awaited()
+    assert json.loads(reply)['reply_text'] == "We're receiving a lot of messages right now. We've got yours and will reply shortly."
+    assert len(controller.redis_client.entries) == 1
+
+@pytest.mark.unit
+def test_nothing_is_shed_without_live_workers():
+    """Test that messages are handled here when no worker would answer a queued one."""
+    for redis_client in (None, InMemoryRedis(None), InMemoryRedis([worker_group(lag=0)], [consumer(600000)])):
+        controller = AdmissionController(redis_client, max_in_flight=1)
+        controller.refresh_lag()
+
+        with controller.track():
+            reply, process = deliver(controller)
+
+        assert reply == 'handled'
+        assert controller.stats['shed'] == 0
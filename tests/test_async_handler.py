@@ -0,0 +1,147 @@
+"""
+Tests for the async message pipeline in Township Connect.
+
+These tests verify that the async pipeline produces the same replies as the
+synchronous handler while moving the non-critical writes off the reply path.
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+from unittest.mock import patch, MagicMock
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.async_handler import handle_incoming_message_async, drain_background_tasks
+
+def run_pipeline(message: dict) -> dict:
+    """Run the async pipeline for a message and wait for its background writes."""
+    async def run():
+        reply = await handle_incoming_message_async(json.dumps(message))
+        await drain_background_tasks()
+        return json.loads(reply)
+    return asyncio.run(run())
+
+@pytest.mark.unit
+def test_async_pipeline_echo_for_existing_user():
+    """Test that an existing user with consent and a bundle gets an echo reply."""
+    message = {'From': 'whatsapp:+27123456789', 'Body': 'Hello there'}
+    existing_user = {'preferred_language': 'en', 'popia_consent_given': True, 'current_bundle': 'street_vendor_crm'}
+
+    with patch('src.core_handler.supabase_client', MagicMock()), \
+         patch('src.core_handler._touch_rpc_available', False), \
+         patch('src.core_handler.get_or_create_user', return_value=(existing_user, False, None)) as mock_get_or_create, \
+         patch('src.core_handler.publish_to_redis_stream') as mock_publish, \
+         patch('src.core_handler.touch_user_activity') as mock_touch, \
+         patch('src.core_handler.log_message') as mock_log:
+
+        result = run_pipeline(message)
+
+        assert result == {'reply_to': 'whatsapp:+27123456789', 'reply_text': 'Echo: Hello there'}
+        mock_get_or_create.assert_called_once()
+        mock_publish.assert_called_once_with(json.dumps(message))
+        mock_touch.assert_called_once_with('whatsapp:+27123456789')
+
+        directions = [call.args[2] for call in mock_log.call_args_list]
+        assert directions.count('inbound') == 1
+        assert directions.count('outbound') == 1
+
+@pytest.mark.unit
+def test_async_pipeline_new_user_gets_popia_notice():
+    """Test that a new user is created and receives the POPIA notice."""
+    message = {'From': 'whatsapp:+27111111111', 'Body': 'Molo'}
+
+    with patch('src.core_handler.supabase_client', MagicMock()), \
+         patch('src.core_handler._touch_rpc_available', False), \
+         patch('src.core_handler.publish_to_redis_stream'), \
+         patch('src.core_handler.get_or_register_user', return_value=(None, True, 'xh')) as mock_register, \
+         patch('src.core_handler.get_content_file', return_value='POPIA notice xh'), \
+         patch('src.core_handler.log_message') as mock_log:
+
+        result = run_pipeline(message)
+
+        assert result['reply_text'] == 'POPIA notice xh'
+        mock_register.assert_called_once_with('whatsapp:+27111111111', 'Molo')
+
+        directions = [call.args[2] for call in mock_log.call_args_list]
+        assert 'inbound' in directions
+        assert 'popia_notice_sent' in directions
+        assert 'outbound' in directions
+
+@pytest.mark.unit
+def test_async_pipeline_user_found_by_the_upsert_is_not_new():
+    """Test that a sender the get-or-create finds existing is not sent the POPIA notice again."""
+    message = {'From': 'whatsapp:+27111111111', 'Body': 'Molo'}
+    existing_user = {'preferred_language': 'xh', 'popia_consent_given': True, 'current_bundle': 'small_business'}
+
+    with patch('src.core_handler.supabase_client', MagicMock()), \
+         patch('src.core_handler._touch_rpc_available', False), \
+         patch('src.core_handler.get_or_create_user', return_value=(existing_user, False, None)), \
+         patch('src.core_handler.publish_to_redis_stream'), \
+         patch('src.core_handler.touch_user_activity'), \
+         patch('src.core_handler.get_content_file', return_value='POPIA notice xh'), \
+         patch('src.core_handler.log_message') as mock_log:
+
+        result = run_pipeline(message)
+
+        assert result['reply_text'] == 'Echo: Molo'
+        assert 'popia_notice_sent' not in [call.args[2] for call in mock_log.call_args_list]
+
+@pytest.mark.unit
+def test_async_pipeline_records_inbound_in_one_request():
+    """Test that the user lookup, activity update and inbound log share one request."""
+    from src.db.supabase_client import MockSupabaseClient
+
+    client = MockSupabaseClient()
+    client.users['whatsapp:+27222222222'] = {
+        'whatsapp_id': 'whatsapp:+27222222222',
+        'preferred_language': 'af',
+        'popia_consent_given': True,
+        'current_bundle': 'small_business'
+    }
+
+    with patch('src.core_handler.supabase_client', client), \
+         patch('src.core_handler.publish_to_redis_stream'), \
+         patch('src.core_handler.log_message') as mock_log:
+
+        result = run_pipeline({'From': 'whatsapp:+27222222222', 'Body': 'Goeie more'})
+
+        assert result['reply_text'] == 'Echo: Goeie more'
+        # The database function call is the only request made before replying
+        assert client.request_count == 1
+        assert client.messages[-1]['direction'] == 'inbound'
+        assert client.users['whatsapp:+27222222222']['last_active_at']
+        # Only the outbound log is left to write after the reply
+        assert [call.args[2] for call in mock_log.call_args_list] == ['outbound']
+
+@pytest.mark.unit
+def test_async_pipeline_falls_back_when_function_is_missing():
+    """Test that a missing database function switches the pipeline to separate requests."""
+    existing_user = {'preferred_language': 'en', 'popia_consent_given': True, 'current_bundle': 'small_business'}
+    missing = (None, False, "PGRST202: Could not find the function public.touch_user_and_log_inbound")
+
+    with patch('src.core_handler.supabase_client', MagicMock()), \
+         patch('src.core_handler._touch_rpc_available', True), \
+         patch('src.core_handler.touch_user_and_log_inbound', return_value=missing) as mock_touch_rpc, \
+         patch('src.core_handler.get_or_create_user', return_value=(existing_user, False, None)) as mock_get_or_create, \
+         patch('src.core_handler.publish_to_redis_stream'), \
+         patch('src.core_handler.touch_user_activity'), \
+         patch('src.core_handler.log_message'):
+
+        run_pipeline({'From': 'whatsapp:+27123456789', 'Body': 'one'})
+        run_pipeline({'From': 'whatsapp:+27123456789', 'Body': 'two'})
+
+        mock_touch_rpc.assert_called_once()
+        assert mock_get_or_create.call_count == 2
+
+@pytest.mark.unit
+def test_async_pipeline_invalid_json():
+    """Test that invalid JSON returns the generic error reply."""
+    reply = asyncio.run(handle_incoming_message_async("This is not JSON"))
+    result = json.loads(reply)
+
+    assert result['reply_to'] == 'unknown'
+    assert "couldn't process your message" in result['reply_text']
@@ -0,0 +1,210 @@
+"""
+Tests for the async Supabase data access layer in Township Connect.
+
+These tests verify that the async functions send the expected PostgREST requests
+through one pooled client and return the same shapes as the synchronous functions.
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+import httpx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db import async_supabase_client as db
+from src.db.user_cache import UserCache
+
+USER_ID = 'whatsapp:+27123456789'
+USER = {'whatsapp_id': USER_ID, 'preferred_language': 'xh', 'popia_consent_given': True}
+
+class FakePostgrest:
+    """Answers PostgREST requests from an in-memory users table and records them."""
+
+    def __init__(self):
+        self.users = {}
+        self.requests = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        body = json.loads(request.content) if request.content else None
+        if request.url.path == '/rest/v1/users':
+            whatsapp_id = request.url.params.get('whatsapp_id', '').replace('eq.', '', 1)
+            if request.method == 'GET':
+                return httpx.Response(200, json=[self.users[whatsapp_id]] if whatsapp_id in self.users else [])
+            if request.method == 'POST':
+                if body['whatsapp_id'] in self.users and 'ignore-duplicates' in request.headers.get('Prefer', ''):
+                    return httpx.Response(201, json=[])
+                if body['whatsapp_id'] in self.users:
+                    return httpx.Response(409, json={'code': '23505', 'message': 'duplicate key value violates unique constraint "users_pkey"'})
+                self.users[body['whatsapp_id']] = body
+                return httpx.Response(201, json=[body])
+            if request.method == 'PATCH':
+                if whatsapp_id not in self.users:
+                    return httpx.Response(200, json=[])
+                self.users[whatsapp_id].update(body)
+                return httpx.Response(200, json=[self.users[whatsapp_id]])
+        if request.url.path == '/rest/v1/service_bundles':
+            return httpx.Response(200, json=[{'id': 'small_business'}])
+        return httpx.Response(404, json={'message': 'Not found'})
+
+def make_client(fake: FakePostgrest, **kwargs) -> db.AsyncSupabaseClient:
+    """Build a client whose requests are answered by a FakePostgrest."""
+    return db.AsyncSupabaseClient('https://example.supabase.co', 'anon-key', transport=httpx.MockTransport(fake.handle), **kwargs)
+
+@pytest.mark.unit
+def test_get_and_create_user():
+    """Test that users are read and created with PostgREST filters and the sync return shapes."""
+    fake = FakePostgrest()
+
+    async def scenario():
+        client = make_client(fake)
+        assert await db.get_user(client, USER_ID) is None
+        created = await db.create_user(client, USER_ID, 'xh')
+        duplicate = await db.create_user(client, USER_ID, 'xh')
+        user = await db.get_user(client, USER_ID)
+        await client.aclose()
+        return created, duplicate, user
+
+    with patch('src.db.supabase_client._user_cache', None):
+        created, duplicate, user = asyncio.run(scenario())
+
+    assert created['error'] is None and created['data'][0]['preferred_language'] == 'xh'
+    assert duplicate['error'].startswith('duplicate key value')
+    assert user['whatsapp_id'] == USER_ID
+    lookup = fake.requests[0]
+    assert lookup.url.params['whatsapp_id'] == f'eq.{USER_ID}'
+    assert lookup.headers['apikey'] == 'anon-key'
+    assert fake.requests[1].headers['Prefer'] == 'return=representation'
+
+@pytest.mark.unit
+def test_get_or_create_user():
+    """Test that get_or_create_user creates a user once and then finds them."""
+    fake = FakePostgrest()
+
+    async def scenario():
+        client = make_client(fake)
+        created = await db.get_or_create_user(client, USER_ID, 'xh')
+        found = await db.get_or_create_user(client, USER_ID, 'en')
+        await client.aclose()
+        return created, found
+
+    with patch('src.db.supabase_client._user_cache', None):
+        created, found = asyncio.run(scenario())
+
+    assert (created[0].preferred_language, created[1], created[2]) == ('xh', True, None)
+    assert (found[0].preferred_language, found[1], found[2]) == ('xh', False, None)
+    upsert = fake.requests[0]
+    assert upsert.url.params['on_conflict'] == 'whatsapp_id'
+    assert upsert.headers['Prefer'] == 'return=representation,resolution=ignore-duplicates'
+
+@pytest.mark.unit
+def test_updates_write_through_to_the_user_cache():
+    """Test that an update returns an APIResponse like the sync client and updates the cached user."""
+    fake = FakePostgrest()
+    fake.users[USER_ID] = dict(USER)
+    cache = UserCache(None)
+    cache.set(USER_ID, USER)
+
+    async def scenario():
+        client = make_client(fake)
+        response = await db.update_user_language(client, USER_ID, 'af')
+        invalid = await db.update_user_language(client, USER_ID, 'fr')
+        cached = await db.get_user(client, USER_ID)
+        await client.aclose()
+        return response, invalid, cached
+
+    with patch('src.db.supabase_client._user_cache', cache):
+        response, invalid, cached = asyncio.run(scenario())
+
+    assert response.data[0]['preferred_language'] == 'af'
+    assert invalid == {'data': [], 'error': 'Invalid language code: fr'}
+    assert cached['preferred_language'] == 'af'
+    assert [request.method for request in fake.requests] == ['PATCH']
+
+@pytest.mark.unit
+def test_log_message_uses_the_buffered_writer():
+    """Test that log rows go to the buffered writer when one is installed."""
+    class Writer:
+        rows = []
+
+        def enqueue(self, table, row):
+            self.rows.append((table, row))
+            return True
+
+    fake = FakePostgrest()
+
+    async def scenario():
+        client = make_client(fake)
+        result = await db.log_message(client, USER_ID, 'inbound', 'Molo', 0.1)
+        await client.aclose()
+        return result
+
+    with patch('src.db.supabase_client._log_writer', Writer()):
+        result = asyncio.run(scenario())
+
+    assert result['error'] is None
+    assert Writer.rows[0][0] == 'message_logs'
+    assert fake.requests == []
+
+@pytest.mark.unit
+def test_timeouts_are_reported_as_errors():
+    """Test that a request timing out returns an error instead of raising."""
+    def slow(request):
+        raise httpx.ReadTimeout('timed out', request=request)
+
+    async def scenario():
+        client = db.AsyncSupabaseClient('https://example.supabase.co', 'anon-key', transport=httpx.MockTransport(slow))
+        user = await db.get_user(client, USER_ID)
+        bundles = await db.get_service_bundles(client)
+        popia = await db.update_user_popia_consent(client, USER_ID, True)
+        await client.aclose()
+        return user, bundles, popia
+
+    with patch('src.db.supabase_client._user_cache', None):
+        user, bundles, popia = asyncio.run(scenario())
+
+    assert user is None
+    assert bundles == []
+    assert popia == {'data': [], 'error': 'timed out'}
+
+@pytest.mark.unit
+def test_shared_client_per_event_loop(monkeypatch):
+    """Test that the shared client is reused within a loop and rebuilt for a new loop."""
+    monkeypatch.setenv('SUPABASE_URL', 'https://example.supabase.co')
+    monkeypatch.setenv('SUPABASE_ANON_KEY', 'anon-key')
+    monkeypatch.setenv('SUPABASE_HTTP_MAX_CONNECTIONS', '50')
+
+    async def scenario():
+        first = db.get_async_client()
+        second = db.get_async_client()
+        await db.close_async_client()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    third, _ = asyncio.run(scenario())
+
+    assert first is second
+    assert third is not first
+    assert first.limits.max_connections == 50
+
+@pytest.mark.unit
+def test_service_bundles_are_active_and_ordered():
+    """Test that bundles are read with the bundle catalog's filter and order."""
+    fake = FakePostgrest()
+
+    async def scenario():
+        client = make_client(fake)
+        bundles = await db.get_service_bundles(client)
+        await client.aclose()
+        return bundles
+
+    assert asyncio.run(scenario()) == [{'id': 'small_business'}]
+    params = fake.requests[0].url.params
+    assert params['active'] == 'eq.true'
+    assert params['order'] == 'created_at,bundle_id'
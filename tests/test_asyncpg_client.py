@@ -0,0 +1,120 @@
+"""
+Tests for the asyncpg backend of the async data access layer in Township Connect.
+
+These tests verify that the async data access functions produce the expected
+parameterized statements against a pool, and that rows come back shaped like PostgREST rows.
+"""
+
+import asyncio
+import os
+import pytest
+import sys
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db import async_supabase_client as db
+from src.db.asyncpg_client import AsyncPostgresClient
+from src.db.user_record import ADMIN_USER_COLUMNS
+
+USER_ID = 'whatsapp:+27123456789'
+CREATED_AT = datetime(2025, 5, 1, 8, 30, tzinfo=timezone.utc)
+
+class FakePool:
+    """Records statements and answers them with canned rows."""
+
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.statements = []
+
+    async def fetch(self, sql, *args, timeout=None):
+        self.statements.append((sql, args))
+        return self.rows
+
+    async def executemany(self, sql, values, timeout=None):
+        self.statements.append((sql, tuple(values)))
+
+    async def close(self):
+        pass
+
+@pytest.mark.unit
+def test_get_user_selects_with_a_parameter():
+    """Test that get_user runs a parameterized, projected select and returns PostgREST-shaped rows."""
+    pool = FakePool([{'whatsapp_id': USER_ID, 'preferred_language': 'xh', 'created_at': CREATED_AT}])
+    client = AsyncPostgresClient('postgresql://localhost/township', pool=pool)
+
+    with patch('src.db.supabase_client._user_cache', None):
+        user = asyncio.run(db.get_user(client, USER_ID, ADMIN_USER_COLUMNS))
+
+    assert pool.statements == [(
+        'SELECT "whatsapp_id", "preferred_language", "current_bundle", "popia_consent_given", '
+        '"created_at", "last_active_at" FROM users WHERE "whatsapp_id" = $1',
+        (USER_ID,)
+    )]
+    assert user == {'whatsapp_id': USER_ID, 'preferred_language': 'xh', 'created_at': '2025-05-01T08:30:00+00:00'}
+
+@pytest.mark.unit
+def test_updates_and_inserts_convert_timestamps():
+    """Test that updates set columns by placeholder and timestamps are sent as datetimes."""
+    pool = FakePool([{'whatsapp_id': USER_ID, 'preferred_language': 'af'}])
+    client = AsyncPostgresClient('postgresql://localhost/township', pool=pool)
+
+    with patch('src.db.supabase_client._user_cache', None), \
+         patch('src.db.supabase_client._log_writer', None):
+        response = asyncio.run(db.update_user_language(client, USER_ID, 'af'))
+        asyncio.run(db.log_security_event(client, USER_ID, 'DATA_DELETE_REQUESTED', {'source': 'test'}))
+
+    sql, args = pool.statements[0]
+    assert sql == 'UPDATE users SET "preferred_language" = $1, "last_active_at" = $2 WHERE "whatsapp_id" = $3 RETURNING *'
+    assert args[0] == 'af' and isinstance(args[1], datetime) and args[2] == USER_ID
+    assert response.data[0]['preferred_language'] == 'af'
+
+    sql, values = pool.statements[1]
+    assert sql == 'INSERT INTO security_logs ("user_whatsapp_id", "event_type", "details", "timestamp") VALUES ($1, $2, $3, $4)'
+    assert values[0][2] == {'source': 'test'} and isinstance(values[0][3], datetime)
+
+@pytest.mark.unit
+def test_rpc_calls_functions_with_named_arguments():
+    """Test that touch_user_and_log_inbound is called with named arguments in one statement."""
+    pool = FakePool([{'result': {'whatsapp_id': USER_ID, 'preferred_language': 'en', 'is_new_user': True}}])
+    client = AsyncPostgresClient('postgresql://localhost/township', pool=pool)
+
+    with patch('src.db.supabase_client._user_cache', None):
+        user, is_new_user, error = asyncio.run(db.touch_user_and_log_inbound(client, USER_ID, 'Hello'))
+
+    assert pool.statements[0][0] == (
+        'SELECT touch_user_and_log_inbound(p_whatsapp_id => $1, p_message_content => $2, '
+        'p_data_size_kb => $3, p_preferred_language => $4) AS result'
+    )
+    assert (user['whatsapp_id'], is_new_user, error) == (USER_ID, True, None)
+
+@pytest.mark.unit
+def test_unknown_tables_and_columns_are_rejected():
+    """Test that only the schema's tables, columns and functions can be queried."""
+    client = AsyncPostgresClient('postgresql://localhost/township', pool=FakePool())
+
+    with pytest.raises(ValueError):
+        asyncio.run(client.select('pg_authid', {}))
+    with pytest.raises(ValueError):
+        asyncio.run(client.select('users', {'whatsapp_id = whatsapp_id OR true; --': 'x'}))
+    with pytest.raises(ValueError):
+        asyncio.run(client.rpc('pg_sleep', {'seconds': 10}))
+
+@pytest.mark.unit
+def test_backend_is_selected_by_config(monkeypatch):
+    """Test that DATABASE_BACKEND=asyncpg makes the shared client an AsyncPostgresClient."""
+    monkeypatch.setenv('DATABASE_BACKEND', 'asyncpg')
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://localhost/township')
+
+    async def scenario():
+        client = db.get_async_client()
+        db._forget_shared_client()
+        return client
+
+    with patch('src.db.asyncpg_client.asyncpg', object()):
+        client = asyncio.run(scenario())
+
+    assert isinstance(client, AsyncPostgresClient)
+    assert client.dsn == 'postgresql://localhost/township'
@@ -0,0 +1,104 @@
+"""
+Tests for the service bundle catalog in Township Connect.
+
+These tests verify that the catalog serves bundles and selection prompts from memory
+in a stable order and reloads only when the bundles change.
+"""
+
+import json
+import pytest
+import sys
+import os
+import time
+from unittest.mock import patch
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.bundle_catalog import BundleCatalog
+from src.core_handler import generate_bundle_selection_prompt, handle_incoming_message
+from src.db.supabase_client import MockSupabaseClient
+
+def make_client() -> MockSupabaseClient:
+    """Create a mock client with two active bundles and one inactive bundle."""
+    client = MockSupabaseClient()
+    client.bundles = [
+        {'bundle_id': 'street_vendor_crm', 'bundle_name_en': 'Street-Vendor CRM', 'bundle_name_xh': 'Isixhobo soThengiso',
+         'bundle_name_af': 'Straatverkoper CRM', 'active': True, 'created_at': '2025-01-01', 'updated_at': '2025-01-01'},
+        {'bundle_id': 'retired', 'bundle_name_en': 'Retired Bundle', 'active': False,
+         'created_at': '2025-01-01', 'updated_at': '2025-01-01'},
+        {'bundle_id': 'delivery_runner', 'bundle_name_en': 'Delivery Runner', 'bundle_name_xh': 'Umthumeli',
+         'bundle_name_af': 'Afleweraar', 'active': True, 'created_at': '2025-01-01', 'updated_at': '2025-01-01'},
+    ]
+    return client
+
+def wait_for_refresh(catalog: BundleCatalog) -> None:
+    """Wait for a background revalidation to finish."""
+    deadline = time.monotonic() + 2
+    while catalog._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+@pytest.mark.unit
+def test_catalog_orders_active_bundles_and_prerenders_prompts():
+    """Test that only active bundles are listed, in a stable order, with rendered prompts."""
+    client = make_client()
+    catalog = BundleCatalog(client, generate_bundle_selection_prompt)
+    catalog.load()
+    requests_after_load = client.request_count
+
+    assert [b['bundle_id'] for b in catalog.bundles()] == ['delivery_runner', 'street_vendor_crm']
+    assert catalog.bundle_by_number(2)['bundle_id'] == 'street_vendor_crm'
+    assert catalog.bundle_by_number(3) is None
+    assert catalog.bundle_by_id('retired') is None
+    assert "1. Delivery Runner" in catalog.prompt('en')
+    assert "2. Isixhobo soThengiso" in catalog.prompt('xh')
+    assert "1. Afleweraar" in catalog.prompt('af')
+
+    # Reads are served from memory
+    assert client.request_count == requests_after_load
+
+@pytest.mark.unit
+def test_catalog_reloads_only_when_bundles_change():
+    """Test stale-while-revalidate: unchanged bundles are not read again."""
+    client = make_client()
+    catalog = BundleCatalog(client, generate_bundle_selection_prompt, refresh_interval_seconds=0)
+    catalog.load()
+
+    catalog.bundles()
+    wait_for_refresh(catalog)
+    assert catalog.stats['loads'] == 1
+    assert catalog.stats['revalidations'] == 1
+
+    client.bundles[0]['bundle_name_en'] = 'Vendor CRM'
+    client.bundles[0]['updated_at'] = '2025-02-01'
+    # The stale catalog is still served while it is revalidated
+    assert "Street-Vendor CRM" in catalog.prompt('en')
+    wait_for_refresh(catalog)
+
+    assert catalog.stats['loads'] == 2
+    assert "2. Vendor CRM" in catalog.prompt('en')
+
+@pytest.mark.unit
+def test_handler_uses_installed_catalog():
+    """Test that bundle listing needs no database access when a catalog is installed."""
+    client = make_client()
+    catalog = BundleCatalog(client, generate_bundle_selection_prompt)
+    catalog.load()
+    user = {'preferred_language': 'en', 'popia_consent_given': True}
+
+    with patch('src.core_handler.bundle_catalog', catalog), \
+         patch('src.core_handler.supabase_client', client), \
+         patch('src.core_handler._touch_rpc_available', False), \
+         patch('src.core_handler.get_or_create_user', return_value=(user, False, None)), \
+         patch('src.core_handler.get_service_bundles') as mock_get_bundles, \
+         patch('src.core_handler.publish_to_redis_stream'), \
+         patch('src.core_handler.log_message'), \
+         patch('src.core_handler.update_user_bundle') as mock_update_bundle:
+
+        prompt_reply = json.loads(handle_incoming_message(json.dumps({'From': 'whatsapp:+27123456789', 'Body': 'Hi'})))
+        select_reply = json.loads(handle_incoming_message(json.dumps({'From': 'whatsapp:+27123456789', 'Body': '2'})))
+
+        assert "1. Delivery Runner" in prompt_reply['reply_text']
+        assert select_reply['reply_text'] == "Bundle 'Street-Vendor CRM' selected!"
+        mock_update_bundle.assert_called_once_with(client, 'whatsapp:+27123456789', 'street_vendor_crm')
+        mock_get_bundles.assert_not_called()
@@ -0,0 +1,115 @@
+"""
+Tests for the Supabase client registry in Township Connect.
+
+These tests verify that clients are created once per process and kind, recreated when
+their configuration changes or they fail a health check, and dropped in a forked child.
+"""
+
+import os
+import pytest
+import sys
+from unittest.mock import MagicMock, patch
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db.client_registry import ClientRegistry
+from src.db.supabase_client import get_client, get_service_client
+
+def make_registry() -> ClientRegistry:
+    """Build a registry whose factory creates open mock clients."""
+    def factory(url, key):
+        client = MagicMock()
+        client.postgrest.session.is_closed = False
+        return client
+    return ClientRegistry(factory=factory)
+
+@pytest.mark.unit
+def test_clients_are_reused_per_kind():
+    """Test that each kind gets one client until its URL or key changes."""
+    registry = make_registry()
+
+    anon = registry.get('anon', 'https://example.supabase.co', 'anon-key')
+    service = registry.get('service', 'https://example.supabase.co', 'service-key')
+    assert registry.get('anon', 'https://example.supabase.co', 'anon-key') is anon
+    assert service is not anon
+
+    rotated = registry.get('anon', 'https://example.supabase.co', 'new-anon-key')
+    assert rotated is not anon
+    anon.postgrest.session.close.assert_called_once()
+    assert registry.stats['created'] == 3
+    assert registry.stats['reused'] == 1
+
+@pytest.mark.unit
+def test_closed_and_unhealthy_clients_are_recreated():
+    """Test that a closed client or one failing its health check is replaced."""
+    registry = make_registry()
+    first = registry.get('service', 'https://example.supabase.co', 'service-key')
+
+    first.postgrest.session.is_closed = True
+    second = registry.get('service', 'https://example.supabase.co', 'service-key')
+    assert second is not first
+
+    assert registry.check_health('service')
+    second.table.return_value.select.return_value.limit.return_value.execute.side_effect = Exception('connection reset')
+    assert not registry.check_health('service')
+    assert registry.get('service', 'https://example.supabase.co', 'service-key') is not second
+    assert registry.stats['health_checks_failed'] == 1
+
+@pytest.mark.unit
+def test_reset_hooks_run_on_reset_and_in_a_forked_child():
+    """Test that a forked child forgets the parent's clients without closing them."""
+    registry = make_registry()
+    hook = MagicMock()
+    registry.add_reset_hook(hook)
+    parent_client = registry.get('anon', 'https://example.supabase.co', 'anon-key')
+
+    with patch('src.db.client_registry.os.getpid', return_value=os.getpid() + 1):
+        child_client = registry.get('anon', 'https://example.supabase.co', 'anon-key')
+
+    assert child_client is not parent_client
+    parent_client.postgrest.session.close.assert_not_called()
+    hook.assert_called_once()
+
+    registry.reset()
+    child_client.postgrest.session.close.assert_called_once()
+    assert hook.call_count == 2
+
+@pytest.mark.unit
+def test_supabase_client_functions_share_the_registry(monkeypatch):
+    """Test that get_client and get_service_client return the same client on every call."""
+    monkeypatch.setenv('SUPABASE_URL', 'https://example.supabase.co')
+    monkeypatch.setenv('SUPABASE_ANON_KEY', 'anon-key')
+    monkeypatch.setenv('SUPABASE_SERVICE_KEY', 'service-key')
+    registry = make_registry()
+
+    with patch('src.db.supabase_client.get_client_registry', return_value=registry):
+        assert get_client() is get_client()
+        assert get_service_client() is get_service_client()
+        assert get_client() is not get_service_client()
+
+    assert registry.stats['created'] == 2
+
+@pytest.mark.unit
+def test_warm_up_replaces_an_unhealthy_supabase_client(monkeypatch):
+    """Test that warming up health-checks the handler's client and swaps in a new one if it fails."""
+    from src import core_handler
+
+    monkeypatch.setenv('SUPABASE_URL', 'https://example.supabase.co')
+    monkeypatch.setenv('SUPABASE_ANON_KEY', 'anon-key')
+    registry = make_registry()
+
+    with patch('src.db.supabase_client.get_client_registry', return_value=registry), \
+         patch('src.core_handler.get_client_registry', return_value=registry), \
+         patch('src.core_handler.redis_client', None):
+        stale = get_client()
+        stale.table.return_value.select.return_value.limit.return_value.execute.side_effect = Exception('connection reset')
+        monkeypatch.setattr(core_handler, 'supabase_client', stale)
+
+        assert core_handler.warm_up_clients() == {'supabase': False, 'redis': False}
+        replacement = core_handler.supabase_client
+        assert replacement is not stale
+        stale.postgrest.session.close.assert_called_once()
+
+        assert core_handler.warm_up_clients() == {'supabase': True, 'redis': False}
+        assert core_handler.supabase_client is replacement
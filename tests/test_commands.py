@@ -0,0 +1,84 @@
+"""
+Tests for the command registry in Township Connect.
+
+These tests verify that messages are routed to commands by exact text, keyword and
+slash command prefix, and that unmatched messages fall through to the default command.
+"""
+
+import pytest
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.commands import CommandRegistry
+from src.core_handler import COMMANDS, parse_message
+
+def parse_sale(arguments: str, message_text: str):
+    """Parse '/sale <amount>'."""
+    if arguments.isdigit():
+        return "sale", {"amount": int(arguments)}
+    return None
+
+@pytest.fixture
+def registry():
+    """Registry with a few commands of each kind."""
+    registry = CommandRegistry(default_command="echo")
+    registry.add_command("echo", lambda params, sender_id, language: f"Echo: {params['text']}")
+    registry.add_command("sale", lambda params, sender_id, language: f"Sale of R{params['amount']} recorded")
+    registry.add_command("help", lambda params, sender_id, language: f"Help ({language})")
+    registry.add_exact("/help", "help")
+    registry.add_keyword("HELP", "help")
+    registry.add_prefix("/sale", parse_sale)
+    return registry
+
+@pytest.mark.unit
+def test_registry_routes_messages(registry):
+    """Test exact, keyword and prefix routing."""
+    assert registry.parse("/help") == ("help", {})
+    assert registry.parse("  Help ") == ("help", {})
+    assert registry.parse("/SALE 25") == ("sale", {"amount": 25})
+    # Declined arguments and unknown slash commands fall through to the default
+    assert registry.parse("/sale lots") == ("echo", {"text": "/sale lots"})
+    assert registry.parse("/refund 5") == ("echo", {"text": "/refund 5"})
+    assert registry.parse("Hello") == ("echo", {"text": "Hello"})
+
+@pytest.mark.unit
+def test_registry_dispatches_to_handlers(registry):
+    """Test that parsed commands are handled by their registered handler."""
+    command_type, params = registry.parse("/sale 40")
+
+    assert registry.dispatch(command_type, params, "whatsapp:+27123456789", "xh") == "Sale of R40 recorded"
+    assert registry.dispatch("help", {}, "whatsapp:+27123456789", "xh") == "Help (xh)"
+    assert registry.dispatch("missing", {}, "whatsapp:+27123456789") == "Unknown command: missing"
+
+@pytest.mark.unit
+def test_registry_rejects_duplicates(registry):
+    """Test that a command or route cannot be registered twice."""
+    with pytest.raises(ValueError):
+        registry.add_command("sale", lambda params, sender_id, language: "")
+    with pytest.raises(ValueError):
+        registry.add_exact("/help", "sale")
+    with pytest.raises(ValueError):
+        registry.add_prefix("/Sale", parse_sale)
+
+@pytest.mark.unit
+def test_parsed_params_are_copies():
+    """Test that changing parsed parameters does not change the routing table."""
+    command_type, params = parse_message("3")
+    params["bundle_number"] = 7
+
+    assert parse_message("3") == ("bundle_select", {"bundle_number": 3})
+
+@pytest.mark.unit
+def test_production_registry_covers_every_command():
+    """Test that every command type the parser can produce has a handler."""
+    produced = {
+        parse_message(text)[0]
+        for text in ["Hi", "/lang af", "/delete", "/delete confirm", "/bundle", "1",
+                     "/simulate_qr_user +27821234567", "/simulate_qr_user abc"]
+    }
+
+    assert produced <= set(COMMANDS.commands())
+    assert "popia_agree" in COMMANDS.commands()
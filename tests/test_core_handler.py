@@ -41,12 +41,12 @@ def test_handle_incoming_message_basic(sample_message_json):
     
     # Test with an existing user who has already given POPIA consent
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_message_template') as mock_get_template:
         
         # Setup mock user
         mock_user = {'preferred_language': 'en', 'popia_consent_given': True}
-        mock_get_user.return_value = mock_user
+        mock_get_or_create_user.return_value = (mock_user, False, None)
         mock_get_template.return_value = "Welcome to Township Connect!"
         
         # Call the function
@@ -169,7 +169,7 @@ def test_handle_incoming_message_commands(command, expected_response, language):
     """Test that the handle_incoming_message function handles various commands correctly."""
     # Mock the Supabase client, user, and message template
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_message_template') as mock_get_template, \
          patch('src.core_handler.get_service_bundles') as mock_get_bundles:
          
@@ -187,7 +187,7 @@ def test_handle_incoming_message_commands(command, expected_response, language):
         
         # Setup mock user with POPIA consent given to avoid POPIA notice
         mock_user = {'preferred_language': language, 'popia_consent_given': True}
-        mock_get_user.return_value = mock_user
+        mock_get_or_create_user.return_value = (mock_user, False, None)
         
         # Create a test message
         test_message = {
@@ -287,12 +287,12 @@ def test_new_user_popia_notice():
     """Test that new users receive a POPIA notice."""
     # Mock the Supabase client and user
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_message_template') as mock_get_template, \
          patch('src.core_handler.get_content_file') as mock_content_file:
 
         # Setup mocks
-        mock_get_user.return_value = None  # User doesn't exist
+        mock_get_or_create_user.return_value = (None, True, None)  # User doesn't exist
         mock_get_template.return_value = "POPIA NOTICE: This is a test notice."
         
         # Mock the content file path to ensure it calls get_message_template with the right file
@@ -322,11 +322,11 @@ def test_popia_agreement():
     """Test that POPIA agreement is handled correctly."""
     # Mock the Supabase client and user
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_message_template') as mock_get_template:
         
         # Setup mocks
-        mock_get_user.return_value = {'preferred_language': 'en'}  # User exists
+        mock_get_or_create_user.return_value = ({'preferred_language': 'en'}, False, None)  # User exists
         mock_get_template.return_value = "Welcome to Township Connect!"
         
         # Create a test message
@@ -354,11 +354,11 @@ def test_message_logging_to_supabase():
     # Mock the Supabase client and log_message function
     with patch('src.core_handler.supabase_client') as mock_client, \
          patch('src.core_handler.log_message') as mock_log_message, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_message_template') as mock_get_template:
         
         # Setup mocks
-        mock_get_user.return_value = {'preferred_language': 'en', 'popia_consent_given': True}
+        mock_get_or_create_user.return_value = ({'preferred_language': 'en', 'popia_consent_given': True}, False, None)
         mock_get_template.return_value = "Welcome to Township Connect!"
         
         # Create a test message
@@ -390,15 +390,15 @@ def test_echo_functionality():
     
     # Mock the Supabase client and user
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.log_message') as mock_log_message:
         
         # Setup mock user with POPIA consent and a selected bundle
-        mock_get_user.return_value = {
+        mock_get_or_create_user.return_value = ({
             'preferred_language': 'en',
             'popia_consent_given': True,
             'current_bundle': 'test_bundle'  # Add a bundle to avoid bundle selection prompt
-        }
+        }, False, None)
         
         # Call the function
         result = handle_incoming_message(json.dumps(test_message))
@@ -442,15 +442,15 @@ def test_n8n_format_echo_functionality():
     
     # Mock the Supabase client and user
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.log_message') as mock_log_message:
         
         # Setup mock user with POPIA consent and a selected bundle
-        mock_get_user.return_value = {
+        mock_get_or_create_user.return_value = ({
             'preferred_language': 'en',
             'popia_consent_given': True,
             'current_bundle': 'test_bundle'  # Add a bundle to avoid bundle selection prompt
-        }
+        }, False, None)
         
         # Call the function
         result = handle_incoming_message(json.dumps(test_message))
@@ -481,6 +481,73 @@ def test_n8n_format_echo_functionality():
             ANY  # We don't need to check the exact size
         )
 
+@pytest.mark.unit
+def test_handler_records_inbound_in_one_request():
+    """Test that the user lookup, activity update and inbound log share one request."""
+    from src.db.supabase_client import MockSupabaseClient
+
+    client = MockSupabaseClient()
+    client.users['whatsapp:+27222222222'] = {
+        'whatsapp_id': 'whatsapp:+27222222222',
+        'preferred_language': 'af',
+        'popia_consent_given': True,
+        'current_bundle': 'small_business'
+    }
+
+    with patch('src.core_handler.supabase_client', client), \
+         patch('src.core_handler._touch_rpc_available', True), \
+         patch('src.core_handler.publish_to_redis_stream'), \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
+         patch('src.core_handler.log_message') as mock_log:
+
+        result = json.loads(handle_incoming_message(json.dumps({'From': 'whatsapp:+27222222222', 'Body': 'Goeie more'})))
+
+        assert result['reply_text'] == 'Echo: Goeie more'
+        assert client.request_count == 1
+        assert client.messages[-1]['direction'] == 'inbound'
+        mock_get_or_create_user.assert_not_called()
+        assert [call.args[2] for call in mock_log.call_args_list] == ['outbound']
+
+@pytest.mark.unit
+def test_handler_falls_back_when_function_is_missing():
+    """Test that a missing database function switches the handler to separate requests."""
+    existing_user = {'preferred_language': 'en', 'popia_consent_given': True, 'current_bundle': 'small_business'}
+    missing = (None, False, "PGRST202: Could not find the function public.touch_user_and_log_inbound")
+
+    with patch('src.core_handler.supabase_client', MagicMock()), \
+         patch('src.core_handler._touch_rpc_available', True), \
+         patch('src.core_handler.touch_user_and_log_inbound', return_value=missing) as mock_touch_rpc, \
+         patch('src.core_handler.get_or_create_user', return_value=(existing_user, False, None)) as mock_get_or_create, \
+         patch('src.core_handler.publish_to_redis_stream'), \
+         patch('src.core_handler.touch_user_activity'), \
+         patch('src.core_handler.log_message') as mock_log:
+
+        handle_incoming_message(json.dumps({'From': 'whatsapp:+27123456789', 'Body': 'one'}))
+        handle_incoming_message(json.dumps({'From': 'whatsapp:+27123456789', 'Body': 'two'}))
+
+        mock_touch_rpc.assert_called_once()
+        assert mock_get_or_create.call_count == 2
+        assert [call.args[2] for call in mock_log.call_args_list].count('inbound') == 2
+
+@pytest.mark.unit
+def test_erasure_confirmation_is_not_logged():
+    """Test that the reply to a successful /delete confirm is not logged for the erased user."""
+    existing_user = {'preferred_language': 'en', 'popia_consent_given': True, 'current_bundle': 'small_business'}
+
+    with patch('src.core_handler.supabase_client', MagicMock()), \
+         patch('src.core_handler.redis_client', None), \
+         patch('src.core_handler._touch_rpc_available', False), \
+         patch('src.core_handler.get_or_create_user', return_value=(existing_user, False, None)), \
+         patch('src.core_handler.touch_user_activity'), \
+         patch('src.core_handler.erase_user_data', return_value=True) as mock_erase, \
+         patch('src.core_handler.log_message') as mock_log:
+
+        result = json.loads(handle_incoming_message(json.dumps({'From': 'whatsapp:+27333333333', 'Body': '/delete confirm'})))
+
+    mock_erase.assert_called_once()
+    assert result['reply_to'] == 'whatsapp:+27333333333'
+    assert [call.args[2] for call in mock_log.call_args_list] == ['inbound']
+
 @pytest.mark.unit
 def test_cli_wrapper(monkeypatch, capsys):
     """Test the CLI wrapper functionality."""
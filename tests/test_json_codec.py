@@ -0,0 +1,72 @@
+"""
+Tests for the JSON codec layer in Township Connect.
+
+These tests verify that every installed codec decodes str and bytes and encodes to
+UTF-8 bytes the same way, and that the pipeline accepts webhook bodies as bytes.
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import async_handler, json_codec
+from src.core_handler import handle_incoming_message
+
+PAYLOAD = {'From': 'whatsapp:+27123456789', 'Body': 'Goeie môre', 'MessageSid': 'SM0001', 'NumMedia': '0'}
+
+@pytest.mark.unit
+@pytest.mark.parametrize('codec', json_codec.available_codecs(), ids=lambda codec: codec.name)
+def test_codec_round_trip(codec):
+    """Test that a codec decodes str and bytes and writes compact UTF-8."""
+    encoded = codec.dumps(PAYLOAD)
+
+    assert isinstance(encoded, bytes)
+    assert 'môre'.encode('utf-8') in encoded
+    assert b', ' not in encoded
+    assert codec.loads(encoded) == PAYLOAD
+    assert codec.loads(encoded.decode('utf-8')) == PAYLOAD
+    assert codec.dumps_str(PAYLOAD) == encoded.decode('utf-8')
+
+@pytest.mark.unit
+@pytest.mark.parametrize('codec', json_codec.available_codecs(), ids=lambda codec: codec.name)
+def test_codec_rejects_invalid_json(codec):
+    """Test that every codec raises ValueError for invalid JSON, like the json module."""
+    with pytest.raises(ValueError):
+        codec.loads(b'This is not JSON')
+
+@pytest.mark.unit
+def test_get_codec_falls_back_when_not_installed():
+    """Test that naming a missing or unknown codec gives the fastest installed one."""
+    assert json_codec.get_codec('stdlib').name == 'stdlib'
+    assert json_codec.get_codec('no-such-codec').name == json_codec.available_codecs()[0].name
+    assert json_codec.available_codecs()[-1].name == 'stdlib'
+
+@pytest.mark.unit
+def test_pipeline_accepts_webhook_body_bytes():
+    """Test that both pipelines answer a payload passed as bytes."""
+    body = json.dumps(PAYLOAD).encode('utf-8')
+
+    with patch('src.core_handler.supabase_client', None), \
+         patch('src.core_handler.redis_client', None), \
+         patch('src.core_handler.message_dedup', None), \
+         patch('src.async_handler.sender_scheduler', None), \
+         patch('src.async_handler.admission_controller', None):
+        replies = [
+            json.loads(handle_incoming_message(body)),
+            json.loads(asyncio.run(async_handler.handle_incoming_message_async(body))),
+        ]
+
+    assert replies == [{'reply_to': 'whatsapp:+27123456789', 'reply_text': 'Echo: Goeie môre'}] * 2
+
+@pytest.mark.unit
+def test_invalid_body_bytes_get_error_reply():
+    """Test that an invalid body passed as bytes gets the generic error reply."""
+    reply = json.loads(handle_incoming_message(b'This is not JSON'))
+
+    assert reply['reply_to'] == 'unknown'
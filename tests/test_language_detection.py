@@ -12,7 +12,7 @@ import os
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.language_utils import detect_language
+from src.language_utils import LanguageGuess, detect_language, detect_languages, guess_language
 
 @pytest.mark.parametrize("text,expected_language", [
     ("Hello", "en"),
@@ -37,4 +37,37 @@ def test_detect_language_case_insensitive():
     """Test that language detection is case-insensitive."""
     assert detect_language("HELLO") == "en"
     assert detect_language("mOlO") == "xh"
-    assert detect_language("HALLO") == "af"
\ No newline at end of file
+    assert detect_language("HALLO") == "af"
+@pytest.mark.parametrize("text,expected_language", [
+    ("Can you help me register my business", "en"),
+    ("The delivery was late again", "en"),
+    ("Ndingabhalisa njani ishishini lam", "xh"),
+    ("Ndifuna ukujonga imali yam", "xh"),
+    ("Ek wil graag my besigheid registreer", "af"),
+    ("Die aflewering was weer laat", "af"),
+])
+@pytest.mark.unit
+def test_detect_language_without_greeting(text, expected_language):
+    """Test that messages without a greeting are detected by the n-gram scorer."""
+    assert detect_language(text) == expected_language
+
+@pytest.mark.unit
+def test_guess_language_confidence():
+    """Test that greetings are certain, and that uncertain guesses fall back to the default."""
+    assert guess_language("Hi, molo") == LanguageGuess("en", 1.0)
+    assert guess_language("12345") == LanguageGuess(None, 0.0)
+
+    language, confidence = guess_language("Random text")
+    assert confidence < 0.95
+    assert detect_language("Random text", default_language="xh") == "xh"
+    assert detect_language("Random text", min_confidence=0) == language
+
+@pytest.mark.unit
+def test_detect_languages():
+    """Test that a batch gets one guess per text, in order, with defaults for uncertain texts."""
+    guesses = detect_languages(["Molo", "Baie dankie vir die hulp", None, "Molo", "Random text"])
+
+    assert [guess.language for guess in guesses] == ["xh", "af", "en", "xh", "en"]
+    assert guesses[0].confidence == 1.0
+    assert guesses[2].confidence == 0.0
+    assert guesses[4].confidence < 0.95
@@ -53,14 +53,12 @@ def test_user_language_storage_integration(mocker):
     
     # Mock the Supabase client and functions
     mock_supabase = mocker.patch('src.core_handler.supabase_client')
-    mock_get_user = mocker.patch('src.core_handler.get_user')
-    mock_create_user = mocker.patch('src.core_handler.create_user')
+    mock_get_or_create_user = mocker.patch('src.core_handler.get_or_create_user', return_value=(None, True, None))
     mock_log_message = mocker.patch('src.core_handler.log_message')
     mock_get_template = mocker.patch('src.core_handler.get_message_template')
     mock_publish = mocker.patch('src.core_handler.publish_to_redis_stream')
     
     # Setup for a new Xhosa-speaking user
-    mock_get_user.return_value = None  # User doesn't exist yet
     mock_get_template.return_value = "POPIA Notice"
     
     # Create test message for a new user saying "Molo" (Xhosa greeting)
@@ -72,8 +70,8 @@ def test_user_language_storage_integration(mocker):
     # Process the message
     handle_incoming_message(json.dumps(test_message))
     
-    # Verify that create_user was called with the correct language
-    mock_create_user.assert_called_once_with(
+    # Verify that get_or_create_user was called with the correct language
+    mock_get_or_create_user.assert_called_once_with(
         mock_supabase, 'whatsapp:+27123456789', 'xh', popia_consent=False
     )
 
@@ -90,14 +88,12 @@ def test_xhosa_user_language_storage(mocker):
     
     # Mock the Supabase client and functions
     mock_supabase = mocker.patch('src.core_handler.supabase_client')
-    mock_get_user = mocker.patch('src.core_handler.get_user')
-    mock_create_user = mocker.patch('src.core_handler.create_user')
+    mock_get_or_create_user = mocker.patch('src.core_handler.get_or_create_user', return_value=(None, True, None))
     mock_log_message = mocker.patch('src.core_handler.log_message')
     mock_get_template = mocker.patch('src.core_handler.get_message_template')
     mock_publish = mocker.patch('src.core_handler.publish_to_redis_stream')
     
     # Setup for a new Xhosa-speaking user
-    mock_get_user.return_value = None  # User doesn't exist yet
     mock_get_template.return_value = "POPIA Notice"
     
     # Test user ID
@@ -115,7 +111,7 @@ def test_xhosa_user_language_storage(mocker):
     # Process the message
     handle_incoming_message(json.dumps(test_message))
     
-    # Verify that create_user was called with the correct language
-    mock_create_user.assert_called_once_with(
+    # Verify that get_or_create_user was called with the correct language
+    mock_get_or_create_user.assert_called_once_with(
         mock_supabase, test_user_id, 'xh', popia_consent=False
     )
\ No newline at end of file
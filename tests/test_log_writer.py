@@ -0,0 +1,157 @@
+"""
+Tests for the buffered log writer in Township Connect.
+
+These tests verify that log rows are flushed as bulk inserts by batch size, by
+flush interval and on shutdown, and that memory stays bounded when Supabase is slow.
+"""
+
+import pytest
+import sys
+import os
+import time
+from unittest.mock import MagicMock
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db import supabase_client
+from src.db.log_writer import BufferedLogWriter, install_log_writer, uninstall_log_writer
+from src.db.supabase_client import MockSupabaseClient
+
+def make_row(i: int) -> dict:
+    """Build a message_logs row."""
+    return {'user_whatsapp_id': f'whatsapp:+2782{i:07d}', 'direction': 'inbound', 'message_content': f'msg {i}'}
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    """Poll a condition until it holds or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+@pytest.mark.unit
+def test_flushes_full_batch_in_one_request():
+    """Test that a full batch is written as a single bulk insert."""
+    client = MockSupabaseClient()
+    writer = BufferedLogWriter(client, max_batch_size=10, flush_interval_ms=60000)
+    writer.start()
+    try:
+        for i in range(10):
+            assert writer.enqueue('message_logs', make_row(i))
+
+        assert wait_for(lambda: len(client.messages) == 10)
+        assert client.request_count == 1
+    finally:
+        writer.stop()
+
+@pytest.mark.unit
+def test_flushes_partial_batch_after_interval():
+    """Test that rows are written once the oldest has waited for the flush interval."""
+    client = MockSupabaseClient()
+    writer = BufferedLogWriter(client, max_batch_size=100, flush_interval_ms=50)
+    writer.start()
+    try:
+        writer.enqueue('message_logs', make_row(1))
+        writer.enqueue('message_logs', make_row(2))
+
+        assert wait_for(lambda: len(client.messages) == 2)
+        assert client.request_count == 1
+        assert writer.pending() == 0
+    finally:
+        writer.stop()
+
+@pytest.mark.unit
+def test_stop_flushes_buffered_rows():
+    """Test that stopping the writer writes everything still in the buffer."""
+    client = MockSupabaseClient()
+    writer = BufferedLogWriter(client, max_batch_size=100, flush_interval_ms=60000)
+    writer.start()
+
+    for i in range(5):
+        writer.enqueue('message_logs', make_row(i))
+    writer.stop()
+
+    assert len(client.messages) == 5
+    # A stopped writer hands rows back to the caller
+    assert not writer.enqueue('message_logs', make_row(6))
+
+@pytest.mark.unit
+def test_full_buffer_rejects_rows():
+    """Test that the buffer never grows past max_buffer_size."""
+    writer = BufferedLogWriter(MockSupabaseClient(), max_batch_size=10, max_buffer_size=3)
+
+    results = [writer.enqueue('message_logs', make_row(i)) for i in range(5)]
+
+    assert results == [True, True, True, False, False]
+    assert writer.pending() == 3
+    assert writer.stats['rejected'] == 2
+
+@pytest.mark.unit
+def test_failed_bulk_insert_retries_rows_individually():
+    """Test that one bad row is dropped without losing the rest of the batch."""
+    client = MagicMock()
+    inserted = []
+
+    def insert(data):
+        if isinstance(data, list):
+            raise Exception("insert or update on table violates foreign key constraint")
+        if data['user_whatsapp_id'].endswith('1'):
+            raise Exception("insert or update on table violates foreign key constraint")
+        inserted.append(data)
+        return MagicMock()
+
+    client.table.return_value.insert.side_effect = insert
+    writer = BufferedLogWriter(client)
+    for i in range(3):
+        writer.enqueue('message_logs', make_row(i))
+
+    assert writer.flush() == 2
+    assert len(inserted) == 2
+    assert writer.stats['dropped'] == 1
+
+@pytest.mark.unit
+def test_erasure_discards_the_users_buffered_rows():
+    """Test that a user's buffered rows are dropped before their data is erased, not written after."""
+    client = MockSupabaseClient()
+    install_log_writer(client)
+    erased, other = make_row(1), make_row(2)
+    try:
+        supabase_client.log_message(client, erased['user_whatsapp_id'], 'inbound', '/delete confirm')
+        supabase_client.log_security_event(client, erased['user_whatsapp_id'], 'DATA_DELETE_REQUESTED')
+        supabase_client.log_message(client, other['user_whatsapp_id'], 'inbound', 'Hi')
+
+        assert supabase_client.discard_pending_logs(erased['user_whatsapp_id']) == 2
+        assert supabase_client.get_log_writer().pending() == 1
+    finally:
+        uninstall_log_writer()
+
+    assert [row['user_whatsapp_id'] for row in client.messages] == [other['user_whatsapp_id']]
+
+@pytest.mark.unit
+def test_unsupported_table_is_rejected():
+    """Test that only log tables can be buffered."""
+    writer = BufferedLogWriter(MockSupabaseClient())
+
+    with pytest.raises(ValueError):
+        writer.enqueue('users', {'whatsapp_id': 'whatsapp:+27123456789'})
+
+@pytest.mark.unit
+def test_log_message_uses_installed_writer():
+    """Test that log_message buffers rows while a writer is installed."""
+    client = MockSupabaseClient()
+    install_log_writer(client)
+    try:
+        result = supabase_client.log_message(client, 'whatsapp:+27123456789', 'outbound', 'Hi')
+        supabase_client.log_security_event(client, 'whatsapp:+27123456789', 'DATA_DELETE_REQUESTED')
+
+        assert result['error'] is None
+        assert result['data'][0]['message_content'] == 'Hi'
+        assert supabase_client.get_log_writer().pending() == 2
+        assert client.request_count == 0
+    finally:
+        uninstall_log_writer()
+
+    assert supabase_client.get_log_writer() is None
+    assert client.messages[-1]['message_content'] == 'Hi'
@@ -0,0 +1,141 @@
+"""
+Tests for the message logging utilities in Township Connect.
+
+These tests verify that per-message log lines carry the message context instead of
+the sender's phone number, that message text is redacted or truncated, and that
+HOT_PATH lines are sampled per message.
+"""
+
+import asyncio
+import io
+import json
+import logging
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import async_handler, logging_utils
+from src.core_handler import handle_incoming_message
+from src.logging_utils import (
+    HOT_PATH, ContextFilter, JsonFormatter, current_log_context, message_logging, payload, sender_hash
+)
+
+SENDER = 'whatsapp:+27123456789'
+TEXT = 'My ID number is 8001015009087'
+PAYLOAD = json.dumps({'From': SENDER, 'Body': TEXT, 'MessageSid': 'SM0001', 'NumMedia': '0'})
+
+class CapturedLogs:
+    """Captures the records of the root logger through a ContextFilter."""
+
+    def __init__(self, formatter: logging.Formatter = None):
+        self.stream = io.StringIO()
+        self.handler = logging.StreamHandler(self.stream)
+        self.handler.setFormatter(formatter or logging.Formatter(logging_utils.TEXT_FORMAT))
+        self.handler.addFilter(ContextFilter())
+
+    def __enter__(self):
+        root = logging.getLogger()
+        self.level = root.level
+        root.addHandler(self.handler)
+        root.setLevel(logging.DEBUG)
+        return self
+
+    def __exit__(self, *exc_info):
+        root = logging.getLogger()
+        root.removeHandler(self.handler)
+        root.setLevel(self.level)
+
+    @property
+    def text(self) -> str:
+        return self.stream.getvalue()
+
+@pytest.mark.unit
+@pytest.mark.parametrize('mode, expected', [
+    ('redact', '<29 chars>'),
+    ('truncate', "'My ID numbe'... (29 chars)"),
+    ('full', TEXT),
+])
+def test_payload_modes(mode, expected):
+    """Test that message text is logged according to LOG_PAYLOAD_MODE."""
+    with patch('src.logging_utils.PAYLOAD_MODE', mode), patch('src.logging_utils.PAYLOAD_MAX_CHARS', 11):
+        assert str(payload(TEXT)) == expected
+
+@pytest.mark.unit
+def test_payload_is_formatted_only_when_logged():
+    """Test that a payload below the logger's level is never formatted."""
+    class Text:
+        formatted = 0
+
+        def __str__(self):
+            Text.formatted += 1
+            return TEXT
+
+    test_logger = logging.getLogger('tests.lazy')
+    test_logger.setLevel(logging.WARNING)
+    test_logger.info("Received message: %s", payload(Text()), extra=HOT_PATH)
+
+    assert Text.formatted == 0
+
+@pytest.mark.unit
+def test_message_log_lines_carry_context_not_personal_data():
+    """Test that handling a message logs the sender hash and MessageSid, not the number or text."""
+    with patch('src.core_handler.supabase_client', None), patch('src.core_handler.redis_client', None):
+        with CapturedLogs() as logs:
+            handle_incoming_message(PAYLOAD)
+
+    assert 'Received message' in logs.text
+    assert f"[SM0001 {sender_hash(SENDER)}]" in logs.text
+    assert '+27123456789' not in logs.text
+    assert '8001015009087' not in logs.text
+    assert current_log_context() is None
+
+@pytest.mark.unit
+def test_async_pipeline_context_reaches_threads():
+    """Test that lines logged from the async pipeline's threads keep the message context."""
+    with patch('src.core_handler.supabase_client', None), patch('src.core_handler.redis_client', None):
+        with CapturedLogs() as logs:
+            asyncio.run(async_handler.process_message_async(PAYLOAD))
+
+    reply_lines = [line for line in logs.text.splitlines() if 'Sending direct format' in line]
+    assert reply_lines and all(f"[SM0001 {sender_hash(SENDER)}]" in line for line in reply_lines)
+    assert '+27123456789' not in logs.text
+
+@pytest.mark.unit
+def test_unsampled_messages_keep_warnings_and_unmarked_lines():
+    """Test that only HOT_PATH lines below WARNING are dropped for unsampled messages."""
+    test_logger = logging.getLogger('tests.sampling')
+    with patch('src.logging_utils.SAMPLE_RATE', 0.0), CapturedLogs() as logs:
+        with message_logging(SENDER, 'SM0002') as context:
+            test_logger.info("hot info", extra=HOT_PATH)
+            test_logger.warning("hot warning", extra=HOT_PATH)
+            test_logger.info("plain info")
+
+    assert not context.sampled
+    assert 'hot info' not in logs.text
+    assert 'hot warning' in logs.text
+    assert 'plain info' in logs.text
+
+@pytest.mark.unit
+def test_nested_message_logging_keeps_the_outer_context():
+    """Test that a nested message_logging block does not replace the message's context."""
+    with message_logging(SENDER, 'SM0003') as outer:
+        with message_logging('whatsapp:+27000000000', 'SM0004') as inner:
+            assert inner is outer
+    assert outer.trace_id == 'SM0003'
+
+@pytest.mark.unit
+def test_json_formatter():
+    """Test that the JSON formatter writes one object with the context fields per line."""
+    test_logger = logging.getLogger('tests.json')
+    with CapturedLogs(JsonFormatter()) as logs:
+        with message_logging(SENDER, 'SM0005'):
+            test_logger.info("Received message: %s", payload(TEXT))
+
+    entry = json.loads(logs.text)
+    assert entry['message'] == 'Received message: <29 chars>'
+    assert (entry['trace_id'], entry['sender_hash']) == ('SM0005', sender_hash(SENDER))
+    assert entry['level'] == 'INFO'
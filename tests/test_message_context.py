@@ -0,0 +1,81 @@
+"""
+Tests for the per-message context in Township Connect.
+
+These tests verify that the context is computed once per message and that every
+reply goes through the single serializer.
+"""
+
+import json
+import pytest
+import sys
+import os
+from unittest.mock import patch, MagicMock
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core_handler import build_message_context, handle_incoming_message, parse_message
+from src.message_context import serialize_reply
+
+@pytest.mark.unit
+def test_context_from_direct_and_n8n_payloads():
+    """Test that both payload formats produce the same context fields."""
+    direct = build_message_context({'From': 'whatsapp:+27123456789', 'Body': '  agree popia '})
+    n8n = build_message_context({'message': {'from': 'whatsapp:+27123456789', 'body': '/lang xh'}})
+
+    assert direct.sender_id == 'whatsapp:+27123456789'
+    assert direct.normalized_text == 'agree popia'
+    assert direct.is_popia_agreement
+    assert not direct.is_n8n_format
+    assert direct.size_kb == pytest.approx(len('  agree popia ') / 1024.0)
+
+    assert n8n.is_n8n_format
+    assert (n8n.command_type, n8n.command_params) == ('language', {'language': 'xh'})
+    assert not n8n.is_popia_agreement
+
+@pytest.mark.unit
+def test_context_is_slotted():
+    """Test that the context does not carry a per-instance __dict__."""
+    ctx = build_message_context({'From': 'whatsapp:+27123456789', 'Body': 'Hi'})
+
+    assert not hasattr(ctx, '__dict__')
+    with pytest.raises(AttributeError):
+        ctx.unexpected = True
+
+@pytest.mark.unit
+def test_set_user_reads_consent():
+    """Test that the user lookup result fills in the user fields."""
+    ctx = build_message_context({'From': 'whatsapp:+27123456789', 'Body': 'Hi'})
+    ctx.set_user({'preferred_language': 'af', 'popia_consent_given': True}, False, 'af')
+
+    assert ctx.language == 'af'
+    assert ctx.popia_consent_given is True
+
+    ctx.set_user(None, True, 'xh')
+    assert ctx.is_new_user and not ctx.popia_consent_given
+
+@pytest.mark.unit
+def test_serialize_reply_shape():
+    """Test that replies to both payload formats have the same shape."""
+    ctx = build_message_context({'message': {'from': 'whatsapp:+27123456789', 'body': 'Hi'}})
+
+    assert json.loads(serialize_reply(ctx, 'Hello!')) == {'reply_to': 'whatsapp:+27123456789', 'reply_text': 'Hello!'}
+
+@pytest.mark.unit
+def test_message_is_parsed_once():
+    """Test that handling a message parses its text only once."""
+    user = {'preferred_language': 'en', 'popia_consent_given': True, 'current_bundle': 'small_business'}
+
+    with patch('src.core_handler.supabase_client', MagicMock()), \
+         patch('src.core_handler.get_or_create_user', return_value=(user, False, None)), \
+         patch('src.core_handler.publish_to_redis_stream'), \
+         patch('src.core_handler.touch_user_activity'), \
+         patch('src.core_handler.log_message') as mock_log, \
+         patch('src.core_handler.parse_message', side_effect=parse_message) as mock_parse:
+
+        result = json.loads(handle_incoming_message(json.dumps({'From': 'whatsapp:+27123456789', 'Body': 'Sawubona'})))
+
+        assert result['reply_text'] == 'Echo: Sawubona'
+        mock_parse.assert_called_once_with('Sawubona')
+        outbound = [call.args for call in mock_log.call_args_list if call.args[2] == 'outbound']
+        assert outbound[0][4] == pytest.approx(len('Echo: Sawubona') / 1024.0)
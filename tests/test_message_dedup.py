@@ -0,0 +1,151 @@
+"""
+Tests for MessageSid deduplication in Township Connect.
+
+These tests verify that repeated deliveries of a Twilio message are marked as duplicates
+without running the pipeline again, and that a lost claim expires.
+"""
+
+import json
+import pytest
+import sys
+import os
+from unittest.mock import patch, MagicMock
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core_handler import handle_incoming_message
+from src.message_dedup import MessageDedup, DONE, PENDING, REDIS_KEY_PREFIX
+
+USER_ID = 'whatsapp:+27123456789'
+USER = {'whatsapp_id': USER_ID, 'preferred_language': 'en', 'popia_consent_given': True, 'current_bundle': 'small_business'}
+
+class InMemoryRedis:
+    """Minimal stand-in for the Redis string commands used by the deduplicator."""
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+
+    def set(self, key, value, nx=False, xx=False, ex=None):
+        if (nx and key in self.data) or (xx and key not in self.data):
+            return None
+        self.data[key] = value.encode()
+        self.expiry[key] = ex
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def xadd(self, *args, **kwargs):
+        return b'1-0'
+
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self)
+
+class InMemoryPipeline:
+    """Pipeline that runs its queued commands when executed."""
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.queued = []
+
+    def __getattr__(self, command):
+        return lambda *args, **kwargs: self.queued.append((command, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis_client, command)(*args, **kwargs) for command, args, kwargs in self.queued]
+
+def deliver(redis_client, dedup, body='Hello', sid='SM0001', get_or_create_user=None):
+    """Deliver a Twilio webhook payload, returning the reply and the mocked writes."""
+    payload = {'From': USER_ID, 'Body': body, 'MessageSid': sid}
+    with patch('src.core_handler.redis_client', redis_client), \
+         patch('src.core_handler.message_dedup', dedup), \
+         patch('src.core_handler.supabase_client', MagicMock()), \
+         patch('src.core_handler.get_or_create_user', get_or_create_user or MagicMock(return_value=(dict(USER), False, None))), \
+         patch('src.core_handler.touch_user_activity'), \
+         patch('src.core_handler.publish_to_redis_stream') as mock_publish, \
+         patch('src.core_handler.log_message') as mock_log:
+        reply = handle_incoming_message(json.dumps(payload))
+    return json.loads(reply), mock_publish, mock_log
+
+@pytest.mark.unit
+def test_retry_is_marked_duplicate_without_repeating_work():
+    """Test that a retried delivery is not answered again."""
+    redis_client = InMemoryRedis()
+    dedup = MessageDedup(redis_client, wait_seconds=0)
+
+    first, first_publish, first_log = deliver(redis_client, dedup)
+    retry, retry_publish, retry_log = deliver(redis_client, dedup)
+
+    assert first == {'reply_to': USER_ID, 'reply_text': 'Echo: Hello'}
+    assert retry == {'reply_to': USER_ID, 'reply_text': '', 'duplicate': True}
+    assert redis_client.expiry[REDIS_KEY_PREFIX + 'SM0001'] == dedup.ttl
+    # Only a marker is kept for the TTL, not the reply with the user's content
+    assert redis_client.data[REDIS_KEY_PREFIX + 'SM0001'] == DONE.encode()
+    assert first_publish.call_count == 1 and first_log.call_count == 2
+    retry_publish.assert_not_called()
+    retry_log.assert_not_called()
+    assert dedup.stats['duplicates'] == 1
+
+@pytest.mark.unit
+def test_different_sids_are_handled_separately():
+    """Test that two messages with the same text are both handled."""
+    redis_client = InMemoryRedis()
+    dedup = MessageDedup(redis_client, wait_seconds=0)
+
+    deliver(redis_client, dedup, sid='SM0001')
+    _, publish, _ = deliver(redis_client, dedup, sid='SM0002')
+
+    publish.assert_called_once()
+
+@pytest.mark.unit
+def test_retry_during_first_delivery_is_marked_duplicate():
+    """Test that a retry while the first delivery is in progress is not answered twice."""
+    redis_client = InMemoryRedis()
+    redis_client.set(REDIS_KEY_PREFIX + 'SM0001', PENDING)
+    dedup = MessageDedup(redis_client, wait_seconds=0)
+
+    reply, publish, _ = deliver(redis_client, dedup)
+
+    assert reply == {'reply_to': USER_ID, 'reply_text': '', 'duplicate': True}
+    publish.assert_not_called()
+    assert dedup.stats['in_progress'] == 1
+
+@pytest.mark.unit
+def test_claim_is_a_short_lease():
+    """Test that a claim without a reply expires after the lease, not the full TTL."""
+    redis_client = InMemoryRedis()
+    dedup = MessageDedup(redis_client, lease_seconds=30, wait_seconds=0)
+
+    assert dedup.claim('SM0001') is None
+
+    assert redis_client.expiry[REDIS_KEY_PREFIX + 'SM0001'] == 30
+
+@pytest.mark.unit
+def test_failed_delivery_is_released_for_the_retry():
+    """Test that a retry is handled normally when the first delivery failed."""
+    redis_client = InMemoryRedis()
+    dedup = MessageDedup(redis_client, wait_seconds=0)
+
+    failed, _, _ = deliver(redis_client, dedup, get_or_create_user=MagicMock(side_effect=ConnectionError("Supabase unavailable")))
+    assert REDIS_KEY_PREFIX + 'SM0001' not in redis_client.data
+
+    retry, publish, _ = deliver(redis_client, dedup)
+    assert retry['reply_text'] == 'Echo: Hello'
+    publish.assert_called_once()
+
+@pytest.mark.unit
+def test_payload_without_sid_is_not_deduplicated():
+    """Test that payloads without a MessageSid (e.g. manual tests) are always handled."""
+    redis_client = InMemoryRedis()
+    dedup = MessageDedup(redis_client, wait_seconds=0)
+
+    deliver(redis_client, dedup, sid='')
+    _, publish, _ = deliver(redis_client, dedup, sid='')
+
+    publish.assert_called_once()
+    assert redis_client.data == {}
@@ -35,11 +35,11 @@ def test_handle_n8n_message_format(n8n_message_format):
     """Test that the handle_incoming_message function works with n8n message format."""
     # Mock the Supabase client and user
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_message_template') as mock_get_template:
         
         # Setup mocks
-        mock_get_user.return_value = {'preferred_language': 'en', 'popia_consent_given': True}
+        mock_get_or_create_user.return_value = ({'preferred_language': 'en', 'popia_consent_given': True}, False, None)
         mock_get_template.return_value = "Welcome to Township Connect!"
         
         # Call the function
@@ -59,11 +59,11 @@ def test_handle_n8n_message_echo_reply(n8n_message_format):
     """Test that the handle_incoming_message function returns an echo reply for n8n."""
     # Mock the Supabase client and user
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_message_template') as mock_get_template:
         
         # Setup mocks
-        mock_get_user.return_value = {'preferred_language': 'en', 'popia_consent_given': True}
+        mock_get_or_create_user.return_value = ({'preferred_language': 'en', 'popia_consent_given': True}, False, None)
         mock_get_template.return_value = "Echo: Hello Bot"
         
         # Call the function
@@ -84,11 +84,11 @@ def test_handle_n8n_message_logging(n8n_message_format):
     # Mock the Supabase client and log_message function
     with patch('src.core_handler.supabase_client') as mock_client, \
          patch('src.core_handler.log_message') as mock_log_message, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_message_template') as mock_get_template:
         
         # Setup mocks
-        mock_get_user.return_value = {'preferred_language': 'en', 'popia_consent_given': True}
+        mock_get_or_create_user.return_value = ({'preferred_language': 'en', 'popia_consent_given': True}, False, None)
         mock_get_template.return_value = "Echo: Hello Bot"
         
         # Call the function
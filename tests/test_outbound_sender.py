@@ -0,0 +1,170 @@
+"""
+Tests for the outbound reply sender in Township Connect.
+
+These tests run the sender against a local Twilio stub and verify that replies are
+sent at the configured rate over kept-alive connections, and that rate-limited or
+failed sends are retried.
+"""
+
+import json
+import pytest
+import sys
+import os
+import threading
+import time
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.outbound_sender import (
+    OutboundSender, ReplyStreamSender, TokenBucket, TwilioMessageClient,
+    FAILED_REPLY_STREAM_NAME
+)
+from src.logging_utils import sender_hash
+from src.stream_worker import REPLY_STREAM_NAME
+from tests.test_stream_worker import InMemoryStreams
+from tests.twilio_stub import TwilioStub
+
+FROM_NUMBER = 'whatsapp:+14155238886'
+USER_ID = 'whatsapp:+27123456789'
+
+def make_sender(stub, **options) -> OutboundSender:
+    """Create a sender that talks to the stub."""
+    options.setdefault('backoff_seconds', 0.01)
+    client = TwilioMessageClient('AC123', 'token', base_url=stub.base_url, pool_size=options.get('workers', 4))
+    return OutboundSender(client, FROM_NUMBER, **options)
+
+def send_all(sender, replies):
+    """Submit replies to a started sender and wait until they are all sent or given up on."""
+    done = threading.Semaphore(0)
+    results = []
+
+    def finished(sent):
+        results.append(sent)
+        done.release()
+
+    sender.start()
+    for reply_to, reply_text in replies:
+        sender.submit(reply_to, reply_text, callback=finished)
+    for _ in replies:
+        assert done.acquire(timeout=10)
+    sender.stop()
+    return results
+
+@pytest.mark.unit
+def test_token_bucket_limits_rate():
+    """Test that the bucket allows a burst and then one token per 1/rate seconds."""
+    bucket = TokenBucket(rate=50, burst=2)
+
+    started = time.monotonic()
+    for _ in range(7):
+        bucket.acquire()
+
+    assert time.monotonic() - started >= 5 / 50 * 0.9
+
+@pytest.mark.unit
+def test_reply_json_is_sent_to_twilio():
+    """Test that a handle_incoming_message reply is sent with its reply_to and reply_text."""
+    with TwilioStub() as stub:
+        sender = make_sender(stub)
+        sender.start()
+        assert sender.submit_reply(json.dumps({'reply_to': USER_ID, 'reply_text': 'Echo: Hello'}))
+        sender.stop()
+
+    assert [(m['From'], m['To'], m['Body']) for m in stub.messages] == [(FROM_NUMBER, USER_ID, 'Echo: Hello')]
+    assert sender.stats['sent'] == 1
+
+@pytest.mark.unit
+def test_empty_and_error_replies_are_not_sent():
+    """Test that there is nothing to send for duplicates, empty replies or unknown senders."""
+    with TwilioStub() as stub:
+        sender = make_sender(stub)
+
+        assert not sender.submit_reply('{"reply_to":"%s","reply_text":"Echo: Hello","duplicate":true}' % USER_ID)
+        assert not sender.submit_reply(json.dumps({'reply_to': USER_ID, 'reply_text': ''}))
+        assert not sender.submit_reply(json.dumps({'reply_to': 'unknown', 'reply_text': 'Sorry'}))
+        assert not sender.submit_reply('not JSON')
+        assert sender.queue_size() == 0
+        assert sender.stats['duplicates'] == 1
+
+@pytest.mark.unit
+def test_sends_reuse_kept_alive_connections():
+    """Test that the sending threads share a pool instead of connecting per message."""
+    with TwilioStub() as stub:
+        results = send_all(make_sender(stub, workers=2), [(USER_ID, f'Reply {i}') for i in range(20)])
+
+    assert results == [True] * 20
+    assert len(stub.messages) == 20
+    assert stub.connections <= 2
+
+@pytest.mark.unit
+def test_rate_limit_keeps_below_twilio_cap():
+    """Test that sending just under the stub's cap causes no 429s."""
+    with TwilioStub(rate_per_second=100, burst=5) as stub:
+        # The margin absorbs requests that arrive closer together than they were sent
+        sender = make_sender(stub, rate_per_second=90, burst=1, workers=4)
+        started = time.monotonic()
+        results = send_all(sender, [(USER_ID, f'Reply {i}') for i in range(30)])
+        elapsed = time.monotonic() - started
+
+    assert results == [True] * 30
+    assert stub.rate_limited == 0
+    assert elapsed >= 29 / 90 * 0.9
+
+@pytest.mark.unit
+def test_rate_limited_send_is_retried_after_retry_after():
+    """Test that a 429 is retried once the Retry-After time has passed."""
+    with TwilioStub(rate_per_second=20, burst=1) as stub:
+        # The sender believes it may send faster than the stub allows
+        sender = make_sender(stub, rate_per_second=1000, burst=3, workers=1)
+        results = send_all(sender, [(USER_ID, f'Reply {i}') for i in range(3)])
+
+    assert results == [True] * 3
+    assert [m['Body'] for m in stub.messages] == ['Reply 0', 'Reply 1', 'Reply 2']
+    assert sender.stats['rate_limited'] >= 1
+    assert sender.stats['failed'] == 0
+
+@pytest.mark.unit
+def test_server_errors_are_retried_with_backoff():
+    """Test that a Twilio 5xx is retried and the reply sent once."""
+    with TwilioStub() as stub:
+        stub.fail_next(2, status=503)
+        results = send_all(make_sender(stub), [(USER_ID, 'Hello')])
+
+    assert results == [True]
+    assert len(stub.messages) == 1
+
+@pytest.mark.unit
+def test_client_errors_are_not_retried(caplog):
+    """Test that a 4xx other than 429 gives up straight away, logging the sender hash instead of the number."""
+    with TwilioStub() as stub:
+        stub.fail_next(1, status=400)
+        sender = make_sender(stub)
+        results = send_all(sender, [(USER_ID, 'Hello')])
+
+    assert results == [False]
+    assert sender.stats == {'sent': 0, 'failed': 1, 'retries': 0, 'rate_limited': 0, 'duplicates': 0}
+    assert f'Giving up on reply to {sender_hash(USER_ID)}' in caplog.text
+    assert '27123456789' not in caplog.text
+
+@pytest.mark.unit
+def test_reply_stream_entries_are_acked_once_sent():
+    """Test that replies written by the stream workers are sent, and failures kept."""
+    redis_client = InMemoryStreams()
+    with TwilioStub() as stub:
+        stub.fail_next(1, status=400)
+        sender = make_sender(stub, workers=1)
+        stream_sender = ReplyStreamSender(redis_client, sender, consumer_name='sender-1', block_ms=0)
+        stream_sender.ensure_group()
+        for entry_id, text in [('1-0', 'Rejected'), ('2-0', ''), ('3-0', 'Sent')]:
+            reply = json.dumps({'reply_to': USER_ID, 'reply_text': text})
+            redis_client.xadd(REPLY_STREAM_NAME, {'data': reply, 'message_id': entry_id})
+
+        sender.start()
+        assert stream_sender.run_once() == 3
+        sender.stop()
+
+    assert [m['Body'] for m in stub.messages] == ['Sent']
+    assert redis_client.pending == {}
+    [failed] = redis_client.entries(FAILED_REPLY_STREAM_NAME)
+    assert failed['reply_id'] == '1-0'
@@ -25,14 +25,12 @@ def test_new_user_receives_popia_notice():
     """Test that new users receive the POPIA notice."""
     # Mock the Supabase client and user
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
-         patch('src.core_handler.create_user') as mock_create_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_content_file') as mock_get_content_file, \
          patch('src.core_handler.log_message') as mock_log_message:
         
         # Setup mocks
-        mock_get_user.return_value = None  # User doesn't exist
-        mock_create_user.return_value = {"data": [{"whatsapp_id": "test_user", "preferred_language": "en", "popia_consent_given": False}]}
+        mock_get_or_create_user.return_value = (None, True, None)
         mock_get_content_file.return_value = "Welcome to Township Connect! To use our services, we need your consent under POPIA..."
         
         # Create a test message
@@ -66,12 +64,12 @@ def test_existing_user_without_consent_receives_popia_notice():
     """Test that existing users without POPIA consent receive the POPIA notice."""
     # Mock the Supabase client and user
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_content_file') as mock_get_content_file, \
          patch('src.core_handler.log_message') as mock_log_message:
         
         # Setup mocks
-        mock_get_user.return_value = {"whatsapp_id": "test_user", "preferred_language": "en", "popia_consent_given": False}
+        mock_get_or_create_user.return_value = ({"whatsapp_id": "test_user", "preferred_language": "en", "popia_consent_given": False}, False, None)
         mock_get_content_file.return_value = "Welcome to Township Connect! To use our services, we need your consent under POPIA..."
         
         # Create a test message
@@ -105,13 +103,13 @@ def test_agree_popia_updates_consent():
     """Test that 'AGREE POPIA' messages update the user's consent status."""
     # Mock the Supabase client and user
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.update_user_popia_consent') as mock_update_consent, \
          patch('src.core_handler.get_message_template') as mock_get_template, \
          patch('src.core_handler.log_message') as mock_log_message:
         
         # Setup mocks
-        mock_get_user.return_value = {"whatsapp_id": "test_user_agreeing", "preferred_language": "en", "popia_consent_given": False}
+        mock_get_or_create_user.return_value = ({"whatsapp_id": "test_user_agreeing", "preferred_language": "en", "popia_consent_given": False}, False, None)
         mock_get_template.return_value = "Welcome to Township Connect!"
         
         # Create a test message with "AGREE POPIA"
@@ -148,12 +146,12 @@ def test_popia_notice_logging():
     """Test that POPIA notice dispatch is logged in the message_logs table."""
     # Mock the Supabase client and user
     with patch('src.core_handler.supabase_client') as mock_client, \
-         patch('src.core_handler.get_user') as mock_get_user, \
+         patch('src.core_handler.get_or_create_user') as mock_get_or_create_user, \
          patch('src.core_handler.get_content_file') as mock_get_content_file, \
          patch('src.core_handler.log_message') as mock_log_message:
         
         # Setup mocks
-        mock_get_user.return_value = {"whatsapp_id": "test_user_popia_notice_sent", "preferred_language": "en", "popia_consent_given": False}
+        mock_get_or_create_user.return_value = ({"whatsapp_id": "test_user_popia_notice_sent", "preferred_language": "en", "popia_consent_given": False}, False, None)
         mock_get_content_file.return_value = "Welcome to Township Connect! To use our services, we need your consent under POPIA..."
         
         # Create a test message
@@ -0,0 +1,169 @@
+"""
+Tests for per-message Redis command batching in Township Connect.
+
+These tests verify that the Redis commands of a message are sent in one pipeline,
+that delete requests are consumed atomically, and that each message reports how
+many commands it cost.
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+from unittest.mock import patch, MagicMock
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from redis.exceptions import NoScriptError
+
+from src import async_handler
+from src.core_handler import handle_incoming_message, CONSUME_DELETE_REQUEST
+from src.logging_utils import HOT_PATH
+from src.redis_batch import RedisBatch, message_batch, defer_command, execute_command
+
+USER_ID = 'whatsapp:+27123456789'
+USER = {'whatsapp_id': USER_ID, 'preferred_language': 'en', 'popia_consent_given': True, 'current_bundle': 'small_business'}
+
+class RecordingRedis:
+    """Stand-in Redis that records each round trip and runs the delete request script."""
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = []
+        self.scripts = set()
+
+    def pipeline(self, transaction=True):
+        return RecordingPipeline(self)
+
+    def run(self, command, *args, **kwargs):
+        if command == 'setex':
+            self.data[args[0]] = args[2]
+        elif command == 'get':
+            return self.data.get(args[0])
+        return True
+
+    def __getattr__(self, command):
+        def call(*args, **kwargs):
+            self.round_trips.append([command])
+            return self.run(command, *args, **kwargs)
+        return call
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        self.round_trips.append(['evalsha'])
+        if sha not in self.scripts:
+            raise NoScriptError("NOSCRIPT No matching script")
+        assert sha == CONSUME_DELETE_REQUEST.sha
+        return self.data.pop(keys_and_args[0], None)
+
+    def eval(self, source, numkeys, *keys_and_args):
+        self.round_trips.append(['eval'])
+        self.scripts.add(CONSUME_DELETE_REQUEST.sha)
+        return self.data.pop(keys_and_args[0], None)
+
+class RecordingPipeline:
+    """Pipeline that sends its queued commands as one round trip."""
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.queued = []
+
+    def __getattr__(self, command):
+        def queue(*args, **kwargs):
+            self.queued.append((command, args, kwargs))
+        return queue
+
+    def execute(self):
+        self.redis_client.round_trips.append([command for command, _, _ in self.queued])
+        return [self.redis_client.run(command, *args, **kwargs) for command, args, kwargs in self.queued]
+
+def send(redis_client, text: str) -> str:
+    """Handle a message from the existing user with the given Redis client."""
+    with patch('src.core_handler.redis_client', redis_client), \
+         patch('src.core_handler.supabase_client', MagicMock()), \
+         patch('src.core_handler.get_or_create_user', return_value=(dict(USER), False, None)), \
+         patch('src.core_handler.touch_user_activity'), \
+         patch('src.core_handler.log_message'), \
+         patch('src.core_handler.log_security_event'), \
+         patch('src.core_handler.erase_user_data'):
+        return json.loads(handle_incoming_message(json.dumps({'From': USER_ID, 'Body': text})))['reply_text']
+
+@pytest.mark.unit
+def test_message_commands_share_one_pipeline():
+    """Test that the stream publish and the delete request are sent in one round trip."""
+    redis_client = RecordingRedis()
+
+    send(redis_client, '/delete')
+
+    assert redis_client.round_trips == [['xadd', 'setex']]
+    assert f"delete_request:{USER_ID}" in redis_client.data
+
+@pytest.mark.unit
+def test_delete_request_is_confirmed_once():
+    """Test that confirming consumes the request in a single script call."""
+    redis_client = RecordingRedis()
+    send(redis_client, '/delete')
+    redis_client.round_trips.clear()
+
+    send(redis_client, '/delete confirm')
+    # The first EVALSHA loads the script with EVAL; later messages need one call
+    assert redis_client.round_trips == [['evalsha'], ['eval'], ['xadd']]
+
+    redis_client.round_trips.clear()
+    assert "no active delete request" in send(redis_client, '/delete confirm').lower()
+    assert redis_client.round_trips == [['evalsha'], ['xadd']]
+
+@pytest.mark.unit
+def test_batch_reports_commands_per_message():
+    """Test that a batch counts deferred and immediate commands and round trips."""
+    redis_client = RecordingRedis()
+
+    with patch('src.redis_batch.logger') as mock_logger:
+        with message_batch(redis_client) as batch:
+            defer_command(redis_client, 'xadd', 'stream', {'data': '{}'})
+            defer_command(redis_client, 'setex', 'key', 300, '1')
+            execute_command(redis_client, 'hgetall', 'user')
+
+        assert (batch.commands, batch.round_trips) == (3, 2)
+        mock_logger.info.assert_called_with(
+            "Redis commands for %s: %d in %d round trips", "message", 3, 2, extra=HOT_PATH
+        )
+
+@pytest.mark.unit
+def test_nested_batches_are_flushed_by_the_outer_batch():
+    """Test that a message handled inside another batch joins it."""
+    redis_client = RecordingRedis()
+
+    with message_batch(redis_client, 'worker') as outer:
+        with message_batch(redis_client, USER_ID) as inner:
+            defer_command(redis_client, 'xadd', 'stream', {'data': '{}'})
+        assert inner is outer
+        assert redis_client.round_trips == []
+
+    assert redis_client.round_trips == [['xadd']]
+
+@pytest.mark.unit
+def test_commands_after_flush_run_immediately():
+    """Test that a background task outliving its message does not lose commands."""
+    redis_client = RecordingRedis()
+    batch = RedisBatch(redis_client, USER_ID)
+    batch.flush()
+
+    batch.defer('xadd', 'stream', {'data': '{}'})
+
+    assert redis_client.round_trips == [['xadd']]
+
+@pytest.mark.unit
+def test_async_pipeline_batches_publish():
+    """Test that the async pipeline sends the stream publish with the other commands."""
+    redis_client = RecordingRedis()
+
+    with patch('src.core_handler.redis_client', redis_client), \
+         patch('src.core_handler.supabase_client', None):
+        reply = asyncio.run(async_handler.handle_incoming_message_async(
+            json.dumps({'From': USER_ID, 'Body': '/delete'})
+        ))
+
+    assert json.loads(reply)['reply_to'] == USER_ID
+    assert redis_client.round_trips == [['xadd', 'setex']]
@@ -0,0 +1,138 @@
+"""
+Tests for the sender scheduler in Township Connect.
+
+These tests verify that each sender's messages are handled in arrival order while
+messages from different senders are handled in parallel without waiting for each other.
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+import time
+from unittest.mock import patch
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import async_handler
+from src.sender_scheduler import SenderScheduler
+
+@pytest.mark.unit
+def test_messages_from_one_sender_run_in_order():
+    """Test that a slow first message is not overtaken by a fast second one."""
+    handled = []
+
+    async def handle(text, delay):
+        await asyncio.sleep(delay)
+        handled.append(text)
+        return text
+
+    async def run():
+        scheduler = SenderScheduler()
+        replies = await asyncio.gather(
+            scheduler.submit('whatsapp:+27123456789', handle, '/delete', 0.05),
+            scheduler.submit('whatsapp:+27123456789', handle, '/delete confirm', 0)
+        )
+        await scheduler.stop()
+        return replies, scheduler.active_senders()
+
+    replies, active_senders = asyncio.run(run())
+    assert replies == ['/delete', '/delete confirm']
+    assert handled == ['/delete', '/delete confirm']
+    assert active_senders == 0
+
+@pytest.mark.unit
+def test_different_senders_run_in_parallel():
+    """Test that many senders do not wait for each other."""
+    senders = [f'whatsapp:+2782{i:07d}' for i in range(100)]
+
+    async def run():
+        scheduler = SenderScheduler()
+        started = time.perf_counter()
+        await asyncio.gather(*(scheduler.submit(sender, asyncio.sleep, 0.1) for sender in senders))
+        elapsed = time.perf_counter() - started
+        await scheduler.stop()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.18
+
+@pytest.mark.unit
+def test_slow_sender_does_not_block_others():
+    """Test that a sender with a slow message does not delay another sender's messages."""
+    handled = []
+
+    async def handle(text, delay):
+        await asyncio.sleep(delay)
+        handled.append(text)
+
+    async def run():
+        scheduler = SenderScheduler()
+        await asyncio.gather(
+            scheduler.submit('whatsapp:+27111111111', handle, 'slow', 0.2),
+            *(scheduler.submit('whatsapp:+27222222222', handle, f'fast {i}', 0.01) for i in range(3))
+        )
+        await scheduler.stop()
+
+    asyncio.run(run())
+    assert handled == ['fast 0', 'fast 1', 'fast 2', 'slow']
+
+@pytest.mark.unit
+def test_max_concurrent_caps_running_jobs():
+    """Test that no more than max_concurrent jobs run at once."""
+    running = 0
+    peak = 0
+
+    async def handle():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def run():
+        scheduler = SenderScheduler(max_concurrent=3)
+        await asyncio.gather(*(scheduler.submit(f'whatsapp:+2782{i:07d}', handle) for i in range(10)))
+        await scheduler.stop()
+
+    asyncio.run(run())
+    assert peak == 3
+
+@pytest.mark.unit
+def test_failures_are_raised_to_the_submitter():
+    """Test that a failing message does not stop the sender's later messages."""
+    async def fail():
+        raise RuntimeError("Supabase unavailable")
+
+    async def ok():
+        return 'ok'
+
+    async def run():
+        scheduler = SenderScheduler()
+        with pytest.raises(RuntimeError):
+            await scheduler.submit('whatsapp:+27123456789', fail)
+        result = await scheduler.submit('whatsapp:+27123456789', ok)
+        await scheduler.stop()
+        return result, scheduler.stats
+
+    result, stats = asyncio.run(run())
+    assert result == 'ok'
+    assert stats == {'submitted': 2, 'completed': 1, 'failed': 1}
+
+@pytest.mark.unit
+def test_async_handler_schedules_by_sender():
+    """Test that the installed scheduler is used with the payload's sender."""
+    submitted = []
+
+    class RecordingScheduler:
+        async def submit(self, sender_id, func, *args):
+            submitted.append(sender_id)
+            return json.dumps({'reply_to': sender_id, 'reply_text': 'ok'})
+
+    with patch('src.async_handler.sender_scheduler', RecordingScheduler()):
+        asyncio.run(async_handler.handle_incoming_message_async(json.dumps({'From': 'whatsapp:+27111111111', 'Body': 'Hi'})))
+        asyncio.run(async_handler.handle_incoming_message_async(json.dumps({'message': {'from': 'whatsapp:+27222222222', 'body': 'Hi'}})))
+        asyncio.run(async_handler.handle_incoming_message_async("This is not JSON"))
+
+    assert submitted == ['whatsapp:+27111111111', 'whatsapp:+27222222222', '']
@@ -18,6 +18,7 @@ from unittest.mock import patch, MagicMock, mock_open
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.db.supabase_client import get_service_bundles, update_user_bundle
+from src.db.user_record import BUNDLE_COLUMNS, select_list
 from src.core_handler import handle_incoming_message, parse_message, generate_response, generate_bundle_selection_prompt
 
 @pytest.fixture
@@ -49,15 +50,16 @@ def test_get_service_bundles():
     """Test that the get_service_bundles function retrieves bundles correctly."""
     # Mock the Supabase client
     mock_client = MagicMock()
-    mock_client.table.return_value.select.return_value.execute.return_value = {
-        "data": [
+    mock_query = mock_client.table.return_value.select.return_value.eq.return_value
+    mock_query.order.return_value.order.return_value.execute.return_value = MagicMock(
+        data=[
             {
                 "bundle_id": "street_vendor_crm",
                 "bundle_name_en": "Street-Vendor CRM"
             }
         ],
-        "error": None
-    }
+        error=None
+    )
     
     # Call the function
     result = get_service_bundles(mock_client)
@@ -69,7 +71,10 @@ def test_get_service_bundles():
     
     # Verify the mock was called correctly
     mock_client.table.assert_called_with("service_bundles")
-    mock_client.table.return_value.select.assert_called_with("*")
+    mock_client.table.return_value.select.assert_called_with(select_list(BUNDLE_COLUMNS))
+    mock_client.table.return_value.select.return_value.eq.assert_called_with("active", True)
+    mock_query.order.assert_called_with("created_at")
+    mock_query.order.return_value.order.assert_called_with("bundle_id")
 
 @pytest.mark.unit
 def test_update_user_bundle():
@@ -0,0 +1,209 @@
+"""
+Tests for stream retention and archival in Township Connect.
+
+These tests verify that stream entries are written to date-partitioned archive files
+before they are trimmed, and that entries still needed by the workers are kept.
+"""
+
+import json
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core_handler import publish_to_redis_stream
+from src.stream_archive import StreamArchiver, archive_dates, read_archive, entry_date, report_cap_trim
+
+STREAM = 'incoming_whatsapp_messages'
+
+# 2025-05-14T18:30:00Z and a day later, in milliseconds
+DAY_ONE_MS = 1747247400000
+DAY_TWO_MS = DAY_ONE_MS + 86400000
+
+def id_key(entry_id):
+    milliseconds, sequence = entry_id.split('-')
+    return int(milliseconds), int(sequence)
+
+class InMemoryStream:
+    """Minimal stand-in for the Redis commands used by the archiver."""
+
+    def __init__(self):
+        self.entries = []
+        self.keys = {}
+        self.groups = []
+        self.pending_min = None
+        self.max_deleted = '0-0'
+
+    def add(self, milliseconds, body):
+        entry_id = f"{milliseconds}-{len(self.entries)}"
+        self.entries.append((entry_id.encode(), {b'data': json.dumps({'Body': body}).encode()}))
+        return entry_id
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def get(self, key):
+        return self.keys.get(key)
+
+    def delete(self, key):
+        self.keys.pop(key, None)
+
+    def xrange(self, name, min='-', count=None):
+        start = min[1:]
+        entries = [e for e in self.entries if id_key(e[0].decode()) > id_key(start)]
+        return entries[:count]
+
+    def xtrim(self, name, minid=None, approximate=True):
+        kept = [e for e in self.entries if id_key(e[0].decode()) >= id_key(minid)]
+        return self._delete_oldest(len(self.entries) - len(kept))
+
+    def cap(self, maxlen):
+        """Trim like XADD MAXLEN, ignoring the cursor and the groups."""
+        return self._delete_oldest(max(0, len(self.entries) - maxlen))
+
+    def _delete_oldest(self, count):
+        if count:
+            self.max_deleted = self.entries[count - 1][0].decode()
+            self.entries = self.entries[count:]
+        return count
+
+    def xinfo_stream(self, name):
+        return {'length': len(self.entries), 'max-deleted-entry-id': self.max_deleted.encode()}
+
+    def xinfo_groups(self, name):
+        return self.groups
+
+    def xpending(self, name, groupname):
+        return {'pending': 1, 'min': self.pending_min.encode()}
+
+@pytest.mark.unit
+def test_entries_are_archived_by_date_before_trimming(tmp_path):
+    """Test that old entries end up in per-day files and are trimmed from Redis."""
+    redis_client = InMemoryStream()
+    first = redis_client.add(DAY_ONE_MS, 'Hello')
+    redis_client.add(DAY_TWO_MS, 'Molo')
+    archiver = StreamArchiver(redis_client, tmp_path, STREAM, retention_seconds=0, batch_size=1)
+
+    assert archiver.run_once() == 2
+
+    assert archive_dates(tmp_path, STREAM) == ['2025-05-14', '2025-05-15']
+    archived = list(read_archive(tmp_path, STREAM, '2025-05-14'))
+    assert archived == [(first, {'data': json.dumps({'Body': 'Hello'})})]
+    assert redis_client.entries == []
+
+@pytest.mark.unit
+def test_entries_inside_retention_window_stay_in_redis(tmp_path):
+    """Test that recent entries are archived but not trimmed."""
+    redis_client = InMemoryStream()
+    redis_client.add(DAY_ONE_MS, 'Hello')
+    archiver = StreamArchiver(redis_client, tmp_path, STREAM, retention_seconds=10 ** 9)
+
+    archiver.run_once()
+
+    assert len(redis_client.entries) == 1
+    assert len(list(read_archive(tmp_path, STREAM, '2025-05-14'))) == 1
+
+@pytest.mark.unit
+def test_entries_needed_by_workers_are_not_trimmed(tmp_path):
+    """Test that pending and undelivered entries are kept for the consumer group."""
+    redis_client = InMemoryStream()
+    redis_client.add(DAY_ONE_MS, 'Acked')
+    pending = redis_client.add(DAY_ONE_MS + 1, 'Pending')
+    redis_client.add(DAY_ONE_MS + 2, 'Undelivered')
+    redis_client.groups = [{'name': b'message-workers', 'pending': 1, 'last-delivered-id': pending.encode()}]
+    redis_client.pending_min = pending
+    archiver = StreamArchiver(redis_client, tmp_path, STREAM, retention_seconds=0)
+
+    archiver.run_once()
+
+    assert [e[0].decode() for e in redis_client.entries][0] == pending
+    assert len(redis_client.entries) == 2
+
+@pytest.mark.unit
+def test_runs_continue_from_the_cursor(tmp_path):
+    """Test that each entry is archived once across runs and duplicates are skipped on read."""
+    redis_client = InMemoryStream()
+    redis_client.add(DAY_ONE_MS, 'Hello')
+    archiver = StreamArchiver(redis_client, tmp_path, STREAM, retention_seconds=10 ** 9)
+    archiver.run_once()
+    redis_client.add(DAY_ONE_MS + 5, 'Molo')
+
+    assert archiver.run_once() == 1
+    # A run that stopped before saving its cursor writes the same entries again
+    redis_client.keys.pop(archiver.cursor_key)
+    archiver.run_once()
+
+    assert [body for _, body in read_archive(tmp_path, STREAM, '2025-05-14')] == [
+        {'data': json.dumps({'Body': 'Hello'})}, {'data': json.dumps({'Body': 'Molo'})}
+    ]
+
+@pytest.mark.unit
+def test_run_is_skipped_while_another_archiver_holds_the_lock(tmp_path):
+    """Test that only one archiver works at a time."""
+    redis_client = InMemoryStream()
+    redis_client.add(DAY_ONE_MS, 'Hello')
+    archiver = StreamArchiver(redis_client, tmp_path, STREAM)
+    redis_client.set(archiver.lock_key, 'other', nx=True)
+
+    assert archiver.run_once() == 0
+    assert archive_dates(tmp_path, STREAM) == []
+
+@pytest.mark.unit
+def test_cap_trimming_past_the_cursor_is_reported_once(tmp_path, caplog):
+    """Test that the MINID trim is not reported but the emergency cap dropping unarchived entries is."""
+    redis_client = InMemoryStream()
+    redis_client.add(DAY_ONE_MS, 'Hello')
+    archiver = StreamArchiver(redis_client, tmp_path, STREAM, retention_seconds=0)
+    archiver.run_once()
+    assert 'REDIS_STREAM_MAXLEN' not in caplog.text
+
+    redis_client.add(DAY_ONE_MS + 1, 'Molo')
+    lost = redis_client.add(DAY_ONE_MS + 2, 'Dumela')
+    redis_client.add(DAY_ONE_MS + 3, 'Hallo')
+    redis_client.cap(1)
+    assert report_cap_trim(redis_client, STREAM, f'{DAY_ONE_MS}-0') == lost
+    assert report_cap_trim(redis_client, STREAM, f'{DAY_ONE_MS}-0', last_reported=lost) == lost
+    assert caplog.text.count('was trimmed up to') == 1
+
+    archiver.run_once()
+    assert archiver.stats['cap_trims'] == 1
+    # Once the cursor has moved past the gap, later runs are clean again
+    assert archiver.run_once() == 0
+    assert archiver._reported_cap_trim is None
+
+@pytest.mark.unit
+def test_cap_trimming_undelivered_entries_is_reported():
+    """Test that the cap dropping entries a consumer group has not read yet is reported."""
+    redis_client = InMemoryStream()
+    delivered = redis_client.add(DAY_ONE_MS, 'Hello')
+    redis_client.add(DAY_ONE_MS + 1, 'Molo')
+    redis_client.add(DAY_ONE_MS + 2, 'Hallo')
+    redis_client.groups = [{'name': b'reply-senders', 'pending': 0, 'last-delivered-id': delivered.encode()}]
+
+    redis_client.cap(2)
+    assert report_cap_trim(redis_client, STREAM) is None
+    redis_client.cap(1)
+    assert report_cap_trim(redis_client, STREAM) == f'{DAY_ONE_MS + 1}-1'
+
+@pytest.mark.unit
+def test_publish_caps_stream_length():
+    """Test that publishing trims the stream approximately."""
+    with patch('src.core_handler.redis_client') as mock_redis, \
+         patch('src.core_handler.STREAM_MAXLEN', 5000):
+        publish_to_redis_stream(json.dumps({'From': 'whatsapp:+27123456789', 'Body': 'Hi'}))
+
+        kwargs = mock_redis.xadd.call_args.kwargs
+        assert kwargs == {'maxlen': 5000, 'approximate': True}
+
+@pytest.mark.unit
+def test_entry_date_is_utc():
+    """Test that entries are partitioned by their UTC date."""
+    assert entry_date(f"{DAY_ONE_MS}-0") == '2025-05-14'
+    assert entry_date('1747267199999-3') == '2025-05-14'
+    assert entry_date('1747267200000-0') == '2025-05-15'
@@ -0,0 +1,236 @@
+"""
+Tests for the message stream workers in Township Connect.
+
+These tests verify that workers answer enqueued messages, acknowledge entries only
+after their reply is written, and reclaim or dead-letter entries left pending.
+"""
+
+import json
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from redis.exceptions import ResponseError
+
+from src.core_handler import enqueue_message, process_incoming_message
+from src.stream_worker import (
+    StreamWorker, StreamWorkerPool, CONSUMER_GROUP, STREAM_NAME, REPLY_STREAM_NAME,
+    DEAD_LETTER_STREAM_NAME, QUEUED_COUNT_KEY
+)
+
+class InMemoryStreams:
+    """Minimal stand-in for the Redis stream and consumer group commands."""
+
+    def __init__(self):
+        self.streams = {}
+        self.groups = {}
+        self.pending = {}
+        self.counters = {}
+        self.sequence = 0
+
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self)
+
+    def incr(self, name):
+        self.counters[name] = self.counters.get(name, 0) + 1
+        return self.counters[name]
+
+    def decr(self, name):
+        self.counters[name] = self.counters.get(name, 0) - 1
+        return self.counters[name]
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        self.sequence += 1
+        entry_id = f"{self.sequence}-0"
+        self.streams.setdefault(name, []).append((entry_id.encode(), {k.encode(): v.encode() for k, v in fields.items()}))
+        return entry_id.encode()
+
+    def xgroup_create(self, name, groupname, id="$", mkstream=False):
+        if (name, groupname) in self.groups:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+        self.streams.setdefault(name, [])
+        self.groups[(name, groupname)] = len(self.streams[name])
+
+    def xreadgroup(self, groupname, consumername, streams, count=None, block=None):
+        response = []
+        for name in streams:
+            position = self.groups[(name, groupname)]
+            entries = self.streams[name][position:position + count]
+            self.groups[(name, groupname)] = position + len(entries)
+            for entry_id, _ in entries:
+                self.pending[entry_id.decode()] = {'consumer': consumername, 'times_delivered': 1}
+            if entries:
+                response.append([name.encode(), entries])
+        return response
+
+    def xack(self, name, groupname, entry_id):
+        return int(self.pending.pop(entry_id, None) is not None)
+
+    def xautoclaim(self, name, groupname, consumername, min_idle_time, start_id="0-0", count=None):
+        claimed = []
+        for entry_id, fields in self.streams.get(name, []):
+            pending = self.pending.get(entry_id.decode())
+            if pending and pending['consumer'] != consumername:
+                pending['consumer'] = consumername
+                pending['times_delivered'] += 1
+                claimed.append((entry_id, fields))
+        return [b"0-0", claimed, []]
+
+    def xpending_range(self, name, groupname, min, max, count):
+        pending = self.pending.get(min)
+        return [dict(pending, message_id=min.encode())] if pending else []
+
+    def entries(self, name):
+        return [{k.decode(): v.decode() for k, v in fields.items()} for _, fields in self.streams.get(name, [])]
+
+class InMemoryPipeline:
+    """Queues commands and runs them against InMemoryStreams on execute."""
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    def __getattr__(self, command):
+        return lambda *args, **kwargs: self.commands.append((command, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis_client, command)(*args, **kwargs) for command, args, kwargs in self.commands]
+
+def echo_handler(message_data_json_string: str) -> str:
+    """Reply with the message body, like the default echo command."""
+    message_data = json.loads(message_data_json_string)
+    return json.dumps({'reply_to': message_data['From'], 'reply_text': f"Echo: {message_data['Body']}"})
+
+def make_worker(redis_client, handler=echo_handler, consumer_name='worker-1', **options) -> StreamWorker:
+    """Create a worker whose group exists and that only reclaims when asked."""
+    worker = StreamWorker(redis_client, handler, consumer_name, block_ms=0, claim_interval_seconds=3600, **options)
+    worker.ensure_group()
+    worker._next_claim = float('inf')
+    return worker
+
+def enqueue(redis_client, body: str) -> str:
+    """Enqueue a message through core_handler.enqueue_message."""
+    with patch('src.core_handler.redis_client', redis_client):
+        return enqueue_message(json.dumps({'From': 'whatsapp:+27123456789', 'Body': body}))
+
+@pytest.mark.unit
+def test_worker_answers_enqueued_messages():
+    """Test that enqueued messages are answered on the reply stream and acknowledged."""
+    redis_client = InMemoryStreams()
+    worker = make_worker(redis_client)
+    first = enqueue(redis_client, 'Hello')
+    enqueue(redis_client, 'Molo')
+
+    assert worker.run_once() == 2
+
+    replies = redis_client.entries(REPLY_STREAM_NAME)
+    assert [json.loads(reply['data'])['reply_text'] for reply in replies] == ['Echo: Hello', 'Echo: Molo']
+    assert replies[0]['message_id'] == first
+    assert redis_client.pending == {}
+    assert redis_client.counters[QUEUED_COUNT_KEY] == 0
+    assert worker.stats['processed'] == 2
+
+@pytest.mark.unit
+def test_worker_skips_inline_entries():
+    """Test that entries published by the inline webhook are acknowledged without a reply."""
+    redis_client = InMemoryStreams()
+    worker = make_worker(redis_client)
+    redis_client.xadd(STREAM_NAME, {'data': json.dumps({'From': 'whatsapp:+27123456789', 'Body': 'Hi'})})
+
+    worker.run_once()
+
+    assert redis_client.entries(REPLY_STREAM_NAME) == []
+    assert redis_client.pending == {}
+    assert worker.stats['skipped'] == 1
+
+@pytest.mark.unit
+def test_failed_entry_is_left_pending_and_reclaimed():
+    """Test that an entry whose handler fails is retried by another worker."""
+    redis_client = InMemoryStreams()
+
+    def failing_handler(message_data_json_string):
+        raise ConnectionError("Supabase unavailable")
+
+    crashed = make_worker(redis_client, handler=failing_handler, consumer_name='worker-1')
+    entry_id = enqueue(redis_client, 'Hello')
+    crashed.run_once()
+    assert entry_id in redis_client.pending
+
+    survivor = make_worker(redis_client, consumer_name='worker-2')
+    assert survivor.reclaim() == 1
+
+    assert json.loads(redis_client.entries(REPLY_STREAM_NAME)[0]['data'])['reply_text'] == 'Echo: Hello'
+    assert redis_client.pending == {}
+    assert survivor.stats['reclaimed'] == 1
+
+@pytest.mark.unit
+def test_handler_errors_leave_the_entry_pending():
+    """Test that the workers' handler raises instead of replying with the generic error reply."""
+    redis_client = InMemoryStreams()
+    worker = make_worker(redis_client, handler=lambda data: process_incoming_message(data, publish=False))
+    redis_client.xadd(STREAM_NAME, {'data': 'This is not JSON', 'queued': '1'})
+
+    worker.run_once()
+
+    assert redis_client.entries(REPLY_STREAM_NAME) == []
+    assert list(redis_client.pending) == ['1-0']
+    assert worker.stats['failed'] == 1
+
+@pytest.mark.unit
+def test_failed_reply_write_releases_the_message():
+    """Test that a reply that could not be written releases the message for the retry."""
+    class ReplyStreamDown(InMemoryStreams):
+        def xadd(self, name, fields, maxlen=None, approximate=True):
+            if name == REPLY_STREAM_NAME:
+                raise ConnectionError("Redis connection reset")
+            return super().xadd(name, fields, maxlen, approximate)
+
+    redis_client = ReplyStreamDown()
+    released = []
+    worker = make_worker(redis_client, release=released.append)
+    entry_id = enqueue(redis_client, 'Hello')
+
+    worker.run_once()
+
+    assert [json.loads(data)['Body'] for data in released] == ['Hello']
+    assert entry_id in redis_client.pending
+    assert worker.stats['failed'] == 1
+
+@pytest.mark.unit
+def test_entry_is_dead_lettered_after_max_deliveries():
+    """Test that an entry that keeps failing is moved to the dead letter stream."""
+    redis_client = InMemoryStreams()
+    make_worker(redis_client, consumer_name='worker-1')
+    entry_id = enqueue(redis_client, 'Hello')
+    redis_client.xreadgroup(CONSUMER_GROUP, 'worker-1', {STREAM_NAME: '>'}, count=10)
+    redis_client.pending[entry_id]['times_delivered'] = 2
+
+    worker = make_worker(redis_client, consumer_name='worker-2', max_deliveries=2)
+    worker.reclaim()
+
+    dead = redis_client.entries(DEAD_LETTER_STREAM_NAME)
+    assert dead[0]['message_id'] == entry_id
+    assert redis_client.entries(REPLY_STREAM_NAME) == []
+    assert redis_client.pending == {}
+    assert redis_client.counters[QUEUED_COUNT_KEY] == 0
+
+@pytest.mark.unit
+def test_ensure_group_is_idempotent():
+    """Test that starting workers against an existing group does not fail."""
+    redis_client = InMemoryStreams()
+    pool = StreamWorkerPool(redis_client, echo_handler, workers=3)
+
+    pool.workers[0].ensure_group()
+    pool.workers[1].ensure_group()
+
+    assert len({worker.consumer_name for worker in pool.workers}) == 3
+
+@pytest.mark.unit
+def test_enqueue_message_without_redis():
+    """Test that enqueueing reports failure when Redis is not configured."""
+    with patch('src.core_handler.redis_client', None):
+        assert enqueue_message(json.dumps({'From': 'whatsapp:+27123456789', 'Body': 'Hi'})) is None
@@ -0,0 +1,91 @@
+"""
+Tests for the template store in Township Connect.
+
+These tests verify that templates and content files are served from memory, that the
+content-to-template fallback is resolved by the store, and that edited files are reloaded.
+"""
+
+import os
+import pytest
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core_handler import get_message_template, get_content_file, get_localized_text, generate_response
+from src.template_store import TemplateStore
+
+@pytest.fixture
+def directories():
+    """Create template and content directories with a few files."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        template_dir = Path(temp_dir) / "templates"
+        content_dir = Path(temp_dir) / "content"
+        template_dir.mkdir()
+        content_dir.mkdir()
+        (template_dir / "popia_notice_en.txt").write_text("Template POPIA notice", encoding='utf-8')
+        (template_dir / "lang_confirmation_xh.txt").write_text("Template Xhosa", encoding='utf-8')
+        (content_dir / "popia_notice_en.txt").write_text("Content POPIA notice", encoding='utf-8')
+        (content_dir / "lang_confirmation_xh.txt").write_text("   ", encoding='utf-8')
+        yield template_dir, content_dir
+
+@pytest.fixture
+def store(directories):
+    """Install a loaded template store for the directories fixture."""
+    template_dir, content_dir = directories
+    template_store = TemplateStore(template_dir, content_dir, check_interval_seconds=0)
+    template_store.load()
+    with patch('src.core_handler.TEMPLATE_DIR', template_dir), \
+         patch('src.core_handler.CONTENT_DIR', content_dir), \
+         patch('src.core_handler.template_store', template_store):
+        yield template_store
+
+@pytest.mark.unit
+def test_lookups_are_served_from_memory(store):
+    """Test that lookups do not open files once the store is loaded."""
+    with patch('builtins.open', side_effect=AssertionError("file opened")):
+        store.check_interval = 60
+        assert get_message_template("popia_notice_en.txt") == "Template POPIA notice"
+        assert get_content_file("popia_notice_en.txt") == "Content POPIA notice"
+        assert get_message_template("missing.txt") == "Template 'missing.txt' not found."
+        assert get_content_file("missing.txt") == "Content file 'missing.txt' not found."
+
+@pytest.mark.unit
+def test_content_falls_back_to_template(store):
+    """Test that an empty or missing content file resolves to the template."""
+    assert get_localized_text("popia_notice_en.txt") == "Content POPIA notice"
+    assert get_localized_text("lang_confirmation_xh.txt") == "Template Xhosa"
+    assert generate_response("language", {"language": "xh"}, "whatsapp:+27123456789", "en") == "Template Xhosa"
+    assert get_localized_text("welcome_zu.txt") == "Template 'welcome_zu.txt' not found."
+
+@pytest.mark.unit
+def test_changed_added_and_removed_files_are_reloaded(store, directories):
+    """Test hot reload based on modification times."""
+    template_dir, content_dir = directories
+    files_read = store.stats["files_read"]
+
+    edited = content_dir / "popia_notice_en.txt"
+    edited.write_text("Updated POPIA notice", encoding='utf-8')
+    # Make sure the modification time changes even on coarse-grained filesystems
+    future = time.time() + 5
+    os.utime(edited, (future, future))
+    (template_dir / "welcome_en.txt").write_text("Welcome!", encoding='utf-8')
+    (template_dir / "lang_confirmation_xh.txt").unlink()
+
+    assert get_localized_text("popia_notice_en.txt") == "Updated POPIA notice"
+    assert get_message_template("welcome_en.txt") == "Welcome!"
+    assert get_localized_text("lang_confirmation_xh.txt") == "Template 'lang_confirmation_xh.txt' not found."
+    # Only the edited and the new file were read again
+    assert store.stats["files_read"] == files_read + 2
+
+@pytest.mark.unit
+def test_store_is_bypassed_for_other_directories(store):
+    """Test that a store built for other directories is not used."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        (Path(temp_dir) / "test_template.txt").write_text("From disk", encoding='utf-8')
+        with patch('src.core_handler.TEMPLATE_DIR', Path(temp_dir)):
+            assert get_message_template("test_template.txt") == "From disk"
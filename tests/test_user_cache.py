@@ -0,0 +1,234 @@
+"""
+Tests for the user cache in Township Connect.
+
+These tests verify that get_user is answered from the local and Redis tiers, and that
+user updates and deletions keep the cache consistent with the database.
+"""
+
+import pytest
+import sys
+import os
+import queue
+import time
+from unittest.mock import patch
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db import supabase_client
+from src.db.supabase_client import MockSupabaseClient
+from src.db.user_cache import UserCache, REDIS_KEY_PREFIX
+
+USER_ID = 'whatsapp:+27123456789'
+
+class InMemoryPubSub:
+    """Minimal stand-in for a Redis pub/sub connection."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.messages = queue.Queue()
+
+    def subscribe(self, channel):
+        self.redis.subscribers.setdefault(channel, []).append(self)
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        for subscribers in self.redis.subscribers.values():
+            if self in subscribers:
+                subscribers.remove(self)
+
+class InMemoryRedis:
+    """Minimal stand-in for the Redis hash and pub/sub commands used by the cache."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.subscribers = {}
+
+    def publish(self, channel, message):
+        for pubsub in self.subscribers.get(channel, []):
+            pubsub.messages.put({'type': 'message', 'channel': channel, 'data': message.encode()})
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return InMemoryPubSub(self)
+
+    def hgetall(self, key):
+        return {k.encode(): v.encode() for k, v in self.hashes.get(key, {}).items()}
+
+    def exists(self, key):
+        return int(key in self.hashes)
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def expire(self, key, seconds):
+        pass
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+def make_client() -> MockSupabaseClient:
+    """Create a mock client with one existing user."""
+    client = MockSupabaseClient()
+    client.users[USER_ID] = {'whatsapp_id': USER_ID, 'preferred_language': 'en', 'popia_consent_given': True}
+    return client
+
+@pytest.fixture
+def cache():
+    """Install a user cache with a shared Redis tier for the duration of a test."""
+    user_cache = UserCache(InMemoryRedis())
+    supabase_client.set_user_cache(user_cache)
+    yield user_cache
+    supabase_client.set_user_cache(None)
+
+@pytest.mark.unit
+def test_get_user_reads_supabase_once(cache):
+    """Test that repeated lookups for the same user are served from the cache."""
+    client = make_client()
+
+    for _ in range(5):
+        assert supabase_client.get_user(client, USER_ID)['preferred_language'] == 'en'
+
+    assert client.request_count == 1
+    assert cache.stats['misses'] == 1
+    assert cache.stats['local_hits'] == 4
+
+@pytest.mark.unit
+def test_redis_tier_is_shared_between_workers(cache):
+    """Test that a user cached by one worker is found in Redis by another."""
+    client = make_client()
+    supabase_client.get_user(client, USER_ID)
+
+    # A second worker shares Redis but has an empty local LRU
+    cache.clear_local()
+    user = supabase_client.get_user(client, USER_ID)
+
+    assert user['popia_consent_given'] is True
+    assert client.request_count == 1
+    assert cache.stats['redis_hits'] == 1
+
+@pytest.mark.unit
+def test_updates_write_through(cache):
+    """Test that user updates are visible in the cache without another read."""
+    client = make_client()
+    supabase_client.get_user(client, USER_ID)
+
+    supabase_client.update_user_language(client, USER_ID, 'xh')
+    supabase_client.update_user_bundle(client, USER_ID, 'street_vendor_crm')
+    supabase_client.update_user_popia_consent(client, USER_ID, False)
+    cache.clear_local()
+    user = supabase_client.get_user(client, USER_ID)
+
+    assert user['preferred_language'] == 'xh'
+    assert user['current_bundle'] == 'street_vendor_crm'
+    assert user['popia_consent_given'] is False
+    assert cache.stats['redis_hits'] == 1
+
+@pytest.mark.unit
+def test_failed_update_invalidates(cache):
+    """Test that a user is dropped from the cache when an update fails."""
+    client = make_client()
+    supabase_client.get_user(client, USER_ID)
+
+    with patch.object(client, 'update', side_effect=Exception("connection reset")):
+        supabase_client.update_user_bundle(client, USER_ID, 'small_business')
+
+    assert cache.get(USER_ID) is None
+    assert REDIS_KEY_PREFIX + USER_ID not in cache.redis_client.hashes
+
+@pytest.mark.unit
+def test_create_and_delete(cache):
+    """Test that new users are cached and erased users are not."""
+    client = MockSupabaseClient()
+
+    supabase_client.create_user(client, USER_ID, 'af')
+    assert cache.get(USER_ID)['preferred_language'] == 'af'
+
+    supabase_client.delete_user_data(client, USER_ID)
+    assert cache.get(USER_ID) is None
+    assert REDIS_KEY_PREFIX + USER_ID not in cache.redis_client.hashes
+
+@pytest.mark.unit
+def test_local_tier_expires_and_evicts():
+    """Test the local TTL and the LRU size bound."""
+    user_cache = UserCache(max_size=2, local_ttl_seconds=0.05)
+    user_cache.set('a', {'whatsapp_id': 'a'})
+    user_cache.set('b', {'whatsapp_id': 'b'})
+    user_cache.get('a')
+    user_cache.set('c', {'whatsapp_id': 'c'})
+
+    # 'b' was the least recently used
+    assert user_cache.get('b') is None
+    assert user_cache.get('a') is not None
+
+    time.sleep(0.06)
+    assert user_cache.get('a') is None
+    assert user_cache.hit_rate() == pytest.approx(2 / 4)
+
+@pytest.mark.unit
+def test_redis_errors_fall_back_to_supabase():
+    """Test that a failing Redis does not break user lookups."""
+    class BrokenRedis(InMemoryRedis):
+        def hgetall(self, key):
+            raise ConnectionError("Redis is down")
+
+    user_cache = UserCache(BrokenRedis())
+    supabase_client.set_user_cache(user_cache)
+    try:
+        client = make_client()
+        assert supabase_client.get_user(client, USER_ID)['whatsapp_id'] == USER_ID
+        assert user_cache.stats['redis_errors'] == 1
+    finally:
+        supabase_client.set_user_cache(None)
+
+@pytest.mark.unit
+def test_changes_drop_other_processes_local_entries():
+    """Test that a change made by one process is not answered from another process's local tier."""
+    redis = InMemoryRedis()
+    first, second = UserCache(redis), UserCache(redis)
+    for cache in (first, second):
+        cache.start()
+        assert cache._subscribed.wait(1)
+    try:
+        first.set(USER_ID, {'whatsapp_id': USER_ID, 'preferred_language': 'en', 'popia_consent_given': True})
+        assert second.get(USER_ID)['preferred_language'] == 'en'
+        assert second.get(USER_ID)['preferred_language'] == 'en'
+
+        first.update(USER_ID, {'preferred_language': 'xh', 'popia_consent_given': False})
+        deadline = time.monotonic() + 1
+        while second.stats['remote_invalidations'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        user = second.get(USER_ID)
+        assert (user['preferred_language'], user['popia_consent_given']) == ('xh', False)
+        assert first.stats['remote_invalidations'] == 0
+    finally:
+        first.stop()
+        second.stop()
+
+@pytest.mark.unit
+def test_local_tier_is_skipped_while_not_subscribed():
+    """Test that local entries are not trusted while the invalidation listener is disconnected."""
+    class UnreachableRedis(InMemoryRedis):
+        def pubsub(self, ignore_subscribe_messages=False):
+            raise ConnectionError("Redis is down")
+
+    user_cache = UserCache(UnreachableRedis())
+    user_cache.start()
+    try:
+        user_cache.set(USER_ID, {'whatsapp_id': USER_ID, 'preferred_language': 'en'})
+        assert user_cache.get(USER_ID)['preferred_language'] == 'en'
+        assert user_cache.stats['local_hits'] == 0
+        assert user_cache.stats['redis_hits'] == 1
+    finally:
+        user_cache.stop()
@@ -0,0 +1,79 @@
+"""
+Tests for the column-projected user records in Township Connect.
+
+These tests verify that get_user reads only the columns of its use case, keeps large
+columns out of the user cache, and returns read-only records that work like user dicts.
+"""
+
+import pytest
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db import supabase_client
+from src.db.supabase_client import MockSupabaseClient
+from src.db.user_cache import UserCache
+from src.db.user_record import ADMIN_USER_COLUMNS, UserRecord
+
+USER_ID = 'whatsapp:+27123456789'
+USER_ROW = {
+    'whatsapp_id': USER_ID,
+    'preferred_language': 'xh',
+    'current_bundle': None,
+    'popia_consent_given': True,
+    'created_at': '2025-05-01T08:30:00+00:00',
+    'last_active_at': '2025-05-02T09:00:00+00:00',
+    'baileys_creds_encrypted': 'x' * 4096,
+}
+
+@pytest.fixture
+def cache():
+    """Install a local-only user cache for the duration of a test."""
+    user_cache = UserCache(None)
+    supabase_client.set_user_cache(user_cache)
+    yield user_cache
+    supabase_client.set_user_cache(None)
+
+@pytest.mark.unit
+def test_get_user_projects_the_message_columns(cache):
+    """Test that message lookups leave out timestamps and Baileys credentials, also in the cache."""
+    client = MockSupabaseClient()
+    client.users[USER_ID] = dict(USER_ROW)
+
+    user = supabase_client.get_user(client, USER_ID)
+
+    assert isinstance(user, UserRecord)
+    assert client.current_query['select'] == 'whatsapp_id,preferred_language,current_bundle,popia_consent_given'
+    assert user.preferred_language == 'xh'
+    assert user.get('created_at') is None
+    assert 'baileys_creds_encrypted' not in user
+    assert set(cache.get(USER_ID)) == {'whatsapp_id', 'preferred_language', 'current_bundle', 'popia_consent_given'}
+
+@pytest.mark.unit
+def test_admin_lookups_bypass_the_cache(cache):
+    """Test that admin lookups read the timestamps from the database, not the cached message columns."""
+    client = MockSupabaseClient()
+    client.users[USER_ID] = dict(USER_ROW)
+    supabase_client.get_user(client, USER_ID)
+
+    user = supabase_client.get_user(client, USER_ID, ADMIN_USER_COLUMNS)
+
+    assert user.created_at == '2025-05-01T08:30:00+00:00'
+    assert client.request_count == 2
+
+@pytest.mark.unit
+def test_user_record_reads_like_a_dict():
+    """Test that records are read-only and support the dict reads callers use."""
+    user = UserRecord.from_row(USER_ROW)
+
+    assert user['preferred_language'] == 'xh'
+    assert user.get('current_bundle', 'none') == 'none'
+    assert user.get('unknown_column', 'default') == 'default'
+    assert dict(user) == {key: value for key, value in USER_ROW.items() if key in ADMIN_USER_COLUMNS and value is not None}
+    assert not hasattr(user, '__dict__')
+    with pytest.raises(AttributeError):
+        user.preferred_language = 'en'
+    with pytest.raises(KeyError):
+        user['baileys_creds_encrypted']
@@ -0,0 +1,179 @@
+"""
+Local stub of the Twilio Messages API for Township Connect tests.
+
+TwilioStub serves POST /2010-04-01/Accounts/<sid>/Messages.json on localhost with
+HTTP/1.1 keep-alive, records the messages it accepts and the connections it sees,
+and can enforce a per-number rate limit (answering 429 with Retry-After, like
+Twilio) or fail the next requests with a given status.
+
+Run it on its own to load test the outbound sender against it:
+    python -m tests.twilio_stub [--port PORT] [--rate N]
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+MESSAGES_PATH = re.compile(r"^/2010-04-01/Accounts/(?P<sid>[^/]+)/Messages\.json$")
+
+class TwilioStub:
+    """A Twilio Messages API stub running in a background thread."""
+
+    def __init__(self, port: int = 0, rate_per_second: Optional[float] = None, burst: int = 1):
+        """
+        Initialize the stub. The server starts with start() or as a context manager.
+
+        Args:
+            port: Port to listen on, 0 for any free port (default: 0)
+            rate_per_second: Messages per second accepted per From number, None for no limit
+            burst: Messages a From number may send at once (default: 1)
+        """
+        self.rate = rate_per_second
+        self.burst = burst
+        self.messages: List[Dict[str, str]] = []
+        self.connections = 0
+        self.rate_limited = 0
+
+        self._failures: List[int] = []
+        self._allowance: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _handler_for(self))
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """Base URL to use as TWILIO_API_BASE_URL."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, count: int, status: int = 500) -> None:
+        """
+        Answer the next requests with an error.
+
+        Args:
+            count: Number of requests to fail
+            status: HTTP status to answer with (default: 500)
+        """
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def start(self) -> "TwilioStub":
+        """Start serving in a background thread."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, name="twilio-stub", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "TwilioStub":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def respond(self, fields: Dict[str, str]) -> tuple:
+        """
+        Decide the response to a message request.
+
+        Args:
+            fields: The posted form fields
+
+        Returns:
+            A tuple of (status, headers, body)
+        """
+        with self._lock:
+            if self._failures:
+                status = self._failures.pop(0)
+                return status, {}, {"code": 20500, "message": "Stub failure", "status": status}
+
+            wait = self._take_token(fields.get("From", ""))
+            if wait:
+                self.rate_limited += 1
+                return 429, {"Retry-After": f"{wait:.3f}"}, {
+                    "code": 20429, "message": "Too Many Requests", "status": 429
+                }
+
+            sid = "SM" + uuid.uuid4().hex
+            self.messages.append({**fields, "sid": sid})
+        return 201, {}, {"sid": sid, "status": "queued", **{k.lower(): v for k, v in fields.items()}}
+
+    def _take_token(self, from_number: str) -> float:
+        """Take a token of a From number, returning 0 or how long until one is available."""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._allowance.get(from_number, [float(self.burst), now])
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._allowance[from_number] = [tokens, now]
+            return (1 - tokens) / self.rate
+        self._allowance[from_number] = [tokens - 1, now]
+        return 0.0
+
+def _handler_for(stub: TwilioStub):
+    """Build the request handler class bound to a stub."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            with stub._lock:
+                stub.connections += 1
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            if not MESSAGES_PATH.match(self.path):
+                return self._send(404, {}, {"code": 20404, "message": "Not found", "status": 404})
+            if not self.headers.get("Authorization", "").startswith("Basic "):
+                return self._send(401, {}, {"code": 20003, "message": "Authenticate", "status": 401})
+            fields = {key: values[0] for key, values in parse_qs(body).items()}
+            if not fields.get("To") or not fields.get("Body"):
+                return self._send(400, {}, {"code": 21604, "message": "A 'To' and 'Body' are required", "status": 400})
+            self._send(*stub.respond(fields))
+
+        def _send(self, status: int, headers: Dict[str, str], payload: Dict) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def main():
+    """Serve the stub until interrupted."""
+    parser = argparse.ArgumentParser(description='Local stub of the Twilio Messages API')
+    parser.add_argument('--port', type=int, default=8099, help='Port to listen on (default: 8099)')
+    parser.add_argument('--rate', type=float, default=None, help='Messages per second accepted per From number (default: no limit)')
+    args = parser.parse_args()
+
+    stub = TwilioStub(args.port, rate_per_second=args.rate, burst=max(1, int(args.rate or 1)))
+    print(f"Twilio stub listening on {stub.base_url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Accepted {len(stub.messages)} messages, rate limited {stub.rate_limited}, {stub.connections} connections")
+
+if __name__ == "__main__":
+    main()